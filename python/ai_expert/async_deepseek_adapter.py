@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Async DeepSeek API Adapter
+DeepSeek 大模型 API 异步适配器
+
+基于 httpx.AsyncClient，请求构造、结果解析与重试退避策略与同步版 DeepSeekAdapter 一致；
+每次请求先经全局出站调控器排队，再在事件循环的并发信号量内发出，退避等待期间不占用名额；
+熔断器与对冲决策和同步 Adapter 共享，对冲时落败的请求直接取消。
+"""
+
+import time
+import asyncio
+import threading
+from contextlib import nullcontext
+from typing import AsyncIterator, List, Dict, Optional
+
+import httpx
+
+from .async_runtime import AsyncRuntime, get_async_runtime
+from .deadline import current_deadline
+from .llm_governor import LLMGovernor, Permit, current_lane, get_llm_governor, parse_retry_after
+from .circuit_breaker import CircuitBreaker, get_circuit_breaker
+from .request_hedger import RequestHedger, get_request_hedger
+from .tracing import traced
+from .config import Config
+from .deepseek_adapter import (
+    build_chat_payload,
+    parse_chat_response,
+    failed_chat_result,
+    parse_stream_line,
+    apply_stream_usage,
+)
+from .constants import (
+    MAX_RETRIES,
+    RETRY_DELAY_BASE,
+    RETRY_BACKOFF_FACTOR,
+    RETRYABLE_STATUS_CODES,
+    LLM_THROTTLE_STATUS_CODES,
+    DEADLINE_MIN_LLM_ATTEMPT,
+    HTTP_POOL_MAXSIZE,
+)
+
+
+class AsyncDeepSeekAdapter:
+    def __init__(
+        self,
+        api_key: str,
+        runtime: Optional[AsyncRuntime] = None,
+        llm_governor: Optional[LLMGovernor] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedger: Optional[RequestHedger] = None
+    ):
+        self.api_key = api_key
+        self.base_url = f"{Config.get_deepseek_base_url()}/chat/completions"
+        self.model = "deepseek-chat"
+        self.timeout = 30  # 30秒超时
+        self.runtime = runtime or get_async_runtime()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._llm_governor = llm_governor
+        self._circuit_breaker = circuit_breaker
+        self._hedger = hedger
+
+    @property
+    def llm_governor(self) -> Optional[LLMGovernor]:
+        return self._llm_governor or get_llm_governor()
+
+    def _governed(self):
+        """占用一个出站名额；未启用调控器时返回不做限制的空名额"""
+        governor = self.llm_governor
+        return governor.slot_async() if governor else nullcontext(Permit(current_lane()))
+
+    def _request_timeout(self) -> float:
+        """单次请求超时：不超过当前请求剩余的时间预算"""
+        deadline = current_deadline()
+        return deadline.timeout(self.timeout) if deadline else self.timeout
+
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        return self._circuit_breaker or get_circuit_breaker()
+
+    @property
+    def hedger(self) -> RequestHedger:
+        return self._hedger or get_request_hedger()
+
+    @traced('deepseek.http')
+    async def _send(self, headers: Dict, data: Dict) -> httpx.Response:
+        """发出一次非流式请求：熔断检查 -> 出站名额 -> 记录结果与延迟"""
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.check()
+        async with self._governed() as permit:
+            # 与同步版一致：延迟从拿到名额开始计
+            start_time = time.time()
+            try:
+                response = await self.runtime.limit(
+                    self._get_client().post(self.base_url, headers=headers, json=data, timeout=self._request_timeout())
+                )
+            except (httpx.TimeoutException, httpx.TransportError):
+                if breaker:
+                    breaker.record_failure()
+                raise
+            if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                permit.throttled(parse_retry_after(response.headers.get('Retry-After')))
+
+        if breaker:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        if response.status_code == 200:
+            self.hedger.record_latency(data['max_tokens'], time.time() - start_time)
+        return response
+
+    async def _post(self, headers: Dict, data: Dict) -> httpx.Response:
+        """发出一次请求；启用对冲且延迟样本足够时，超过 p95 仍未返回则再发一份，先成功者胜出"""
+        hedger = self.hedger
+        breaker = self.circuit_breaker
+        delay = hedger.plan(data['max_tokens']) if Config.use_hedged_requests() else None
+        if delay is None or (breaker and breaker.state != CircuitBreaker.CLOSED):
+            return await self._send(headers, data)
+
+        primary = asyncio.ensure_future(self._send(headers, data))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not hedger.try_hedge():
+            return await primary
+
+        hedge = asyncio.ensure_future(self._send(headers, data))
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None and t.result().status_code == 200), None)
+                if winner is None and pending:
+                    continue
+                winner = winner or next(iter(done))
+                if winner is hedge:
+                    hedger.record_hedge_win()
+                return winner.result()
+        finally:
+            # 取消落败的请求，并等它归还出站名额与并发信号量
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # AsyncClient 绑定事件循环，在共享循环内首次使用时创建
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.runtime.max_concurrency,
+                    max_keepalive_connections=HTTP_POOL_MAXSIZE
+                )
+            )
+        return self._client
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    @traced('deepseek.chat')
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        response_format: Optional[Dict] = None
+    ) -> Dict:
+        """
+        异步调用 DeepSeek Chat API（返回结构同 DeepSeekAdapter.chat）
+        """
+        headers = self._headers()
+        data = build_chat_payload(self.model, messages, temperature, max_tokens, response_format=response_format)
+
+        retry_delay = float(RETRY_DELAY_BASE)
+        retry_after = None
+        last_error = None
+        attempt = 0
+        start_time = time.time()
+        # 入口设置了时间预算时，单次请求超时与重试都不超出剩余预算
+        deadline = current_deadline()
+
+        while attempt <= MAX_RETRIES:
+            try:
+                if attempt > 0:
+                    delay = retry_after if retry_after is not None else retry_delay
+                    if deadline and deadline.expired(delay + DEADLINE_MIN_LLM_ATTEMPT):
+                        return failed_chat_result(f"请求时间预算不足，放弃重试: {last_error}", time.time() - start_time)
+                    print(f"[DeepSeek] Retrying async request (Attempt {attempt}/{MAX_RETRIES}) after {delay}s...")
+                    await asyncio.sleep(delay)
+                    retry_delay *= RETRY_BACKOFF_FACTOR
+                elif deadline and deadline.expired(DEADLINE_MIN_LLM_ATTEMPT):
+                    return failed_chat_result("请求时间预算已用尽", time.time() - start_time)
+
+                retry_after = None
+                response = await self._post(headers, data)
+                if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+                response_time = time.time() - start_time
+
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    if attempt < MAX_RETRIES:
+                        last_error = f"API Error: {response.status_code}"
+                        attempt += 1
+                        continue
+                    else:
+                        raise Exception(f"API Error after {MAX_RETRIES} retries: {response.status_code} - {response.text}")
+
+                if response.status_code != 200:
+                    raise Exception(f"API Error: {response.status_code} - {response.text}")
+
+                return parse_chat_response(response.json(), response_time)
+
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt < MAX_RETRIES:
+                    last_error = str(e)
+                    attempt += 1
+                    continue
+                else:
+                    return failed_chat_result(
+                        f"请求超时/连接失败，已重试 {MAX_RETRIES} 次: {str(e)}",
+                        time.time() - start_time
+                    )
+
+            except Exception as e:
+                return failed_chat_result(str(e), time.time() - start_time)
+
+    @traced('deepseek.chat_stream')
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        异步流式调用，逐块产出文本
+
+        首个数据块到达前遇到可重试状态码或连接失败时按退避策略重试；
+        已开始输出后出错则直接抛出，由调用方决定如何处理
+
+        Args:
+            usage: 传入字典时，结束后写入 prompt / completion token 与费用
+        """
+        headers = self._headers()
+        data = build_chat_payload(self.model, messages, temperature, max_tokens, stream=True)
+
+        breaker = self.circuit_breaker
+        deadline = current_deadline()
+        retry_delay = float(RETRY_DELAY_BASE)
+        retry_after = None
+        attempt = 0
+
+        while True:
+            if attempt > 0:
+                delay = retry_after if retry_after is not None else retry_delay
+                if deadline and deadline.expired(delay + DEADLINE_MIN_LLM_ATTEMPT):
+                    raise TimeoutError("请求时间预算不足，放弃重试")
+                print(f"[DeepSeek] Retrying stream (Attempt {attempt}/{MAX_RETRIES}) after {delay}s...")
+                await asyncio.sleep(delay)
+                retry_delay *= RETRY_BACKOFF_FACTOR
+
+            started = False
+            retry_after = None
+            if breaker:
+                breaker.check()
+            try:
+                async with self._governed() as permit, self.runtime.slot():
+                    async with self._get_client().stream(
+                        'POST', self.base_url, headers=headers, json=data, timeout=self._request_timeout()
+                    ) as response:
+                        if breaker:
+                            if response.status_code >= 500:
+                                breaker.record_failure()
+                            else:
+                                breaker.record_success()
+                        if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            permit.throttled(retry_after)
+                        if response.status_code in RETRYABLE_STATUS_CODES and attempt < MAX_RETRIES:
+                            attempt += 1
+                            continue
+                        if response.status_code != 200:
+                            body = (await response.aread()).decode('utf-8', errors='replace')
+                            raise Exception(f"API Error: {response.status_code} - {body}")
+
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            is_done, content, chunk_usage = parse_stream_line(line)
+                            if is_done:
+                                break
+                            if chunk_usage:
+                                apply_stream_usage(usage, chunk_usage)
+                            if content:
+                                started = True
+                                yield content
+                        return
+
+            except (httpx.TimeoutException, httpx.TransportError):
+                if breaker:
+                    breaker.record_failure()
+                if started or attempt >= MAX_RETRIES:
+                    raise
+                attempt += 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_adapters: Dict[str, AsyncDeepSeekAdapter] = {}
+_adapters_lock = threading.Lock()
+
+
+def get_async_deepseek_adapter(api_key: str) -> AsyncDeepSeekAdapter:
+    """按 API Key 复用 AsyncDeepSeekAdapter（共享事件循环与连接池）"""
+    adapter = _adapters.get(api_key)
+    if adapter is None:
+        with _adapters_lock:
+            adapter = _adapters.get(api_key)
+            if adapter is None:
+                adapter = AsyncDeepSeekAdapter(api_key)
+                _adapters[api_key] = adapter
+    return adapter
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Async Runtime
+进程级共享的异步事件循环
+
+Flask 视图与后台线程都是同步代码，LLM 调用却以等待网络为主：
+- 单个守护线程常驻一个 asyncio 事件循环，所有异步 LLM 请求都在这里并发执行
+- 同步调用方通过 run() 提交协程并阻塞等待结果，无需为每个请求新建线程池
+- 全局信号量限制同时在途的 LLM 请求数
+"""
+
+import asyncio
+import threading
+import concurrent.futures
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from .constants import LLM_RUN_TIMEOUT
+
+
+class AsyncRuntime:
+    """后台线程中的常驻事件循环"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="llm-event-loop", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._completed = 0
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        # 信号量在事件循环线程中创建，只在该循环内使用
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        self.loop.run_forever()
+
+    def run(self, coro, timeout: Optional[float] = LLM_RUN_TIMEOUT):
+        """在共享事件循环中执行协程，阻塞当前（同步）线程直到完成"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncRuntime.run() 不能在事件循环线程内调用，请直接 await")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """提交协程但不等待，返回可取消的 Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个全局并发名额（流式请求在整个读取期间持有）"""
+        async with self.semaphore:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            try:
+                yield
+            finally:
+                self._in_flight -= 1
+                self._completed += 1
+
+    async def limit(self, coro):
+        """在全局并发上限内执行协程（仅统计真正占用名额的阶段）"""
+        async with self.slot():
+            return await coro
+
+    def get_metrics(self) -> Dict:
+        # 计数只在事件循环线程中修改，这里读取快照即可
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self._in_flight,
+            'peak_in_flight': self._peak_in_flight,
+            'completed': self._completed,
+            'pending_tasks': len(asyncio.all_tasks(self.loop)) if self.loop.is_running() else 0,
+        }
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> AsyncRuntime:
+    """获取进程级共享的异步运行时"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                from .config import Config
+                _runtime = AsyncRuntime(Config.get_llm_max_concurrency())
+    return _runtime
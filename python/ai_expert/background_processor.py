@@ -6,21 +6,28 @@ Background Processor
 
 import threading
 import time
-import json
 import logging
 from typing import Optional
 from .message_queue_manager import MessageQueueManager
 from .enhanced_reply_generator import EnhancedReplyGenerator
 from .database import AIExpertDatabase
 from .knowledge_base_manager import KnowledgeBaseManager
+from .compiled_prompt_cache import get_compiled_prompt_cache
+from .pregeneration import get_pregeneration_registry
+from .llm_governor import llm_lane
+from .deadline import request_deadline
+from .constants import LLM_LANE_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
 class BackgroundProcessor:
-    def __init__(self, db: AIExpertDatabase, queue_manager: MessageQueueManager, generator: EnhancedReplyGenerator):
+    def __init__(self, db: AIExpertDatabase, queue_manager: MessageQueueManager, generator: EnhancedReplyGenerator,
+                 generator_service=None):
         self.db = db
         self.queue_manager = queue_manager
         self.generator = generator
+        # 提供服务时每条任务都取当前生成器，API Key 更新后自动切换
+        self.generator_service = generator_service
         self.running = False
         self._thread: Optional[threading.Thread] = None
 
@@ -72,32 +79,33 @@ class BackgroundProcessor:
         session_id = task['session_id']
         message = task['raw_message']
 
+        # 领取任务（交互式 /generate 可能已经领取并生成）
+        if not self.queue_manager.claim_task(task_id):
+            return
+        # 登记为生成中：交互式 /generate 等待这份结果，而不是重复调用
+        registry = get_pregeneration_registry()
+        pending = registry.begin(session_id, active_prompt['id'], message)
+        result = None
+
         try:
-            # 更新状态为 PROCESSING
-            self.queue_manager.update_status(task_id, 'PROCESSING')
 
             # 构造配置
-            system_prompt_config = {
-                'role_definition': active_prompt.get('role_definition', ''),
-                'business_logic': active_prompt.get('business_logic', ''),
-                'tone_style': active_prompt.get('tone_style', 'professional'),
-                'reply_length': active_prompt.get('reply_length', 'medium'),
-                'emoji_usage': active_prompt.get('emoji_usage', 'occasional'),
-                'knowledge_base': json.loads(active_prompt.get('knowledge_base', '[]')),
-                'forbidden_words': json.loads(active_prompt.get('forbidden_words', '[]'))
-            }
+            system_prompt_config = get_compiled_prompt_cache(self.db).get_config(active_prompt)
 
             # 获取历史记录
             history = self.db.get_recent_messages(session_id, limit=5)
 
-            # 调用生成器
-            result = self.generator.generate_three_versions(
-                session_id=session_id,
-                customer_message=message,
-                system_prompt_config=system_prompt_config,
-                prompt_id=active_prompt['id'],
-                conversation_history=history
-            )
+            # 调用生成器（后台通道：交互式请求优先获得出站名额）
+            with llm_lane(LLM_LANE_BACKGROUND):
+                generator = self.generator_service.get() if self.generator_service else self.generator
+                result = generator.generate_three_versions(
+                    session_id=session_id,
+                    customer_message=message,
+                    system_prompt_config=system_prompt_config,
+                    prompt_id=active_prompt['id'],
+                    conversation_history=history,
+                    deadline=request_deadline('background')
+                )
 
             if result['success']:
                 # 更新状态为 COMPLETED 并存储建议
@@ -118,3 +126,5 @@ class BackgroundProcessor:
         except Exception as e:
             logger.error(f"[Background Error] Failed to process task {task_id}: {e}")
             self.queue_manager.update_status(task_id, 'FAILED', error_msg=str(e))
+        finally:
+            registry.complete(pending, result)
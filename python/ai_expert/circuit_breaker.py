@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit Breaker
+DeepSeek 熔断器
+
+服务商故障时，每次调用都要耗尽重试与超时（最坏约两分钟），请求线程会全部堆积在上面：
+- closed：正常放行；连续失败（5xx / 超时 / 连接失败）达到阈值后熔断
+- open：直接拒绝，调用方快速失败；经过恢复时间后进入半开
+- half_open：只放行少量探测请求，成功则恢复，失败则重新熔断
+"""
+
+import time
+import threading
+from typing import Dict, Optional
+
+from .constants import LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RECOVERY_TIMEOUT, LLM_BREAKER_HALF_OPEN_CALLS
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝请求"""
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = LLM_BREAKER_RECOVERY_TIMEOUT,
+        half_open_max_calls: int = LLM_BREAKER_HALF_OPEN_CALLS
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_at = 0.0
+        self._probes = 0
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _maybe_half_open(self, now: float):
+        # 调用方持有 self._lock
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_at = now
+            self._probes = 0
+            print("[CircuitBreaker] Half-open, probing DeepSeek...")
+
+    def allow(self) -> bool:
+        """是否放行一次请求（半开状态下占用一个探测名额）"""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == self.OPEN:
+                self._stats['rejected'] += 1
+                return False
+            if self._state == self.HALF_OPEN:
+                # 探测请求迟迟没有结果（例如被取消）时，过了恢复时间再放行新的探测
+                if self._probes >= self.half_open_max_calls and now - self._half_open_at < self.recovery_timeout:
+                    self._stats['rejected'] += 1
+                    return False
+                if self._probes >= self.half_open_max_calls:
+                    self._half_open_at = now
+                    self._probes = 0
+                self._probes += 1
+            return True
+
+    def check(self):
+        """不放行时抛出 CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError("DeepSeek 服务异常，熔断中，请稍后重试")
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                self._state = self.CLOSED
+                print("[CircuitBreaker] Closed, DeepSeek recovered")
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats['opened'] += 1
+                print(f"[CircuitBreaker] Open after {self._consecutive_failures} consecutive failures")
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            retry_in = self.recovery_timeout - (now - self._opened_at) if self._state == self.OPEN else 0.0
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'retry_in': round(max(0.0, retry_in), 3),
+                **self._stats,
+            }
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    """获取进程级共享的熔断器（LLM_CIRCUIT_BREAKER=0 时返回 None）"""
+    global _breaker
+    from .config import Config
+    if not Config.use_circuit_breaker():
+        return None
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=Config.get_breaker_failure_threshold(),
+                    recovery_timeout=Config.get_breaker_recovery_timeout()
+                )
+    return _breaker
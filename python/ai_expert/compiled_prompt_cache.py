@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled Prompt Cache
+AI 专家 System Prompt 预编译缓存
+
+System Prompt 的静态部分（角色、业务、话术、知识库、禁忌、输出要求）只取决于 ai_prompts 中的一行：
+- 按 (prompt_id, updated_at) 缓存解析后的配置与渲染好的静态章节，每次生成只需构建动态部分
+- update_prompt / full_update_prompt_transactional / activate_prompt / delete_prompt 通过
+  数据库的变更回调主动失效；其他进程改动配置时 updated_at 变化，键自然不再命中
+- 每个数据库实例一份缓存，容量有上限，超出后按最近使用时间淘汰
+"""
+
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .constants import COMPILED_PROMPT_CACHE_SIZE
+from .enhanced_prompt_builder import EnhancedPromptBuilder
+
+
+def parse_prompt_config(prompt: Dict) -> Dict:
+    """解析 ai_prompts 行（将 JSON 字符串转换为列表），得到生成所需的配置"""
+    def _load(raw):
+        try:
+            return json.loads(raw) if isinstance(raw, str) else raw
+        except (TypeError, ValueError):
+            return []
+
+    return {
+        'role_definition': prompt.get('role_definition', ''),
+        'business_logic': prompt.get('business_logic', ''),
+        'tone_style': prompt.get('tone_style', 'professional'),
+        'reply_length': prompt.get('reply_length', 'medium'),
+        'emoji_usage': prompt.get('emoji_usage', 'occasional'),
+        'knowledge_base': _load(prompt.get('knowledge_base', '[]')) or [],
+        'forbidden_words': _load(prompt.get('forbidden_words', '[]')) or []
+    }
+
+
+class CompiledPromptCache:
+    """预编译 System Prompt 缓存（内存 LRU）"""
+
+    def __init__(self, max_size: int = COMPILED_PROMPT_CACHE_SIZE):
+        self.max_size = max_size
+        self._builder = EnhancedPromptBuilder()
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()   # (prompt_id, updated_at) -> config
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get_config(self, prompt: Dict) -> Dict:
+        """
+        获取 ai_prompts 行对应的生成配置
+
+        返回值带有 compiled_static_prompt（预渲染的静态章节），
+        EnhancedPromptBuilder.build_stable_prompt 会直接复用。返回的是副本，调用方可以修改。
+        """
+        key = (prompt.get('id'), str(prompt.get('updated_at')))
+        with self._lock:
+            config = self._entries.get(key)
+            if config is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return dict(config)
+            self._stats['misses'] += 1
+
+        config = parse_prompt_config(prompt)
+        config['compiled_static_prompt'] = self._builder.build_static_prompt(config)
+
+        with self._lock:
+            # 同一专家的旧版本不会再被命中
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[stale]
+            self._entries[key] = config
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return dict(config)
+
+    def invalidate(self, prompt_id: Optional[int] = None):
+        """失效指定专家的缓存；prompt_id 为 None 时清空"""
+        with self._lock:
+            keys = [k for k in self._entries if prompt_id is None or k[0] == prompt_id]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': round(self._stats['hits'] / lookups * 100, 2) if lookups else 0,
+                **self._stats
+            }
+
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def get_compiled_prompt_cache(db) -> CompiledPromptCache:
+    """获取数据库实例对应的预编译缓存（首次获取时注册配置变更回调）"""
+    cache = _caches.get(db)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db)
+            if cache is None:
+                cache = CompiledPromptCache()
+                db.add_prompt_change_listener(cache.invalidate)
+                _caches[db] = cache
+    return cache
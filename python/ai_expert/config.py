@@ -58,6 +58,127 @@ class Config:
 
         return ''
     
+    @staticmethod
+    def get_deepseek_base_url() -> str:
+        """DeepSeek API 根地址（兼容 OpenAI 接口的服务均可，如本地 deepseek_stub_server.py）"""
+        from ai_expert.constants import DEEPSEEK_BASE_URL
+        return os.environ.get('DEEPSEEK_BASE_URL', DEEPSEEK_BASE_URL).rstrip('/')
+    
+    @staticmethod
+    def get_http_pool_maxsize() -> int:
+        """每个主机保持的最大 HTTP 连接数（应不小于并发生成数）"""
+        from ai_expert.constants import HTTP_POOL_MAXSIZE
+        return int(os.environ.get('HTTP_POOL_MAXSIZE', HTTP_POOL_MAXSIZE))
+    
+    @staticmethod
+    def warm_up_deepseek() -> bool:
+        """启动时是否预先建立到 DeepSeek 的连接"""
+        return os.environ.get('DEEPSEEK_WARMUP', '1') == '1'
+    
+    @staticmethod
+    def get_generation_mode() -> str:
+        """多版本生成模式：single（一次调用，JSON 输出）/ per_style（每个版本单独调用）"""
+        from ai_expert.constants import AI_GENERATION_MODES
+        mode = os.environ.get('AI_GENERATION_MODE', 'single').strip().lower()
+        return mode if mode in AI_GENERATION_MODES else 'single'
+    
+    @staticmethod
+    def use_stage_pipeline() -> bool:
+        """生成前的准备阶段是否按依赖关系并发执行（0 表示按顺序串行执行）"""
+        return os.environ.get('AI_STAGE_PIPELINE', '1') == '1'
+    
+    @staticmethod
+    def get_trace_exporter() -> str:
+        """OpenTelemetry span 导出方式：none / console / file"""
+        from ai_expert.constants import TRACE_EXPORTERS
+        exporter = os.environ.get('AI_TRACE_EXPORTER', 'none').strip().lower()
+        return exporter if exporter in TRACE_EXPORTERS else 'none'
+    
+    @staticmethod
+    def get_trace_file() -> str:
+        """file 导出时写入的 JSON Lines 文件"""
+        from ai_expert.constants import TRACE_FILE
+        return os.environ.get('AI_TRACE_FILE', TRACE_FILE)
+    
+    @staticmethod
+    def use_async_llm() -> bool:
+        """多版本生成是否走异步扇出（关闭时回退到线程池）"""
+        return os.environ.get('AI_ASYNC_LLM', '1') == '1'
+    
+    @staticmethod
+    def get_llm_max_concurrency() -> int:
+        """全局同时在途的 LLM 请求上限"""
+        from ai_expert.constants import LLM_MAX_CONCURRENCY
+        return int(os.environ.get('LLM_MAX_CONCURRENCY', LLM_MAX_CONCURRENCY))
+    
+    @staticmethod
+    def use_llm_governor() -> bool:
+        """是否通过全局调控器（自适应并发 + 优先级通道）发出 LLM 请求"""
+        return os.environ.get('LLM_GOVERNOR', '1') == '1'
+    
+    @staticmethod
+    def get_llm_governor_max_limit() -> int:
+        """调控器并发上限可增长到的最大值"""
+        from ai_expert.constants import LLM_GOVERNOR_MAX_LIMIT
+        return int(os.environ.get('LLM_GOVERNOR_MAX_LIMIT', LLM_GOVERNOR_MAX_LIMIT))
+    
+    @staticmethod
+    def use_circuit_breaker() -> bool:
+        """DeepSeek 连续失败时是否熔断（快速失败 + 半开探测）"""
+        return os.environ.get('LLM_CIRCUIT_BREAKER', '1') == '1'
+    
+    @staticmethod
+    def get_breaker_failure_threshold() -> int:
+        from ai_expert.constants import LLM_BREAKER_FAILURE_THRESHOLD
+        return int(os.environ.get('LLM_BREAKER_FAILURE_THRESHOLD', LLM_BREAKER_FAILURE_THRESHOLD))
+    
+    @staticmethod
+    def get_breaker_recovery_timeout() -> float:
+        from ai_expert.constants import LLM_BREAKER_RECOVERY_TIMEOUT
+        return float(os.environ.get('LLM_BREAKER_RECOVERY_TIMEOUT', LLM_BREAKER_RECOVERY_TIMEOUT))
+    
+    @staticmethod
+    def use_hedged_requests() -> bool:
+        """请求超过 p95 延迟仍未返回时是否再发一份（先返回者胜出）"""
+        return os.environ.get('LLM_HEDGING', '0') == '1'
+    
+    @staticmethod
+    def get_request_deadline(endpoint: str) -> float:
+        """入口的端到端时间预算（秒），AI_DEADLINE_<ENDPOINT> 覆盖默认值，0 表示不限"""
+        from ai_expert.constants import REQUEST_DEADLINES
+        return float(os.environ.get(f"AI_DEADLINE_{endpoint.upper()}", REQUEST_DEADLINES.get(endpoint, 0)))
+    
+    @staticmethod
+    def use_llm_cache() -> bool:
+        """是否缓存关键词提取、语义相似度等辅助 LLM 调用"""
+        return os.environ.get('LLM_CACHE', '1') == '1'
+    
+    @staticmethod
+    def use_llm_keywords() -> bool:
+        """上下文选择的检索关键词是否调用 DeepSeek 提取（默认本地提取）"""
+        return os.environ.get('AI_LLM_KEYWORDS', '0') == '1'
+    
+    @staticmethod
+    def use_reply_cache() -> bool:
+        """是否缓存重复客户问题的三个版本回复"""
+        return os.environ.get('AI_REPLY_CACHE', '1') == '1'
+    
+    @staticmethod
+    def get_reply_cache_ttl() -> float:
+        from ai_expert.constants import REPLY_CACHE_TTL
+        return float(os.environ.get('AI_REPLY_CACHE_TTL', REPLY_CACHE_TTL))
+    
+    @staticmethod
+    def get_reply_cache_semantic_threshold() -> float:
+        """回复缓存语义层的最低余弦相似度，0 表示只用精确层"""
+        from ai_expert.constants import REPLY_CACHE_SEMANTIC_THRESHOLD
+        return float(os.environ.get('AI_REPLY_CACHE_SEMANTIC_THRESHOLD', REPLY_CACHE_SEMANTIC_THRESHOLD))
+    
+    @staticmethod
+    def use_rate_limit() -> bool:
+        """是否对 API 做按客户端的频率限制"""
+        return os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    
     # ========== CORS 配置 ==========
     @staticmethod
     def get_allowed_origins() -> list:
@@ -82,6 +203,29 @@ class Config:
         """获取监控匹配模式"""
         return os.environ.get('MONITOR_MATCH_MODE', 'contains')
     
+    # ========== 知识库 (RAG) 配置 ==========
+    @staticmethod
+    def use_embedding_worker() -> bool:
+        """是否在独立进程中运行向量化 / OCR"""
+        return os.environ.get('RAG_EMBEDDING_WORKER', '0') == '1'
+    
+    @staticmethod
+    def preload_ocr() -> bool:
+        """是否在启动时预热 OCR 模型"""
+        return os.environ.get('RAG_OCR_PRELOAD', '0') == '1'
+    
+    @staticmethod
+    def get_ocr_max_width() -> int:
+        """OCR 前图片缩放的最大宽度 (像素)"""
+        from ai_expert.constants import OCR_MAX_WIDTH
+        return int(os.environ.get('RAG_OCR_MAX_WIDTH', OCR_MAX_WIDTH))
+    
+    @staticmethod
+    def get_ocr_tile_height() -> int:
+        """长截图分块识别的块高度 (像素)"""
+        from ai_expert.constants import OCR_TILE_HEIGHT
+        return int(os.environ.get('RAG_OCR_TILE_HEIGHT', OCR_TILE_HEIGHT))
+    
     # ========== 日志配置 ==========
     @staticmethod
     def get_log_level() -> str:
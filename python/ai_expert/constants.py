@@ -27,17 +27,128 @@ AI_TEMPERATURE_AGGRESSIVE = 0.8      # 激进版温度
 AI_TEMPERATURE_CONSERVATIVE = 0.3    # 保守版温度
 AI_TEMPERATURE_PROFESSIONAL = 0.5    # 专业版温度
 AI_MODEL_DEFAULT = "deepseek-chat"   # 默认模型
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"  # DeepSeek API 根地址（压测时可指向本地桩服务）
+AI_VERSION_MAX_TOKENS = 600          # 单个版本回复的最大 token 数
+AI_MULTI_VERSION_MAX_TOKENS = 1800   # 一次生成全部版本时的最大 token 数
+AI_GENERATION_MODES = ('single', 'per_style')  # single: 一次调用输出全部版本; per_style: 每个版本单独调用
+GENERATION_MAX_WORKERS = 48          # 逐版本生成（线程模式）共享线程池大小
+
+# ========== HTTP 连接池 ==========
+HTTP_POOL_CONNECTIONS = 4            # 缓存的主机连接池数量
+HTTP_POOL_MAXSIZE = 16               # 每个主机保持的最大连接数
+
+# ========== 异步 LLM 调用 ==========
+LLM_MAX_CONCURRENCY = 200            # 全局同时在途的 LLM 请求上限
+LLM_RUN_TIMEOUT = 120                # 同步调用方等待异步批次的最长时间 (秒)
+
+# ========== 出站 LLM 流量调控 ==========
+LLM_LANE_INTERACTIVE = 'interactive' # 交互式生成（坐席正在等待）
+LLM_LANE_BACKGROUND = 'background'   # 后台预生成 / 批量生成
+LLM_LANES = (LLM_LANE_INTERACTIVE, LLM_LANE_BACKGROUND)  # 按优先级从高到低
+LLM_GOVERNOR_INITIAL_LIMIT = 16      # 初始并发上限
+LLM_GOVERNOR_MIN_LIMIT = 1           # 并发上限下限
+LLM_GOVERNOR_MAX_LIMIT = 64          # 并发上限上限
+LLM_GOVERNOR_DECREASE_FACTOR = 0.5   # 遇到限流时上限的收缩系数
+LLM_GOVERNOR_DECREASE_COOLDOWN = 1.0 # 两次收缩的最小间隔 (秒)，同一波限流只收缩一次
+LLM_GOVERNOR_BACKGROUND_SHARE = 0.5  # 后台通道最多占用的上限比例
+LLM_GOVERNOR_QUEUE_TIMEOUT = 60      # 排队等待名额的最长时间 (秒)
+LLM_GOVERNOR_WAIT_SAMPLES = 1000     # 每个通道保留的最近排队耗时样本数
+LLM_THROTTLE_STATUS_CODES = (429, 503)  # 视为限流信号的 HTTP 状态码
+LLM_RETRY_AFTER_MAX = 60             # Retry-After 的最大采信值 (秒)
+
+# ========== 熔断与对冲请求 ==========
+LLM_BREAKER_FAILURE_THRESHOLD = 5    # 连续失败多少次后熔断
+LLM_BREAKER_RECOVERY_TIMEOUT = 30    # 熔断后多久进入半开探测 (秒)
+LLM_BREAKER_HALF_OPEN_CALLS = 1      # 半开状态允许同时进行的探测请求数
+LLM_LATENCY_WINDOW = 200             # 每类请求保留的最近延迟样本数
+LLM_HEDGE_MIN_SAMPLES = 20           # 样本数达到后才启用对冲
+LLM_HEDGE_PERCENTILE = 0.95          # 超过该分位延迟仍未返回时发出对冲请求
+LLM_HEDGE_MIN_DELAY = 0.5            # 对冲等待时间下限 (秒)
+LLM_HEDGE_MAX_RATIO = 0.1            # 对冲请求占总请求数的比例上限
+LLM_HEDGE_MAX_WORKERS = 32           # 同步对冲线程池大小（只运行对冲请求，原请求在调用方线程中发出）
+
+# ========== 请求时间预算 ==========
+REQUEST_DEADLINES = {                # 各入口的端到端时间预算 (秒)，0 表示不限
+    'generate': 20,
+    'generate_stream': 40,
+    'bulk_generate': 60,
+    'background': 90,
+}
+DEADLINE_GENERATION_RESERVE = 8      # 为生成预留的预算，剩余不足时跳过可选的 LLM 辅助步骤 (秒)
+DEADLINE_MIN_LLM_ATTEMPT = 1.0       # 剩余预算低于该值时不再发起 / 重试 LLM 请求 (秒)
+FALLBACK_SNIPPET_CHARS = 200         # 兜底回复中检索片段的最大长度
+FALLBACK_REPLY = "您好，您的问题我已收到，正在为您确认具体信息，请稍等片刻~"  # 没有任何可用兜底内容时的回复
+
+# ========== 生成前准备阶段 ==========
+PIPELINE_MAX_WORKERS = 32            # 阶段线程池大小（所有请求共享）
+PIPELINE_STAGE_TIMEOUTS = {          # 可选阶段的超时 (秒)，超时后使用默认值继续
+    'memory': 3,
+    'preset': 10,
+    'knowledge': 10,
+    'golden': 3,
+}
+
+# ========== 本地关键词提取 ==========
+KEYWORD_NGRAM_RANGE = (2, 4)         # 候选词的字符 n-gram 长度范围
+KEYWORD_TOP_K = 5                    # 每条消息最多提取的关键词数
+KEYWORD_LEXICON_REFRESH_INTERVAL = 600  # 领域词表的后台刷新间隔 (秒)
+KEYWORD_LEXICON_MAX_CHUNKS = 2000    # 构建词表时最多读取的知识库分块数（最新的）
+KEYWORD_RULE_BOOST = 3.0             # 关键词规则中的词的得分倍数
+KEYWORD_UNSEEN_PENALTY = 0.3         # 领域语料中从未出现的候选词的得分倍数
+KEYWORD_SEEN_FILTER_BITS = 1 << 24   # 记录只出现过一次的 n-gram 的位图大小 (2MB)
+
+# ========== 回复缓存 ==========
+REPLY_CACHE_TTL = 3600               # 缓存回复的有效期 (秒)
+REPLY_CACHE_MAX_ENTRIES = 2000       # 每个数据库实例最多缓存的问题数
+REPLY_CACHE_MAX_MESSAGE_CHARS = 60   # 只缓存不超过该长度的消息（归一化后）
+REPLY_CACHE_TOPIC_TURNS = 3          # 会话话题取最近几条客户消息的关键词
+REPLY_CACHE_SEMANTIC_THRESHOLD = 0.92  # 语义层的最低余弦相似度
+
+# ========== 后台预生成复用 ==========
+PREGENERATION_TTL = 600              # 预生成结果的有效期，超过后交互式请求不再复用 (秒)
+PREGENERATION_MAX_ENTRIES = 500      # 登记处最多保留的结果数
+PREGENERATION_WAIT_TIMEOUT = 30      # 等待生成中的后台结果的最长时间 (秒)
+
+# ========== 链路追踪 ==========
+TRACE_EXPORTERS = ('none', 'console', 'file')  # OpenTelemetry span 导出方式
+TRACE_FILE = "ai_traces.jsonl"       # file 导出时写入的文件
+TRACE_LATENCY_WINDOW = 1000          # 每个 span 名称保留的最近耗时样本数
 
 # ========== 知识库相关 ==========
 KB_CHUNK_SIZE = 500                  # 知识库分块大小
-KB_CHUNK_OVERLAP = 50                # 知识库分块重叠
+KB_CHUNK_OVERLAP = 100               # 知识库分块重叠
 KB_TOP_K_RESULTS = 3                 # 知识库检索返回数量
 KB_SIMILARITY_THRESHOLD = 0.7        # 相似度阈值
+EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"  # 默认向量模型
+KB_SUMMARY_QUERY_MESSAGES = 3        # 对话摘要查询取最近几条客户消息
+KB_SUMMARY_QUERY_MAX_CHARS = 200     # 对话摘要查询最大长度
+
+# ========== 向量索引重建 ==========
+REEMBED_BATCH_SIZE = 64              # 每批重新编码的分块数
+REEMBED_BATCH_PAUSE = 0.2            # 批次之间的休眠，避免占满 CPU / 工作进程 (秒)
+
+# ========== OCR 图片识别 ==========
+OCR_LANGUAGES = ['ch_sim', 'en']     # EasyOCR 识别语言
+OCR_MAX_WIDTH = 1600                 # 宽度超过该值时等比缩小 (像素)
+OCR_TILE_HEIGHT = 1600               # 长截图按该高度分块识别 (像素)
+OCR_TILE_OVERLAP = 100               # 相邻分块的重叠高度，避免切断文字行 (像素)
+
+# ========== 向量化工作进程 (秒) ==========
+EMBEDDING_WORKER_START_TIMEOUT = 30      # 子进程启动并连接的最长等待
+EMBEDDING_WORKER_REQUEST_TIMEOUT = 300   # 单次编码 / OCR 请求超时 (首次需加载模型)
+EMBEDDING_WORKER_HEALTH_INTERVAL = 15    # 心跳间隔
+EMBEDDING_WORKER_MAX_MISSED_PINGS = 3    # 连续无响应次数达到后重启
 
 # ========== 缓存相关 (秒) ==========
 CACHE_TTL_SHORT = 60                 # 短期缓存 1 分钟
 CACHE_TTL_MEDIUM = 300               # 中期缓存 5 分钟
 CACHE_TTL_LONG = 3600                # 长期缓存 1 小时
+LLM_CACHE_TTL = 7 * 24 * 3600        # 辅助 LLM 调用结果缓存 7 天
+LLM_CACHE_MEMORY_SIZE = 2048         # 内存 LRU 最大条目数
+LLM_CACHE_MAX_ROWS = 50000           # SQLite 中保留的最大条目数
+LLM_CACHE_PRUNE_INTERVAL = 500       # 每写入多少条清理一次过期 / 超量条目
+COMPILED_PROMPT_CACHE_SIZE = 64      # 预编译 System Prompt 缓存的最大专家数
+CONFIG_CACHE_CHECK_INTERVAL = 1.0    # AI 专家配置缓存检查跨进程变更的间隔
 
 # ========== 文件上传 ==========
 MAX_UPLOAD_SIZE_MB = 10              # 最大上传文件大小 (MB)
@@ -51,4 +162,6 @@ DB_TIMEOUT = 30                      # 数据库超时
 MAX_RETRIES = 3                      # 最大重试次数
 RETRY_DELAY_BASE = 1                 # 重试基础延迟 (秒)
 RETRY_DELAY_MAX = 30                 # 重试最大延迟 (秒)
+RETRY_BACKOFF_FACTOR = 2             # 重试延迟倍增系数
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)  # 可重试的 HTTP 状态码
 
@@ -8,25 +8,31 @@ API 费用计算器
 # 参考: https://platform.deepseek.com/api-docs/pricing/
 DEEPSEEK_PRICING = {
     "deepseek-chat": {
-        "input": 0.001,   # ¥0.001 / 1K tokens
-        "output": 0.002,  # ¥0.002 / 1K tokens
+        "input": 0.001,              # ¥0.001 / 1K tokens（缓存未命中）
+        "input_cache_hit": 0.00025,  # ¥0.00025 / 1K tokens（命中服务端上下文缓存，约为未命中的 1/4）
+        "output": 0.002,             # ¥0.002 / 1K tokens
     }
 }
 
-def calculate_deepseek_cost(prompt_tokens: int, completion_tokens: int) -> float:
+def calculate_deepseek_cost(prompt_tokens: int, completion_tokens: int, cache_hit_tokens: int = 0) -> float:
     """
     计算 DeepSeek API 调用费用
     
     Args:
-        prompt_tokens: 输入 token 数
+        prompt_tokens: 输入 token 数（含缓存命中部分）
         completion_tokens: 输出 token 数
+        cache_hit_tokens: 输入中命中上下文缓存的 token 数（usage.prompt_cache_hit_tokens）
     
     Returns:
         费用（元），保留4位小数
     """
     pricing = DEEPSEEK_PRICING["deepseek-chat"]
     
-    input_cost = (prompt_tokens / 1000) * pricing["input"]
+    cache_hit_tokens = min(cache_hit_tokens, prompt_tokens)
+    input_cost = (
+        ((prompt_tokens - cache_hit_tokens) / 1000) * pricing["input"]
+        + (cache_hit_tokens / 1000) * pricing["input_cache_hit"]
+    )
     output_cost = (completion_tokens / 1000) * pricing["output"]
     
     total_cost = input_cost + output_cost
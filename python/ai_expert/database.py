@@ -6,17 +6,31 @@ AI Expert Database Module
 
 import sqlite3
 import json
+import time
 import threading
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from contextlib import contextmanager
 import os
 
+from .constants import CONFIG_CACHE_CHECK_INTERVAL
+
 class AIExpertDatabase:
     """数据库管理类 - 每次操作创建新连接以避免连接关闭问题"""
 
     def __init__(self, db_path: str = "ai_expert.db"):
         self.db_path = db_path
+        self._prompt_change_listeners = []
+
+        # AI 专家配置缓存：所有 ai_prompts 行 + 当前激活的 ID
+        self._config_lock = threading.Lock()
+        self._prompt_rows: Dict[int, Dict] = {}
+        self._active_prompt_id: Optional[int] = None
+        self._config_loaded = False
+        self._config_generation = 0          # 每次失效递增，防止并发加载写回旧数据
+        self._config_version = None          # (data_version, config_version.version)
+        self._next_version_check = 0.0
+        self._version_conn = None            # 常驻连接：PRAGMA data_version 只对其他连接的提交变化
         self._init_wal_mode()  # 只在初始化时设置一次 WAL 模式
         self.init_database()
 
@@ -113,11 +127,28 @@ class AIExpertDatabase:
                 is_sent BOOLEAN DEFAULT 0,
                 tokens_used INTEGER DEFAULT 0,
                 cost REAL DEFAULT 0.0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                generation_mode TEXT,
+                llm_calls INTEGER DEFAULT 0,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (prompt_id) REFERENCES ai_prompts(id)
             )
         """)
         
+        # 3b. 流式生成各版本耗时
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ai_suggestion_timings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                suggestion_id INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                ttft REAL,
+                total_time REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (suggestion_id) REFERENCES ai_suggestions(id)
+            )
+        """)
+        
         # 4. 收藏话术表
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS favorite_replies (
@@ -142,6 +173,8 @@ class AIExpertDatabase:
                 prompt_tokens INTEGER,
                 completion_tokens INTEGER,
                 total_tokens INTEGER,
+                prompt_cache_hit_tokens INTEGER DEFAULT 0,
+                prompt_cache_miss_tokens INTEGER DEFAULT 0,
                 estimated_cost REAL,
                 response_time REAL,
                 success BOOLEAN DEFAULT 1,
@@ -270,6 +303,23 @@ class AIExpertDatabase:
             ON message_queue(status)
         """)
 
+        # 13. 配置版本表：ai_prompts 任何写入（包括其他进程）都会递增版本号，用于配置缓存失效
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS config_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO config_version (id, version) VALUES (1, 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_ai_prompts_version_{event.lower()}
+                AFTER {event} ON ai_prompts
+                BEGIN
+                    UPDATE config_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
         conn.commit()
         conn.close()
 
@@ -304,6 +354,27 @@ class AIExpertDatabase:
                 """)
                 print("[OK] cost column added")
             
+            # 多版本生成模式与 token 明细
+            for column, ddl in [
+                ('prompt_tokens', 'INTEGER DEFAULT 0'),
+                ('completion_tokens', 'INTEGER DEFAULT 0'),
+                ('generation_mode', 'TEXT'),
+                ('llm_calls', 'INTEGER DEFAULT 0'),
+            ]:
+                if column not in columns:
+                    print(f"[INFO] Adding {column} column to ai_suggestions table...")
+                    cursor.execute(f"ALTER TABLE ai_suggestions ADD COLUMN {column} {ddl}")
+                    print(f"[OK] {column} column added")
+            
+            # 上下文缓存命中 / 未命中的输入 token
+            cursor.execute("PRAGMA table_info(api_usage_stats)")
+            usage_columns = {row[1] for row in cursor.fetchall()}
+            for column in ('prompt_cache_hit_tokens', 'prompt_cache_miss_tokens'):
+                if column not in usage_columns:
+                    print(f"[INFO] Adding {column} column to api_usage_stats table...")
+                    cursor.execute(f"ALTER TABLE api_usage_stats ADD COLUMN {column} INTEGER DEFAULT 0")
+                    print(f"[OK] {column} column added")
+            
             conn.commit()
         except sqlite3.OperationalError as e:
             print(f"[WARN] Database migration note: {e}")
@@ -340,33 +411,102 @@ class AIExpertDatabase:
         prompt_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
         
         return prompt_id
     
-    def get_active_prompt(self) -> Optional[Dict]:
-        """获取当前激活的配置"""
+    def add_prompt_change_listener(self, callback):
+        """注册 AI 专家配置变更回调：callback(prompt_id)，prompt_id 为 None 表示所有配置都可能变化"""
+        self._prompt_change_listeners.append(callback)
+
+    def _notify_prompt_changed(self, prompt_id: Optional[int] = None):
+        self._invalidate_config_cache()
+        for callback in list(self._prompt_change_listeners):
+            try:
+                callback(prompt_id)
+            except Exception as e:
+                print(f"[DB] Prompt change listener failed: {e}")
+
+    # ---------- 配置缓存 ----------
+
+    def _invalidate_config_cache(self):
+        """本进程写入后立即失效（写穿）"""
+        with self._config_lock:
+            self._config_loaded = False
+            self._config_generation += 1
+
+    def _read_config_version(self):
+        """跨进程失效信号：data_version 未变时不再查询版本表"""
+        if self._version_conn is None:
+            self._version_conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._config_version and self._config_version[0] == data_version:
+            return self._config_version
+        row = self._version_conn.execute("SELECT version FROM config_version WHERE id = 1").fetchone()
+        return (data_version, row[0] if row else 0)
+
+    def _ensure_config_cache(self):
+        """
+        保证配置缓存可用：命中时只是一次时间比较；
+        每隔 CONFIG_CACHE_CHECK_INTERVAL 秒检查一次跨进程版本，版本变化时整表重新加载
+        """
+        now = time.monotonic()
+        if self._config_loaded and now < self._next_version_check:
+            return
+
+        with self._config_lock:
+            if self._config_loaded and now < self._next_version_check:
+                return
+            version = self._read_config_version()
+            if self._config_loaded and version[1] == self._config_version[1]:
+                self._config_version = version
+                self._next_version_check = now + CONFIG_CACHE_CHECK_INTERVAL
+                return
+            generation = self._config_generation
+
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            rows = [dict(row) for row in conn.execute("SELECT * FROM ai_prompts")]
+        finally:
+            conn.close()
 
-        cursor.execute("""
-            SELECT * FROM ai_prompts WHERE is_active = 1 LIMIT 1
-        """)
+        with self._config_lock:
+            if generation != self._config_generation:
+                # 加载期间有写入，本次结果可能已过期，下次访问重新加载
+                return
+            self._prompt_rows = {row['id']: row for row in rows}
+            self._active_prompt_id = next((row['id'] for row in rows if row['is_active']), None)
+            self._config_version = version
+            self._config_loaded = True
+            self._next_version_check = now + CONFIG_CACHE_CHECK_INTERVAL
 
-        row = cursor.fetchone()
-        conn.close()
+    def get_active_prompt(self) -> Optional[Dict]:
+        """获取当前激活的配置（走配置缓存，返回副本）"""
+        self._ensure_config_cache()
+        if not self._config_loaded:
+            return self._query_prompt("SELECT * FROM ai_prompts WHERE is_active = 1 LIMIT 1")
 
-        if row:
-            return dict(row)
-        return None
+        row = self._prompt_rows.get(self._active_prompt_id)
+        return dict(row) if row else None
 
     def get_prompt_by_id(self, prompt_id: int) -> Optional[Dict]:
-        """根据 ID 获取配置"""
+        """根据 ID 获取配置（走配置缓存，返回副本）"""
+        self._ensure_config_cache()
+        if not self._config_loaded:
+            return self._query_prompt("SELECT * FROM ai_prompts WHERE id = ?", (prompt_id,))
+
+        try:
+            row = self._prompt_rows.get(int(prompt_id))
+        except (TypeError, ValueError):
+            return None
+        return dict(row) if row else None
+
+    def _query_prompt(self, sql: str, params: tuple = ()) -> Optional[Dict]:
+        """缓存正在重新加载时直接查库"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT * FROM ai_prompts WHERE id = ?
-        """, (prompt_id,))
+        cursor.execute(sql, params)
 
         row = cursor.fetchone()
         conn.close()
@@ -423,6 +563,7 @@ class AIExpertDatabase:
 
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
 
     def full_update_prompt_transactional(self, prompt_id: int, data: Dict):
         """
@@ -489,6 +630,7 @@ class AIExpertDatabase:
 
             conn.commit()
             print(f"[DB] Full transactional update success for prompt {prompt_id}")
+            self._notify_prompt_changed(prompt_id)
         except Exception as e:
             conn.rollback()
             print(f"[DB ERROR] Transaction failed: {e}")
@@ -512,6 +654,7 @@ class AIExpertDatabase:
 
         conn.commit()
         conn.close()
+        self._notify_prompt_changed()
 
     def delete_prompt(self, prompt_id: int):
         """删除配置"""
@@ -522,6 +665,7 @@ class AIExpertDatabase:
 
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
 
     # ========== 对话历史管理 ==========
 
@@ -831,6 +975,7 @@ class AIExpertDatabase:
         qa_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
 
         return qa_id
 
@@ -854,6 +999,7 @@ class AIExpertDatabase:
         """更新预设问答"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        prompt_id = self._get_preset_qa_prompt_id(cursor, qa_id)
 
         cursor.execute("""
             UPDATE preset_qa
@@ -863,11 +1009,13 @@ class AIExpertDatabase:
 
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
 
     def delete_preset_qa(self, qa_id: int):
         """删除预设问答"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        prompt_id = self._get_preset_qa_prompt_id(cursor, qa_id)
 
         cursor.execute("""
             DELETE FROM preset_qa WHERE id = ?
@@ -875,6 +1023,14 @@ class AIExpertDatabase:
 
         conn.commit()
         conn.close()
+        self._notify_prompt_changed(prompt_id)
+
+    @staticmethod
+    def _get_preset_qa_prompt_id(cursor, qa_id: int) -> Optional[int]:
+        """预设问答所属的配置 ID（记录不存在时为 None，通知所有配置）"""
+        cursor.execute("SELECT prompt_id FROM preset_qa WHERE id = ?", (qa_id,))
+        row = cursor.fetchone()
+        return row['prompt_id'] if row else None
 
     def match_preset_answer(self, prompt_id: int, question: str, deepseek_adapter=None) -> Optional[str]:
         """
@@ -991,6 +1147,8 @@ class AIExpertDatabase:
             
         conn.commit()
         conn.close()
+        # 引用计数决定注入上下文的话术，计数变化也要失效回复缓存
+        self._notify_prompt_changed(prompt_id)
 
     def get_golden_replies(self, prompt_id: int, limit: int = 50) -> List[Dict]:
         """获取金牌话术列表"""
@@ -1021,14 +1179,17 @@ class AIExpertDatabase:
         cursor.execute("""
             INSERT INTO api_usage_stats (
                 prompt_id, model_name, prompt_tokens, completion_tokens,
-                total_tokens, estimated_cost, response_time, success, error_message
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                total_tokens, prompt_cache_hit_tokens, prompt_cache_miss_tokens,
+                estimated_cost, response_time, success, error_message
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             data.get('prompt_id'),
             data.get('model_name', 'deepseek-chat'),
             data.get('prompt_tokens', 0),
             data.get('completion_tokens', 0),
             data.get('total_tokens', 0),
+            data.get('prompt_cache_hit_tokens', 0),
+            data.get('prompt_cache_miss_tokens', 0),
             data.get('estimated_cost', 0.0),
             data.get('response_time', 0.0),
             data.get('success', True),
@@ -1058,6 +1219,8 @@ class AIExpertDatabase:
             SELECT
                 COUNT(*) as requests,
                 COALESCE(SUM(total_tokens), 0) as total_tokens,
+                COALESCE(SUM(prompt_cache_hit_tokens), 0) as prompt_cache_hit_tokens,
+                COALESCE(SUM(prompt_cache_miss_tokens), 0) as prompt_cache_miss_tokens,
                 COALESCE(SUM(estimated_cost), 0.0) as total_cost,
                 COALESCE(AVG(response_time), 0.0) as avg_response_time,
                 SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_requests
@@ -1071,14 +1234,79 @@ class AIExpertDatabase:
         if row:
             result = dict(row)
             result['success_rate'] = (result['successful_requests'] / result['requests'] * 100) if result['requests'] > 0 else 0
+            cached_input = result['prompt_cache_hit_tokens'] + result['prompt_cache_miss_tokens']
+            result['cache_hit_rate'] = (result['prompt_cache_hit_tokens'] / cached_input * 100) if cached_input > 0 else 0
             return result
 
         return {
             'requests': 0,
             'total_tokens': 0,
+            'prompt_cache_hit_tokens': 0,
+            'prompt_cache_miss_tokens': 0,
+            'cache_hit_rate': 0.0,
             'total_cost': 0.0,
             'avg_response_time': 0.0,
             'successful_requests': 0,
             'success_rate': 0.0
         }
 
+    def save_suggestion_timings(self, suggestion_id: int, timings: Dict[str, Dict]):
+        """记录流式生成中各版本的首 token 时间与总耗时（秒）"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany("""
+            INSERT INTO ai_suggestion_timings (suggestion_id, version, ttft, total_time)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (suggestion_id, version, timing.get('ttft'), timing.get('total_time'))
+            for version, timing in timings.items()
+        ])
+
+        conn.commit()
+        conn.close()
+
+    def get_stream_latency_stats(self) -> List[Dict]:
+        """按版本统计流式生成的平均 / 最大首 token 时间与总耗时"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT
+                version,
+                COUNT(*) as samples,
+                AVG(ttft) as avg_ttft,
+                MAX(ttft) as max_ttft,
+                AVG(total_time) as avg_total_time,
+                MAX(total_time) as max_total_time
+            FROM ai_suggestion_timings
+            WHERE ttft IS NOT NULL
+            GROUP BY version
+        """)
+
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def get_generation_mode_stats(self) -> List[Dict]:
+        """按多版本生成模式统计每条建议的平均 token、调用次数与费用"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT
+                generation_mode,
+                COUNT(*) as suggestions,
+                AVG(prompt_tokens) as avg_prompt_tokens,
+                AVG(completion_tokens) as avg_completion_tokens,
+                AVG(llm_calls) as avg_llm_calls,
+                AVG(cost) as avg_cost
+            FROM ai_suggestions
+            WHERE generation_mode IS NOT NULL
+            GROUP BY generation_mode
+        """)
+
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
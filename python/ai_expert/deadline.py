@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Request Deadline
+端到端请求时间预算
+
+一次生成请求要经过关键词提取、语义预设匹配、检索与多次生成，各自带 30 秒超时与重试：
+- 入口创建 Deadline 并放入上下文，同一上下文内（含提交到共享事件循环的协程）都能读到
+- DeepSeekAdapter 按剩余时间收紧单次请求超时，预算不足时不再重试
+- 生成器在预算紧张时跳过可选的 LLM 辅助步骤，用尽时返回兜底回复
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+
+class Deadline:
+    """从创建时刻起计算的时间预算"""
+
+    def __init__(self, budget: float, expires_at: Optional[float] = None):
+        self.budget = budget
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self, margin: float = 0.0) -> bool:
+        """剩余时间不超过 margin 秒"""
+        return self.remaining() <= margin
+
+    def timeout(self, default: float) -> float:
+        """单次操作的超时：不超过剩余预算"""
+        return min(default, self.remaining())
+
+    def shrink(self, seconds: float) -> "Deadline":
+        """提前 seconds 秒到期的子预算（为后续步骤预留时间）"""
+        return Deadline(max(0.0, self.budget - seconds), self.expires_at - seconds)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """在当前上下文内生效的时间预算；传入 None 时不做任何限制"""
+    if deadline is None:
+        yield None
+        return
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def deadline_allows(seconds: float) -> bool:
+    """当前预算是否还剩超过 seconds 秒（没有预算时总是 True）"""
+    deadline = current_deadline()
+    return deadline is None or deadline.remaining() > seconds
+
+
+def request_deadline(endpoint: str) -> Optional[Deadline]:
+    """按入口配置创建时间预算（配置为 0 时返回 None，表示不限）"""
+    from .config import Config
+    budget = Config.get_request_deadline(endpoint)
+    return Deadline(budget) if budget else None
@@ -7,22 +7,356 @@ DeepSeek 大模型 API 适配器
 import requests
 import time
 import json
-from typing import List, Dict, Optional
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import nullcontext
+from typing import Callable, List, Dict, Optional, Tuple
 from .cost_calculator import calculate_deepseek_cost
+from .http_client import HTTPClient, RequestHandle, get_http_client
+from .llm_cache import LLMCallCache, get_llm_cache
+from .deadline import current_deadline
+from .llm_governor import LLMGovernor, Permit, current_lane, get_llm_governor, parse_retry_after
+from .circuit_breaker import CircuitBreaker, get_circuit_breaker
+from .request_hedger import RequestHedger, get_request_hedger
+from .tracing import traced
+from .config import Config
+from .constants import (
+    MAX_RETRIES,
+    RETRY_DELAY_BASE,
+    RETRY_BACKOFF_FACTOR,
+    RETRYABLE_STATUS_CODES,
+    LLM_THROTTLE_STATUS_CODES,
+    DEADLINE_MIN_LLM_ATTEMPT,
+    LLM_HEDGE_MAX_WORKERS,
+)
+
+
+# ========== 请求构造与结果解析（同步 / 异步 Adapter 共用） ==========
+
+def build_chat_payload(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    stream: bool = False,
+    response_format: Optional[Dict] = None
+) -> Dict:
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+    if response_format:
+        # 例如 {"type": "json_object"}：要求模型输出合法 JSON
+        payload["response_format"] = response_format
+    if stream:
+        # 流式输出在最后一个数据块中附带 token 用量
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def parse_stream_line(line: str) -> Tuple[bool, Optional[str], Optional[Dict]]:
+    """
+    解析一行流式输出 (SSE)
+
+    Returns:
+        (is_done, content_delta, usage)
+    """
+    if not line.startswith('data: '):
+        return False, None, None
+    data_str = line[6:]
+    if data_str == '[DONE]':
+        return True, None, None
+    try:
+        data_json = json.loads(data_str)
+    except json.JSONDecodeError:
+        return False, None, None
+
+    content = None
+    if 'choices' in data_json and len(data_json['choices']) > 0:
+        delta = data_json['choices'][0].get('delta', {})
+        content = delta.get('content') or None
+    return False, content, data_json.get('usage')
+
+
+def parse_usage(usage: Dict) -> Dict:
+    """
+    解析 usage：token 数、上下文缓存命中 / 未命中的输入 token 数与费用
+    （服务端未返回缓存字段时，全部输入计为未命中）
+    """
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    cache_hit_tokens = usage.get("prompt_cache_hit_tokens", 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": usage.get("total_tokens", prompt_tokens + completion_tokens),
+        "prompt_cache_hit_tokens": cache_hit_tokens,
+        "prompt_cache_miss_tokens": usage.get("prompt_cache_miss_tokens", prompt_tokens - cache_hit_tokens),
+        "cost": calculate_deepseek_cost(prompt_tokens, completion_tokens, cache_hit_tokens)
+    }
+
+
+def apply_stream_usage(usage: Optional[Dict], chunk_usage: Dict):
+    """把流式输出末尾的用量写入调用方传入的 usage 字典"""
+    if usage is None:
+        return
+    usage.update(parse_usage(chunk_usage))
+
+
+def parse_chat_response(result: Dict, response_time: float) -> Dict:
+    """把 Chat API 的 JSON 响应转换为统一的结果结构"""
+    # 极致安全的提取方式
+    choices = result.get("choices", [])
+    if not choices:
+        return {
+            "success": False,
+            "error": f"API 返回结果结构异常 (无 choices): {json.dumps(result, ensure_ascii=False)}"
+        }
+    
+    message = choices[0].get("message", {})
+    content = message.get("content", "")
+    
+    if not content and not result.get("usage"):
+        return {
+            "success": False,
+            "error": f"API 返回空内容或异常结构: {json.dumps(result, ensure_ascii=False)}"
+        }
+
+    # token 用量与费用（区分上下文缓存命中部分）
+    return {
+        "content": content,
+        **parse_usage(result.get("usage", {})),
+        "response_time": response_time,
+        "success": True,
+        "error": None
+    }
+
+
+def failed_chat_result(error: str, response_time: float) -> Dict:
+    return {
+        "content": "",
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "prompt_cache_hit_tokens": 0,
+        "prompt_cache_miss_tokens": 0,
+        "cost": 0.0,
+        "response_time": response_time,
+        "success": False,
+        "error": error
+    }
 
 class DeepSeekAdapter:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        http_client: Optional[HTTPClient] = None,
+        llm_cache: Optional[LLMCallCache] = None,
+        llm_governor: Optional[LLMGovernor] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedger: Optional[RequestHedger] = None
+    ):
         self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/chat/completions"
+        api_root = Config.get_deepseek_base_url()
+        self.base_url = f"{api_root}/chat/completions"
+        self.models_url = f"{api_root}/models"
         self.model = "deepseek-chat"
         self.timeout = 30  # 30秒超时
+        # 共享连接池，复用 TCP / TLS 连接
+        self.http = http_client or get_http_client()
+        # 辅助调用（关键词提取、相似度判断）的结果缓存，未指定时首次使用才初始化
+        self._llm_cache = llm_cache
+        # 全局出站调控（自适应并发 + 优先级通道），所有 DeepSeek 请求共享
+        self._llm_governor = llm_governor
+        # 熔断与对冲：服务商整体状态，同步 / 异步 Adapter 共享
+        self._circuit_breaker = circuit_breaker
+        self._hedger = hedger
+
+    @property
+    def llm_cache(self) -> Optional[LLMCallCache]:
+        return self._llm_cache or get_llm_cache()
+
+    @property
+    def llm_governor(self) -> Optional[LLMGovernor]:
+        return self._llm_governor or get_llm_governor()
+
+    def _governed(self):
+        """占用一个出站名额；未启用调控器时返回不做限制的空名额"""
+        governor = self.llm_governor
+        return governor.slot() if governor else nullcontext(Permit(current_lane()))
+
+    def _request_timeout(self) -> float:
+        """单次请求超时：不超过当前请求剩余的时间预算"""
+        deadline = current_deadline()
+        return deadline.timeout(self.timeout) if deadline else self.timeout
+
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        return self._circuit_breaker or get_circuit_breaker()
+
+    @property
+    def hedger(self) -> RequestHedger:
+        return self._hedger or get_request_hedger()
+
+    @traced('deepseek.http')
+    def _send(
+        self,
+        headers: Dict,
+        data: Dict,
+        handle: Optional[RequestHandle] = None,
+        on_slot: Optional[Callable[[], None]] = None
+    ) -> Optional[requests.Response]:
+        """
+        发出一次非流式请求：熔断检查 -> 出站名额 -> 记录结果与延迟
+
+        Args:
+            handle: 中止句柄；被中止时返回 None，不计为故障
+            on_slot: 拿到出站名额、即将发出请求时回调
+        """
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.check()
+        with self._governed() as permit:
+            if on_slot:
+                on_slot()
+            # 延迟从拿到名额开始计，排队时间不计入对冲用的延迟统计
+            start_time = time.time()
+            try:
+                response = self.http.post(self.base_url, headers=headers, json=data,
+                                          timeout=self._request_timeout(), handle=handle)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                if handle and handle.cancelled:
+                    return None
+                if breaker:
+                    breaker.record_failure()
+                raise
+            if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                permit.throttled(parse_retry_after(response.headers.get('Retry-After')))
+
+        if breaker:
+            # 4xx（含限流）说明服务本身可用，只有 5xx 计为故障
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        if response.status_code == 200:
+            self.hedger.record_latency(data['max_tokens'], time.time() - start_time)
+        return response
+
+    def _post(self, headers: Dict, data: Dict) -> requests.Response:
+        """
+        发出一次请求；启用对冲且延迟样本足够时，原请求在调用方线程中发出，拿到出站名额后开始计时，
+        超过 p95 仍未返回则由线程池再发一份：
+        - 对冲先成功时中止原请求的连接，返回对冲结果；原请求先成功时对冲请求在后台读完后丢弃
+        - 调控器有请求在排队或因限流暂停时不对冲，避免拥塞时再加流量
+        """
+        hedger = self.hedger
+        breaker = self.circuit_breaker
+        delay = hedger.plan(data['max_tokens']) if Config.use_hedged_requests() else None
+        if delay is None or (breaker and breaker.state != CircuitBreaker.CLOSED):
+            return self._send(headers, data)
+
+        primary = RequestHandle()
+        # 线程池不继承调用方上下文（出站通道），复制一份给对冲请求
+        context = contextvars.copy_context()
+        lock = threading.Lock()
+        state = {'settled': False, 'hedge': None, 'timer': None}
+
+        def on_hedge_done(future):
+            try:
+                succeeded = future.result().status_code == 200
+            except Exception:
+                succeeded = False
+            if succeeded:
+                primary.cancel()
+
+        def fire_hedge():
+            governor = self.llm_governor
+            with lock:
+                if state['settled'] or (governor and governor.is_congested()) or not hedger.try_hedge():
+                    return
+                state['hedge'] = _get_hedge_executor().submit(context.run, self._send, headers, data)
+            state['hedge'].add_done_callback(on_hedge_done)
+
+        def start_timer():
+            timer = threading.Timer(delay, fire_hedge)
+            timer.daemon = True
+            state['timer'] = timer
+            timer.start()
+
+        response, error = None, None
+        try:
+            response = self._send(headers, data, handle=primary, on_slot=start_timer)
+        except Exception as e:
+            error = e
+        with lock:
+            state['settled'] = True
+            hedge = state['hedge']
+        if state['timer'] is not None:
+            state['timer'].cancel()
+
+        if hedge is None or (response is not None and response.status_code == 200):
+            if error is not None:
+                raise error
+            return response
+
+        # 原请求被中止或失败：使用对冲结果
+        try:
+            hedged = hedge.result()
+        except Exception:
+            hedged = None
+        if hedged is not None and hedged.status_code == 200:
+            hedger.record_hedge_win()
+            return hedged
+        if error is not None:
+            raise error
+        return response
+
+    def _cache_get(self, function: str, inputs: List[str]):
+        cache = self.llm_cache
+        if cache is None:
+            return None
+        try:
+            return cache.get(function, self.model, inputs)
+        except Exception as e:
+            print(f"[DeepSeek] LLM cache read failed: {e}")
+            return None
+
+    def _cache_put(self, function: str, inputs: List[str], value):
+        cache = self.llm_cache
+        if cache is None:
+            return
+        try:
+            cache.put(function, self.model, inputs, value)
+        except Exception as e:
+            print(f"[DeepSeek] LLM cache write failed: {e}")
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def warm_up(self, background: bool = True):
+        """预先建立连接（请求模型列表接口，不消耗 token）"""
+        self.http.warm_up(
+            self.models_url,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            background=background
+        )
     
+    @traced('deepseek.chat')
     def chat(
         self, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7,
         max_tokens: int = 500,
-        stream: bool = False
+        stream: bool = False,
+        response_format: Optional[Dict] = None
     ) -> Dict:
         """
         调用 DeepSeek Chat API
@@ -32,6 +366,7 @@ class DeepSeekAdapter:
             temperature: 温度参数 (0-1)
             max_tokens: 最大生成token数
             stream: 是否流式输出
+            response_format: 输出格式约束，如 {"type": "json_object"}
         
         Returns:
             {
@@ -39,177 +374,139 @@ class DeepSeekAdapter:
                 "prompt_tokens": 输入token数,
                 "completion_tokens": 输出token数,
                 "total_tokens": 总token数,
+                "prompt_cache_hit_tokens": 命中上下文缓存的输入token数,
+                "prompt_cache_miss_tokens": 未命中缓存的输入token数,
                 "cost": 费用（元）,
                 "response_time": 响应时间（秒）
             }
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": stream
-        }
-        
-        max_retries = 3
-        retry_delay = 1.0  # Initial delay 1s
-        backoff_factor = 2.0
+        headers = self._headers()
+        data = build_chat_payload(self.model, messages, temperature, max_tokens, stream, response_format)
         
+        retry_delay = float(RETRY_DELAY_BASE)
+        retry_after = None
+        last_error = None
         attempt = 0
         start_time = time.time()
+        # 入口设置了时间预算时，单次请求超时与重试都不超出剩余预算
+        deadline = current_deadline()
         
-        while attempt <= max_retries:
+        while attempt <= MAX_RETRIES:
             try:
                 if attempt > 0:
-                    print(f"[DeepSeek] Retrying request (Attempt {attempt}/{max_retries}) after {retry_delay}s...")
-                    time.sleep(retry_delay)
-                    retry_delay *= backoff_factor
-
-                response = requests.post(
-                    self.base_url,
-                    headers=headers,
-                    json=data,
-                    timeout=self.timeout
-                )
+                    # 服务端给出 Retry-After 时按其等待（调控器同时暂停其他请求），否则指数退避
+                    delay = retry_after if retry_after is not None else retry_delay
+                    if deadline and deadline.expired(delay + DEADLINE_MIN_LLM_ATTEMPT):
+                        return failed_chat_result(f"请求时间预算不足，放弃重试: {last_error}", time.time() - start_time)
+                    print(f"[DeepSeek] Retrying request (Attempt {attempt}/{MAX_RETRIES}) after {delay}s...")
+                    time.sleep(delay)
+                    retry_delay *= RETRY_BACKOFF_FACTOR
+                elif deadline and deadline.expired(DEADLINE_MIN_LLM_ATTEMPT):
+                    return failed_chat_result("请求时间预算已用尽", time.time() - start_time)
+
+                retry_after = None
+                response = self._post(headers, data)
+                if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
                 
                 response_time = time.time() - start_time
                 
                 # Check for retryable status codes
-                if response.status_code in [429, 500, 502, 503, 504]:
-                    if attempt < max_retries:
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    if attempt < MAX_RETRIES:
+                        last_error = f"API Error: {response.status_code}"
                         attempt += 1
                         continue
                     else:
-                        raise Exception(f"API Error after {max_retries} retries: {response.status_code} - {response.text}")
+                        raise Exception(f"API Error after {MAX_RETRIES} retries: {response.status_code} - {response.text}")
                 
                 if response.status_code != 200:
                     raise Exception(f"API Error: {response.status_code} - {response.text}")
                 
-                result = response.json()
-                
-                # 极致安全的提取方式
-                choices = result.get("choices", [])
-                if not choices:
-                    return {
-                        "success": False,
-                        "error": f"API 返回结果结构异常 (无 choices): {json.dumps(result, ensure_ascii=False)}"
-                    }
-                
-                message = choices[0].get("message", {})
-                content = message.get("content", "")
-                
-                if not content and not result.get("usage"):
-                     return {
-                        "success": False,
-                        "error": f"API 返回空内容或异常结构: {json.dumps(result, ensure_ascii=False)}"
-                    }
-
-                usage = result.get("usage", {})
-                
-                prompt_tokens = usage.get("prompt_tokens", 0)
-                completion_tokens = usage.get("completion_tokens", 0)
-                total_tokens = usage.get("total_tokens", 0)
-                
-                # 计算费用
-                cost = calculate_deepseek_cost(prompt_tokens, completion_tokens)
-                
-                return {
-                    "content": content,
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": total_tokens,
-                    "cost": cost,
-                    "response_time": response_time,
-                    "success": True,
-                    "error": None
-                }
+                return parse_chat_response(response.json(), response_time)
                 
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                if attempt < max_retries:
+                if attempt < MAX_RETRIES:
+                    last_error = str(e)
                     attempt += 1
                     continue
                 else:
-                    return {
-                        "content": "",
-                        "prompt_tokens": 0,
-                        "completion_tokens": 0,
-                        "total_tokens": 0,
-                        "cost": 0.0,
-                        "response_time": time.time() - start_time,
-                        "success": False,
-                        "error": f"请求超时/连接失败，已重试 {max_retries} 次: {str(e)}"
-                    }
+                    return failed_chat_result(
+                        f"请求超时/连接失败，已重试 {MAX_RETRIES} 次: {str(e)}",
+                        time.time() - start_time
+                    )
             
             except Exception as e:
-                return {
-                    "content": "",
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0,
-                    "total_tokens": 0,
-                    "cost": 0.0,
-                    "response_time": time.time() - start_time,
-                    "success": False,
-                    "error": str(e)
-                }
+                return failed_chat_result(str(e), time.time() - start_time)
     
+    @traced('deepseek.chat_stream')
     def chat_stream(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        usage: Optional[Dict] = None
     ):
         """
         流式调用 DeepSeek API
         
+        Args:
+            usage: 传入字典时，结束后写入 prompt / completion token 与费用
+        
         Yields:
             每次返回一个字符块
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": True
-        }
+        headers = self._headers()
+        data = build_chat_payload(self.model, messages, temperature, max_tokens, stream=True)
         
+        response = None
+        breaker = self.circuit_breaker
         try:
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                json=data,
-                stream=True,
-                timeout=self.timeout
-            )
-            
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        data_str = line[6:]
-                        if data_str == '[DONE]':
+            if breaker:
+                breaker.check()
+            # 流式请求在整个读取期间占用出站名额
+            with self._governed() as permit:
+                try:
+                    response = self.http.post(
+                        self.base_url,
+                        headers=headers,
+                        json=data,
+                        stream=True,
+                        timeout=self._request_timeout()
+                    )
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                    if breaker:
+                        breaker.record_failure()
+                    raise
+                if breaker:
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                
+                if response.status_code in LLM_THROTTLE_STATUS_CODES:
+                    permit.throttled(parse_retry_after(response.headers.get('Retry-After')))
+                if response.status_code != 200:
+                    raise Exception(f"API Error: {response.status_code} - {response.text}")
+                
+                for line in response.iter_lines():
+                    if line:
+                        is_done, content, chunk_usage = parse_stream_line(line.decode('utf-8'))
+                        if is_done:
                             break
-                        try:
-                            data_json = json.loads(data_str)
-                            if 'choices' in data_json and len(data_json['choices']) > 0:
-                                delta = data_json['choices'][0].get('delta', {})
-                                if 'content' in delta:
-                                    yield delta['content']
-                        except json.JSONDecodeError:
-                            continue
+                        if chunk_usage:
+                            apply_stream_usage(usage, chunk_usage)
+                        if content:
+                            yield content
         
         except Exception as e:
             print(f"Stream error: {e}")
             yield ""
+
+        finally:
+            # 及时释放连接（读完的连接归还连接池）
+            if response is not None:
+                response.close()
     
     def test_connection(self) -> bool:
         """测试 API 连接"""
@@ -223,6 +520,7 @@ class DeepSeekAdapter:
         except Exception as e:
             print(f"Connection test failed: {e}")
             return False
+    @traced('deepseek.check_similarity')
     def check_similarity(self, text1: str, text2: str) -> float:
         """
         使用 LLM 判断两句话的语义相似度 (0.0 - 1.0)
@@ -231,6 +529,12 @@ class DeepSeekAdapter:
         if text1.strip() == text2.strip():
             return 1.0
 
+        # 相似度与顺序无关，排序后作为缓存键
+        cache_inputs = sorted([text1, text2])
+        cached = self._cache_get('check_similarity', cache_inputs)
+        if cached is not None:
+            return cached
+
         sys_prompt = "你是一个语义判断专家。请判断以下两句话的语义相似度，返回0.0到1.0之间的数值。0.0表示完全不相关，1.0表示语义完全相同。请只返回一个数字，不要包含任何其他文字。"
         user_prompt = f"句子1: {text1}\n句子2: {text2}"
         
@@ -250,7 +554,9 @@ class DeepSeekAdapter:
                 import re
                 match = re.search(r"0\.\d+|1\.0|1|0", content)
                 if match:
-                    return float(match.group())
+                    similarity = float(match.group())
+                    self._cache_put('check_similarity', cache_inputs, similarity)
+                    return similarity
             
             return 0.0
             
@@ -258,10 +564,15 @@ class DeepSeekAdapter:
             print(f"[DeepSeek] Similarity check failed: {e}")
             return 0.0
 
+    @traced('deepseek.extract_keywords')
     def extract_search_keywords(self, text: str) -> List[str]:
         """
         从文本中提取核心检索关键词
         """
+        cached = self._cache_get('extract_search_keywords', [text])
+        if cached is not None:
+            return cached
+
         sys_prompt = "你是一个搜索专家。请从用户输入的文本中提取2-5个核心检索关键词，用于在历史记录中搜索相关内容。忽略无意义的虚词。结果必须是合法的 JSON 字符串列表，例如：[\"价格\", \"优惠\"]。"
         
         try:
@@ -281,6 +592,8 @@ class DeepSeekAdapter:
                 try:
                     keywords = json.loads(content)
                     if isinstance(keywords, list):
+                        # 只缓存模型成功给出的结果，回退分词不缓存
+                        self._cache_put('extract_search_keywords', [text], keywords)
                         return keywords
                 except:
                     pass
@@ -291,3 +604,35 @@ class DeepSeekAdapter:
         except Exception as e:
             print(f"[DeepSeek] Keyword extraction failed: {e}")
             return []
+
+
+_hedge_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=LLM_HEDGE_MAX_WORKERS,
+                    thread_name_prefix="llm-hedge"
+                )
+    return _hedge_executor
+
+
+_adapters: Dict[str, DeepSeekAdapter] = {}
+_adapters_lock = threading.Lock()
+
+
+def get_deepseek_adapter(api_key: str) -> DeepSeekAdapter:
+    """按 API Key 复用 DeepSeekAdapter（共享同一个连接池）"""
+    adapter = _adapters.get(api_key)
+    if adapter is None:
+        with _adapters_lock:
+            adapter = _adapters.get(api_key)
+            if adapter is None:
+                adapter = DeepSeekAdapter(api_key)
+                _adapters[api_key] = adapter
+    return adapter
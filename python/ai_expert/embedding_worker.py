@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+"""
+Embedding Worker
+独立的向量化 / OCR 工作进程
+
+SentenceTransformer 编码和 EasyOCR 识别会长时间占用 GIL，放在 Flask 进程里会拖慢
+SSE、看板轮询等无关接口。这里把它们挪到一个独立子进程：
+- 父进程通过本地 IPC 连接 (multiprocessing.connection) 发送请求
+- 向量结果写入 multiprocessing.shared_memory，父进程直接拷贝，不走 pickle
+- 父进程定期心跳检测，子进程退出或无响应时自动重启
+
+子进程以 `python -m ai_expert.embedding_worker` 方式启动，而不是 multiprocessing 的 spawn，
+避免在 Windows 上重新执行 api_server.py 顶层的启动逻辑。
+"""
+
+import os
+import sys
+import time
+import uuid
+import queue
+import logging
+import argparse
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .constants import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_WORKER_START_TIMEOUT,
+    EMBEDDING_WORKER_REQUEST_TIMEOUT,
+    EMBEDDING_WORKER_HEALTH_INTERVAL,
+    EMBEDDING_WORKER_MAX_MISSED_PINGS,
+    OCR_LANGUAGES,
+)
+from .ocr_service import read_image
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY_ENV = 'AI_EXPERT_WORKER_AUTHKEY'
+
+
+class EmbeddingWorkerError(Exception):
+    """工作进程调用失败"""
+    pass
+
+
+class EmbeddingWorkerRestarted(EmbeddingWorkerError):
+    """请求途中工作进程被重启"""
+    pass
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    以只读方式挂载子进程创建的共享内存
+    Python < 3.13 在 POSIX 上挂载时也会注册到 resource_tracker，父进程退出时会误删并告警，
+    所以挂载后立即取消注册，生命周期由创建方 (子进程) 负责。
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+    return shm
+
+
+class EmbeddingWorker:
+    """父进程侧的工作进程管理器（线程安全）"""
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        start_timeout: float = EMBEDDING_WORKER_START_TIMEOUT,
+        request_timeout: float = EMBEDDING_WORKER_REQUEST_TIMEOUT,
+        health_interval: float = EMBEDDING_WORKER_HEALTH_INTERVAL,
+        max_missed_pings: int = EMBEDDING_WORKER_MAX_MISSED_PINGS
+    ):
+        self.model_name = model_name
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.max_missed_pings = max_missed_pings
+
+        self._process: Optional[subprocess.Popen] = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._lifecycle_lock = threading.RLock()
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._generation = 0
+        self._running = False
+        self._health_thread: Optional[threading.Thread] = None
+
+        self.restart_count = 0
+        self.last_pong_time: Optional[float] = None
+        self.missed_pings = 0
+
+    # ========== 生命周期 ==========
+
+    def start(self):
+        """启动工作进程与心跳线程"""
+        with self._lifecycle_lock:
+            if self._running:
+                return
+            self._running = True
+            self._spawn()
+
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        """停止工作进程"""
+        with self._lifecycle_lock:
+            self._running = False
+            self._teardown(EmbeddingWorkerError("工作进程已停止"))
+
+    def is_alive(self) -> bool:
+        process = self._process
+        return process is not None and process.poll() is None
+
+    def _spawn(self):
+        """启动子进程并建立连接（调用方持有 _lifecycle_lock）"""
+        authkey = os.urandom(32)
+        listener = Listener(authkey=authkey)
+
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = authkey.hex()
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = package_root + os.pathsep + env.get('PYTHONPATH', '')
+
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'ai_expert.embedding_worker',
+                '--address', str(listener.address),
+                '--model', self.model_name
+            ],
+            cwd=package_root,
+            env=env
+        )
+
+        accepted = {}
+
+        def _accept():
+            try:
+                accepted['conn'] = listener.accept()
+            except Exception as e:
+                accepted['error'] = e
+
+        accept_thread = threading.Thread(target=_accept, daemon=True)
+        accept_thread.start()
+        accept_thread.join(self.start_timeout)
+
+        if 'conn' not in accepted:
+            process.kill()
+            listener.close()
+            raise EmbeddingWorkerError(f"工作进程启动超时: {accepted.get('error')}")
+
+        listener.close()
+        self._process = process
+        self._conn = accepted['conn']
+        self._generation += 1
+        self.missed_pings = 0
+        self.last_pong_time = time.time()
+
+        threading.Thread(
+            target=self._dispatch_loop,
+            args=(self._conn, self._generation),
+            daemon=True
+        ).start()
+        logger.info(f"[EmbeddingWorker] Worker started (pid={process.pid})")
+
+    def _teardown(self, error: Exception):
+        """关闭连接、结束子进程，并让所有等待中的请求失败"""
+        conn, self._conn = self._conn, None
+        process, self._process = self._process, None
+
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def restart(self, reason: str = ""):
+        """重启工作进程"""
+        with self._lifecycle_lock:
+            if not self._running:
+                return
+            logger.warning(f"[EmbeddingWorker] Restarting worker: {reason}")
+            self._teardown(EmbeddingWorkerRestarted(f"工作进程已重启: {reason}"))
+            self.restart_count += 1
+            self._spawn()
+
+    # ========== 通信 ==========
+
+    def _dispatch_loop(self, conn, generation: int):
+        """读取子进程的响应并唤醒等待中的请求"""
+        while True:
+            try:
+                req_id, ok, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._pending_lock:
+                future = self._pending.pop(req_id, None)
+            if future is None or future.done():
+                continue
+
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(EmbeddingWorkerError(payload))
+
+        if generation == self._generation and self._running:
+            logger.warning("[EmbeddingWorker] Connection to worker lost")
+
+    def _send(self, op: str, payload=None, expect_reply: bool = True) -> Optional[Future]:
+        with self._lifecycle_lock:
+            if not self._running:
+                raise EmbeddingWorkerError("工作进程未启动")
+            if not self.is_alive():
+                self.restart("worker process exited")
+            conn = self._conn
+
+        req_id = uuid.uuid4().hex
+        future = None
+        if expect_reply:
+            future = Future()
+            with self._pending_lock:
+                self._pending[req_id] = future
+
+        try:
+            with self._send_lock:
+                conn.send((op, req_id, payload))
+        except (OSError, ValueError, AttributeError) as e:
+            with self._pending_lock:
+                self._pending.pop(req_id, None)
+            raise EmbeddingWorkerError(f"发送请求失败: {e}")
+
+        return future
+
+    def _call(self, op: str, payload=None, timeout: float = None):
+        future = self._send(op, payload)
+        try:
+            return future.result(timeout=timeout or self.request_timeout)
+        except FutureTimeoutError:
+            raise EmbeddingWorkerError(f"工作进程请求超时: {op}")
+
+    # ========== 对外接口 ==========
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """心跳检测"""
+        try:
+            self._call('ping', timeout=timeout)
+            self.last_pong_time = time.time()
+            return True
+        except EmbeddingWorkerError:
+            return False
+
+    def preload(self, model_name: str = None, ocr: bool = False):
+        """让工作进程提前加载模型（不等待结果）"""
+        self._send('preload', {'model_name': model_name or self.model_name, 'ocr': ocr}, expect_reply=False)
+
+    def encode(self, texts: List[str], model_name: str = None) -> np.ndarray:
+        """向量化文本，结果通过共享内存返回"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        payload = {'model_name': model_name or self.model_name, 'texts': list(texts)}
+        try:
+            result = self._call('encode', payload)
+        except EmbeddingWorkerRestarted:
+            # 请求途中工作进程被重启时重试一次
+            result = self._call('encode', payload)
+
+        shm_name, shape = result['shm_name'], tuple(result['shape'])
+        shm = _attach_shared_memory(shm_name)
+        try:
+            vectors = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            try:
+                self._send('release', shm_name, expect_reply=False)
+            except EmbeddingWorkerError:
+                pass
+        return vectors
+
+    def ocr(self, image_path: str, max_width: int = None, tile_height: int = None) -> List[str]:
+        """识别图片文字（max_width / tile_height 为空时不缩放 / 不分块）"""
+        return self._call('ocr', {'path': image_path, 'max_width': max_width, 'tile_height': tile_height})
+
+    def get_status(self) -> Dict:
+        """健康状态"""
+        process = self._process
+        return {
+            'running': self._running,
+            'alive': self.is_alive(),
+            'pid': process.pid if process else None,
+            'model_name': self.model_name,
+            'restart_count': self.restart_count,
+            'missed_pings': self.missed_pings,
+            'last_pong_time': self.last_pong_time,
+            'pending_requests': len(self._pending)
+        }
+
+    def _health_loop(self):
+        """心跳线程：进程退出或连续多次无响应时自动重启"""
+        while self._running:
+            time.sleep(self.health_interval)
+            if not self._running:
+                break
+
+            try:
+                if not self.is_alive():
+                    self.restart("worker process exited")
+                    continue
+
+                if self.ping():
+                    self.missed_pings = 0
+                else:
+                    self.missed_pings += 1
+                    logger.warning(f"[EmbeddingWorker] Missed ping ({self.missed_pings}/{self.max_missed_pings})")
+                    if self.missed_pings >= self.max_missed_pings:
+                        self.restart("worker not responding")
+            except Exception as e:
+                logger.error(f"[EmbeddingWorker] Health check failed: {e}")
+
+
+# ========== 子进程侧 ==========
+
+class _WorkerServer:
+    """子进程：接收线程立即应答心跳，计算线程串行处理编码 / OCR 任务"""
+
+    def __init__(self, conn, default_model: str):
+        self.conn = conn
+        self.default_model = default_model
+        self.send_lock = threading.Lock()
+        self.tasks = queue.Queue()
+        self.models = {}
+        self.ocr_reader = None
+        self.segments: Dict[str, shared_memory.SharedMemory] = {}
+        self.segments_lock = threading.Lock()
+
+    def reply(self, req_id: str, ok: bool, payload):
+        if req_id is None:
+            return
+        with self.send_lock:
+            self.conn.send((req_id, ok, payload))
+
+    def get_model(self, model_name: str):
+        model = self.models.get(model_name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+            self.models[model_name] = model
+            print(f"[EmbeddingWorker] Embedding model loaded: {model_name}")
+        return model
+
+    def get_ocr_reader(self):
+        if self.ocr_reader is None:
+            import easyocr
+            self.ocr_reader = easyocr.Reader(OCR_LANGUAGES)
+            print("[EmbeddingWorker] EasyOCR initialized")
+        return self.ocr_reader
+
+    def release(self, shm_name: str):
+        with self.segments_lock:
+            shm = self.segments.pop(shm_name, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def handle(self, op: str, req_id: str, payload):
+        if op == 'preload':
+            self.get_model(payload.get('model_name') or self.default_model)
+            if payload.get('ocr'):
+                self.get_ocr_reader()
+            self.reply(req_id, True, None)
+
+        elif op == 'encode':
+            model = self.get_model(payload.get('model_name') or self.default_model)
+            vectors = np.ascontiguousarray(model.encode(payload['texts']), dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(vectors.nbytes, 1))
+            np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+            # 保持句柄直到父进程拷贝完成 (Windows 上最后一个句柄关闭即销毁)
+            with self.segments_lock:
+                self.segments[shm.name] = shm
+            self.reply(req_id, True, {'shm_name': shm.name, 'shape': vectors.shape})
+
+        elif op == 'ocr':
+            reader = self.get_ocr_reader()
+            lines = read_image(reader, payload['path'], payload.get('max_width'), payload.get('tile_height'))
+            self.reply(req_id, True, lines)
+
+        else:
+            self.reply(req_id, False, f"未知操作: {op}")
+
+    def compute_loop(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            op, req_id, payload = task
+            try:
+                self.handle(op, req_id, payload)
+            except Exception as e:
+                try:
+                    self.reply(req_id, False, f"{type(e).__name__}: {e}")
+                except (OSError, ValueError):
+                    break
+
+    def serve(self):
+        compute_thread = threading.Thread(target=self.compute_loop, daemon=True)
+        compute_thread.start()
+
+        while True:
+            try:
+                op, req_id, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if op == 'ping':
+                self.reply(req_id, True, {'pid': os.getpid(), 'queued': self.tasks.qsize()})
+            elif op == 'release':
+                self.release(payload)
+            else:
+                self.tasks.put((op, req_id, payload))
+
+        # 父进程断开：清理所有未释放的共享内存后退出
+        self.tasks.put(None)
+        for name in list(self.segments):
+            self.release(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Expert embedding / OCR worker")
+    parser.add_argument('--address', required=True)
+    parser.add_argument('--model', default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_ENV))
+    conn = Client(args.address, authkey=authkey)
+    _WorkerServer(conn, args.model).serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,65 @@ Enhanced Prompt Builder
 """
 
 import json
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from .intent_recognizer import CustomerIntent, ObjectionType
 from .conversation_stage_manager import ConversationStage
 
+# 各版本风格：(图标, 名称, 要求)
+VERSION_STYLES = {
+    'aggressive': ('🚀', '进取型', [
+        '积极引导客户做出决策',
+        '营造紧迫感和稀缺性',
+        '强调立即行动的好处',
+        '使用更有说服力的语言',
+        '适度施加压力，但不要过于强硬',
+    ]),
+    'conservative': ('🛡️', '保守型', [
+        '稳健推进，不急于求成',
+        '重点建立信任和了解需求',
+        '提供充分的信息和选择',
+        '尊重客户的决策节奏',
+        '强调长期价值和保障',
+    ]),
+    'professional': ('🎓', '专业型', [
+        '展示专业知识和行业洞察',
+        '提供详细的产品信息',
+        '使用数据和案例支撑',
+        '保持专业、客观的态度',
+        '充分展示产品价值和优势',
+    ]),
+}
+
+# 版本后缀只取决于风格定义，导入时渲染一次
+VERSION_SUFFIXES = {
+    version_type: f"\n\n# {icon} 版本要求：{name}\n" + "\n".join(f"- {rule}" for rule in rules)
+    for version_type, (icon, name, rules) in VERSION_STYLES.items()
+}
+
+
+@lru_cache(maxsize=16)
+def _render_multi_version_suffix(version_types: Tuple[str, ...]) -> str:
+    """多版本后缀只取决于版本组合，按组合缓存渲染结果"""
+    parts = [
+        "\n\n# 📦 多版本输出要求",
+        f"请针对客户的最新消息，一次性写出以下 {len(version_types)} 个不同风格的回复版本，"
+        "每个版本都必须遵守上文的全部要求，彼此独立、可直接发送。"
+    ]
+    for v_type in version_types:
+        icon, name, rules = VERSION_STYLES[v_type]
+        parts.append(f"\n## {icon} {name} ({v_type})")
+        parts.extend(f"- {rule}" for rule in rules)
+
+    example = json.dumps({v_type: f"{VERSION_STYLES[v_type][1]}回复内容" for v_type in version_types}, ensure_ascii=False)
+    parts.append("\n# 🧾 输出格式（严格遵守）")
+    parts.append("只输出一个 JSON 对象，不要输出任何解释、前缀或 Markdown 代码块：")
+    parts.append(example)
+    parts.append("- 键名必须与上面完全一致，不能增删")
+    parts.append("- 每个值是一条完整的回复文本（字符串），换行使用 \\n")
+    return "\n".join(parts)
+
+
 class EnhancedPromptBuilder:
     """构建增强版 System Prompt"""
     
@@ -20,10 +75,11 @@ class EnhancedPromptBuilder:
         conversation_stage: Optional[ConversationStage] = None,
         customer_intent: Optional[CustomerIntent] = None,
         objection_type: Optional[ObjectionType] = None,
-        stage_guidance: Optional[Dict] = None
+        stage_guidance: Optional[Dict] = None,
+        retrieved_knowledge: Optional[List[str]] = None
     ) -> str:
         """
-        构建完整的 System Prompt
+        构建完整的 System Prompt（稳定部分在前、本轮情境在后，拼成一条消息）
         
         Args:
             config: 基础配置（角色定义、业务逻辑等）
@@ -32,10 +88,42 @@ class EnhancedPromptBuilder:
             customer_intent: 客户意图
             objection_type: 异议类型（如果有）
             stage_guidance: 阶段指导建议
+            retrieved_knowledge: 本轮检索到的资料（预设问答、知识库片段）
         
         Returns:
             完整的 System Prompt
         """
+        return "\n\n".join(filter(None, [
+            self.build_stable_prompt(config),
+            self.build_turn_prompt(
+                customer_memory,
+                conversation_stage,
+                customer_intent,
+                objection_type,
+                stage_guidance,
+                retrieved_knowledge
+            )
+        ]))
+    
+    def build_stable_prompt(self, config: Dict) -> str:
+        """
+        构建只取决于 AI 专家配置的部分
+        
+        DeepSeek 按请求前缀命中上下文缓存（命中部分计费更低、首 token 更快），
+        因此这里不能出现任何随对话变化的内容：同一专家的所有请求，这部分逐字节一致。
+        config 中带有预编译的 compiled_static_prompt 时直接复用（见 CompiledPromptCache）。
+        """
+        sections = [config.get('compiled_static_prompt') or self.build_static_prompt(config)]
+        
+        # ========== 第7部分：Dynamic Few-Shot (Phase 3) ==========
+        # 金牌话术按使用次数排序，偶尔变化，放在稳定部分的末尾
+        if config.get('few_shot_examples'):
+            sections.append(self._build_few_shot_section(config))
+        
+        return "\n\n".join(filter(None, sections))
+    
+    def build_static_prompt(self, config: Dict) -> str:
+        """构建稳定部分中完全由 ai_prompts 配置决定的章节（第1-6部分）"""
         sections = []
         
         # ========== 第1部分：角色定义 ==========
@@ -44,43 +132,50 @@ class EnhancedPromptBuilder:
         # ========== 第2部分：业务目标 ==========
         sections.append(self._build_business_section(config))
         
-        # ========== 第3部分：当前对话情境 ==========
-        sections.append(self._build_context_section(
-            customer_memory,
-            conversation_stage,
-            customer_intent,
-            objection_type,
-            stage_guidance
-        ))
-        
-        # ========== 第4部分：话术规范 ==========
+        # ========== 第3部分：话术规范 ==========
         sections.append(self._build_tone_section(config))
         
-        # ========== 第5部分：知识库 ==========
+        # ========== 第4部分：知识库 ==========
         if config.get('knowledge_base'):
             sections.append(self._build_knowledge_section(config))
         
-        # ========== 第6部分：禁忌规则 ==========
+        # ========== 第5部分：禁忌规则 ==========
         if config.get('forbidden_words'):
             sections.append(self._build_forbidden_section(config))
-        
-        # ========== 第7部分：策略指导 ==========
-        sections.append(self._build_strategy_section(
-            conversation_stage,
-            customer_intent,
-            objection_type,
-            stage_guidance
-        ))
-        
-        # ========== 第8部分：Dynamic Few-Shot (Phase 3) ==========
-        if config.get('few_shot_examples'):
-            sections.append(self._build_few_shot_section(config))
 
-        # ========== 第9部分：输出要求 ==========
+        # ========== 第6部分：输出要求 ==========
         sections.append(self._build_output_section())
         
         return "\n\n".join(filter(None, sections))
     
+    def build_turn_prompt(
+        self,
+        customer_memory: Optional[Dict] = None,
+        conversation_stage: Optional[ConversationStage] = None,
+        customer_intent: Optional[CustomerIntent] = None,
+        objection_type: Optional[ObjectionType] = None,
+        stage_guidance: Optional[Dict] = None,
+        retrieved_knowledge: Optional[List[str]] = None
+    ) -> str:
+        """构建每轮都会变化的部分：对话情境、本轮检索资料、策略指导（放在历史消息之后）"""
+        sections = [
+            self._build_context_section(
+                customer_memory,
+                conversation_stage,
+                customer_intent,
+                objection_type,
+                stage_guidance
+            ),
+            self._build_retrieved_section(retrieved_knowledge),
+            self._build_strategy_section(
+                conversation_stage,
+                customer_intent,
+                objection_type,
+                stage_guidance
+            )
+        ]
+        return "\n\n".join(filter(None, sections))
+    
     def _build_role_section(self, config: Dict) -> str:
         """构建角色定义部分"""
         role = config.get('role_definition', '你是一名专业的销售顾问')
@@ -248,6 +343,15 @@ class EnhancedPromptBuilder:
 
         return "\n".join(parts)
 
+    def _build_retrieved_section(self, retrieved_knowledge: Optional[List[str]]) -> str:
+        """构建本轮检索资料部分（预设问答、知识库片段）"""
+        if not retrieved_knowledge:
+            return ""
+
+        parts = ["# 🔎 检索资料（与客户当前问题相关，优先参考）"]
+        parts.extend(f"- {item}" for item in retrieved_knowledge)
+        return "\n".join(parts)
+
     def _build_forbidden_section(self, config: Dict) -> str:
         """构建禁忌规则部分"""
         forbidden = config.get('forbidden_words')
@@ -361,8 +465,8 @@ class EnhancedPromptBuilder:
     def _build_output_section(self) -> str:
         """构建输出要求部分"""
         return """# 📝 输出要求与严厉约束
-- **真实性优先级**：你的回复必须严格基于上文提供的【产品知识库】和【参考示例】。
-- **严禁幻觉/猜测**：如果客户问及的具体细节（如特定的公司定位、银行信息、价格细节）在上文中**完全没有提到**，你必须：
+- **真实性优先级**：你的回复必须严格基于提供的【产品知识库】、【检索资料】和【参考示例】。
+- **严禁幻觉/猜测**：如果客户问及的具体细节（如特定的公司定位、银行信息、价格细节）在提供的资料中**完全没有提到**，你必须：
   1. 诚实告知客户：“抱歉，关于这一点我目前没有详细的官方记录。”
   2. 引导客户提供更多信息或告知“我会请人工客服为您核实并发送”。
   3. **绝对严禁**自编任何看似真实的地址、链接或敏感数据。
@@ -380,35 +484,18 @@ class EnhancedPromptBuilder:
         Returns:
             版本特定的指令
         """
-        suffixes = {
-            'aggressive': """
-
-# 🚀 版本要求：进取型
-- 积极引导客户做出决策
-- 营造紧迫感和稀缺性
-- 强调立即行动的好处
-- 使用更有说服力的语言
-- 适度施加压力，但不要过于强硬""",
-
-            'conservative': """
-
-# 🛡️ 版本要求：保守型
-- 稳健推进，不急于求成
-- 重点建立信任和了解需求
-- 提供充分的信息和选择
-- 尊重客户的决策节奏
-- 强调长期价值和保障""",
-
-            'professional': """
-
-# 🎓 版本要求：专业型
-- 展示专业知识和行业洞察
-- 提供详细的产品信息
-- 使用数据和案例支撑
-- 保持专业、客观的态度
-- 充分展示产品价值和优势"""
-        }
+        return VERSION_SUFFIXES.get(version_type, '')
+
+    def build_multi_version_suffix(self, version_types: List[str]) -> str:
+        """
+        构建“一次调用生成多个版本”的 Prompt 后缀（严格 JSON 输出）
 
-        return suffixes.get(version_type, '')
+        Args:
+            version_types: 需要生成的版本列表
+
+        Returns:
+            多版本指令与输出格式约束
+        """
+        return _render_multi_version_suffix(tuple(version_types))
 
 
@@ -5,12 +5,20 @@ Enhanced Reply Generator
 整合所有5个改进点
 """
 
+import re
+import json
 import time
-from typing import Dict, List, Optional
+import queue
+import asyncio
+import threading
+import contextvars
+from typing import Dict, Iterator, List, Optional, Tuple
 import concurrent.futures
 from .database import AIExpertDatabase
-from .deepseek_adapter import DeepSeekAdapter
-from .cost_calculator import calculate_deepseek_cost
+from .deepseek_adapter import DeepSeekAdapter, get_deepseek_adapter
+from .async_deepseek_adapter import AsyncDeepSeekAdapter, get_async_deepseek_adapter
+from .deadline import Deadline, current_deadline, deadline_allows, deadline_scope
+from .config import Config
 from .enhanced_prompt_builder import EnhancedPromptBuilder
 from .smart_context_selector import SmartContextSelector
 from .intent_recognizer import IntentRecognizer, CustomerIntent
@@ -18,14 +26,94 @@ from .customer_memory import CustomerMemory
 from .conversation_stage_manager import ConversationStageManager
 from .feedback_learner import FeedbackLearner
 from .pii_masker import PIIMasker
+from .pipeline import Stage, StagePipeline
+from .reply_cache import get_reply_cache, memory_profile, conversation_topic
+from .keyword_extractor import get_keyword_extractor
+from .tracing import traced
+from .constants import (
+    KB_SUMMARY_QUERY_MESSAGES,
+    KB_SUMMARY_QUERY_MAX_CHARS,
+    AI_VERSION_MAX_TOKENS,
+    AI_MULTI_VERSION_MAX_TOKENS,
+    LLM_RUN_TIMEOUT,
+    DEADLINE_GENERATION_RESERVE,
+    DEADLINE_MIN_LLM_ATTEMPT,
+    FALLBACK_SNIPPET_CHARS,
+    FALLBACK_REPLY,
+    PIPELINE_STAGE_TIMEOUTS,
+    GENERATION_MAX_WORKERS,
+)
+
+VERSION_TYPES = ['aggressive', 'conservative', 'professional']
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+# 按调用累加的 token 用量字段（含上下文缓存命中 / 未命中的输入 token）
+USAGE_TOKEN_KEYS = ('prompt_tokens', 'completion_tokens', 'total_tokens',
+                    'prompt_cache_hit_tokens', 'prompt_cache_miss_tokens')
+
+
+def parse_multi_version_reply(content: str, version_types: List[str]) -> Dict[str, str]:
+    """
+    解析一次调用生成的多版本 JSON 回复
+
+    容忍 Markdown 代码块、JSON 前后的多余文字以及字符串中的裸换行；
+    只返回值为非空字符串的版本，缺失或无效的版本由调用方单独补生成
+
+    Returns:
+        {v_type: reply}
+    """
+    if not content:
+        return {}
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1], strict=False)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    versions = {}
+    for v_type in version_types:
+        value = data.get(v_type)
+        if isinstance(value, str) and value.strip():
+            versions[v_type] = value.strip()
+    return versions
+
+_version_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_version_executor_lock = threading.Lock()
+
+
+def _get_version_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """逐版本生成（线程模式）共用的线程池，避免每次生成都创建、销毁线程"""
+    global _version_executor
+    if _version_executor is None:
+        with _version_executor_lock:
+            if _version_executor is None:
+                _version_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=GENERATION_MAX_WORKERS,
+                    thread_name_prefix="version-gen"
+                )
+    return _version_executor
+
 
 class EnhancedReplyGenerator:
     """增强版回复生成器"""
     
-    def __init__(self, api_key: str, db_instance, kb_manager=None):
+    def __init__(
+        self,
+        api_key: str,
+        db_instance,
+        kb_manager=None,
+        deepseek_adapter: Optional[DeepSeekAdapter] = None,
+        async_deepseek_adapter: Optional[AsyncDeepSeekAdapter] = None
+    ):
         self.db = db_instance
         self.api_key = api_key
-        self.deepseek = DeepSeekAdapter(api_key)
+        # 默认复用进程级共享的 Adapter（共享连接池）
+        self.deepseek = deepseek_adapter or get_deepseek_adapter(api_key)
+        self._async_deepseek = async_deepseek_adapter
         self.context_selector = SmartContextSelector()
         self.intent_recognizer = IntentRecognizer(self.deepseek)
         self.customer_memory = CustomerMemory(self.db)
@@ -34,14 +122,24 @@ class EnhancedReplyGenerator:
         self.kb_manager = kb_manager
         self.feedback_learner = FeedbackLearner(db_instance)
         self.pii_masker = PIIMasker()
+        # 重复问题的回复缓存（每个数据库实例一份，专家配置或知识库变化时失效）
+        self.reply_cache = get_reply_cache(db_instance)
+        # 本地检索关键词提取（领域词表在后台构建，配置或知识库变化后重建）
+        self.keyword_extractor = get_keyword_extractor(db_instance)
+        self.keyword_extractor.warm_up()
+        if kb_manager is not None:
+            self.reply_cache.watch_knowledge_base(kb_manager)
+            self.keyword_extractor.watch_knowledge_base(kb_manager)
     
+    @traced('generate.total')
     def generate_three_versions(
         self,
         session_id: str,
         customer_message: str,
         system_prompt_config: Dict,
         prompt_id: int,
-        conversation_history: List[Dict] = None
+        conversation_history: List[Dict] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict:
         """
         生成三个版本的回复（整合所有改进）
@@ -52,6 +150,7 @@ class EnhancedReplyGenerator:
             system_prompt_config: System Prompt配置
             prompt_id: Prompt配置ID
             conversation_history: 会话历史
+            deadline: 端到端时间预算；预算紧张时跳过可选步骤，用尽时未生成的版本使用兜底回复
         
         Returns:
             {
@@ -72,239 +171,854 @@ class EnhancedReplyGenerator:
                 "response_time": float
             }
         """
-        start_time = time.time()
+        with deadline_scope(deadline):
+            start_time = time.time()
         
-        try:
-            # ========== Phase 5: PII 安全脱敏 (离开本地前处理) ==========
-            masked_customer_message = self.pii_masker.mask(customer_message)
-            
-            if conversation_history:
-                # 脱敏上下文
-                masked_history = self.pii_masker.mask_chat_history(conversation_history)
-                selected_context, context_metadata = self.context_selector.select_context(
-                    masked_history,
-                    max_tokens=2000,
-                    min_messages=3,
-                    customer_message=masked_customer_message,
-                    deepseek_adapter=self.deepseek
+            try:
+                # 重复问题直接使用缓存的三个版本，不调用 DeepSeek
+                cached, cache_probe, turn = self._lookup_reply_cache(
+                    session_id, customer_message, prompt_id, conversation_history
                 )
-            else:
-                # 从数据库获取
-                messages = self.db.get_recent_messages(session_id, limit=20)
-                formatted_messages = [
-                    {
-                        "role": "user" if msg['is_customer'] else "assistant",
-                        "content": self.pii_masker.mask(msg['message']), # 脱敏处理
-                        "timestamp": msg.get('timestamp')
-                    }
-                    for msg in messages
-                ]
-                selected_context, context_metadata = self.context_selector.select_context(
-                    formatted_messages,
-                    max_tokens=2000,
-                    min_messages=3,
-                    customer_message=masked_customer_message,
-                    deepseek_adapter=self.deepseek
+                if cached:
+                    return self._cached_result(
+                        session_id, customer_message, prompt_id, cached, turn, start_time
+                    )
+
+                prepared = self._prepare_generation(
+                    session_id, customer_message, system_prompt_config, prompt_id, conversation_history
                 )
             
-            # ========== 改进点2: 客户意图识别 ==========
-            intent_result = self.intent_recognizer.recognize_intent(
-                masked_customer_message,
-                selected_context
-            )
-            customer_intent = intent_result['intent']
-            objection_type = intent_result.get('objection_type')
-            
-            # ========== 改进点3: 个性化记忆 ==========
-            customer_memory = self.customer_memory.get_memory(session_id)
-            
-            # 更新互动次数
-            self.customer_memory.increment_interaction(session_id)
-            
-            # 更新最后意图
-            self.customer_memory.update_memory(session_id, {
-                'last_intent': customer_intent.value if customer_intent else None,
-                'last_objection_type': objection_type.value if objection_type else None
-            })
+                # ========== 生成三个版本（默认一次调用，失败的版本单独补生成） ==========
+                if deadline_allows(DEADLINE_MIN_LLM_ATTEMPT):
+                    outcome = self._generate_versions(prepared['system_prompt'], prepared['full_context'], VERSION_TYPES)
+                else:
+                    # 准备阶段已耗尽预算，直接使用兜底回复
+                    outcome = self._new_outcome('fallback')
+                    outcome['errors'] = {v_type: "请求时间预算已用尽" for v_type in VERSION_TYPES}
+                versions, fallback_versions = self._collect_versions(
+                    outcome['versions'], outcome['errors'], prepared['fallback']
+                )
+                if len(fallback_versions) == len(VERSION_TYPES):
+                    outcome['mode'] = 'fallback'
+                if cache_probe and not fallback_versions:
+                    self.reply_cache.put(cache_probe, versions)
             
-            # ========== 改进点5 (RAG): 检索知识库与预设问答 ==========
-            retrieved_knowledge = []
+                # 按各次调用的真实 prompt / completion token 累计费用
+                total_tokens = outcome['total_tokens']
+                cost = outcome['cost']
+                response_time = time.time() - start_time
             
-            # 5a. 首先尝试匹配“预设问答” (Preset QA) - 优先级最高
-            try:
-                preset_answer = self.db.match_preset_answer(
-                    prompt_id=prompt_id, 
-                    question=masked_customer_message,
-                    deepseek_adapter=self.deepseek # 启用语义匹配
+                # 保存建议到数据库
+                suggestion_id = self._save_suggestion(
+                    session_id=session_id,
+                    prompt_id=prompt_id,
+                    customer_message=customer_message,
+                    versions=versions,
+                    tokens_used=total_tokens,
+                    cost=cost,
+                    usage=outcome
                 )
-                if preset_answer:
-                    print(f"[RAG] Preset QA Hit!")
-                    retrieved_knowledge.append(f"[官方标准回答] {preset_answer}")
+                self._log_api_usage(prompt_id, outcome, response_time, success=not outcome['errors'])
+            
+                # 返回结果
+                return {
+                    "success": True,
+                    "aggressive": versions['aggressive'],
+                    "conservative": versions['conservative'],
+                    "professional": versions['professional'],
+                    "suggestion_id": suggestion_id,
+                    "metadata": prepared['metadata'],
+                    "tokens_used": total_tokens,
+                    "prompt_tokens": outcome['prompt_tokens'],
+                    "completion_tokens": outcome['completion_tokens'],
+                    "prompt_cache_hit_tokens": outcome['prompt_cache_hit_tokens'],
+                    "generation_mode": outcome['mode'],
+                    "llm_calls": outcome['llm_calls'],
+                    "fallback": {
+                        "source": prepared['fallback']['source'],
+                        "versions": fallback_versions
+                    } if fallback_versions else None,
+                    "cost": cost,
+                    "response_time": response_time
+                }
+        
             except Exception as e:
-                print(f"[RAG] Preset QA matching failed: {e}")
+                import traceback
+                traceback.print_exc()
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "aggressive": "",
+                    "conservative": "",
+                    "professional": ""
+                }
 
-            # 5b. 检索文档知识库 (Vector Search)
-            if self.kb_manager and customer_message:
-                try:
-                    # 传入当前 prompt_id 进行过滤
-                    results = self.kb_manager.search(
-                        query=masked_customer_message, 
-                        bound_prompt_id=prompt_id,
-                        top_k=3, 
-                        threshold=0.35 # 稍微调低阈值以增加召回
-                    )
-                    if results:
-                        print(f"[RAG] Vector Search Hit {len(results)} chunks")
-                        for res in results:
-                            # 避免重复
-                            knowledge_item = f"[参考资料: {res['source']}] {res['content']}"
-                            if knowledge_item not in retrieved_knowledge:
-                                retrieved_knowledge.append(knowledge_item)
-                except Exception as e:
-                    print(f"[RAG] Vector Search failed: {e}")
-
-            # 合并检索到的知识到配置中
-            if retrieved_knowledge:
-                # 确保 knowledge_base 是列表
-                current_kb = system_prompt_config.get('knowledge_base', [])
-                if not isinstance(current_kb, list):
-                    current_kb = []
-                
-                # 放在最前面，作为高优先级上下文
-                system_prompt_config['knowledge_base'] = retrieved_knowledge + current_kb
-
-            # ========== Phase 3: Dynamic Few-Shot Learning ==========
-            # 从数据库获取“金牌话术”作为参考示例
-            # 如果支持 RAG 语义搜索金牌话术更好，目前先使用“高频使用的金牌话术”
-            golden_replies = []
-            try:
-                # 获取该 Prompt ID 下最热的 5 条金牌话术
-                top_golden = self.db.get_golden_replies(prompt_id=prompt_id, limit=5)
-                if top_golden:
-                    print(f"[Learning] Injected {len(top_golden)} golden replies")
-                    golden_formatted = []
-                    for g in top_golden:
-                        golden_formatted.append(f"Q: {g['question']}\nA: {g['reply']}")
-                    
-                    # 将金牌话术注入到 prompt_config 中 (需要 prompt_builder 支持，或者放入 knowledge_base)
-                    # 放入 knowledge_base 是个简单有效的 hack
-                    # 也可以作为一个单独的 section
-                    system_prompt_config['few_shot_examples'] = golden_formatted
-            except Exception as e:
-                print(f"[Learning] Failed to fetch golden replies: {e}")
+    @traced('generate_stream.total')
+    def generate_three_versions_stream(
+        self,
+        session_id: str,
+        customer_message: str,
+        system_prompt_config: Dict,
+        prompt_id: int,
+        conversation_history: List[Dict] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Iterator[Dict]:
+        """
+        流式生成三个版本的回复：三个版本的 token 流并发进行、交替产出
+        （deadline 在生成器内部生效：响应体是在视图函数返回之后才迭代的）
 
-            # ========== 改进点4: 多轮对话优化 ==========
-            conversation_stage = self.stage_manager.detect_stage(
-                selected_context,
-                customer_intent.value if customer_intent else None
+        Yields:
+            {"type": "meta", "metadata": dict, "versions": [...]}
+            {"type": "delta", "version": str, "content": str}
+            {"type": "version_done", "version": str, "ttft": float, "total_time": float}
+            {"type": "version_error", "version": str, "error": str}
+            {"type": "done", "suggestion_id": int, "suggestions": dict, "tokens_used": int,
+             "cost": float, "response_time": float, "timings": dict}
+            {"type": "error", "error": str}
+        """
+        with deadline_scope(deadline):
+            yield from self._stream_versions(
+                session_id, customer_message, system_prompt_config, prompt_id, conversation_history
             )
-            stage_guidance = self.stage_manager.get_guidance(conversation_stage)
-            
-            # ========== 构建增强版 System Prompt ==========
-            enhanced_system_prompt = self.prompt_builder.build_system_prompt(
-                config=system_prompt_config,
-                customer_memory=customer_memory,
-                conversation_stage=conversation_stage,
-                customer_intent=customer_intent,
-                objection_type=objection_type,
-                stage_guidance=stage_guidance
+
+    def _stream_versions(
+        self,
+        session_id: str,
+        customer_message: str,
+        system_prompt_config: Dict,
+        prompt_id: int,
+        conversation_history: List[Dict] = None
+    ) -> Iterator[Dict]:
+        start_time = time.time()
+        try:
+            cached, cache_probe, turn = self._lookup_reply_cache(
+                session_id, customer_message, prompt_id, conversation_history
+            )
+            if cached:
+                result = self._cached_result(session_id, customer_message, prompt_id, cached, turn, start_time)
+                yield {"type": "meta", "metadata": result['metadata'], "versions": VERSION_TYPES}
+                yield {
+                    "type": "done",
+                    "suggestion_id": result['suggestion_id'],
+                    "suggestions": {v_type: result[v_type] for v_type in VERSION_TYPES},
+                    "tokens_used": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "prompt_cache_hit_tokens": 0,
+                    "cost": 0.0,
+                    "response_time": result['response_time'],
+                    "timings": {},
+                    "fallback": None
+                }
+                return
+
+            prepared = self._prepare_generation(
+                session_id, customer_message, system_prompt_config, prompt_id, conversation_history
+            )
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield {"type": "error", "error": str(e)}
+            return
+
+        yield {"type": "meta", "metadata": prepared['metadata'], "versions": VERSION_TYPES}
+
+        events: "queue.Queue[Tuple[str, str, object]]" = queue.Queue()
+        cancel = self._start_version_streams(prepared['system_prompt'], prepared['full_context'], VERSION_TYPES, events)
+
+        chunks = {v_type: [] for v_type in VERSION_TYPES}
+        timings = {v_type: {"ttft": None, "total_time": None} for v_type in VERSION_TYPES}
+        errors = {}
+        usage = {**{key: 0 for key in USAGE_TOKEN_KEYS}, "cost": 0.0}
+        pending = set(VERSION_TYPES)
+        finished = False
+
+        try:
+            while pending:
+                try:
+                    kind, v_type, payload = events.get(timeout=self._run_timeout())
+                except queue.Empty:
+                    cancel()
+                    for v_type in pending:
+                        errors[v_type] = "生成超时"
+                        yield {"type": "version_error", "version": v_type, "error": errors[v_type]}
+                    break
+
+                elapsed = time.time() - start_time
+                if kind == 'delta':
+                    if timings[v_type]["ttft"] is None:
+                        timings[v_type]["ttft"] = elapsed
+                    chunks[v_type].append(payload)
+                    yield {"type": "delta", "version": v_type, "content": payload}
+                elif kind == 'done':
+                    pending.discard(v_type)
+                    for key in usage:
+                        usage[key] += payload.get(key, 0)
+                    if not chunks[v_type]:
+                        errors[v_type] = "模型未返回内容"
+                        yield {"type": "version_error", "version": v_type, "error": errors[v_type]}
+                        continue
+                    timings[v_type]["total_time"] = elapsed
+                    yield {"type": "version_done", "version": v_type, **timings[v_type]}
+                elif kind == 'error':
+                    pending.discard(v_type)
+                    errors[v_type] = str(payload)
+                    print(f"[Error] Failed to stream {v_type}: {payload}")
+                    yield {"type": "version_error", "version": v_type, "error": errors[v_type]}
+
+            versions, fallback_versions = self._collect_versions(
+                {v_type: "".join(chunks[v_type]) for v_type in VERSION_TYPES if v_type not in errors},
+                errors,
+                prepared['fallback']
             )
-            
-            # 添加当前消息到上下文
-            full_context = selected_context + [
-                {"role": "user", "content": masked_customer_message}
-            ]
-            
-            # ========== 生成三个版本（并发优化） ==========
-            versions = {}
-            total_tokens = 0
-            
-            # 定义单个版本生成函数
-            def _generate_version(v_type):
-                # 添加版本特定的后缀
-                version_prompt = enhanced_system_prompt + self.prompt_builder.build_version_suffix(v_type)
-                
-                # 构建完整消息
-                messages = [
-                    {"role": "system", "content": version_prompt}
-                ] + full_context
-                
-                # 调用 DeepSeek API
-                api_result = self.deepseek.chat(
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=600 # 稍微增加长度限制
-                )
-                
-                if not api_result.get('success'):
-                    return v_type, None, 0, api_result.get('error')
-                
-                return v_type, api_result['content'], api_result.get('total_tokens', 0), None
-
-            # 使用线程池并发执行
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [
-                    executor.submit(_generate_version, 'aggressive'),
-                    executor.submit(_generate_version, 'conservative'),
-                    executor.submit(_generate_version, 'professional')
-                ]
-                
-                for future in concurrent.futures.as_completed(futures):
-                    v_type, content, tokens, error = future.result()
-                    if error:
-                        print(f"[Error] Failed to generate {v_type}: {error}")
-                        versions[v_type] = f"生成失败: {error}"
-                    else:
-                        versions[v_type] = content
-                        total_tokens += tokens
-            
-            # 计算费用 (需要 prompt_tokens 和 completion_tokens，这里简化处理)
-            # 假设 total_tokens 中 1/3 是 prompt, 2/3 是 completion
-            prompt_tokens = total_tokens // 3
-            completion_tokens = total_tokens - prompt_tokens
-            cost = calculate_deepseek_cost(prompt_tokens, completion_tokens)
             response_time = time.time() - start_time
-            
-            # 保存建议到数据库
+            outcome = dict(usage, mode='stream', llm_calls=len(VERSION_TYPES))
+
+            # 全部版本结束后再保存建议记录与各版本耗时
             suggestion_id = self._save_suggestion(
                 session_id=session_id,
                 prompt_id=prompt_id,
                 customer_message=customer_message,
                 versions=versions,
-                tokens_used=total_tokens,
-                cost=cost
+                tokens_used=usage['total_tokens'],
+                cost=usage['cost'],
+                usage=outcome
             )
-            
-            # 返回结果
-            return {
-                "success": True,
-                "aggressive": versions['aggressive'],
-                "conservative": versions['conservative'],
-                "professional": versions['professional'],
+            self._log_api_usage(prompt_id, outcome, response_time, success=not errors)
+            self.db.save_suggestion_timings(suggestion_id, timings)
+            if cache_probe and not fallback_versions:
+                self.reply_cache.put(cache_probe, versions)
+            finished = True
+
+            yield {
+                "type": "done",
                 "suggestion_id": suggestion_id,
-                "metadata": {
-                    "intent": customer_intent.value if customer_intent else None,
-                    "objection_type": objection_type.value if objection_type else None,
-                    "conversation_stage": conversation_stage.value if conversation_stage else None,
-                    "customer_stage": customer_memory.get('stage'),
-                    "context_info": context_metadata
-                },
-                "tokens_used": total_tokens,
-                "cost": cost,
-                "response_time": response_time
+                "suggestions": versions,
+                "tokens_used": usage['total_tokens'],
+                "prompt_tokens": usage['prompt_tokens'],
+                "completion_tokens": usage['completion_tokens'],
+                "prompt_cache_hit_tokens": usage['prompt_cache_hit_tokens'],
+                "cost": usage['cost'],
+                "response_time": response_time,
+                "timings": timings,
+                "fallback": {
+                    "source": prepared['fallback']['source'],
+                    "versions": fallback_versions
+                } if fallback_versions else None
             }
-        
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return {
-                "success": False,
-                "error": str(e),
-                "aggressive": "",
-                "conservative": "",
-                "professional": ""
-            }
+            yield {"type": "error", "error": str(e)}
+        finally:
+            # 客户端中途断开时停止仍在进行的上游请求
+            if not finished:
+                cancel()
 
+    def _lookup_reply_cache(
+        self,
+        session_id: str,
+        customer_message: str,
+        prompt_id: int,
+        conversation_history: List[Dict] = None
+    ) -> Tuple[Optional[Dict], Optional[Dict], Optional[Dict]]:
+        """
+        查找回复缓存：键为 (专家, 意图, 对话阶段, 客户画像, 会话话题, 脱敏并归一化的消息)，
+        意图与阶段都是关键词规则，客户画像读取一次客户记忆，话题用本地关键词提取，耗时可忽略
+
+        Returns:
+            (命中结果, 写入缓存用的 probe, 本轮情境 {"intent", "stage", "memory"})；
+            未启用或消息不参与缓存时 probe 为 None
+        """
+        if not Config.use_reply_cache():
+            return None, None, None
+        try:
+            masked_message = self.pii_masker.mask(customer_message)
+            intent = self.intent_recognizer.recognize_intent(masked_message)
+            intent_value = intent['intent'].value if intent['intent'] else None
+            history = conversation_history or [
+                {"role": "user" if msg['is_customer'] else "assistant", "content": msg['message']}
+                for msg in self.db.get_recent_messages(session_id, limit=20)
+            ]
+            stage = self.stage_manager.detect_stage(history, intent_value)
+            memory = self.customer_memory.get_memory(session_id)
+            topic = conversation_topic(
+                self.pii_masker.mask_chat_history(history), masked_message, self.keyword_extractor.extract
+            )
+            probe = self.reply_cache.probe(
+                prompt_id, masked_message, intent_value, stage.value if stage else None,
+                memory_profile(memory), topic
+            )
+            if probe is None:
+                return None, None, None
+            cached = self.reply_cache.get(
+                probe, embed=self._embed_for_cache, threshold=Config.get_reply_cache_semantic_threshold()
+            )
+            return cached, probe, {"intent": intent, "stage": stage, "memory": memory}
+        except Exception as e:
+            print(f"[ReplyCache] Lookup failed, generating normally: {e}")
+            return None, None, None
+
+    def _embed_for_cache(self, text: str) -> Optional[List[float]]:
+        """语义层使用知识库的向量模型；没有知识库或模型不可用时返回 None"""
+        if self.kb_manager is None:
+            return None
+        vectors = self.kb_manager.encode_texts([text])
+        return vectors[0] if vectors else None
+
+    def _cached_result(
+        self,
+        session_id: str,
+        customer_message: str,
+        prompt_id: int,
+        cached: Dict,
+        turn: Dict,
+        start_time: float
+    ) -> Dict:
+        """缓存命中：仍保存建议记录（版本选择与反馈学习照常进行）并更新客户记忆，不产生 token 费用"""
+        versions = cached['versions']
+        # 与正常生成一样计入互动次数、记录最后意图
+        try:
+            self.customer_memory.increment_interaction(session_id)
+            self.customer_memory.update_memory(session_id, self._intent_memory_updates(turn['intent']))
+        except Exception as e:
+            print(f"[ReplyCache] Customer memory update failed: {e}")
+
+        outcome = self._new_outcome('cache')
+        suggestion_id = self._save_suggestion(
+            session_id=session_id,
+            prompt_id=prompt_id,
+            customer_message=customer_message,
+            versions=versions,
+            tokens_used=0,
+            cost=0.0,
+            usage=outcome
+        )
+        intent, stage = turn['intent'], turn['stage']
+        print(f"[ReplyCache] {cached['tier']} hit (score {cached['score']})")
+        return {
+            "success": True,
+            **{v_type: versions[v_type] for v_type in VERSION_TYPES},
+            "suggestion_id": suggestion_id,
+            "metadata": {
+                "intent": intent['intent'].value if intent['intent'] else None,
+                "objection_type": intent['objection_type'].value if intent.get('objection_type') else None,
+                "conversation_stage": stage.value if stage else None,
+                "customer_stage": turn['memory'].get('stage'),
+                "reply_cache": {"tier": cached['tier'], "score": cached['score']}
+            },
+            "tokens_used": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "prompt_cache_hit_tokens": 0,
+            "generation_mode": "cache",
+            "llm_calls": 0,
+            "fallback": None,
+            "cost": 0.0,
+            "response_time": time.time() - start_time
+        }
+
+    @traced('generate.prepare')
+    def _prepare_generation(
+        self,
+        session_id: str,
+        customer_message: str,
+        system_prompt_config: Dict,
+        prompt_id: int,
+        conversation_history: List[Dict] = None
+    ) -> Dict:
+        """
+        生成前的准备：脱敏、上下文选择、意图识别、知识检索、构建 System Prompt
+
+        Returns:
+            {"system_prompt": str, "full_context": List[Dict], "metadata": Dict,
+             "fallback": {"source": str, "content": str}}
+            system_prompt 只含稳定部分；full_context 为 历史消息 + [本轮情境 (system)] + 当前消息
+        """
+        # ========== Phase 5: PII 安全脱敏 (离开本地前处理) ==========
+        masked_customer_message = self.pii_masker.mask(customer_message)
+
+        # 剩余预算不足以同时容纳生成时，跳过可选的 LLM 辅助步骤（关键词提取、语义预设匹配）；
+        # 辅助步骤本身在提前到期的子预算内执行，为生成预留时间
+        deadline = current_deadline()
+        helper_adapter = self.deepseek if deadline_allows(DEADLINE_GENERATION_RESERVE) else None
+        helper_deadline = deadline.shrink(DEADLINE_GENERATION_RESERVE) if deadline else None
+        if helper_adapter is None:
+            print(f"[Deadline] {deadline.remaining():.1f}s left, skipping optional LLM stages")
+
+        # 各阶段按依赖关系并发执行（上下文选择 → 向量检索 是关键路径，其余阶段与之并行）
+        def load_history():
+            if conversation_history:
+                # 脱敏上下文
+                return self.pii_masker.mask_chat_history(conversation_history)
+            # 从数据库获取
+            messages = self.db.get_recent_messages(session_id, limit=20)
+            return [
+                {
+                    "role": "user" if msg['is_customer'] else "assistant",
+                    "content": self.pii_masker.mask(msg['message']), # 脱敏处理
+                    "timestamp": msg.get('timestamp')
+                }
+                for msg in messages
+            ]
+
+        # 检索关键词默认本地提取（亚毫秒级）；AI_LLM_KEYWORDS=1 时在预算允许的情况下调用 DeepSeek
+        if Config.use_llm_keywords():
+            keyword_extractor = helper_adapter.extract_search_keywords if helper_adapter else None
+        else:
+            keyword_extractor = self.keyword_extractor.extract
+
+        def select_context(history):
+            with deadline_scope(helper_deadline):
+                return self.context_selector.select_context(
+                    history,
+                    max_tokens=2000,
+                    min_messages=3,
+                    customer_message=masked_customer_message,
+                    keyword_extractor=keyword_extractor
+                )
+
+        # ========== 改进点2: 客户意图识别（只依赖当前消息） ==========
+        def recognize_intent():
+            return self.intent_recognizer.recognize_intent(masked_customer_message)
+
+        # ========== 改进点3: 个性化记忆 ==========
+        def load_memory():
+            customer_memory = self.customer_memory.get_memory(session_id)
+            # 更新互动次数
+            self.customer_memory.increment_interaction(session_id)
+            return customer_memory
+
+        def update_memory(intent, memory):
+            # 更新最后意图（在读取记忆之后写入，保持与串行执行相同的可见性）
+            self.customer_memory.update_memory(session_id, self._intent_memory_updates(intent))
+
+        # ========== 改进点5 (RAG): 检索知识库与预设问答 ==========
+        # 5a. 首先尝试匹配“预设问答” (Preset QA) - 优先级最高
+        def match_preset():
+            with deadline_scope(helper_deadline):
+                preset_answer = self.db.match_preset_answer(
+                    prompt_id=prompt_id, 
+                    question=masked_customer_message,
+                    deepseek_adapter=helper_adapter # 启用语义匹配
+                )
+            if preset_answer:
+                print(f"[RAG] Preset QA Hit!")
+            return preset_answer
+
+        # 5b. 检索文档知识库 (Vector Search)
+        def search_knowledge(context):
+            selected_context, context_metadata = context
+            # 当前消息 + 提取的关键词 + 近期对话摘要，一次批量检索
+            # 传入当前 prompt_id 进行过滤
+            results = self.kb_manager.search_many(
+                self._build_search_queries(masked_customer_message, selected_context, context_metadata),
+                bound_prompt_id=prompt_id,
+                top_k=3, 
+                threshold=0.35 # 稍微调低阈值以增加召回
+            )
+            if results:
+                print(f"[RAG] Vector Search Hit {len(results)} chunks")
+            return results or []
+
+        # ========== Phase 3: Dynamic Few-Shot Learning ==========
+        # 从数据库获取“金牌话术”作为参考示例
+        # 如果支持 RAG 语义搜索金牌话术更好，目前先使用“高频使用的金牌话术”
+        def load_golden():
+            # 获取该 Prompt ID 下最热的 5 条金牌话术
+            return self.db.get_golden_replies(prompt_id=prompt_id, limit=5) or []
+
+        # ========== 改进点4: 多轮对话优化 ==========
+        def detect_stage(context, intent):
+            conversation_stage = self.stage_manager.detect_stage(
+                context[0],
+                intent['intent'].value if intent['intent'] else None
+            )
+            return conversation_stage, self.stage_manager.get_guidance(conversation_stage)
+
+        pipeline = StagePipeline([
+            Stage('history', load_history),
+            Stage('context', select_context, deps=['history']),
+            Stage('intent', recognize_intent, inline=True),
+            Stage('memory', load_memory, timeout=PIPELINE_STAGE_TIMEOUTS['memory'], optional=True, default={}),
+            Stage('memory_update', update_memory, deps=['intent', 'memory'],
+                  timeout=PIPELINE_STAGE_TIMEOUTS['memory'], optional=True),
+            Stage('preset', match_preset, timeout=PIPELINE_STAGE_TIMEOUTS['preset'], optional=True),
+            Stage('knowledge', search_knowledge, deps=['context'], timeout=PIPELINE_STAGE_TIMEOUTS['knowledge'],
+                  optional=True, default=[], condition=lambda: bool(self.kb_manager and customer_message)),
+            Stage('golden', load_golden, timeout=PIPELINE_STAGE_TIMEOUTS['golden'], optional=True, default=[]),
+            Stage('stage', detect_stage, deps=['context', 'intent'], inline=True),
+        ], concurrent=Config.use_stage_pipeline())
+        results = pipeline.run()
+
+        selected_context, context_metadata = results['context']
+        customer_intent = results['intent']['intent']
+        objection_type = results['intent'].get('objection_type')
+        customer_memory = results['memory'] or {}
+        conversation_stage, stage_guidance = results['stage']
+
+        retrieved_knowledge = []
+        # 时间预算用尽时的兜底回复，按 预设问答 > 金牌话术 > 检索片段 的优先级选取
+        fallback_candidates = {}
+
+        preset_answer = results['preset']
+        if preset_answer:
+            fallback_candidates['preset'] = preset_answer
+            retrieved_knowledge.append(f"[官方标准回答] {preset_answer}")
+
+        if results['knowledge']:
+            fallback_candidates['knowledge'] = results['knowledge'][0]['content'][:FALLBACK_SNIPPET_CHARS]
+            for res in results['knowledge']:
+                # 避免重复
+                knowledge_item = f"[参考资料: {res['source']}] {res['content']}"
+                if knowledge_item not in retrieved_knowledge:
+                    retrieved_knowledge.append(knowledge_item)
+
+        top_golden = results['golden']
+        if top_golden:
+            print(f"[Learning] Injected {len(top_golden)} golden replies")
+            fallback_candidates['golden'] = top_golden[0]['reply']
+            golden_formatted = []
+            for g in top_golden:
+                golden_formatted.append(f"Q: {g['question']}\nA: {g['reply']}")
+            
+            # 将金牌话术注入到 prompt_config 中 (需要 prompt_builder 支持，或者放入 knowledge_base)
+            # 放入 knowledge_base 是个简单有效的 hack
+            # 也可以作为一个单独的 section
+            # 复制一份再注入，不修改调用方传入的配置
+            system_prompt_config = {**system_prompt_config, 'few_shot_examples': golden_formatted}
+        
+        # ========== 构建增强版 System Prompt（按上下文缓存友好的顺序拆分） ==========
+        # 稳定部分（只取决于专家配置）作为首条消息；本轮情境与检索资料放在历史之后、当前消息之前
+        stable_prompt = self.prompt_builder.build_stable_prompt(system_prompt_config)
+        turn_prompt = self.prompt_builder.build_turn_prompt(
+            customer_memory=customer_memory,
+            conversation_stage=conversation_stage,
+            customer_intent=customer_intent,
+            objection_type=objection_type,
+            stage_guidance=stage_guidance,
+            retrieved_knowledge=retrieved_knowledge
+        )
+        
+        # 历史消息只保留 role / content，按时间顺序排列，保证同一会话的后续请求前缀一致
+        full_context = [{"role": msg['role'], "content": msg['content']} for msg in selected_context]
+        if turn_prompt:
+            full_context.append({"role": "system", "content": turn_prompt})
+        full_context.append({"role": "user", "content": masked_customer_message})
+        
+        return {
+            "system_prompt": stable_prompt,
+            "full_context": full_context,
+            "metadata": {
+                "intent": customer_intent.value if customer_intent else None,
+                "objection_type": objection_type.value if objection_type else None,
+                "conversation_stage": conversation_stage.value if conversation_stage else None,
+                "customer_stage": customer_memory.get('stage'),
+                "context_info": context_metadata,
+                "pipeline": {"timings_ms": pipeline.timings, "skipped": pipeline.skipped}
+            },
+            "fallback": next(
+                ({"source": source, "content": fallback_candidates[source]}
+                 for source in ('preset', 'golden', 'knowledge') if fallback_candidates.get(source)),
+                {"source": "default", "content": FALLBACK_REPLY}
+            )
+        }
+
+    @staticmethod
+    def _intent_memory_updates(intent: Dict) -> Dict:
+        """本轮意图识别结果中需要记入客户记忆的字段"""
+        return {
+            'last_intent': intent['intent'].value if intent['intent'] else None,
+            'last_objection_type': intent['objection_type'].value if intent.get('objection_type') else None
+        }
+
+    @property
+    def async_deepseek(self) -> AsyncDeepSeekAdapter:
+        # 首次使用时才启动共享事件循环
+        if self._async_deepseek is None:
+            self._async_deepseek = get_async_deepseek_adapter(self.api_key)
+        return self._async_deepseek
+
+    @staticmethod
+    def _run_timeout() -> float:
+        """等待一批 LLM 调用的最长时间：不超过当前请求剩余的时间预算"""
+        deadline = current_deadline()
+        return deadline.timeout(LLM_RUN_TIMEOUT) if deadline else LLM_RUN_TIMEOUT
+
+    @staticmethod
+    def _collect_versions(generated: Dict[str, str], errors: Dict, fallback: Dict) -> Tuple[Dict[str, str], List[str]]:
+        """
+        汇总各版本结果；设置了时间预算时，未生成的版本使用兜底回复（保证坐席拿到可用答复）
+
+        Returns:
+            (versions, fallback_versions)
+        """
+        use_fallback = current_deadline() is not None
+        versions, fallback_versions = {}, []
+        for v_type in VERSION_TYPES:
+            if v_type in generated:
+                versions[v_type] = generated[v_type]
+                continue
+            error = errors.get(v_type)
+            print(f"[Error] Failed to generate {v_type}: {error}")
+            if use_fallback:
+                versions[v_type] = fallback['content']
+                fallback_versions.append(v_type)
+            else:
+                versions[v_type] = f"生成失败: {error}"
+        return versions, fallback_versions
+
+    @staticmethod
+    def _layout_messages(system_prompt: str, full_context: List[Dict], suffix: str) -> List[Dict]:
+        """
+        上下文缓存友好的消息布局：
+        [稳定 System Prompt] + 历史消息 + [本轮情境 + 版本要求] + 当前消息
+        变化的内容都在末尾，各版本之间、同一会话的相邻请求之间共享尽可能长的请求前缀
+        """
+        *history, current = full_context
+        turn_prompt = history.pop()['content'] if history and history[-1].get('role') == 'system' else ''
+        return (
+            [{"role": "system", "content": system_prompt}]
+            + history
+            + [{"role": "system", "content": (turn_prompt + suffix).strip()}, current]
+        )
+
+    def _version_messages(self, system_prompt: str, full_context: List[Dict], v_type: str) -> List[Dict]:
+        # 版本特定的要求放在最后，不破坏共享前缀
+        return self._layout_messages(system_prompt, full_context, self.prompt_builder.build_version_suffix(v_type))
+
+    def _multi_version_messages(self, system_prompt: str, full_context: List[Dict], version_types: List[str]) -> List[Dict]:
+        # 共享的 System Prompt 与上下文只发送一次
+        return self._layout_messages(
+            system_prompt, full_context, self.prompt_builder.build_multi_version_suffix(version_types)
+        )
+
+    @staticmethod
+    def _new_outcome(mode: str) -> Dict:
+        return {
+            "mode": mode,
+            "versions": {},
+            "errors": {},
+            "llm_calls": 0,
+            "fallback_versions": [],
+            **{key: 0 for key in USAGE_TOKEN_KEYS},
+            "cost": 0.0
+        }
+
+    @staticmethod
+    def _add_usage(outcome: Dict, api_result: Dict):
+        outcome['llm_calls'] += 1
+        for key in USAGE_TOKEN_KEYS:
+            outcome[key] += api_result.get(key, 0)
+        outcome['cost'] += api_result.get('cost', 0.0)
+
+    def _apply_multi_result(self, outcome: Dict, api_result: Dict, version_types: List[str]) -> List[str]:
+        """记录一次多版本调用的结果，返回需要单独补生成的版本"""
+        self._add_usage(outcome, api_result)
+        if api_result.get('success'):
+            outcome['versions'].update(parse_multi_version_reply(api_result.get('content', ''), version_types))
+        missing = [v_type for v_type in version_types if v_type not in outcome['versions']]
+        if missing:
+            reason = api_result.get('error') if not api_result.get('success') else '多版本 JSON 解析失败'
+            print(f"[Generator] Single-call generation incomplete ({reason}), falling back for: {missing}")
+            outcome['fallback_versions'] = missing
+        return missing
+
+    def _apply_version_result(self, outcome: Dict, v_type: str, api_result: Dict):
+        self._add_usage(outcome, api_result)
+        if api_result.get('success'):
+            outcome['versions'][v_type] = api_result['content']
+        else:
+            outcome['errors'][v_type] = api_result.get('error')
+
+    @traced('generate.versions')
+    def _generate_versions(
+        self,
+        system_prompt: str,
+        full_context: List[Dict],
+        version_types: List[str],
+        mode: Optional[str] = None
+    ) -> Dict:
+        """
+        生成多个版本（同步入口，供 Flask 视图与后台线程调用）
+
+        - single：一次调用以 JSON 输出全部版本，解析失败的版本再单独调用补生成
+        - per_style：每个版本单独调用，并发执行
+        默认提交到共享事件循环异步执行；AI_ASYNC_LLM=0 时回退到线程池
+
+        Returns:
+            {"mode", "versions": {v_type: reply}, "errors": {v_type: error}, "llm_calls",
+             "fallback_versions", "prompt_tokens", "completion_tokens", "total_tokens", "cost"}
+        """
+        mode = mode or Config.get_generation_mode()
+        if Config.use_async_llm():
+            try:
+                return self.async_deepseek.runtime.run(
+                    self.generate_versions_async(system_prompt, full_context, version_types, mode),
+                    timeout=self._run_timeout()
+                )
+            except concurrent.futures.TimeoutError:
+                outcome = self._new_outcome(mode)
+                outcome['errors'] = {v_type: "生成超时" for v_type in version_types}
+                return outcome
+
+        outcome = self._new_outcome(mode)
+        pending = list(version_types)
+        if mode == 'single':
+            api_result = self.deepseek.chat(
+                messages=self._multi_version_messages(system_prompt, full_context, version_types),
+                temperature=0.7,
+                max_tokens=AI_MULTI_VERSION_MAX_TOKENS,
+                response_format=JSON_RESPONSE_FORMAT
+            )
+            pending = self._apply_multi_result(outcome, api_result, version_types)
+
+        def _generate_version(v_type):
+            return v_type, self.deepseek.chat(
+                messages=self._version_messages(system_prompt, full_context, v_type),
+                temperature=0.7,
+                max_tokens=AI_VERSION_MAX_TOKENS # 稍微增加长度限制
+            )
+
+        if pending:
+            executor = _get_version_executor()
+            # 线程池不继承调用方的上下文（出站通道、时间预算），逐个复制
+            futures = [
+                executor.submit(contextvars.copy_context().run, _generate_version, v_type)
+                for v_type in pending
+            ]
+            for future in futures:
+                v_type, api_result = future.result()
+                self._apply_version_result(outcome, v_type, api_result)
+        return outcome
+
+    async def generate_versions_async(
+        self,
+        system_prompt: str,
+        full_context: List[Dict],
+        version_types: List[str],
+        mode: Optional[str] = None
+    ) -> Dict:
+        """异步版本：逐版本请求用 asyncio.gather 并发，受全局并发信号量约束"""
+        mode = mode or Config.get_generation_mode()
+        outcome = self._new_outcome(mode)
+        pending = list(version_types)
+        if mode == 'single':
+            api_result = await self.async_deepseek.chat(
+                messages=self._multi_version_messages(system_prompt, full_context, version_types),
+                temperature=0.7,
+                max_tokens=AI_MULTI_VERSION_MAX_TOKENS,
+                response_format=JSON_RESPONSE_FORMAT
+            )
+            pending = self._apply_multi_result(outcome, api_result, version_types)
+
+        async def _generate_version(v_type):
+            return v_type, await self.async_deepseek.chat(
+                messages=self._version_messages(system_prompt, full_context, v_type),
+                temperature=0.7,
+                max_tokens=AI_VERSION_MAX_TOKENS
+            )
+
+        for v_type, api_result in await asyncio.gather(*[_generate_version(v_type) for v_type in pending]):
+            self._apply_version_result(outcome, v_type, api_result)
+        return outcome
+
+    def _start_version_streams(
+        self,
+        system_prompt: str,
+        full_context: List[Dict],
+        version_types: List[str],
+        events: queue.Queue
+    ):
+        """
+        并发启动各版本的流式请求，事件写入 events 队列：
+        ('delta', v_type, text) / ('done', v_type, usage) / ('error', v_type, message)
+
+        Returns:
+            取消函数
+        """
+        if Config.use_async_llm():
+            adapter = self.async_deepseek
+
+            async def _stream(v_type):
+                usage = {}
+                try:
+                    async for chunk in adapter.chat_stream(
+                        self._version_messages(system_prompt, full_context, v_type),
+                        temperature=0.7,
+                        max_tokens=AI_VERSION_MAX_TOKENS,
+                        usage=usage
+                    ):
+                        events.put(('delta', v_type, chunk))
+                    events.put(('done', v_type, usage))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    events.put(('error', v_type, e))
+
+            async def _stream_all():
+                await asyncio.gather(*[_stream(v_type) for v_type in version_types])
+
+            future = adapter.runtime.submit(_stream_all())
+            return future.cancel
+
+        # 回退：每个版本一个线程读取同步流
+        stop = threading.Event()
+
+        def _stream_sync(v_type):
+            usage = {}
+            try:
+                for chunk in self.deepseek.chat_stream(
+                    self._version_messages(system_prompt, full_context, v_type),
+                    temperature=0.7,
+                    max_tokens=AI_VERSION_MAX_TOKENS,
+                    usage=usage
+                ):
+                    if stop.is_set():
+                        return
+                    if chunk:
+                        events.put(('delta', v_type, chunk))
+                events.put(('done', v_type, usage))
+            except Exception as e:
+                events.put(('error', v_type, e))
+
+        for v_type in version_types:
+            threading.Thread(
+                target=contextvars.copy_context().run, args=(_stream_sync, v_type),
+                name=f"stream-{v_type}", daemon=True
+            ).start()
+        return stop.set
+
+    def _build_search_queries(
+        self,
+        customer_message: str,
+        selected_context: List[Dict],
+        context_metadata: Dict
+    ) -> List[str]:
+        """
+        构建知识库检索的查询列表：
+        1. 当前客户消息
+        2. 上下文选择器提取的搜索关键词
+        3. 最近几条客户消息拼成的滚动摘要
+        """
+        queries = [customer_message]
+
+        keywords = (context_metadata or {}).get('search_keywords') or []
+        if keywords:
+            queries.append(" ".join(keywords))
+
+        recent_customer = [
+            msg.get('content', '') for msg in (selected_context or [])
+            if msg.get('role') == 'user' and msg.get('content')
+        ][-KB_SUMMARY_QUERY_MESSAGES:]
+        if recent_customer:
+            summary = " ".join(recent_customer)[-KB_SUMMARY_QUERY_MAX_CHARS:]
+            if summary != customer_message:
+                queries.append(summary)
+
+        return queries
+
+    @traced('generate.save')
     def _save_suggestion(
         self,
         session_id: str,
@@ -312,17 +1026,20 @@ class EnhancedReplyGenerator:
         customer_message: str,
         versions: Dict,
         tokens_used: int,
-        cost: float
+        cost: float,
+        usage: Optional[Dict] = None
     ) -> int:
         """保存生成的建议到数据库"""
+        usage = usage or {}
         conn = self.db.get_connection()
         cursor = conn.cursor()
 
         cursor.execute("""
             INSERT INTO ai_suggestions
             (session_id, prompt_id, customer_message, suggestion_aggressive,
-             suggestion_conservative, suggestion_professional, tokens_used, cost)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+             suggestion_conservative, suggestion_professional, tokens_used, cost,
+             prompt_tokens, completion_tokens, generation_mode, llm_calls)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             session_id,
             prompt_id,
@@ -331,7 +1048,11 @@ class EnhancedReplyGenerator:
             versions['conservative'],
             versions['professional'],
             tokens_used,
-            cost
+            cost,
+            usage.get('prompt_tokens', 0),
+            usage.get('completion_tokens', 0),
+            usage.get('mode'),
+            usage.get('llm_calls', 0)
         ))
 
         suggestion_id = cursor.lastrowid
@@ -340,6 +1061,20 @@ class EnhancedReplyGenerator:
 
         return suggestion_id
 
+    def _log_api_usage(self, prompt_id: int, usage: Dict, response_time: float, success: bool):
+        """记录一次生成请求的 API 用量（多次 LLM 调用合计，含上下文缓存命中 token）"""
+        try:
+            self.db.log_api_usage({
+                'prompt_id': prompt_id,
+                'model_name': self.deepseek.model,
+                **{key: usage.get(key, 0) for key in USAGE_TOKEN_KEYS},
+                'estimated_cost': usage.get('cost', 0.0),
+                'response_time': response_time,
+                'success': success
+            })
+        except Exception as e:
+            print(f"[Usage] Failed to log API usage: {e}")
+
     def record_version_selection(
         self,
         session_id: str,
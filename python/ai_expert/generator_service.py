@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Generator Service
+应用级回复生成器服务
+
+EnhancedReplyGenerator 本身不保存请求状态，但构造开销不小：意图识别器要重建关键词表，
+CustomerMemory / FeedbackLearner 在构造时执行建表 DDL。服务在应用启动时创建一次：
+- 按 API Key 缓存生成器，各请求直接复用（共享 Adapter、连接池与版本生成线程池）
+- API Key 只在首次使用时读取（环境变量或 ai_config.json），之后直接取缓存
+- 配置更新（如修改 API Key）后调用 invalidate()，下一个请求构建新的生成器；
+  旧生成器仍可供进行中的请求使用，切换无需加锁等待
+"""
+
+import threading
+from typing import Dict, Optional
+
+from .config import Config
+from .deepseek_adapter import get_deepseek_adapter
+from .enhanced_reply_generator import EnhancedReplyGenerator
+
+
+class GeneratorService:
+    """按 API Key 复用 EnhancedReplyGenerator"""
+
+    def __init__(self, db, kb_manager=None):
+        self.db = db
+        self.kb_manager = kb_manager
+        self._generators: Dict[str, EnhancedReplyGenerator] = {}
+        self._api_key: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {'builds': 0, 'invalidations': 0}
+
+    def get_api_key(self) -> str:
+        """当前配置的 DeepSeek API Key（未配置时每次重新读取，以便配置后立即生效）"""
+        api_key = self._api_key
+        if api_key is None:
+            api_key = Config.get_deepseek_api_key()
+            if api_key:
+                self._api_key = api_key
+        return api_key
+
+    def get(self, api_key: Optional[str] = None) -> EnhancedReplyGenerator:
+        """获取（必要时构建）生成器；不传 api_key 时使用当前配置的 Key"""
+        api_key = api_key or self.get_api_key()
+        generator = self._generators.get(api_key)
+        if generator is None:
+            with self._lock:
+                generator = self._generators.get(api_key)
+                if generator is None:
+                    generator = EnhancedReplyGenerator(
+                        api_key, self.db, kb_manager=self.kb_manager,
+                        deepseek_adapter=get_deepseek_adapter(api_key)
+                    )
+                    # 复制后整体替换，读取方无需加锁
+                    self._generators = {**self._generators, api_key: generator}
+                    self._stats['builds'] += 1
+                    print(f"[GeneratorService] Built generator #{self._stats['builds']}")
+        return generator
+
+    def invalidate(self):
+        """配置变化后调用：丢弃缓存的 API Key 与生成器，下次请求时重新构建"""
+        with self._lock:
+            self._api_key = None
+            self._generators = {}
+            self._stats['invalidations'] += 1
+
+    def get_metrics(self) -> Dict:
+        return {'generators': len(self._generators), **self._stats}
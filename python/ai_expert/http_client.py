@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP Client
+进程级共享的 HTTP 客户端
+
+所有对 DeepSeek 的调用共用一个 requests.Session：
+- HTTPAdapter 维护按主机划分的连接池，keep-alive 复用 TCP / TLS 连接
+- 启动时可选预热，首个生成请求也不必等待握手
+- 统计请求数、新建连接数、池中空闲连接等指标，供 /stats/performance 展示
+- 请求可绑定 RequestHandle，由其他线程中止（对冲请求胜出后中止仍在等待的原请求）
+"""
+
+import time
+import socket
+import threading
+import contextvars
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .constants import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+
+# ========== 可中止的请求 ==========
+
+_current_handle: contextvars.ContextVar = contextvars.ContextVar('http_request_handle', default=None)
+
+
+class RequestHandle:
+    """
+    在途请求的中止句柄：cancel() 关闭该请求正在使用的连接，阻塞中的调用抛出 ConnectionError
+    （连接归还连接池后句柄即失效，不会误关其他请求复用的连接）
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _attach(self, connection):
+        with self._lock:
+            self._connection = connection
+
+    def _detach(self, connection):
+        with self._lock:
+            if self._connection is connection:
+                self._connection = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connection = self._connection
+            # 持锁关闭，保证连接不会在关闭前被归还、分给其他请求
+            sock = getattr(connection, 'sock', None) if connection is not None else None
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class _TrackedPoolMixin:
+    """从连接池取出连接时登记到当前请求的句柄，归还时注销"""
+
+    def _get_conn(self, *args, **kwargs):
+        conn = super()._get_conn(*args, **kwargs)
+        handle = _current_handle.get()
+        if handle is not None:
+            conn._request_handle = handle
+            handle._attach(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        handle = getattr(conn, '_request_handle', None)
+        if handle is not None:
+            handle._detach(conn)
+            conn._request_handle = None
+        return super()._put_conn(conn)
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _TrackedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TrackedHTTPConnectionPool,
+            'https': _TrackedHTTPSConnectionPool,
+        }
+
+
+class HTTPClient:
+    """带连接池与指标的共享 HTTP 客户端"""
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS, pool_maxsize: int = HTTP_POOL_MAXSIZE):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        self.session = requests.Session()
+        # pool_block=False：池满时临时新建连接而不是阻塞，用完后多余连接被丢弃
+        self.adapter = _TrackedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._errors = 0
+        self._total_latency = 0.0
+        self._warmed_up_hosts = []
+
+    # ========== 请求 ==========
+
+    def request(self, method: str, url: str, handle: Optional[RequestHandle] = None, **kwargs) -> requests.Response:
+        """
+        发出请求
+
+        Args:
+            handle: 可选的中止句柄，其他线程调用 handle.cancel() 时本次请求抛出 ConnectionError
+        """
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        start = time.time()
+        token = _current_handle.set(handle)
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            if not (handle and handle.cancelled):
+                with self._lock:
+                    self._errors += 1
+            raise
+        finally:
+            _current_handle.reset(token)
+            with self._lock:
+                self._in_flight -= 1
+                self._requests += 1
+                self._total_latency += time.time() - start
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def warm_up(self, url: str, headers: Optional[Dict] = None, timeout: float = 10, background: bool = True):
+        """预先建立到目标主机的连接（TCP + TLS），失败不影响后续请求"""
+        def _run():
+            try:
+                self.get(url, headers=headers, timeout=timeout).close()
+                with self._lock:
+                    self._warmed_up_hosts.append(url)
+                print(f"[HTTPClient] Connection warmed up: {url}")
+            except Exception as e:
+                print(f"[HTTPClient] Warm-up failed ({url}): {e}")
+
+        if background:
+            threading.Thread(target=_run, name="http-warmup", daemon=True).start()
+        else:
+            _run()
+
+    # ========== 指标 ==========
+
+    def get_metrics(self) -> Dict:
+        pools = []
+        # urllib3 PoolManager 按 (scheme, host, port) 维护连接池
+        pool_manager = self.adapter.poolmanager
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                # 队列中预填了 None 占位，只统计真实的空闲连接
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                'maxsize': pool.pool.maxsize if pool.pool is not None else self.pool_maxsize,
+            })
+
+        with self._lock:
+            requests_total = self._requests
+            metrics = {
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'requests': requests_total,
+                'errors': self._errors,
+                'in_flight': self._in_flight,
+                'peak_in_flight': self._peak_in_flight,
+                'avg_latency': round(self._total_latency / requests_total, 4) if requests_total else 0.0,
+                'warmed_up': list(self._warmed_up_hosts),
+            }
+
+        created = sum(p['connections_created'] for p in pools)
+        pooled_requests = sum(p['requests'] for p in pools)
+        metrics['pools'] = pools
+        metrics['connections_created'] = created
+        # 复用率：不需要新建连接的请求占比
+        metrics['connection_reuse_rate'] = round(1 - created / pooled_requests, 4) if pooled_requests else 0.0
+        return metrics
+
+    def close(self):
+        self.session.close()
+
+
+_client: Optional[HTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """获取进程级共享的 HTTP 客户端"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from .config import Config
+                _client = HTTPClient(pool_maxsize=Config.get_http_pool_maxsize())
+    return _client
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Local Keyword Extractor
+本地检索关键词提取（替代每次生成时的 LLM 关键词调用）
+
+SmartContextSelector 用关键词挑选高价值历史消息、向量检索用关键词扩展查询。
+过去每次生成都要多一次 DeepSeek 往返（约 1 秒），本模块在本地完成，耗时亚毫秒级：
+- 候选词：中文片段先在虚词、代词和常见功能词（"一下"、"这个"、"了解" 等）处切开，再取字符 n-gram (2~4)，
+  候选词中不含虚词，不会出现 "播课的安" 这类跨词碎片
+- 领域词表：keyword_rules 关键词、preset_qa 问答、知识库分块文本，加上上下文选择 / 异议识别内置的
+  常用词（价格、优惠、售后等，保证没有知识库时词表也不为空），统计候选词的文档频率；
+  只在一个分块中出现的 n-gram 数量很大，用位图记录"出现过"，不放进词频字典
+- 提取：候选词按 词频 × IDF × √长度 打分，关键词规则中的词加权，语料中从未出现的候选（多为跨词碎片）降权；
+  与已选词共用字符的候选（子串、跨词碎片）不再选取
+- 首次提取等待第一次构建完成（只等一次）；之后词表在后台线程中重建并整体替换，按固定间隔刷新，
+  AI 专家配置或知识库变化后标记为过期，提取不再等待
+"""
+
+import math
+import re
+import time
+import threading
+import weakref
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from .tracing import traced
+from .constants import (
+    KEYWORD_NGRAM_RANGE,
+    KEYWORD_TOP_K,
+    KEYWORD_LEXICON_REFRESH_INTERVAL,
+    KEYWORD_LEXICON_MAX_CHUNKS,
+    KEYWORD_RULE_BOOST,
+    KEYWORD_UNSEEN_PENALTY,
+    KEYWORD_SEEN_FILTER_BITS
+)
+
+# 虚词、代词：候选词不能包含这些字
+STOP_CHARS = set("的了吗呢啊吧呀哦嗯么我你他她它们这那就都也很太挺又啦哈嘛")
+# 常见功能词：单字本身可能出现在领域词中（"下单"、"一对一"、"在线"），整词出现时才切开
+STOP_WORDS = [
+    '一下', '一点', '一些', '一个', '这个', '那个', '这些', '那些', '哪个', '哪些',
+    '什么', '怎么', '怎样', '如何', '为什么', '可以', '能不能', '可不可以', '是不是', '有没有',
+    '请问', '想要', '想问', '了解', '咨询', '知道', '需要', '还是', '还有', '或者', '是否',
+    '现在', '已经', '一般', '大概', '比较', '非常', '在吗', '谢谢', '你好', '您好',
+]
+_STOP_RE = re.compile(
+    '|'.join(sorted(STOP_WORDS, key=len, reverse=True)) + '|[' + ''.join(sorted(STOP_CHARS)) + ']'
+)
+_CJK_RUN = re.compile(r'[\u4e00-\u9fff]+')
+_WORD = re.compile(r'[A-Za-z][A-Za-z0-9]+|\d{2,}[A-Za-z]*')
+
+
+def iter_terms(text: str) -> Iterable[str]:
+    """文本中的候选词：中文连续片段在虚词 / 功能词处切开后的字符 n-gram + 英文 / 型号类词"""
+    low, high = KEYWORD_NGRAM_RANGE
+    for run in _CJK_RUN.findall(text or ''):
+        for segment in _STOP_RE.split(run):
+            for n in range(low, min(high, len(segment)) + 1):
+                for i in range(len(segment) - n + 1):
+                    yield segment[i:i + n]
+    for word in _WORD.findall(text or ''):
+        yield word.lower()
+
+
+def builtin_terms() -> List[str]:
+    """上下文选择与异议识别内置的常用词，作为词表的种子"""
+    from .smart_context_selector import SmartContextSelector
+    from .intent_recognizer import IntentRecognizer
+
+    terms = list(SmartContextSelector().high_value_keywords)
+    for keywords in IntentRecognizer().objection_keywords.values():
+        terms.extend(keywords)
+    return terms
+
+
+class _SeenFilter:
+    """记录 n-gram 是否出现过的位图（两个哈希位，极少数未出现的词会被误判为出现过）"""
+
+    def __init__(self, bits: int = KEYWORD_SEEN_FILTER_BITS):
+        self.size = bits
+        self.bits = bytearray(bits // 8)
+
+    def _positions(self, term: str):
+        value = hash(term)
+        return value % self.size, (value >> 32) % self.size
+
+    def add(self, term: str):
+        for pos in self._positions(term):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, term: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(term))
+
+
+class KeywordLexicon:
+    """领域词表快照：n-gram 文档频率 + 只出现过一次的 n-gram 位图 + 关键词规则词"""
+
+    def __init__(self, doc_freq: Dict[str, int], n_docs: int, rule_terms: Set[str],
+                 seen_once: Optional[_SeenFilter] = None):
+        self.doc_freq = doc_freq
+        self.n_docs = n_docs
+        self.rule_terms = rule_terms
+        self.seen_once = seen_once
+
+    def document_frequency(self, term: str) -> int:
+        df = self.doc_freq.get(term)
+        if df:
+            return df
+        return 1 if self.seen_once is not None and term in self.seen_once else 0
+
+    @classmethod
+    def build(cls, rule_terms: Iterable[str], protected_docs: Iterable[str], corpus_docs: Iterable[str]) -> "KeywordLexicon":
+        """
+        Args:
+            rule_terms: keyword_rules 中的关键词（提取时加权）
+            protected_docs: 预设问答、内置常用词等短文档，其中的 n-gram 全部计入词频字典
+            corpus_docs: 知识库分块；至少在两个文档中出现的 n-gram 计入词频字典，
+                只出现一次的记在位图中（文档频率按 1 计），控制词表内存
+        """
+        rule_terms = {t.strip().lower() for t in rule_terms if t and t.strip()}
+        doc_freq: Counter = Counter()
+        n_docs = 0
+        for doc in protected_docs:
+            doc_freq.update(set(iter_terms(doc)))
+            n_docs += 1
+        seen_once = _SeenFilter()
+        for doc in corpus_docs:
+            for gram in set(iter_terms(doc)):
+                if gram in doc_freq:
+                    doc_freq[gram] += 1
+                elif gram in seen_once:
+                    doc_freq[gram] = 2
+                else:
+                    seen_once.add(gram)
+            n_docs += 1
+        for term in rule_terms:
+            doc_freq[term] += 1
+        n_docs += len(rule_terms)
+        return cls(dict(doc_freq), n_docs, rule_terms, seen_once)
+
+    def extract(self, text: str, top_k: int = KEYWORD_TOP_K) -> List[str]:
+        counts = Counter(iter_terms(text))
+        # 关键词规则可能是单字或长词，直接按包含关系补充
+        lowered = (text or '').lower()
+        for term in self.rule_terms:
+            if term not in counts and term in lowered:
+                counts[term] = lowered.count(term)
+        if not counts:
+            return []
+
+        scores = {}
+        for term, tf in counts.items():
+            df = self.document_frequency(term)
+            score = tf * (math.log((self.n_docs + 1) / (df + 1)) + 1) * math.sqrt(len(term))
+            if term in self.rule_terms:
+                score *= KEYWORD_RULE_BOOST
+            elif self.n_docs and df == 0:
+                score *= KEYWORD_UNSEEN_PENALTY
+            scores[term] = score
+
+        # 与已选词共用字符的候选（子串、父串或跨词碎片）不再选取
+        selected: List[str] = []
+        used_chars: Set[str] = set()
+        for term in sorted(scores, key=lambda t: (-scores[t], -len(t), t)):
+            if used_chars.intersection(term):
+                continue
+            selected.append(term)
+            used_chars.update(term)
+            if len(selected) >= top_k:
+                break
+        return selected
+
+
+class LocalKeywordExtractor:
+    """按数据库实例维护领域词表，后台刷新"""
+
+    def __init__(self, db, refresh_interval: float = KEYWORD_LEXICON_REFRESH_INTERVAL):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._lexicon = KeywordLexicon({}, 0, set())
+        self._built_at: Optional[float] = None
+        self._next_refresh = 0.0
+        self._stale = True
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()    # 同一时间只构建一份词表
+        self._first_build = threading.Event()  # 第一次构建（无论成败）已结束
+        self._watched = weakref.WeakSet()
+        self._stats = {'extractions': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    @traced('keywords.local')
+    def extract(self, text: str, top_k: int = KEYWORD_TOP_K) -> List[str]:
+        """提取检索关键词（使用当前词表快照；首次调用等待第一次构建，之后词表过期时触发后台刷新）"""
+        if not self._first_build.is_set():
+            self._wait_for_first_build()
+        self._maybe_refresh()
+        self._stats['extractions'] += 1
+        return self._lexicon.extract(text, top_k)
+
+    def warm_up(self):
+        """启动时在后台构建词表，首个请求通常无需等待"""
+        self._maybe_refresh()
+
+    def _wait_for_first_build(self):
+        """空词表下的提取结果没有意义：等待进行中的构建，或在当前线程构建一次"""
+        with self._build_lock:
+            if self._first_build.is_set():
+                return
+            try:
+                self._build()
+            except Exception as e:
+                # 使用空词表继续，到下一个刷新间隔再试
+                self._next_refresh = time.monotonic() + self.refresh_interval
+                self._stats['refresh_errors'] += 1
+                print(f"[Keywords] Lexicon build failed: {e}")
+            finally:
+                self._first_build.set()
+
+    def _maybe_refresh(self):
+        if not self._stale and time.monotonic() < self._next_refresh:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True, name="keyword-lexicon").start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # 保留旧词表，到下一个刷新间隔再试
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            self._stats['refresh_errors'] += 1
+            print(f"[Keywords] Lexicon refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self):
+        """从数据库重建词表并整体替换（同步执行）"""
+        with self._build_lock:
+            try:
+                self._build()
+            finally:
+                self._first_build.set()
+
+    def _build(self):
+        self._stale = False
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT keyword FROM keyword_rules WHERE is_active = 1")
+            rule_terms = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT question_pattern, answer FROM preset_qa WHERE is_active = 1")
+            preset_docs = [f"{row[0]} {row[1]}" for row in cursor.fetchall()]
+            cursor.execute("SELECT content FROM chunks ORDER BY id DESC LIMIT ?", (KEYWORD_LEXICON_MAX_CHUNKS,))
+            chunk_docs = [row[0] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        lexicon = KeywordLexicon.build(rule_terms, preset_docs + builtin_terms(), chunk_docs)
+        self._lexicon = lexicon
+        self._built_at = time.monotonic()
+        self._next_refresh = self._built_at + self.refresh_interval
+        self._stats['refreshes'] += 1
+        print(f"[Keywords] Lexicon rebuilt: {len(lexicon.doc_freq)} terms from {lexicon.n_docs} documents")
+
+    def mark_stale(self, prompt_id: Optional[int] = None):
+        """配置或知识库变化后调用：下次提取时在后台重建词表"""
+        self._stale = True
+
+    def watch_knowledge_base(self, kb_manager):
+        """知识库文档变化时标记过期（同一知识库只注册一次）"""
+        with self._lock:
+            if kb_manager in self._watched:
+                return
+            self._watched.add(kb_manager)
+        kb_manager.add_change_listener(self.mark_stale)
+
+    def get_metrics(self) -> Dict:
+        return {
+            'terms': len(self._lexicon.doc_freq),
+            'documents': self._lexicon.n_docs,
+            'age_seconds': round(time.monotonic() - self._built_at, 1) if self._built_at else None,
+            **self._stats
+        }
+
+
+_extractors: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_extractors_lock = threading.Lock()
+
+
+def get_keyword_extractor(db) -> LocalKeywordExtractor:
+    """获取数据库实例对应的本地关键词提取器（首次获取时注册配置变更回调）"""
+    extractor = _extractors.get(db)
+    if extractor is None:
+        with _extractors_lock:
+            extractor = _extractors.get(db)
+            if extractor is None:
+                extractor = LocalKeywordExtractor(db)
+                db.add_prompt_change_listener(extractor.mark_stale)
+                _extractors[db] = extractor
+    return extractor
@@ -7,108 +7,250 @@ import uuid
 import re
 import math
 import pickle
-from typing import List, Dict, Optional, Tuple
+import threading
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from ai_expert.constants import EMBEDDING_MODEL_NAME
+from ai_expert.text_splitter import ChineseTextSplitter
+from ai_expert.ocr_service import OCRService
 
 try:
     import numpy as np
     from sentence_transformers import SentenceTransformer
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
     import pypdf
     import docx
-    import easyocr
 except ImportError as e:
     print(f"[WARN] RAG dependencies not installed yet: {e}")
 
+class _VectorSnapshot:
+    """
+    向量库的不可变快照：向量、元数据与预计算的范数始终一一对应。
+    读者只持有快照引用，写者构建新快照后整体替换，读路径无需加锁。
+    """
+    __slots__ = ('vectors', 'metadata', 'norms')
+
+    def __init__(self, vectors, metadata):
+        if vectors is not None and len(vectors) > 0:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            vectors.flags.writeable = False
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1e-10
+            norms.flags.writeable = False
+        else:
+            vectors = None
+            norms = None
+        self.vectors = vectors
+        self.metadata = tuple(metadata) if vectors is not None else ()
+        self.norms = norms
+
+    def __len__(self):
+        return len(self.metadata)
+
+
+GLOBAL_PARTITION = 0  # bound_prompt_id 为空的全局文档
+
+
+def _partition_of(meta: Dict) -> int:
+    return meta.get("bound_prompt_id") or GLOBAL_PARTITION
+
+
 class SimpleVectorStore:
     """
     一个简单的基于 Numpy 的向量检索存储
     替代 ChromaDB 以解决 SQLite 版本兼容性问题
+
+    分区：按 bound_prompt_id 拆分为独立索引（0 为全局分区），
+    检索时只扫描指定分区，删除 AI 专家时整块丢弃其分区。
+
+    并发模型：copy-on-write 快照
+    - search 读取当前分区表引用后只访问其中的快照，不加锁
+    - add / delete 在写锁内基于旧快照构建新快照，再原子替换分区表引用
     """
     def __init__(self, storage_path: str):
         self.storage_path = storage_path
+        self.partitions_path = os.path.join(storage_path, "partitions")
+        # 旧版单文件格式，首次加载时迁移为分区格式
         self.vectors_path = os.path.join(storage_path, "vectors.npy")
         self.meta_path = os.path.join(storage_path, "metadata.pkl")
         
-        self.vectors = None # numpy array
-        self.metadata = []  # list of dicts (aligned with vectors)
+        self._partitions: Dict[int, _VectorSnapshot] = {}
+        self._write_lock = threading.Lock()  # 只在写者之间互斥
         
         self._load()
 
+    @property
+    def vectors(self):
+        snapshots = [snap.vectors for snap in self._partitions.values() if snap.vectors is not None]
+        return np.vstack(snapshots) if snapshots else None
+
+    @property
+    def metadata(self) -> List[Dict]:
+        return [meta for snap in self._partitions.values() for meta in snap.metadata]
+
+    def partition_ids(self) -> List[int]:
+        return list(self._partitions.keys())
+
+    def partition_size(self, partition_id: int) -> int:
+        snapshot = self._partitions.get(partition_id)
+        return len(snapshot) if snapshot else 0
+
+    def _partition_files(self, partition_id: int) -> Tuple[str, str]:
+        base = os.path.join(self.partitions_path, f"p{partition_id}")
+        return base + ".npy", base + ".pkl"
+
     def _load(self):
-        if os.path.exists(self.vectors_path) and os.path.exists(self.meta_path):
-            try:
-                self.vectors = np.load(self.vectors_path)
-                with open(self.meta_path, 'rb') as f:
-                    self.metadata = pickle.load(f)
-                print(f"[VectorStore] Loaded {len(self.metadata)} vectors.")
-            except Exception as e:
-                print(f"[VectorStore] Load failed: {e}")
-                self.vectors = None
-                self.metadata = []
-        else:
-            self.vectors = None
-            self.metadata = []
+        partitions = {}
+        try:
+            if os.path.isdir(self.partitions_path):
+                for name in os.listdir(self.partitions_path):
+                    if not (name.startswith("p") and name.endswith(".npy")):
+                        continue
+                    partition_id = int(name[1:-4])
+                    vectors_file, meta_file = self._partition_files(partition_id)
+                    if not os.path.exists(meta_file):
+                        continue
+                    vectors = np.load(vectors_file)
+                    with open(meta_file, 'rb') as f:
+                        metadata = pickle.load(f)
+                    snapshot = _VectorSnapshot(vectors, metadata)
+                    if len(snapshot):
+                        partitions[partition_id] = snapshot
+            elif os.path.exists(self.vectors_path) and os.path.exists(self.meta_path):
+                partitions = self._migrate_legacy()
+        except Exception as e:
+            print(f"[VectorStore] Load failed: {e}")
+            partitions = {}
 
-    def _save(self):
-        if not os.path.exists(self.storage_path):
-            os.makedirs(self.storage_path, exist_ok=True)
-            
-        if self.vectors is not None:
-            np.save(self.vectors_path, self.vectors)
-            with open(self.meta_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
+        self._partitions = partitions
+        if partitions:
+            total = sum(len(snap) for snap in partitions.values())
+            print(f"[VectorStore] Loaded {total} vectors in {len(partitions)} partitions.")
+
+    def _migrate_legacy(self) -> Dict[int, _VectorSnapshot]:
+        """将旧版单文件索引按 bound_prompt_id 拆分为分区文件"""
+        vectors = np.load(self.vectors_path)
+        with open(self.meta_path, 'rb') as f:
+            metadata = pickle.load(f)
+
+        grouped: Dict[int, List[int]] = {}
+        for i, meta in enumerate(metadata):
+            grouped.setdefault(_partition_of(meta), []).append(i)
+
+        partitions = {}
+        for partition_id, indices in grouped.items():
+            snapshot = _VectorSnapshot(vectors[indices], [metadata[i] for i in indices])
+            partitions[partition_id] = snapshot
+            self._save_partition(partition_id, snapshot)
+        os.makedirs(self.partitions_path, exist_ok=True)
+
+        os.replace(self.vectors_path, self.vectors_path + ".legacy")
+        os.replace(self.meta_path, self.meta_path + ".legacy")
+        print(f"[VectorStore] Migrated {len(metadata)} legacy vectors into {len(partitions)} partitions.")
+        return partitions
+
+    def _save_partition(self, partition_id: int, snapshot: Optional[_VectorSnapshot]):
+        """持久化单个分区（写临时文件后替换，避免进程中断留下不一致的文件）"""
+        os.makedirs(self.partitions_path, exist_ok=True)
+        vectors_file, meta_file = self._partition_files(partition_id)
+
+        if snapshot is None or not len(snapshot):
+            for path in (vectors_file, meta_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
 
-    def add(self, embeddings: List[List[float]], metadatas: List[Dict]):
-        """添加向量"""
+        with open(vectors_file + ".tmp", 'wb') as f:
+            np.save(f, snapshot.vectors)
+        with open(meta_file + ".tmp", 'wb') as f:
+            pickle.dump(list(snapshot.metadata), f)
+        os.replace(vectors_file + ".tmp", vectors_file)
+        os.replace(meta_file + ".tmp", meta_file)
+
+    def save_all(self):
+        """持久化全部分区（用于 add(save=False) 批量构建之后）"""
+        with self._write_lock:
+            for partition_id, snapshot in self._partitions.items():
+                self._save_partition(partition_id, snapshot)
+
+    def add(self, embeddings: List[List[float]], metadatas: List[Dict], save: bool = True):
+        """添加向量（按 bound_prompt_id 写入对应分区；save=False 时只更新内存，稍后调用 save_all）"""
         new_vecs = np.array(embeddings, dtype=np.float32)
+        if len(new_vecs) == 0:
+            return
+
+        grouped: Dict[int, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            grouped.setdefault(_partition_of(meta), []).append(i)
         
-        if self.vectors is None:
-            self.vectors = new_vecs
-        else:
-            self.vectors = np.vstack([self.vectors, new_vecs])
-            
-        self.metadata.extend(metadatas)
-        self._save()
+        with self._write_lock:
+            partitions = dict(self._partitions)
+            for partition_id, indices in grouped.items():
+                current = partitions.get(partition_id)
+                vectors = new_vecs[indices]
+                metadata = [metadatas[i] for i in indices]
+                if current is not None and current.vectors is not None:
+                    vectors = np.vstack([current.vectors, vectors])
+                    metadata = list(current.metadata) + metadata
+                partitions[partition_id] = _VectorSnapshot(vectors, metadata)
+
+            self._partitions = partitions
+            if save:
+                for partition_id in grouped:
+                    self._save_partition(partition_id, partitions[partition_id])
 
-    def search(self, query_embedding: List[float], filter_fn=None, top_k: int = 3) -> List[Dict]:
+    def search(
+        self,
+        query_embedding: List[float],
+        filter_fn=None,
+        top_k: int = 3,
+        partitions: Optional[List[int]] = None
+    ) -> List[Dict]:
         """
         搜索最相似的向量
         filter_fn: function(metadata) -> bool
+        partitions: 需要扫描的分区，None 表示全部
         """
-        if self.vectors is None or len(self.vectors) == 0:
+        table = self._partitions  # 只读取一次引用，后续全部基于该快照
+        if partitions is None:
+            snapshots = list(table.values())
+        else:
+            snapshots = [table[pid] for pid in dict.fromkeys(partitions) if pid in table]
+        if not snapshots:
             return []
             
-        # Normalize vectors for cosine similarity
         # Cosine Similarity = (A . B) / (||A|| * ||B||)
-        # Assuming query_embedding is not normalized
-        
+        # 库内向量的范数在构建快照时已预计算
         q_vec = np.array(query_embedding, dtype=np.float32)
         q_norm = np.linalg.norm(q_vec)
         if q_norm == 0:
             return []
-            
-        # Calculate cosine similarity with all vectors
+
+        results = []
+        for snapshot in snapshots:
+            results.extend(self._search_snapshot(snapshot, q_vec, q_norm, filter_fn, top_k))
+
+        # 合并各分区的 top-k
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:top_k]
+
+    def _search_snapshot(self, snapshot: _VectorSnapshot, q_vec, q_norm, filter_fn, top_k: int) -> List[Dict]:
+        if snapshot.vectors is None:
+            return []
+
         # vectors shape: (N, D), q_vec shape: (D,)
-        
-        # Calculate norms for all storage vectors (cache this if slow)
-        d_norms = np.linalg.norm(self.vectors, axis=1)
-        
-        # Dot product
-        dot_products = np.dot(self.vectors, q_vec)
-        
-        # Similarity
-        # Handle zero division
-        d_norms[d_norms == 0] = 1e-10
-        similarities = dot_products / (d_norms * q_norm)
+        similarities = np.dot(snapshot.vectors, q_vec) / (snapshot.norms * q_norm)
         
         # Sort indices by similarity descending
-        sorted_indices = np.argsort(similarities)[::-1]
+        if filter_fn is None and top_k < len(similarities):
+            candidates = np.argpartition(-similarities, top_k)[:top_k]
+            sorted_indices = candidates[np.argsort(-similarities[candidates])]
+        else:
+            sorted_indices = np.argsort(similarities)[::-1]
         
         results = []
-        count = 0
         
         for idx in sorted_indices:
-            meta = self.metadata[idx]
+            meta = snapshot.metadata[idx]
             
             # Apply filter
             if filter_fn and not filter_fn(meta):
@@ -120,32 +262,122 @@ class SimpleVectorStore:
                 "id": meta.get("chunk_id") # Assuming chunk_id is in metadata
             })
             
-            count += 1
-            if count >= top_k:
+            if len(results) >= top_k:
                 break
                 
         return results
 
-    def delete(self, filter_fn):
-        """删除符合条件的向量"""
-        if self.vectors is None:
-            return
-            
-        indices_to_keep = []
-        new_metadata = []
-        
-        for i, meta in enumerate(self.metadata):
-            if not filter_fn(meta):
-                indices_to_keep.append(i)
-                new_metadata.append(meta)
-                
-        if len(indices_to_keep) < len(self.metadata):
-            self.vectors = self.vectors[indices_to_keep]
-            self.metadata = new_metadata
-            self._save()
+    def search_batch(
+        self,
+        query_embeddings,
+        top_k: int = 3,
+        partitions: Optional[List[int]] = None
+    ) -> List[List[Dict]]:
+        """
+        批量检索：每个分区只做一次矩阵乘法 (N, D) x (D, M)
+        返回与 query_embeddings 一一对应的结果列表
+        """
+        q_mat = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        num_queries = q_mat.shape[0]
+        per_query: List[List[Dict]] = [[] for _ in range(num_queries)]
+
+        table = self._partitions
+        if partitions is None:
+            snapshots = list(table.values())
+        else:
+            snapshots = [table[pid] for pid in dict.fromkeys(partitions) if pid in table]
+        if not snapshots or num_queries == 0:
+            return per_query
+
+        q_norms = np.linalg.norm(q_mat, axis=1)
+        valid = q_norms > 0
+        q_norms[~valid] = 1e-10
+
+        for snapshot in snapshots:
+            if snapshot.vectors is None:
+                continue
+            # similarities shape: (N, M)
+            similarities = np.dot(snapshot.vectors, q_mat.T) / np.outer(snapshot.norms, q_norms)
+            k = min(top_k, len(snapshot))
+            if k < len(snapshot):
+                candidates = np.argpartition(-similarities, k - 1, axis=0)[:k]
+            else:
+                candidates = np.tile(np.arange(len(snapshot))[:, None], (1, num_queries))
+
+            for q in range(num_queries):
+                if not valid[q]:
+                    continue
+                for idx in candidates[:, q]:
+                    meta = snapshot.metadata[idx]
+                    per_query[q].append({
+                        "score": float(similarities[idx, q]),
+                        "metadata": meta,
+                        "id": meta.get("chunk_id")
+                    })
+
+        # 合并各分区的 top-k
+        for q in range(num_queries):
+            per_query[q].sort(key=lambda r: r["score"], reverse=True)
+            del per_query[q][top_k:]
+        return per_query
+
+    def delete(self, filter_fn, partitions: Optional[List[int]] = None):
+        """删除符合条件的向量（可限定分区）"""
+        with self._write_lock:
+            table = self._partitions
+            targets = list(table.keys()) if partitions is None else [pid for pid in partitions if pid in table]
+
+            changed = {}
+            for partition_id in targets:
+                current = table[partition_id]
+                keep = [i for i, meta in enumerate(current.metadata) if not filter_fn(meta)]
+                if len(keep) == len(current.metadata):
+                    continue
+                changed[partition_id] = _VectorSnapshot(
+                    current.vectors[keep],
+                    [current.metadata[i] for i in keep]
+                ) if keep else None
+
+            if not changed:
+                return
+
+            new_table = dict(table)
+            for partition_id, snapshot in changed.items():
+                if snapshot is None:
+                    new_table.pop(partition_id, None)
+                else:
+                    new_table[partition_id] = snapshot
+            self._partitions = new_table
+
+            for partition_id, snapshot in changed.items():
+                self._save_partition(partition_id, snapshot)
+
+    def drop_partition(self, partition_id: int) -> int:
+        """整块删除一个分区，返回删除的向量数"""
+        with self._write_lock:
+            table = self._partitions
+            snapshot = table.get(partition_id)
+            if snapshot is None:
+                return 0
+            new_table = dict(table)
+            del new_table[partition_id]
+            self._partitions = new_table
+            self._save_partition(partition_id, None)
+            return len(snapshot)
+
+class _ActiveIndex:
+    """当前生效的向量模型与其索引，二者作为一个整体原子切换"""
+    __slots__ = ('model_name', 'store')
+
+    def __init__(self, model_name: str, store: SimpleVectorStore):
+        self.model_name = model_name
+        self.store = store
+
 
 class KnowledgeBaseManager:
-    def __init__(self, db_path: str = None, vector_db_path: str = None):
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, db_path: str = None, vector_db_path: str = None, use_worker: bool = None):
         # 1. SQL DB
         if db_path:
             from ai_expert.database import AIExpertDatabase
@@ -158,61 +390,223 @@ class KnowledgeBaseManager:
         if not vector_db_path:
             vector_db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'vector_store')
         
-        self.vector_store = SimpleVectorStore(vector_db_path)
+        # 每个向量模型一个独立索引目录，manifest.json 记录当前生效的模型
+        self.vector_root = vector_db_path
+        manifest = self._load_manifest()
+        active_model = manifest['active_model']
+        self._active = _ActiveIndex(active_model, SimpleVectorStore(self._model_store_path(active_model, manifest)))
+        # 写索引（add / delete / 切换模型）互斥，检索不加锁
+        self._index_lock = threading.RLock()
+        self.reembed_job = None
+        # 文档增删 / 模型切换的回调（如回复缓存失效），参数为受影响的 prompt_id，None 表示全部
+        self._change_listeners = []
+        self.text_splitter = ChineseTextSplitter()
 
         # 3. Text & OCR
-        try:
-            # Use multilingual model for Chinese support
-            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-            print("[RAG] Embedding model loaded: paraphrase-multilingual-MiniLM-L12-v2")
-        except Exception as e:
-            print(f"[RAG] Model loading failed: {e}")
-            self.model = None
+        self.models = {}  # 本进程内加载的向量模型: {model_name: SentenceTransformer}
+        self.worker = None
+
+        if use_worker is None:
+            from ai_expert.config import Config
+            use_worker = Config.use_embedding_worker()
+
+        if use_worker:
+            # 向量化 / OCR 放到独立进程，API 进程只负责调度
+            try:
+                from ai_expert.embedding_worker import EmbeddingWorker
+                self.worker = EmbeddingWorker(self.model_name)
+                self.worker.start()
+                self.worker.preload()
+                print(f"[RAG] Embedding worker started: {self.model_name}")
+            except Exception as e:
+                print(f"[RAG] Embedding worker failed to start, falling back to in-process model: {e}")
+                self.worker = None
+
+        if self.worker is None:
+            try:
+                # Use multilingual model for Chinese support
+                self._get_local_model(self.model_name)
+            except Exception as e:
+                print(f"[RAG] Model loading failed: {e}")
+
+        # 4. OCR (识别器常驻 + 结果缓存)
+        self.ocr_service = OCRService(self.sql_db, worker=self.worker)
+        from ai_expert.config import Config
+        if Config.preload_ocr():
+            self.ocr_service.preload()
+
+    # ========== 向量模型与索引版本 ==========
+
+    @property
+    def model_name(self) -> str:
+        return self._active.model_name
+
+    @property
+    def vector_store(self) -> SimpleVectorStore:
+        return self._active.store
+
+    @property
+    def model(self):
+        return self.models.get(self.model_name)
+
+    @model.setter
+    def model(self, value):
+        self.models[self.model_name] = value
+
+    def _load_manifest(self) -> Dict:
+        path = os.path.join(self.vector_root, self.MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        # 旧版：根目录下的索引即默认模型生成的向量
+        return {
+            "active_model": EMBEDDING_MODEL_NAME,
+            "models": {EMBEDDING_MODEL_NAME: {"path": "."}}
+        }
+
+    def _save_manifest(self, manifest: Dict):
+        os.makedirs(self.vector_root, exist_ok=True)
+        path = os.path.join(self.vector_root, self.MANIFEST_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _model_store_path(self, model_name: str, manifest: Dict) -> str:
+        entry = manifest['models'][model_name]
+        return os.path.normpath(os.path.join(self.vector_root, entry['path']))
+
+    def _new_store_path(self, model_name: str) -> str:
+        """重建索引用的新目录: models/<模型名>-<时间戳>"""
+        slug = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name).strip('_')
+        return os.path.join(self.vector_root, 'models', f"{slug}-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}")
+
+    def _get_local_model(self, model_name: str):
+        model = self.models.get(model_name)
+        if model is None:
+            model = SentenceTransformer(model_name)
+            self.models[model_name] = model
+            print(f"[RAG] Embedding model loaded: {model_name}")
+        return model
+
+    def _embedding_available(self) -> bool:
+        return self.worker is not None or self.model is not None
+
+    def _encode(self, texts: List[str], model_name: str = None):
+        """向量化文本（优先走工作进程）"""
+        model_name = model_name or self.model_name
+        if self.worker is not None:
+            return self.worker.encode(texts, model_name=model_name)
+        return self._get_local_model(model_name).encode(texts)
+
+    def encode_texts(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """用当前向量模型编码任意文本（供回复缓存等复用）；模型不可用时返回 None"""
+        if not self._embedding_available():
+            return None
+        return np.asarray(self._encode(texts)).tolist()
+
+    def add_change_listener(self, callback):
+        """注册知识库变更回调：callback(prompt_id)，prompt_id 为 None 表示全局文档或索引整体变化"""
+        self._change_listeners.append(callback)
+
+    def _notify_changed(self, prompt_id: Optional[int] = None):
+        for callback in list(self._change_listeners):
+            try:
+                callback(prompt_id)
+            except Exception as e:
+                print(f"[RAG] Change listener failed: {e}")
+
+    def activate_index(self, model_name: str, store: SimpleVectorStore):
+        """
+        原子切换到新模型的索引（由重建任务在追平增量后调用，调用方需持有 _index_lock）
+        旧索引目录保留，便于回滚
+        """
+        manifest = self._load_manifest()
+        models = manifest.setdefault('models', {})
+        models[model_name] = {
+            "path": os.path.relpath(store.storage_path, self.vector_root),
+            "activated_at": time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        manifest['previous_model'] = self.model_name
+        manifest['active_model'] = model_name
+        self._save_manifest(manifest)
+
+        self._active = _ActiveIndex(model_name, store)
+        print(f"[RAG] Embedding index switched to {model_name}")
+        self._notify_changed()
+
+    def start_reembed(self, model_name: str, batch_size: int = None, pause_seconds: float = None) -> Dict:
+        """后台用新模型重建向量索引，完成后原子切换；期间检索仍使用旧索引"""
+        from ai_expert.reembed_job import ReEmbedJob
+
+        with self._index_lock:
+            if self.reembed_job and self.reembed_job.is_running():
+                raise RuntimeError(f"已有重建任务在运行: {self.reembed_job.model_name}")
+            if model_name == self.model_name:
+                raise ValueError(f"{model_name} 已是当前生效的模型")
+            self.reembed_job = ReEmbedJob(self, model_name, batch_size=batch_size, pause_seconds=pause_seconds)
+            self.reembed_job.start()
+            return self.reembed_job.get_status()
+
+    def cancel_reembed(self) -> bool:
+        if self.reembed_job and self.reembed_job.is_running():
+            self.reembed_job.cancel()
+            return True
+        return False
+
+    def get_reembed_status(self) -> Dict:
+        status = {
+            'active_model': self.model_name,
+            'job': self.reembed_job.get_status() if self.reembed_job else None
+        }
+        return status
 
-        self.ocr_reader = None
+    def _ocr_image(self, file_path: str) -> List[str]:
+        """识别图片文字（带缓存，优先走工作进程）"""
+        return self.ocr_service.recognize(file_path)
 
-    def _get_ocr_reader(self):
-        if not self.ocr_reader:
-            print("[RAG] Initializing EasyOCR...")
-            self.ocr_reader = easyocr.Reader(['ch_sim', 'en'])
-        return self.ocr_reader
+    def get_worker_status(self) -> Dict:
+        """向量化工作进程状态"""
+        if self.worker is None:
+            return {'enabled': False, 'model_loaded': self.model is not None, 'model_name': self.model_name}
+        status = self.worker.get_status()
+        status['enabled'] = True
+        return status
+
+    def preload_ocr(self, wait: bool = False):
+        """预热 OCR 识别器"""
+        self.ocr_service.preload(wait=wait)
+
+    def get_ocr_status(self) -> Dict:
+        """OCR 服务状态与缓存命中统计"""
+        return self.ocr_service.get_status()
 
     # ... (Add document logic same as before, but using self.vector_store.add)
     
     def add_document(self, file_path: str, bound_prompt_id: int = None, description: str = "") -> bool:
         """添加文档到知识库"""
-        if not self.model: 
+        if not self._embedding_available(): 
             return False
 
         if not os.path.exists(file_path): 
             return False
 
-        # ... (Extract text - same as before) ...
         file_name = os.path.basename(file_path)
         file_ext = os.path.splitext(file_name)[1].lower().replace('.', '')
-        text_content = ""
+
+        # 逐页提取并流式分块，不拼接整篇文档
+        text_length = 0
+        def counted(pages):
+            nonlocal text_length
+            for page in pages:
+                text_length += len(page)
+                yield page
+
         try:
-            if file_ext == 'pdf':
-                reader = pypdf.PdfReader(file_path)
-                for page in reader.pages:
-                    text_content += page.extract_text() + "\n"
-            elif file_ext in ['docx', 'doc']:
-                doc = docx.Document(file_path)
-                for para in doc.paragraphs:
-                    text_content += para.text + "\n"
-                for table in doc.tables:
-                    text_content += self._table_to_markdown(table) + "\n"
-            elif file_ext in ['jpg', 'jpeg', 'png', 'bmp']:
-                reader = self._get_ocr_reader()
-                result = reader.readtext(file_path, detail=0)
-                text_content = "\n".join(result)
-            else:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    text_content = f.read()
+            chunks = list(self.text_splitter.split_stream(counted(self._iter_pages(file_path, file_ext))))
         except:
             return False
 
-        if not text_content.strip(): return False
+        if not chunks: return False
 
         # SQL Save
         try:
@@ -221,7 +615,7 @@ class KnowledgeBaseManager:
             cursor.execute("""
                 INSERT INTO files (file_name, file_path, file_type, file_size, bound_prompt_id, description)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (file_name, file_path, file_ext, len(text_content), bound_prompt_id, description))
+            """, (file_name, file_path, file_ext, text_length, bound_prompt_id, description))
             file_id = cursor.lastrowid
             conn.commit()
             conn.close()
@@ -229,15 +623,42 @@ class KnowledgeBaseManager:
             print(f"[RAG] SQL Error: {e}")
             return False
 
-        # Chunking
-        chunks = self._chunk_text(text_content)
-        
         # Embed and Save
+        model_name = self.model_name
         try:
-            embeddings_list = self.model.encode(chunks)
-        except:
+            embeddings_list = self._encode(chunks, model_name)
+        except Exception as e:
+            print(f"[RAG] Embedding Error: {e}")
+            self._discard_file_row(file_id)
             return False
 
+        # SQL 写入与索引写入放在同一把锁内，重建任务切换索引时不会漏掉这批分块
+        with self._index_lock:
+            if model_name != self.model_name:
+                # 编码期间索引已切换到新模型，按新模型重新编码
+                model_name = self.model_name
+                try:
+                    embeddings_list = self._encode(chunks, model_name)
+                except Exception as e:
+                    print(f"[RAG] Embedding Error ({model_name}): {e}")
+                    self._discard_file_row(file_id)
+                    return False
+            self._save_chunks(file_id, file_name, bound_prompt_id, chunks, embeddings_list, model_name)
+        self._notify_changed(bound_prompt_id or None)
+        return True
+
+    def _discard_file_row(self, file_id: int):
+        """编码失败时删除已写入的文件记录（此时还没有分块），不留下没有内容的文档"""
+        try:
+            conn = self.sql_db.get_connection()
+            conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[RAG] SQL Error: {e}")
+
+    def _save_chunks(self, file_id: int, file_name: str, bound_prompt_id: Optional[int],
+                     chunks: List[str], embeddings_list, model_name: str):
         conn = self.sql_db.get_connection()
         cursor = conn.cursor()
         
@@ -255,7 +676,8 @@ class KnowledgeBaseManager:
                 "bound_prompt_id": bound_prompt_id if bound_prompt_id is not None else 0,
                 "chunk_index": i,
                 "source": file_name,
-                "content_preview": chunk[:50] # For debugging if needed
+                "content_preview": chunk[:50], # For debugging if needed
+                "embedding_model": model_name
             }
             metadatas.append(meta)
             
@@ -263,59 +685,90 @@ class KnowledgeBaseManager:
         conn.close()
         
         # Save to Vector Store
-        self.vector_store.add(embeddings_list.tolist(), metadatas)
-        return True
+        self.vector_store.add(np.asarray(embeddings_list).tolist(), metadatas)
 
     def search(self, query: str, bound_prompt_id: int = None, top_k: int = 3, threshold: float = 0.4) -> List[Dict]:
         """检索 (Threshold is Similarity threshold here, meaning min score)"""
-        if not self.model: return []
+        return self.search_many([query], bound_prompt_id=bound_prompt_id, top_k=top_k, threshold=threshold)
 
-        query_embedding = self.model.encode([query])[0].tolist()
+    def search_many(self, queries: List[str], bound_prompt_id: int = None, top_k: int = 3, threshold: float = 0.4) -> List[Dict]:
+        """
+        多查询批量检索：N 个查询一次编码、每个分区一次矩阵乘法，
+        结果按 (file_id, chunk_index) 去重后融合（取各查询中的最高分）。
+
+        返回: [{content, source, score, matched_queries}]，按 score 降序，最多 top_k 条
+        """
+        if not self._embedding_available(): return []
+
+        # 去掉空查询与重复查询，保持原有顺序
+        queries = [q for q in dict.fromkeys(q.strip() for q in queries if q) if q]
+        if not queries:
+            return []
+
+        # 查询向量与索引必须来自同一模型：只读取一次当前索引
+        active = self._active
+        query_embeddings = self._encode(queries, active.model_name)
         
-        target_pid = bound_prompt_id if bound_prompt_id is not None else 0
+        # 只扫描全局分区与当前 AI 专家的分区
+        target_pid = bound_prompt_id or GLOBAL_PARTITION
+        per_query = active.store.search_batch(
+            query_embeddings,
+            top_k=top_k,
+            partitions=[GLOBAL_PARTITION, target_pid]
+        )
         
-        def filter_fn(meta):
-            pid = meta.get("bound_prompt_id", 0)
-            return pid == 0 or pid == target_pid
+        # Similarity is -1 to 1 (Cosine). Below threshold is dropped before fusion.
+        fused: Dict[Tuple[int, int], Dict] = {}
+        for query_index, results in enumerate(per_query):
+            for res in results:
+                if res['score'] < threshold:
+                    continue
+                meta = res['metadata']
+                key = (meta['file_id'], meta['chunk_index'])
+                hit = fused.get(key)
+                if hit is None:
+                    fused[key] = hit = {
+                        "file_id": meta['file_id'],
+                        "chunk_index": meta['chunk_index'],
+                        "source": meta.get('source'),
+                        "score": res['score'],
+                        "matched_queries": []
+                    }
+                hit['score'] = max(hit['score'], res['score'])
+                hit['matched_queries'].append(query_index)
 
-        results = self.vector_store.search(query_embedding, filter_fn, top_k)
-        
-        structured_results = []
-        for res in results:
-            # res: {score, metadata}
-            # Threshold: if score < threshold (e.g. 0.4 similarity), skip
-            # Note: Previously we used Distance. Here used Cosine Similarity.
-            # Similarity is -1 to 1. 0.4 is reasonable.
-            if res['score'] < threshold:
-                continue
-                
-            # Retrieve full content from SQL or helper. 
-            # Wait, I didn't save full content in metadata to save RAM, but I saved it in SQL.
-            # But in this simple implementation, let's just fetch from SQL based on file_id/chunk_index 
-            # OR better: fetch from SQL chunks table.
-            
-            # Efficient way:
-            file_id = res['metadata']['file_id']
-            chunk_index = res['metadata']['chunk_index']
-            source = res['metadata']['source']
-            
-            content = self._get_chunk_content(file_id, chunk_index)
-            
-            structured_results.append({
-                "content": content,
-                "source": source,
-                "score": res['score']
-            })
-            
-        return structured_results
+        ranked = sorted(fused.values(), key=lambda h: h['score'], reverse=True)[:top_k]
+        if not ranked:
+            return []
+
+        # 全文保存在 SQL chunks 表中，一次查询批量取回
+        contents = self._get_chunk_contents([(h['file_id'], h['chunk_index']) for h in ranked])
+
+        return [
+            {
+                "content": contents.get((h['file_id'], h['chunk_index']), ""),
+                "source": h['source'],
+                "score": h['score'],
+                "matched_queries": h['matched_queries']
+            }
+            for h in ranked
+        ]
 
     def _get_chunk_content(self, file_id, chunk_index):
+        return self._get_chunk_contents([(file_id, chunk_index)]).get((file_id, chunk_index), "")
+
+    def _get_chunk_contents(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], str]:
+        """批量获取 chunk 全文: {(file_id, chunk_index): content}"""
+        if not keys:
+            return {}
         conn = self.sql_db.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT content FROM chunks WHERE file_id=? AND chunk_index=?", (file_id, chunk_index))
-        row = cursor.fetchone()
+        where = " OR ".join(["(file_id=? AND chunk_index=?)"] * len(keys))
+        params = [value for key in keys for value in key]
+        cursor.execute(f"SELECT file_id, chunk_index, content FROM chunks WHERE {where}", params)
+        rows = cursor.fetchall()
         conn.close()
-        return row['content'] if row else ""
+        return {(row['file_id'], row['chunk_index']): row['content'] for row in rows}
 
     def _table_to_markdown(self, table) -> str:
         rows = []
@@ -328,35 +781,73 @@ class KnowledgeBaseManager:
         rows.insert(1, separator)
         return "\n" + "\n".join(rows) + "\n"
 
+    def _iter_pages(self, file_path: str, file_ext: str) -> Iterator[str]:
+        """按页 / 段落产出文档文本"""
+        if file_ext == 'pdf':
+            reader = pypdf.PdfReader(file_path)
+            for page in reader.pages:
+                yield (page.extract_text() or "") + "\n"
+        elif file_ext in ['docx', 'doc']:
+            doc = docx.Document(file_path)
+            for para in doc.paragraphs:
+                yield para.text + "\n"
+            for table in doc.tables:
+                yield self._table_to_markdown(table) + "\n"
+        elif file_ext in ['jpg', 'jpeg', 'png', 'bmp']:
+            yield "\n".join(self._ocr_image(file_path))
+        else:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    yield line
+
     def _chunk_text(self, text: str) -> List[str]:
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500, chunk_overlap=100,
-            separators=["\n\n", "\n", "。", "！", "？", " ", ""]
-        )
-        return splitter.split_text(text)
+        return self.text_splitter.split_text(text)
 
     def delete_file(self, file_id: int) -> bool:
         # 1. SQL check
         conn = self.sql_db.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM files WHERE id = ?", (file_id,))
-        if not cursor.fetchone():
+        row = cursor.fetchone()
+        if not row:
             conn.close()
             return False
             
-        # 2. Vector delete
+        # 2. Vector delete (只需处理文件所在分区)
         def filter_fn(meta):
             return meta.get("file_id") == file_id
             
-        self.vector_store.delete(filter_fn)
-        
-        # 3. SQL delete
-        cursor.execute("DELETE FROM chunks WHERE file_id = ?", (file_id,))
-        cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
-        conn.commit()
+        with self._index_lock:
+            self.vector_store.delete(filter_fn, partitions=[row['bound_prompt_id'] or GLOBAL_PARTITION])
+            
+            # 3. SQL delete
+            cursor.execute("DELETE FROM chunks WHERE file_id = ?", (file_id,))
+            cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            conn.commit()
         conn.close()
+        self._notify_changed(row['bound_prompt_id'] or None)
         return True
 
+    def delete_prompt_documents(self, prompt_id: int) -> int:
+        """删除 AI 专家绑定的全部文档：整块丢弃其向量分区，返回删除的文件数"""
+        if not prompt_id:
+            return 0
+
+        with self._index_lock:
+            removed_vectors = self.vector_store.drop_partition(prompt_id)
+
+            conn = self.sql_db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM chunks WHERE file_id IN (SELECT id FROM files WHERE bound_prompt_id = ?)", (prompt_id,))
+            cursor.execute("DELETE FROM files WHERE bound_prompt_id = ?", (prompt_id,))
+            removed_files = cursor.rowcount
+            conn.commit()
+            conn.close()
+
+        print(f"[RAG] Dropped partition {prompt_id}: {removed_files} files, {removed_vectors} vectors")
+        self._notify_changed(prompt_id)
+        return removed_files
+
     def get_file_list(self, bound_prompt_id: int = None) -> List:
         conn = self.sql_db.get_connection()
         cursor = conn.cursor()
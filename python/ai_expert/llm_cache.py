@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Call Cache
+辅助 LLM 调用结果缓存
+
+关键词提取、语义相似度判断等低温度辅助调用的输入高度重复，结果基本确定：
+- 键为 (函数名, 模型, 归一化后的输入) 的 sha256
+- 内存 LRU 在前，SQLite 持久化在后（重启后依然命中）
+- 条目带 TTL，内存与 SQLite 都有容量上限，超出后按最近使用时间淘汰
+- 按函数统计内存命中 / 持久化命中 / 未命中次数
+"""
+
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .constants import LLM_CACHE_TTL, LLM_CACHE_MEMORY_SIZE, LLM_CACHE_MAX_ROWS, LLM_CACHE_PRUNE_INTERVAL
+
+
+def normalize_text(text: str) -> str:
+    """归一化输入：去首尾空白、合并连续空白、英文小写"""
+    return re.sub(r"\s+", " ", (text or "").strip()).lower()
+
+
+def make_cache_key(function: str, model: str, inputs: List[str]) -> str:
+    payload = json.dumps([function, model, [normalize_text(t) for t in inputs]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCallCache:
+    """辅助 LLM 调用缓存（内存 LRU + SQLite）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl: float = LLM_CACHE_TTL,
+        memory_size: int = LLM_CACHE_MEMORY_SIZE,
+        max_rows: int = LLM_CACHE_MAX_ROWS
+    ):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._init_table()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_table(self):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_call_cache (
+                cache_key TEXT PRIMARY KEY,
+                function TEXT NOT NULL,
+                model TEXT,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hit_count INTEGER DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_call_cache_last_used
+            ON llm_call_cache(last_used_at)
+        """)
+        conn.commit()
+        conn.close()
+
+    # ========== 读写 ==========
+
+    def get(self, function: str, model: str, inputs: List[str]) -> Optional[Any]:
+        """查询缓存，未命中或已过期返回 None"""
+        key = make_cache_key(function, model, inputs)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self._count(function, 'memory_hits')
+                    return entry[0]
+                del self._memory[key]
+
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT value, expires_at FROM llm_call_cache WHERE cache_key = ?",
+            (key,)
+        )
+        row = cursor.fetchone()
+        value = None
+        if row and row['expires_at'] > now:
+            value = json.loads(row['value'])
+            cursor.execute(
+                "UPDATE llm_call_cache SET hit_count = hit_count + 1, last_used_at = ? WHERE cache_key = ?",
+                (now, key)
+            )
+            conn.commit()
+        conn.close()
+
+        with self._lock:
+            if value is None:
+                self._count(function, 'misses')
+                return None
+            self._remember(key, value, row['expires_at'])
+            self._count(function, 'db_hits')
+        return value
+
+    def put(self, function: str, model: str, inputs: List[str], value: Any, ttl: Optional[float] = None):
+        key = make_cache_key(function, model, inputs)
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+
+        conn = self._get_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO llm_call_cache (cache_key, function, model, value, expires_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, function, model, json.dumps(value, ensure_ascii=False), expires_at, now))
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._count(function, 'puts')
+            self._puts_since_prune += 1
+            should_prune = self._puts_since_prune >= LLM_CACHE_PRUNE_INTERVAL
+            if should_prune:
+                self._puts_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        # 调用方持有 self._lock
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def prune(self) -> int:
+        """清理过期条目，并按最近使用时间淘汰超出容量的条目，返回删除条数"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM llm_call_cache WHERE expires_at <= ?", (time.time(),))
+        removed = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM llm_call_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_call_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.max_rows,))
+        removed += cursor.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._get_connection()
+        conn.execute("DELETE FROM llm_call_cache")
+        conn.commit()
+        conn.close()
+
+    # ========== 指标 ==========
+
+    def _count(self, function: str, field: str):
+        stats = self._stats.setdefault(function, {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'puts': 0})
+        stats[field] += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            functions = {name: dict(stats) for name, stats in self._stats.items()}
+            memory_entries = len(self._memory)
+        for stats in functions.values():
+            lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+            stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+
+        conn = self._get_connection()
+        rows = conn.execute("SELECT COUNT(*) FROM llm_call_cache").fetchone()[0]
+        conn.close()
+        return {
+            'memory_entries': memory_entries,
+            'memory_size': self.memory_size,
+            'rows': rows,
+            'max_rows': self.max_rows,
+            'ttl': self.ttl,
+            'functions': functions,
+        }
+
+
+_cache: Optional[LLMCallCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCallCache]:
+    """获取进程级共享的辅助调用缓存（LLM_CACHE=0 时返回 None）"""
+    global _cache
+    from .config import Config
+    if not Config.use_llm_cache():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCallCache(Config.get_database_path())
+    return _cache
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Governor
+出站 LLM 流量的全局自适应并发调控
+
+交互式生成、批量生成与后台预生成共用同一份 DeepSeek 配额，各自盲目退避会在限流时引发重试风暴：
+- AIMD：上限被用满且请求成功时每次 +1/limit（每轮约 +1）；遇到限流 (429/503) 时乘以收缩系数，
+  冷却期内的多次限流只收缩一次
+- Retry-After：服务端给出等待时间时，全局暂停发放名额直到该时间点
+- 优先级通道：interactive 总是先于 background 获得名额；background 最多占用上限的一部分，为交互请求留出余量
+- 按通道统计排队等待时间
+同步线程与共享事件循环中的协程通过同一个实例排队。
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from .deadline import current_deadline
+from .constants import (
+    LLM_LANE_INTERACTIVE,
+    LLM_LANE_BACKGROUND,
+    LLM_LANES,
+    LLM_GOVERNOR_INITIAL_LIMIT,
+    LLM_GOVERNOR_MIN_LIMIT,
+    LLM_GOVERNOR_MAX_LIMIT,
+    LLM_GOVERNOR_DECREASE_FACTOR,
+    LLM_GOVERNOR_DECREASE_COOLDOWN,
+    LLM_GOVERNOR_BACKGROUND_SHARE,
+    LLM_GOVERNOR_QUEUE_TIMEOUT,
+    LLM_GOVERNOR_WAIT_SAMPLES,
+    LLM_RETRY_AFTER_MAX,
+)
+
+
+_current_lane: contextvars.ContextVar = contextvars.ContextVar('llm_lane', default=LLM_LANE_INTERACTIVE)
+
+
+@contextmanager
+def llm_lane(lane: str):
+    """把当前上下文内发出的 LLM 请求归入指定通道（提交到共享事件循环的协程会继承）"""
+    if lane not in LLM_LANES:
+        raise ValueError(f"未知的 LLM 通道: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane() -> str:
+    return _current_lane.get()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），超过 LLM_RETRY_AFTER_MAX 时截断"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), LLM_RETRY_AFTER_MAX)
+
+
+class Permit:
+    """一次请求占用的名额，调用方按响应结果标记，释放时据此调整并发上限"""
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.outcome = 'success'
+        self.retry_after: Optional[float] = None
+
+    def throttled(self, retry_after: Optional[float] = None):
+        self.outcome = 'throttled'
+        self.retry_after = retry_after
+
+    def failed(self):
+        if self.outcome == 'success':
+            self.outcome = 'error'
+
+
+class _Waiter:
+    """排队中的请求：线程通过 Event 唤醒，协程通过所在事件循环的 Future 唤醒"""
+
+    __slots__ = ('lane', 'enqueued_at', 'granted', 'event', 'loop', 'future')
+
+    def __init__(self, lane: str, loop=None):
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMGovernor:
+    """出站 LLM 请求的全局调控器"""
+
+    def __init__(
+        self,
+        initial_limit: int = LLM_GOVERNOR_INITIAL_LIMIT,
+        min_limit: int = LLM_GOVERNOR_MIN_LIMIT,
+        max_limit: int = LLM_GOVERNOR_MAX_LIMIT,
+        background_share: float = LLM_GOVERNOR_BACKGROUND_SHARE,
+        queue_timeout: float = LLM_GOVERNOR_QUEUE_TIMEOUT
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.background_share = background_share
+        self.queue_timeout = queue_timeout
+
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._lock = threading.Lock()
+        self._in_flight = {lane: 0 for lane in LLM_LANES}
+        self._queues = {lane: deque() for lane in LLM_LANES}
+        self._paused_until = 0.0     # time.monotonic()
+        self._resume_timer: Optional[threading.Timer] = None
+        self._last_decrease = float('-inf')
+        self._increases = 0
+        self._decreases = 0
+
+        self._stats = {
+            lane: {'granted': 0, 'throttled': 0, 'errors': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+            for lane in LLM_LANES
+        }
+        self._recent_waits = {lane: deque(maxlen=LLM_GOVERNOR_WAIT_SAMPLES) for lane in LLM_LANES}
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    # ========== 名额发放（调用方持有 self._lock） ==========
+
+    def _can_grant(self, lane: str, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        if sum(self._in_flight.values()) >= self.limit:
+            return False
+        if lane == LLM_LANE_BACKGROUND:
+            return self._in_flight[lane] < max(1, int(self.limit * self.background_share))
+        return True
+
+    def _dispatch(self):
+        """按通道优先级依次给排队者发放名额"""
+        now = time.monotonic()
+        for lane in LLM_LANES:
+            queue = self._queues[lane]
+            while queue and self._can_grant(lane, now):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._in_flight[lane] += 1
+                self._record_wait(lane, now - waiter.enqueued_at)
+                waiter.wake()
+
+    def _record_wait(self, lane: str, waited: float):
+        stats = self._stats[lane]
+        stats['granted'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+        self._recent_waits[lane].append(waited)
+
+    def _schedule_resume(self):
+        # 暂停结束时没有请求释放名额来触发发放，由定时器唤醒排队者
+        if self._resume_timer is not None and self._resume_timer.is_alive():
+            return
+        delay = max(0.0, self._paused_until - time.monotonic())
+        self._resume_timer = threading.Timer(delay, self._resume)
+        self._resume_timer.daemon = True
+        self._resume_timer.start()
+
+    def _resume(self):
+        with self._lock:
+            self._resume_timer = None
+            if time.monotonic() < self._paused_until:
+                self._schedule_resume()
+            else:
+                self._dispatch()
+
+    # ========== 获取 / 释放 ==========
+
+    def _queue_timeout(self) -> float:
+        # 排队时间同样计入请求的时间预算
+        deadline = current_deadline()
+        return deadline.timeout(self.queue_timeout) if deadline else self.queue_timeout
+
+    def acquire(self, lane: Optional[str] = None) -> Permit:
+        """阻塞当前线程直到获得名额，排队超时抛出 TimeoutError"""
+        waiter = _Waiter(lane or current_lane())
+        with self._lock:
+            self._queues[waiter.lane].append(waiter)
+            self._dispatch()
+
+        timeout = self._queue_timeout()
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._queues[waiter.lane].remove(waiter)
+                    self._stats[waiter.lane]['timeouts'] += 1
+                    raise TimeoutError(f"等待 LLM 并发名额超时 ({timeout:.1f}s)")
+        return Permit(waiter.lane)
+
+    async def acquire_async(self, lane: Optional[str] = None) -> Permit:
+        """协程版 acquire：排队期间不阻塞事件循环"""
+        waiter = _Waiter(lane or current_lane(), asyncio.get_running_loop())
+        with self._lock:
+            self._queues[waiter.lane].append(waiter)
+            self._dispatch()
+
+        timeout = self._queue_timeout()
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException as e:
+            # 超时或被取消：已发放的名额归还，未发放的退出队列
+            with self._lock:
+                if waiter.granted:
+                    self._in_flight[waiter.lane] -= 1
+                    self._dispatch()
+                else:
+                    self._queues[waiter.lane].remove(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._stats[waiter.lane]['timeouts'] += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise TimeoutError(f"等待 LLM 并发名额超时 ({timeout:.1f}s)") from None
+            raise
+        return Permit(waiter.lane)
+
+    def release(self, permit: Permit):
+        """归还名额，并按请求结果调整并发上限"""
+        with self._lock:
+            lane = permit.lane
+            now = time.monotonic()
+            # 只在上限确实成为瓶颈时增长，避免空闲期把上限抬得过高
+            saturated = sum(self._in_flight.values()) >= self.limit or any(self._queues.values())
+            self._in_flight[lane] -= 1
+
+            if permit.outcome == 'throttled':
+                self._stats[lane]['throttled'] += 1
+                if now - self._last_decrease >= LLM_GOVERNOR_DECREASE_COOLDOWN:
+                    self._limit = max(float(self.min_limit), self._limit * LLM_GOVERNOR_DECREASE_FACTOR)
+                    self._last_decrease = now
+                    self._decreases += 1
+                if permit.retry_after:
+                    self._paused_until = max(self._paused_until, now + permit.retry_after)
+                    self._schedule_resume()
+            elif permit.outcome == 'error':
+                self._stats[lane]['errors'] += 1
+            elif saturated and self._limit < self.max_limit:
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                self._increases += 1
+
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: Optional[str] = None):
+        """占用一个名额；请求抛出异常时记为失败"""
+        permit = self.acquire(lane)
+        try:
+            yield permit
+        except Exception:
+            permit.failed()
+            raise
+        finally:
+            self.release(permit)
+
+    @asynccontextmanager
+    async def slot_async(self, lane: Optional[str] = None):
+        permit = await self.acquire_async(lane)
+        try:
+            yield permit
+        except Exception:
+            permit.failed()
+            raise
+        finally:
+            self.release(permit)
+
+    def is_congested(self) -> bool:
+        """是否有请求在排队等待名额，或因限流暂停发放（此时不宜再发额外请求）"""
+        with self._lock:
+            return any(self._queues.values()) or time.monotonic() < self._paused_until
+
+    # ========== 指标 ==========
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            lanes = {}
+            for lane in LLM_LANES:
+                stats = self._stats[lane]
+                waits = sorted(self._recent_waits[lane])
+                granted = stats['granted']
+                lanes[lane] = {
+                    'in_flight': self._in_flight[lane],
+                    'queued': len(self._queues[lane]),
+                    'granted': granted,
+                    'throttled': stats['throttled'],
+                    'errors': stats['errors'],
+                    'timeouts': stats['timeouts'],
+                    'avg_wait_ms': round(stats['total_wait'] / granted * 1000, 1) if granted else 0.0,
+                    'p95_wait_ms': round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+                    'max_wait_ms': round(stats['max_wait'] * 1000, 1),
+                }
+            return {
+                'limit': self.limit,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': sum(self._in_flight.values()),
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 3),
+                'increases': self._increases,
+                'decreases': self._decreases,
+                'lanes': lanes,
+            }
+
+
+_governor: Optional[LLMGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_llm_governor() -> Optional[LLMGovernor]:
+    """获取进程级共享的出站调控器（LLM_GOVERNOR=0 时返回 None）"""
+    global _governor
+    from .config import Config
+    if not Config.use_llm_governor():
+        return None
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = LLMGovernor(max_limit=Config.get_llm_governor_max_limit())
+    return _governor
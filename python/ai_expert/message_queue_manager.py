@@ -100,6 +100,21 @@ class MessageQueueManager:
         finally:
             conn.close()
 
+    def claim_task(self, queue_id: int) -> bool:
+        """原子地将 PENDING 任务置为 PROCESSING；任务已被其他处理方领取时返回 False"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                UPDATE message_queue SET status = 'PROCESSING', updated_at = ?
+                WHERE id = ? AND status = 'PENDING'
+            """, (datetime.now(), queue_id))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
     def get_task_by_id(self, task_id: int) -> Optional[Dict]:
         """按 ID 获取特定任务"""
         conn = self.db.get_connection()
@@ -110,6 +125,22 @@ class MessageQueueManager:
         conn.close()
         return dict(row) if row else None
 
+    def get_pending_task(self, session_id: str, message: str) -> Optional[Dict]:
+        """获取会话中内容相同、尚未处理的最新任务"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT * FROM message_queue 
+            WHERE session_id = ? AND raw_message = ? AND status = 'PENDING'
+            ORDER BY created_at DESC 
+            LIMIT 1
+        """, (session_id, message))
+        
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
     def get_task_by_session(self, session_id: str) -> Optional[Dict]:
         """获取特定会话的最新任务"""
         conn = self.db.get_connection()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+OCR Service
+图片文字识别服务
+
+- 识别器常驻：在向量化工作进程中，或在本进程内懒加载后保持预热，可通过 preload() 提前加载
+- 大图先等比缩小到 OCR_MAX_WIDTH，长截图按 OCR_TILE_HEIGHT 分块识别，块间重叠避免切断文字行
+- 识别结果缓存到 SQLite，按图片内容 sha256 精确命中。不做感知哈希近似命中：
+  价目表等文字截图只有数字不同时哈希几乎相同，复用会把错误的文字写入知识库
+"""
+
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .constants import OCR_LANGUAGES, OCR_TILE_OVERLAP
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# ========== 图片预处理 ==========
+
+def prepare_tiles(
+    image,
+    max_width: int,
+    tile_height: int,
+    tile_overlap: int = OCR_TILE_OVERLAP
+) -> List[Tuple[np.ndarray, int, int]]:
+    """
+    缩放并切块
+
+    Returns:
+        [(tile_array, own_top, own_bottom)]
+        own_top / own_bottom 为该块“负责”的纵向范围（块内坐标），
+        文字行中心落在范围内才归属该块，避免重叠区的行被识别两次
+    """
+    image = image.convert('RGB')
+    width, height = image.size
+    if max_width and width > max_width:
+        height = max(1, round(height * max_width / width))
+        width = max_width
+        image = image.resize((width, height), Image.LANCZOS)
+
+    if not tile_height or height <= tile_height:
+        return [(np.asarray(image), 0, height)]
+
+    step = max(tile_height - tile_overlap, 1)
+    half = tile_overlap // 2
+    tiles = []
+    top = 0
+    while True:
+        bottom = min(top + tile_height, height)
+        is_first, is_last = top == 0, bottom == height
+        tile = np.asarray(image.crop((0, top, width, bottom)))
+        own_top = 0 if is_first else half
+        own_bottom = (bottom - top) if is_last else (bottom - top) - (tile_overlap - half)
+        tiles.append((tile, own_top, own_bottom))
+        if is_last:
+            break
+        top += step
+    return tiles
+
+
+def read_image(reader, image_path: str, max_width: int, tile_height: int) -> List[str]:
+    """对单张图片执行（缩放 + 分块）识别，返回按阅读顺序排列的文字行"""
+    if Image is None:
+        raise ImportError("Pillow 未安装，无法进行图片预处理")
+
+    with Image.open(image_path) as image:
+        tiles = prepare_tiles(image, max_width, tile_height)
+
+    lines = []
+    for tile, own_top, own_bottom in tiles:
+        for bbox, text, _confidence in reader.readtext(tile, detail=1):
+            ys = [point[1] for point in bbox]
+            center = (min(ys) + max(ys)) / 2
+            if own_top <= center < own_bottom:
+                lines.append(text)
+    return lines
+
+
+# ========== 结果缓存 ==========
+
+class OCRCache:
+    """OCR 结果缓存 (SQLite)"""
+
+    def __init__(self, db):
+        self.db = db
+        self._init_table()
+
+    def _init_table(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                content_hash TEXT NOT NULL,
+                options_key TEXT NOT NULL,
+                lines TEXT NOT NULL,
+                hit_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_hit_at TIMESTAMP,
+                PRIMARY KEY (content_hash, options_key)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def get(self, content_hash: str, options_key: str) -> Optional[List[str]]:
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT lines FROM ocr_cache WHERE content_hash = ? AND options_key = ?",
+            (content_hash, options_key)
+        )
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("""
+                UPDATE ocr_cache SET hit_count = hit_count + 1, last_hit_at = ?
+                WHERE content_hash = ? AND options_key = ?
+            """, (datetime.now(), content_hash, options_key))
+            conn.commit()
+        conn.close()
+        return json.loads(row['lines']) if row else None
+
+    def put(self, content_hash: str, options_key: str, lines: List[str]):
+        conn = self.db.get_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO ocr_cache (content_hash, options_key, lines)
+            VALUES (?, ?, ?)
+        """, (content_hash, options_key, json.dumps(lines, ensure_ascii=False)))
+        conn.commit()
+        conn.close()
+
+
+# ========== 识别服务 ==========
+
+class OCRService:
+    """OCR 识别服务：常驻识别器 + 预处理 + 结果缓存"""
+
+    def __init__(self, db, worker=None, max_width: int = None, tile_height: int = None):
+        from .config import Config
+
+        self.worker = worker
+        self.max_width = max_width if max_width is not None else Config.get_ocr_max_width()
+        self.tile_height = tile_height if tile_height is not None else Config.get_ocr_tile_height()
+        self.options_key = f"w{self.max_width}-t{self.tile_height}-o{OCR_TILE_OVERLAP}-{'+'.join(OCR_LANGUAGES)}"
+        self.cache = OCRCache(db)
+
+        self._reader = None
+        self._reader_lock = threading.Lock()   # 加载识别器
+        self._ocr_lock = threading.Lock()      # EasyOCR 实例不保证线程安全，串行识别
+        self._preload_thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            'exact_hits': 0,
+            'misses': 0,
+            'ocr_seconds': 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    # ========== 识别器 ==========
+
+    def _get_reader(self):
+        if self._reader is None:
+            with self._reader_lock:
+                if self._reader is None:
+                    import easyocr
+                    print("[OCR] Initializing EasyOCR...")
+                    self._reader = easyocr.Reader(OCR_LANGUAGES)
+                    print("[OCR] EasyOCR ready")
+        return self._reader
+
+    def preload(self, wait: bool = False):
+        """预热识别器（默认在后台线程中加载，不阻塞调用方）"""
+        if self.worker is not None:
+            self.worker.preload(ocr=True)
+            return
+
+        if self._reader is not None:
+            return
+        if self._preload_thread is None or not self._preload_thread.is_alive():
+            self._preload_thread = threading.Thread(target=self._preload_in_process, daemon=True)
+            self._preload_thread.start()
+        if wait:
+            self._preload_thread.join()
+
+    def _preload_in_process(self):
+        try:
+            self._get_reader()
+        except Exception as e:
+            print(f"[OCR] Preload failed: {e}")
+
+    def is_ready(self) -> bool:
+        if self.worker is not None:
+            return self.worker.is_alive()
+        return self._reader is not None
+
+    # ========== 识别 ==========
+
+    def recognize(self, image_path: str) -> List[str]:
+        """识别图片文字（优先命中缓存）"""
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        lines = self.cache.get(content_hash, self.options_key)
+        if lines is not None:
+            self._count('exact_hits')
+            return lines
+
+        start = time.time()
+        lines = self._run_ocr(image_path)
+        with self._stats_lock:
+            self.stats['misses'] += 1
+            self.stats['ocr_seconds'] += time.time() - start
+
+        self.cache.put(content_hash, self.options_key, lines)
+        return lines
+
+    def _run_ocr(self, image_path: str) -> List[str]:
+        if self.worker is not None:
+            return self.worker.ocr(image_path, max_width=self.max_width, tile_height=self.tile_height)
+        reader = self._get_reader()
+        with self._ocr_lock:
+            return read_image(reader, image_path, self.max_width, self.tile_height)
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get_status(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['exact_hits'] + stats['misses']
+        stats['hit_rate'] = stats['exact_hits'] / lookups if lookups else 0.0
+        stats['avg_ocr_seconds'] = stats['ocr_seconds'] / stats['misses'] if stats['misses'] else 0.0
+        stats.update({
+            'ready': self.is_ready(),
+            'mode': 'worker' if self.worker is not None else 'in-process',
+            'max_width': self.max_width,
+            'tile_height': self.tile_height,
+        })
+        return stats
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Stage Pipeline
+按依赖关系并发执行的阶段流水线（DAG）
+
+生成前的准备工作由多个阶段组成（上下文选择、意图识别、预设问答、向量检索、金牌话术…），
+其中大部分互不依赖。把它们声明为 DAG 后：
+- 依赖全部就绪的阶段立即提交到共享线程池，互不依赖的阶段并行，总耗时约为关键路径而不是各阶段之和
+- 每个阶段可设超时（不超过当前请求的剩余时间预算）
+- 可选阶段失败、超时或条件不满足时使用默认值，下游照常执行；必需阶段失败则整体抛出异常
+- 轻量阶段 (inline) 直接在调用线程执行，省去线程切换
+- 提交时复制 contextvars，时间预算与 LLM 通道随阶段一起传递
+"""
+
+import time
+import threading
+import contextvars
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .deadline import current_deadline
+from .tracing import trace_span
+from .constants import PIPELINE_MAX_WORKERS
+
+
+class StageTimeoutError(TimeoutError):
+    """必需阶段超时"""
+
+
+class Stage:
+    """流水线中的一个阶段：func 以依赖阶段的结果作为关键字参数"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        deps: Sequence[str] = (),
+        timeout: Optional[float] = None,
+        optional: bool = False,
+        default: Any = None,
+        condition: Optional[Callable[[], bool]] = None,
+        inline: bool = False
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.optional = optional
+        self.default = default
+        self.condition = condition
+        self.inline = inline
+
+
+class StagePipeline:
+    """按依赖关系调度阶段；concurrent=False 时按拓扑顺序在调用线程中依次执行"""
+
+    def __init__(self, stages: List[Stage], concurrent: bool = True, executor=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.concurrent = concurrent
+        self.executor = executor
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}      # 阶段耗时 (毫秒)
+        self.skipped: Dict[str, str] = {}        # 阶段名 -> 跳过原因 (condition / timeout / error)
+        self._validate()
+
+    def _validate(self):
+        for stage in self.stages.values():
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        # 检测环：拓扑排序能覆盖所有阶段
+        self._order = []
+        resolved = set()
+        while len(resolved) < len(self.stages):
+            ready = [name for name, stage in self.stages.items()
+                     if name not in resolved and all(dep in resolved for dep in stage.deps)]
+            if not ready:
+                raise ValueError("Stage dependencies contain a cycle")
+            self._order.extend(ready)
+            resolved.update(ready)
+
+    def run(self) -> Dict[str, Any]:
+        """执行全部阶段，返回 {阶段名: 结果}"""
+        if not self.concurrent:
+            for name in self._order:
+                self._finish_inline(self.stages[name])
+            return self.results
+
+        executor = self.executor or get_pipeline_executor()
+        running: Dict[concurrent.futures.Future, tuple] = {}   # future -> (stage, started_at, expires_at)
+        submitted = set()
+
+        while len(self.results) < len(self.stages):
+            # 1. 提交依赖已就绪的阶段（inline 阶段就地执行后可能解锁更多阶段）
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in self._order:
+                    stage = self.stages[name]
+                    if name in submitted or not all(dep in self.results for dep in stage.deps):
+                        continue
+                    submitted.add(name)
+                    progressed = True
+                    if stage.inline or self._skip_by_condition(stage):
+                        self._finish_inline(stage)
+                        continue
+                    started = time.time()
+                    future = executor.submit(contextvars.copy_context().run, self._call, stage)
+                    running[future] = (stage, started, self._expires_at(stage, started))
+
+            if len(self.results) == len(self.stages):
+                break
+            if not running:
+                raise RuntimeError("Stage pipeline stalled")
+
+            # 2. 等待任一阶段完成或最早的超时到期
+            expiries = [expires for _, _, expires in running.values() if expires is not None]
+            wait_timeout = max(0.0, min(expiries) - time.time()) if expiries else None
+            done, _ = concurrent.futures.wait(
+                running, timeout=wait_timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                stage, started, _ = running.pop(future)
+                try:
+                    self._complete(stage, future.result(), started)
+                except Exception as e:
+                    self._fail(stage, e, started)
+
+            # 3. 超时的阶段：可选阶段使用默认值（线程继续运行，结果丢弃），必需阶段抛出异常
+            now = time.time()
+            for future, (stage, started, expires) in list(running.items()):
+                if expires is not None and now >= expires:
+                    running.pop(future)
+                    future.cancel()
+                    self._fail(stage, StageTimeoutError(f"Stage '{stage.name}' timed out"), started, reason='timeout')
+
+        return self.results
+
+    @staticmethod
+    def _expires_at(stage: Stage, started: float) -> Optional[float]:
+        timeout = stage.timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            timeout = deadline.timeout(timeout) if timeout is not None else deadline.remaining()
+        return started + timeout if timeout is not None else None
+
+    def _call(self, stage: Stage):
+        with trace_span(f"stage.{stage.name}"):
+            return stage.func(**{dep: self.results[dep] for dep in stage.deps})
+
+    def _skip_by_condition(self, stage: Stage) -> bool:
+        return stage.condition is not None and not stage.condition()
+
+    def _finish_inline(self, stage: Stage):
+        started = time.time()
+        if self._skip_by_condition(stage):
+            self.skipped[stage.name] = 'condition'
+            self.results[stage.name] = stage.default
+            self.timings[stage.name] = 0.0
+            return
+        try:
+            self._complete(stage, self._call(stage), started)
+        except Exception as e:
+            self._fail(stage, e, started)
+
+    def _complete(self, stage: Stage, value: Any, started: float):
+        self.results[stage.name] = value
+        self.timings[stage.name] = round((time.time() - started) * 1000, 1)
+
+    def _fail(self, stage: Stage, error: Exception, started: float, reason: str = 'error'):
+        self.timings[stage.name] = round((time.time() - started) * 1000, 1)
+        if not stage.optional:
+            raise error
+        print(f"[Pipeline] Optional stage '{stage.name}' skipped ({reason}): {error}")
+        self.skipped[stage.name] = reason
+        self.results[stage.name] = stage.default
+
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_pipeline_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """进程级共享的阶段线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=PIPELINE_MAX_WORKERS,
+                    thread_name_prefix="stage-pipeline"
+                )
+    return _executor
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Pregeneration Registry
+后台预生成结果登记处
+
+BackgroundProcessor / 批量生成为队列中的消息提前生成三个版本，交互式 /generate 复用这些结果：
+- 后台开始生成前 begin() 登记，完成后 complete() 写入结果（失败时写入 None）
+- 交互式请求按 (会话, AI 专家, 消息) 查找：已完成的直接返回；生成中的等待其完成，
+  不再重复调用 DeepSeek；等待受请求时间预算约束，超时则回退为正常生成
+- 结果只被交互式请求取用一次，再次点击生成会得到新的回复；超过有效期的结果不再复用
+- 后台处理器与 API 运行在同一进程内，登记处只保存在内存中
+"""
+
+import time
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .deadline import Deadline
+from .constants import (
+    PREGENERATION_TTL,
+    PREGENERATION_MAX_ENTRIES,
+    PREGENERATION_WAIT_TIMEOUT,
+    DEADLINE_GENERATION_RESERVE
+)
+
+
+def _key(session_id: str, prompt_id: int, message: str) -> Tuple:
+    return (session_id, prompt_id, (message or '').strip())
+
+
+class PregenerationRegistry:
+    """按 (session_id, prompt_id, 消息) 共享进行中 / 已完成的后台生成结果"""
+
+    def __init__(self, ttl: float = PREGENERATION_TTL, max_entries: int = PREGENERATION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[concurrent.futures.Future, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'registered': 0, 'hits_ready': 0, 'hits_inflight': 0, 'misses': 0, 'wait_timeouts': 0}
+
+    def begin(self, session_id: str, prompt_id: int, message: str) -> concurrent.futures.Future:
+        """后台开始生成前登记，返回的 Future 交给 complete()"""
+        future = concurrent.futures.Future()
+        key = _key(session_id, prompt_id, message)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (future, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stats['registered'] += 1
+        return future
+
+    def complete(self, future: concurrent.futures.Future, result: Optional[Dict]):
+        """写入后台生成结果；失败时传 None，等待中的交互式请求会回退为正常生成"""
+        if not future.done():
+            future.set_result(result if result and result.get('success') else None)
+
+    def take(self, session_id: str, prompt_id: int, message: str,
+             deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        交互式请求取用预生成结果
+
+        Returns:
+            生成结果（与 generate_three_versions 的返回值相同），没有可用结果时返回 None
+        """
+        key = _key(session_id, prompt_id, message)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            self._count('misses')
+            return None
+
+        future, registered_at = entry
+        if time.monotonic() - registered_at > self.ttl:
+            self._count('misses')
+            return None
+
+        if future.done():
+            result = future.result()
+            self._count('hits_ready' if result else 'misses')
+            return result
+
+        # 生成中：等待后台结果，但要为超时后的正常生成留出预算
+        wait = PREGENERATION_WAIT_TIMEOUT
+        if deadline is not None:
+            wait = deadline.shrink(DEADLINE_GENERATION_RESERVE).timeout(wait)
+        try:
+            result = future.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            self._count('wait_timeouts')
+            return None
+        self._count('hits_inflight' if result else 'misses')
+        return result
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), **self._stats}
+
+
+_registry: Optional[PregenerationRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_pregeneration_registry() -> PregenerationRegistry:
+    """进程级共享的预生成登记处"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PregenerationRegistry()
+    return _registry
@@ -95,6 +95,11 @@ def rate_limit(max_requests: int = 60, window_seconds: int = 60):
     def decorator(f):
         @wraps(f)
         def decorated(*args, **kwargs):
+            from .config import Config
+            if not Config.use_rate_limit():
+                # 压测时关闭（所有并发客户端都来自同一 IP）
+                return f(*args, **kwargs)
+
             allowed, info = rate_limiter.is_allowed(max_requests, window_seconds)
             
             if not allowed:
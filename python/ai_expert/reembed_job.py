@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Re-Embed Job
+向量索引后台重建任务
+
+切换向量模型时不下线知识库：
+1. 按 chunks.id 分批读取全文，用新模型编码，写入新模型独立的索引目录（只在内存中累积）
+2. 期间新上传的文档仍写入旧索引，同时落入 chunks 表；每轮结束后继续追平 id 更大的分块
+3. 追平后持有索引写锁，做最后一次追平并剔除期间已删除的文件，落盘后原子切换
+"""
+
+import time
+import shutil
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from .constants import REEMBED_BATCH_SIZE, REEMBED_BATCH_PAUSE
+
+
+class ReEmbedJob:
+    """后台重建向量索引"""
+
+    def __init__(self, kb_manager, model_name: str, batch_size: int = None, pause_seconds: float = None):
+        from .knowledge_base_manager import SimpleVectorStore
+
+        self.kb = kb_manager
+        self.model_name = model_name
+        self.batch_size = batch_size or REEMBED_BATCH_SIZE
+        self.pause_seconds = REEMBED_BATCH_PAUSE if pause_seconds is None else pause_seconds
+
+        # 每次重建都使用新的目录，不会混入上次失败残留的向量，也不会覆盖仍在服务的旧索引
+        self.store = SimpleVectorStore(kb_manager._new_store_path(model_name))
+
+        self.status = 'pending'   # pending / running / switching / completed / failed / cancelled
+        self.error: Optional[str] = None
+        self.total = 0
+        self.processed = 0
+        self.last_chunk_id = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ========== 控制 ==========
+
+    def start(self):
+        self.started_at = time.time()
+        self.status = 'running'
+        self._thread = threading.Thread(target=self._run, name=f"reembed-{self.model_name}", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def join(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self.status in ('pending', 'running', 'switching')
+
+    # ========== 执行 ==========
+
+    def _run(self):
+        try:
+            self.total = self._count_chunks()
+            print(f"[ReEmbed] Start re-embedding {self.total} chunks with {self.model_name}")
+
+            # 追平到没有新分块为止
+            while self._process_pending():
+                pass
+
+            if self._cancel.is_set():
+                shutil.rmtree(self.store.storage_path, ignore_errors=True)
+                self._finish('cancelled')
+                return
+
+            self.status = 'switching'
+            with self.kb._index_lock:
+                # 持锁期间不会有新的写入，最后追平一次
+                while self._process_pending(throttle=False):
+                    pass
+                self._drop_deleted_files()
+                self.store.save_all()
+                self.kb.activate_index(self.model_name, self.store)
+
+            self._finish('completed')
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self.error = str(e)
+            self._finish('failed')
+
+    def _process_pending(self, throttle: bool = True) -> bool:
+        """处理一批 id 大于 last_chunk_id 的分块，返回是否处理到了数据"""
+        if self._cancel.is_set():
+            return False
+
+        rows = self._fetch_batch(self.last_chunk_id)
+        if not rows:
+            return False
+
+        embeddings = np.asarray(self.kb._encode([row['content'] for row in rows], self.model_name))
+        metadatas = [
+            {
+                "file_id": row['file_id'],
+                "bound_prompt_id": row['bound_prompt_id'] or 0,
+                "chunk_index": row['chunk_index'],
+                "source": row['file_name'],
+                "content_preview": row['content'][:50],
+                "embedding_model": self.model_name
+            }
+            for row in rows
+        ]
+        self.store.add(embeddings.tolist(), metadatas, save=False)
+
+        with self._lock:
+            self.last_chunk_id = rows[-1]['id']
+            self.processed += len(rows)
+            self.total = max(self.total, self.processed)
+
+        if throttle and self.pause_seconds:
+            self._cancel.wait(self.pause_seconds)
+        return True
+
+    def _fetch_batch(self, after_id: int):
+        conn = self.kb.sql_db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.id, c.file_id, c.chunk_index, c.content, f.bound_prompt_id, f.file_name
+            FROM chunks c JOIN files f ON f.id = c.file_id
+            WHERE c.id > ?
+            ORDER BY c.id
+            LIMIT ?
+        """, (after_id, self.batch_size))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def _count_chunks(self) -> int:
+        conn = self.kb.sql_db.get_connection()
+        row = conn.execute("SELECT COUNT(*) AS cnt FROM chunks").fetchone()
+        conn.close()
+        return row['cnt']
+
+    def _drop_deleted_files(self):
+        """剔除重建期间已被删除的文件"""
+        conn = self.kb.sql_db.get_connection()
+        existing = {row['id'] for row in conn.execute("SELECT id FROM files").fetchall()}
+        conn.close()
+        self.store.delete(lambda meta: meta.get('file_id') not in existing)
+
+    def _finish(self, status: str):
+        self.status = status
+        self.finished_at = time.time()
+        print(f"[ReEmbed] {self.model_name}: {status} ({self.processed}/{self.total})")
+
+    # ========== 进度 ==========
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            processed, total = self.processed, self.total
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        return {
+            'model_name': self.model_name,
+            'status': self.status,
+            'processed': processed,
+            'total': total,
+            'progress': round(processed / total, 4) if total else (1.0 if self.status == 'completed' else 0.0),
+            'chunks_per_second': round(rate, 2),
+            'eta_seconds': round((total - processed) / rate, 1) if rate > 0 and self.is_running() else None,
+            'elapsed_seconds': round(elapsed, 1),
+            'error': self.error
+        }
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Reply Cache
+重复客户问题的回复缓存
+
+"多少钱"、"地址在哪"、"周末营业吗" 这类问题在不同客户之间大量重复，三个版本的回复基本相同：
+- 精确层：键为 (AI 专家, 意图, 对话阶段, 客户画像, 会话话题, 脱敏并归一化后的消息)，命中时不再调用 DeepSeek；
+  客户画像是客户记忆中会写进本轮提示词的部分，画像不同的客户不共用回复；
+  会话话题是最近几条客户消息的关键词，"这个多少钱"、"有货吗" 这类依赖上文的问题只在话题相同时共用回复
+- 语义层：精确层未命中时，用知识库的向量模型编码消息，在同一 (专家, 意图, 阶段, 画像, 话题) 下
+  查找余弦相似度不低于阈值的已缓存问题；阈值为 0 时关闭语义层
+- 只缓存短消息（长消息往往包含个性化细节），条目带 TTL，容量有上限，超出后按最近使用时间淘汰
+- AI 专家配置变更、知识库文档增删或向量模型切换时主动失效
+- 每个数据库实例一份缓存，按层统计命中率
+"""
+
+import math
+import time
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .llm_cache import normalize_text
+from .constants import (
+    REPLY_CACHE_TTL,
+    REPLY_CACHE_MAX_ENTRIES,
+    REPLY_CACHE_MAX_MESSAGE_CHARS,
+    REPLY_CACHE_TOPIC_TURNS
+)
+
+
+def memory_profile(memory: Optional[Dict]) -> Tuple:
+    """客户记忆中会写进本轮提示词的部分：客户阶段、价格敏感、关注点、最近已提供的信息"""
+    if not memory:
+        return ()
+    preferences = memory.get('preferences') or {}
+    provided_info = [
+        item.get('info', item.get('name', str(item))) if isinstance(item, dict) else str(item)
+        for item in (memory.get('provided_info') or [])[-3:]
+    ]
+    return (
+        memory.get('stage') or 'cold',
+        bool(preferences.get('price_sensitive')),
+        tuple(str(concern) for concern in preferences.get('concerns') or ()),
+        tuple(provided_info)
+    )
+
+
+def conversation_topic(history: Optional[List[Dict]], message: str,
+                       extract: Callable[[str], List[str]]) -> Tuple:
+    """
+    会话话题：最近 REPLY_CACHE_TOPIC_TURNS 条客户消息的关键词（寒暄没有关键词，话题为空）
+
+    Args:
+        history: 会话历史，支持 {"role", "content"} 与数据库行 {"message", "is_customer"} 两种格式
+        message: 本轮消息（历史末尾就是本轮消息时不计入）
+        extract: 文本 -> 关键词列表
+    """
+    turns = []
+    for item in history or []:
+        if item.get('role', 'user' if item.get('is_customer', True) else 'assistant') != 'user':
+            continue
+        content = item.get('content') or item.get('message')
+        if content:
+            turns.append(content)
+    if turns and normalize_text(turns[-1]) == normalize_text(message):
+        turns.pop()
+    recent = turns[-REPLY_CACHE_TOPIC_TURNS:]
+    if not recent:
+        return ()
+    return tuple(sorted(set(extract('\n'.join(recent)))))
+
+
+def _normalize_vector(vector) -> Optional[Tuple[float, ...]]:
+    values = [float(v) for v in vector]
+    norm = math.sqrt(sum(v * v for v in values))
+    return tuple(v / norm for v in values) if norm else None
+
+
+class ReplyCache:
+    """回复缓存（精确层 + 语义层，内存 LRU）"""
+
+    def __init__(self, ttl: float = REPLY_CACHE_TTL, max_entries: int = REPLY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (prompt_id, 意图, 阶段, 客户画像, 话题, 消息) -> {"versions", "vector", "expires_at"}
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watched = weakref.WeakSet()
+        self._stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+    @staticmethod
+    def probe(prompt_id: int, message: str, intent: Optional[str], stage: Optional[str],
+              profile: Tuple = (), topic: Tuple = ()) -> Optional[Dict]:
+        """
+        构造查找 / 写入用的键；消息为空或过长时返回 None（不参与缓存）
+
+        Args:
+            profile: memory_profile() 的返回值
+            topic: conversation_topic() 的返回值
+        """
+        text = normalize_text(message)
+        if not text or len(text) > REPLY_CACHE_MAX_MESSAGE_CHARS:
+            return None
+        return {'key': (prompt_id, intent, stage, profile, topic, text), 'text': text, 'vector': None}
+
+    def get(self, probe: Dict, embed: Optional[Callable[[str], Optional[List[float]]]] = None,
+            threshold: float = 0.0) -> Optional[Dict]:
+        """
+        查找缓存的三个版本
+
+        Args:
+            probe: probe() 的返回值；语义层编码的向量会记在其中，写入时复用
+            embed: 文本 -> 向量；为 None 或 threshold 为 0 时只查精确层
+            threshold: 语义层的最低余弦相似度
+
+        Returns:
+            {"versions": dict, "tier": "exact" / "semantic", "score": float}，未命中时返回 None
+        """
+        key = probe['key']
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires_at'] > now:
+                self._entries.move_to_end(key)
+                self._stats['exact_hits'] += 1
+                return {'versions': dict(entry['versions']), 'tier': 'exact', 'score': 1.0}
+
+        hit = None
+        if embed is not None and threshold > 0:
+            vector = embed(probe['text'])
+            probe['vector'] = _normalize_vector(vector) if vector is not None else None
+            if probe['vector'] is not None:
+                hit = self._semantic_lookup(key[:5], probe['vector'], threshold, now)
+
+        with self._lock:
+            self._stats['semantic_hits' if hit else 'misses'] += 1
+        return hit
+
+    def _semantic_lookup(self, scope: Tuple, vector: Tuple[float, ...], threshold: float, now: float) -> Optional[Dict]:
+        best_key, best_score = None, threshold
+        with self._lock:
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if k[:5] == scope and e['vector'] is not None and e['expires_at'] > now]
+        for key, entry in candidates:
+            if len(entry['vector']) != len(vector):
+                continue
+            score = sum(a * b for a, b in zip(entry['vector'], vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(best_key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return {'versions': dict(entry['versions']), 'tier': 'semantic', 'score': round(best_score, 4)}
+
+    def put(self, probe: Dict, versions: Dict[str, str]):
+        """写入一次完整生成的三个版本"""
+        with self._lock:
+            self._entries.pop(probe['key'], None)
+            self._entries[probe['key']] = {
+                'versions': dict(versions),
+                'vector': probe.get('vector'),
+                'expires_at': time.monotonic() + self.ttl
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stats['stores'] += 1
+
+    def invalidate(self, prompt_id: Optional[int] = None):
+        """失效指定专家的缓存；prompt_id 为 None 时清空"""
+        with self._lock:
+            keys = [k for k in self._entries if prompt_id is None or k[0] == prompt_id]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+
+    def watch_knowledge_base(self, kb_manager):
+        """知识库文档变化时失效（同一知识库只注册一次）"""
+        with self._lock:
+            if kb_manager in self._watched:
+                return
+            self._watched.add(kb_manager)
+        kb_manager.add_change_listener(self.invalidate)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            hits = self._stats['exact_hits'] + self._stats['semantic_hits']
+            lookups = hits + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'max_size': self.max_entries,
+                'hit_rate': round(hits / lookups * 100, 2) if lookups else 0,
+                **self._stats
+            }
+
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def get_reply_cache(db) -> ReplyCache:
+    """获取数据库实例对应的回复缓存（首次获取时注册配置变更回调）"""
+    cache = _caches.get(db)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db)
+            if cache is None:
+                from .config import Config
+                cache = ReplyCache(ttl=Config.get_reply_cache_ttl())
+                db.add_prompt_change_listener(cache.invalidate)
+                _caches[db] = cache
+    return cache
@@ -7,14 +7,14 @@ AI 回复生成器
 import asyncio
 import concurrent.futures
 from typing import List, Dict, Optional
-from .deepseek_adapter import DeepSeekAdapter
+from .deepseek_adapter import get_deepseek_adapter
 from .prompt_builder import PromptBuilder
 from .context_manager import ContextManager
 from .database import AIExpertDatabase
 
 class ReplyGenerator:
     def __init__(self, api_key: str, db: AIExpertDatabase):
-        self.deepseek = DeepSeekAdapter(api_key)
+        self.deepseek = get_deepseek_adapter(api_key)
         self.prompt_builder = PromptBuilder()
         self.context_manager = ContextManager(db)
         self.db = db
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Request Hedger
+对冲请求（Hedged Requests）
+
+按请求类型（max_tokens）记录最近的成功延迟；一次请求超过 p95 仍未返回时再发一份相同请求，
+先成功返回者胜出，以少量额外请求换取尾延迟：
+- 样本不足时不对冲
+- 对冲请求数不超过总请求数的固定比例，避免服务商变慢时流量翻倍
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Hashable, Optional
+
+from .constants import (
+    LLM_LATENCY_WINDOW,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MAX_RATIO,
+)
+
+
+def percentile(sorted_values, q: float) -> float:
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+class RequestHedger:
+    """延迟统计 + 对冲决策"""
+
+    def __init__(
+        self,
+        window: int = LLM_LATENCY_WINDOW,
+        min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        min_delay: float = LLM_HEDGE_MIN_DELAY,
+        max_ratio: float = LLM_HEDGE_MAX_RATIO
+    ):
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+
+        self._lock = threading.Lock()
+        self._latencies: Dict[Hashable, deque] = {}
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def record_latency(self, key: Hashable, seconds: float):
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def plan(self, key: Hashable) -> Optional[float]:
+        """登记一次请求，返回发出对冲前应等待的秒数；样本不足时返回 None"""
+        with self._lock:
+            self._requests += 1
+            samples = self._latencies.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            return max(self.min_delay, percentile(sorted(samples), LLM_HEDGE_PERCENTILE))
+
+    def try_hedge(self) -> bool:
+        """对冲预算内返回 True 并计数"""
+        with self._lock:
+            if self._hedged >= self.max_ratio * self._requests:
+                return False
+            self._hedged += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self._hedge_wins += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            latency = {}
+            for key, samples in self._latencies.items():
+                values = sorted(samples)
+                latency[str(key)] = {
+                    'samples': len(values),
+                    'p50': round(percentile(values, 0.5), 3),
+                    'p95': round(percentile(values, 0.95), 3),
+                    'p99': round(percentile(values, 0.99), 3),
+                }
+            return {
+                'requests': self._requests,
+                'hedged': self._hedged,
+                'hedge_wins': self._hedge_wins,
+                'max_ratio': self.max_ratio,
+                'latency': latency,
+            }
+
+
+_hedger: Optional[RequestHedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_request_hedger() -> RequestHedger:
+    """获取进程级共享的延迟统计 / 对冲决策（是否真正对冲由 LLM_HEDGING 控制）"""
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = RequestHedger()
+    return _hedger
@@ -5,7 +5,7 @@ Smart Context Selector
 """
 
 import re
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 
 class SmartContextSelector:
@@ -52,7 +52,8 @@ class SmartContextSelector:
         max_tokens: int = 2000,
         min_messages: int = 3,
         customer_message: str = None,
-        deepseek_adapter = None
+        deepseek_adapter = None,
+        keyword_extractor: Optional[Callable[[str], List[str]]] = None
     ) -> Tuple[List[Dict], Dict]:
         """
         智能选择上下文
@@ -63,6 +64,7 @@ class SmartContextSelector:
             min_messages: 最少保留的消息数
             customer_message: 当前客户发送的消息（用于提取关键词）
             deepseek_adapter: DeepSeekAdapter实例（用于调用LLM）
+            keyword_extractor: 关键词提取函数（如本地提取器），传入时优先于 deepseek_adapter
         
         Returns:
             (selected_messages, metadata)
@@ -83,9 +85,11 @@ class SmartContextSelector:
         
         # 4. 标记高价值消息 (混合模式：静态关键词 + 动态语义关键词)
         search_keywords = []
-        if customer_message and deepseek_adapter:
+        if keyword_extractor is None and deepseek_adapter:
             # 使用 LLM 提取动态关键词
-            search_keywords = deepseek_adapter.extract_search_keywords(customer_message)
+            keyword_extractor = deepseek_adapter.extract_search_keywords
+        if customer_message and keyword_extractor:
+            search_keywords = keyword_extractor(customer_message)
             print(f"[SmartContext] Extracted keywords: {search_keywords}")
         
         high_value_indices = self._mark_high_value_messages(filtered_messages, dynamic_keywords=search_keywords)
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Chinese Text Splitter
+中文感知的流式文本分块器
+
+- 依次以段落（空行）、行、。！？ 为边界，超长句再按 ，；、空格 切分，最后按字符硬切
+- 支持块间重叠 (overlap)
+- 长度函数可替换：默认按字符数，也可使用 token_length 按 token 估算
+- split_stream 接受逐页的文本迭代器，只缓存未结束的半句，不拼接整篇文档；
+  边界恰好落在已读文本末尾时（后续页可能补上更多空白 / 标点）暂不确认，结果与 split_text 一致
+"""
+
+import re
+from itertools import accumulate
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from .constants import KB_CHUNK_SIZE, KB_CHUNK_OVERLAP
+
+# 段落结束（空行）
+_PARAGRAPH_END_RE = re.compile(r'\n[ \t\u3000]*\n\s*')
+# 行结束（与段落结束的匹配终点一致）
+_LINE_END_RE = re.compile(r'\n\s*')
+# 以下模式都允许以文本末尾结束，避免长段无边界文本时逐位置回溯造成平方级耗时；
+# 句子中连续的结束符与紧随的右引号 / 右括号视为同一句
+_LINE_RE = re.compile(r'[^\n]*(?:\n\s*|$)')
+_SENTENCE_RE = re.compile(r'[^。！？!?\n]*(?:[。！？!?]+[”’"\'」』）)]*|\n+|$)')
+# 句子主体（句末标点 / 换行之前的部分）
+_SENTENCE_BODY_RE = re.compile(r'[^。！？!?\n]*')
+# 超长句的次级切分点
+_CLAUSE_RE = re.compile(r'[^，；,;、 ]*(?:[，；,;、 ]+|$)')
+_CJK_RE = re.compile(r'[㐀-鿿豈-﫿]')
+
+
+def token_length(text: str) -> int:
+    """
+    估算 token 数：中文约 1.5 字符 = 1 token，其他约 4 字符 = 1 token
+    （与 cost_calculator.estimate_tokens 的注释口径一致，但分别计算中英文）
+    """
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return int(cjk / 1.5 + other / 4 + 0.5)
+
+
+class ChineseTextSplitter:
+    """中文感知的流式文本分块器"""
+
+    def __init__(
+        self,
+        chunk_size: int = KB_CHUNK_SIZE,
+        chunk_overlap: int = KB_CHUNK_OVERLAP,
+        length_function: Optional[Callable[[str], int]] = None
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) 必须小于 chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function or len
+
+    # ========== 对外接口 ==========
+
+    def split_text(self, text: str) -> List[str]:
+        """切分一段完整文本"""
+        return list(self.split_stream([text]))
+
+    def split_stream(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        切分逐页产出的文本，边读边产出分块
+
+        Args:
+            pages: 文本片段迭代器（如 PDF 每页文本、docx 每个段落）
+
+        Yields:
+            分块文本
+        """
+        merger = _ChunkMerger(self.chunk_size, self.chunk_overlap, self.length_function)
+        length_function = self.length_function
+        chunk_size = self.chunk_size
+        buffer = ""
+        # 当前所处的切分层级：0 段落；1 段落超长，按行切；2 行也超长，按句切
+        depth = 0
+        # buffer 开头是一个超长句的后半部分（前半已按分句输出），无论长短都要按分句切
+        in_long_sentence = False
+
+        for page in pages:
+            if not page:
+                continue
+            buffer += page
+            pos = 0  # 用游标代替反复切片，避免整页文本的平方级复制
+            units = []
+
+            while pos < len(buffer):
+                if depth == 0:
+                    match = self._final_match(_PARAGRAPH_END_RE, buffer, pos)
+                    end = match.end() if match else len(buffer)
+                    paragraph = buffer[pos:end]
+                    if length_function(paragraph) > chunk_size:
+                        depth = 1
+                        continue
+                    if not match:
+                        break  # 段落未结束，等待下一页
+                    # 放得下的段落整体作为一个片段
+                    units.append(paragraph)
+                    pos = end
+
+                elif depth == 1:
+                    match = self._final_match(_PARAGRAPH_END_RE, buffer, pos)
+                    end = match.end() if match else len(buffer)
+                    lines = self._find_lines(buffer, pos, end, keep_tail=bool(match))
+                    pos += sum(map(len, lines))
+                    units.extend(self._split_blocks(lines))
+                    if match:
+                        depth = 0
+                        continue
+                    if length_function(buffer[pos:]) > chunk_size:
+                        depth = 2  # 未结束的这一行已经超长
+                        continue
+                    break
+
+                else:
+                    pending = _LINE_END_RE.search(buffer, pos)
+                    match = pending if pending and pending.end() < len(buffer) else None
+                    end = match.end() if match else len(buffer)
+                    sentences = self._find_sentences(buffer, pos, end, keep_tail=bool(match))
+                    if pending and not match:
+                        # 行尾还可能被后续页延长，与它重叠的句子暂不确认，下一页从行尾之前重新查找
+                        sentences = self._take_before(sentences, pending.start() - pos)
+                    pos += sum(map(len, sentences))
+                    units.extend(self._split_units(sentences, in_long_sentence))
+                    in_long_sentence = in_long_sentence and not sentences
+                    if match:
+                        depth = 0 if _PARAGRAPH_END_RE.search(match.group()) else 1
+                        continue
+                    # 一直没有句子边界的超长内容也不能无限缓存：句子主体超长时输出已确定的分句，
+                    # 保留最后一段；句末标点之后的引号、括号可能还在下一页，不在句末切开
+                    body_end = _SENTENCE_BODY_RE.match(buffer, pos).end()
+                    if length_function(buffer[pos:body_end]) > chunk_size:
+                        pieces = self._split_clauses(buffer[pos:body_end])
+                        pieces.pop()
+                        if pieces:
+                            pos += sum(map(len, pieces))
+                            units.extend(pieces)
+                            in_long_sentence = True
+                    break
+
+            buffer = buffer[pos:]
+            yield from merger.push_all(units)
+
+        if buffer:
+            if depth == 2:
+                units = self._split_units(
+                    self._find_sentences(buffer, 0, len(buffer), keep_tail=True), in_long_sentence
+                )
+            elif depth == 1:
+                units = self._split_blocks(self._find_lines(buffer, 0, len(buffer), keep_tail=True))
+            else:
+                units = self._split_blocks([buffer])
+            yield from merger.push_all(units)
+        yield from merger.flush()
+
+    # ========== 内部实现 ==========
+
+    @staticmethod
+    def _final_match(pattern, text: str, pos: int):
+        """查找边界；匹配延伸到文本末尾时后续页可能继续延长它，视为尚未出现"""
+        match = pattern.search(text, pos)
+        return match if match and match.end() < len(text) else None
+
+    @staticmethod
+    def _take_before(pieces: List[str], limit: int) -> List[str]:
+        """取开头总长度不超过 limit 个字符的若干片段"""
+        total = 0
+        for count, piece in enumerate(pieces):
+            total += len(piece)
+            if total > limit:
+                return pieces[:count]
+        return pieces
+
+    def _find_lines(self, text: str, start: int, end: int, keep_tail: bool) -> List[str]:
+        """
+        切出 text[start:end] 中的行
+        keep_tail=False 时不返回延伸到末尾的最后一行（后续文本可能补全它或延长行尾空白）
+        """
+        lines = [line for line in _LINE_RE.findall(text, start, end) if line]
+        if lines and not keep_tail:
+            lines.pop()
+        return lines
+
+    def _find_sentences(self, text: str, start: int, end: int, keep_tail: bool) -> List[str]:
+        """
+        切出 text[start:end] 中的句子
+        keep_tail=False 时不返回延伸到末尾的最后一句（后续文本可能补全它或延长句末标点）
+        """
+        sentences = [sentence for sentence in _SENTENCE_RE.findall(text, start, end) if sentence]
+        if sentences and not keep_tail:
+            sentences.pop()
+        return sentences
+
+    def _split_blocks(self, blocks: List[str]) -> List[str]:
+        """完整的行 / 段落：放得下的原样保留，超长的按句切分"""
+        if max(map(self.length_function, blocks), default=0) <= self.chunk_size:
+            return blocks
+        units = []
+        for block in blocks:
+            if self.length_function(block) <= self.chunk_size:
+                units.append(block)
+            else:
+                units.extend(self._split_units(self._find_sentences(block, 0, len(block), keep_tail=True)))
+        return units
+
+    def _split_units(self, sentences: List[str], first_is_tail: bool = False) -> List[str]:
+        """
+        只对超长句继续切分，其余原样保留
+        first_is_tail=True 时第一句是已切分过的超长句的后半部分，一律按分句切
+        """
+        units = []
+        if first_is_tail and sentences:
+            units.extend(self._split_clauses(sentences[0]))
+            sentences = sentences[1:]
+        if max(map(self.length_function, sentences), default=0) <= self.chunk_size:
+            return units + sentences
+        for sentence in sentences:
+            units.extend(self._split_sentence(sentence))
+        return units
+
+    def _split_sentence(self, sentence: str) -> List[str]:
+        """超过 chunk_size 的句子按分句符切分，仍然过长则按字符硬切"""
+        if not sentence:
+            return []
+        if self.length_function(sentence) <= self.chunk_size:
+            return [sentence]
+        return self._split_clauses(sentence)
+
+    def _split_clauses(self, sentence: str) -> List[str]:
+        """按分句符切分，过长的分句按字符硬切"""
+        clauses = [clause for clause in _CLAUSE_RE.findall(sentence) if clause]
+
+        pieces = []
+        for clause in clauses:
+            if self.length_function(clause) <= self.chunk_size:
+                pieces.append(clause)
+            else:
+                pieces.extend(self._hard_split(clause))
+        return pieces
+
+    def _hard_split(self, text: str) -> List[str]:
+        """按长度函数硬切（长度函数为 len 时即按字符数）"""
+        if self.length_function is len:
+            return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+        pieces = []
+        start = 0
+        while start < len(text):
+            # 二分查找不超过 chunk_size 的最长前缀
+            lo, hi = start + 1, len(text)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self.length_function(text[start:mid]) <= self.chunk_size:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            pieces.append(text[start:lo])
+            start = lo
+        return pieces
+
+
+class _ChunkMerger:
+    """
+    把片段合并成不超过 chunk_size 的块，并保留 chunk_overlap 的重叠
+
+    结果等价于逐个加入片段：加入后超长则先输出当前块，再从头部丢弃片段，
+    直到剩余部分不超过重叠长度且能放下新片段。
+    长度函数为 len 时用前缀和 + 二分一次处理一批片段，避免逐片段的 Python 开销；
+    其他长度函数（如 token_length）对拼接不可加，候选块拼接后重新计算长度。
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, length_function: Callable[[str], int]):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self.pieces: List[str] = []
+
+    def push_all(self, pieces: List[str]) -> Iterator[str]:
+        if not pieces:
+            return
+
+        items = self.pieces + pieces
+        if self.length_function is len:
+            prefix = [0]
+            prefix.extend(accumulate(map(len, items)))
+            measure = lambda start, end: prefix[end] - prefix[start]
+        else:
+            measure = lambda start, end: self.length_function("".join(items[start:end]))
+        count = len(items)
+
+        start = 0
+        while True:
+            end = self._fit(measure, start, count)
+            if end >= count:
+                break  # 后续片段可能还能放进当前块
+
+            chunk = "".join(items[start:end]).strip()
+            if chunk:
+                yield chunk
+            start = self._keep_from(measure, start, end)
+
+        self.pieces = items[start:]
+
+    def _fit(self, measure, start: int, count: int) -> int:
+        """从 start 开始能放下的最多片段的结束下标（单个超长片段独占一块）"""
+        lo = start + 1
+        if lo >= count or measure(start, lo) > self.chunk_size:
+            return lo
+        # 倍增找到放不下的上界，再二分；拼接的文本始终在一两块的长度以内
+        step = 1
+        while lo + step <= count and measure(start, lo + step) <= self.chunk_size:
+            lo += step
+            step *= 2
+        hi = min(lo + step, count + 1)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if measure(start, mid) <= self.chunk_size:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def _keep_from(self, measure, start: int, end: int) -> int:
+        """保留的重叠部分的起点：不超过 chunk_overlap，且加上下一个片段不超过 chunk_size"""
+        lo, hi = start + 1, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if measure(mid, end) <= self.chunk_overlap and measure(mid, end + 1) <= self.chunk_size:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def flush(self) -> Iterator[str]:
+        chunk = "".join(self.pieces).strip()
+        self.pieces = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Tracing
+生成链路的分阶段耗时追踪
+
+- trace_span(name) / @traced(name) 包住生成器各阶段与每次 DeepSeek 调用
+- 无论是否安装 OpenTelemetry，都在进程内按 span 名称保留最近的耗时样本，
+  /api/ai/stats/performance 据此给出各阶段 p50 / p95 / p99
+- 安装了 opentelemetry-sdk 且 AI_TRACE_EXPORTER=console / file 时同时导出 span：
+  console 输出到标准输出，file 以 JSON Lines 追加写入 AI_TRACE_FILE
+- span 的父子关系沿 contextvars 传递（阶段线程池、异步运行时都会复制上下文）
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+from .request_hedger import percentile
+from .constants import TRACE_LATENCY_WINDOW
+
+# OpenTelemetry 是可选依赖
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+
+class SpanStats:
+    """按 span 名称统计最近的耗时样本与错误数"""
+
+    def __init__(self, window: int = TRACE_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            if error:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._errors.clear()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            spans = {}
+            for name, samples in sorted(self._samples.items()):
+                values = sorted(samples)
+                spans[name] = {
+                    'count': self._counts[name],
+                    'errors': self._errors.get(name, 0),
+                    'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                    'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                    'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+                }
+            return spans
+
+
+_stats = SpanStats()
+_tracer = None
+_tracer_lock = threading.Lock()
+_tracer_initialized = False
+
+
+def get_span_stats() -> SpanStats:
+    return _stats
+
+
+def _get_tracer():
+    """按 AI_TRACE_EXPORTER 初始化 OpenTelemetry（只执行一次）；未启用或未安装时返回 None"""
+    global _tracer, _tracer_initialized
+    if _tracer_initialized:
+        return _tracer
+    with _tracer_lock:
+        if _tracer_initialized:
+            return _tracer
+        from .config import Config
+        exporter_name = Config.get_trace_exporter()
+        if exporter_name != 'none':
+            if not OTEL_AVAILABLE:
+                print("[WARN] opentelemetry-sdk not installed, span export disabled")
+            else:
+                if exporter_name == 'file':
+                    out = open(Config.get_trace_file(), 'a', encoding='utf-8')
+                    exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+                else:
+                    exporter = ConsoleSpanExporter()
+                # 使用独立的 Provider，不影响宿主进程的全局 OpenTelemetry 配置
+                provider = TracerProvider(resource=Resource.create({"service.name": "ai-expert"}))
+                provider.add_span_processor(BatchSpanProcessor(exporter))
+                _tracer = provider.get_tracer("ai_expert")
+                print(f"[Tracing] Exporting spans to {exporter_name}")
+        _tracer_initialized = True
+    return _tracer
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """记录一个 span：耗时计入进程内统计；启用导出时同时生成 OpenTelemetry span"""
+    tracer = _get_tracer()
+    start = time.perf_counter()
+    error = False
+    try:
+        if tracer is None:
+            yield None
+        else:
+            with tracer.start_as_current_span(name, attributes=attributes) as span:
+                yield span
+    except GeneratorExit:
+        # 流式调用方提前关闭，不计为错误
+        raise
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _stats.record(name, time.perf_counter() - start, error)
+
+
+def traced(name: str):
+    """装饰器版 trace_span，支持普通函数、生成器、协程与异步生成器（生成器按完整迭代计时）"""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                with trace_span(name):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with trace_span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                with trace_span(name):
+                    yield from func(*args, **kwargs)
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -4,12 +4,24 @@ AI Expert API
 AI 专家模块的 Flask API 路由
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from ai_expert.database import AIExpertDatabase
 from ai_expert.prompt_builder import PromptBuilder
 from ai_expert.reply_generator import ReplyGenerator
-from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator
-from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.generator_service import GeneratorService
+from ai_expert.deepseek_adapter import DeepSeekAdapter, get_deepseek_adapter
+from ai_expert.http_client import get_http_client
+from ai_expert.async_runtime import get_async_runtime
+from ai_expert.llm_cache import get_llm_cache
+from ai_expert.compiled_prompt_cache import get_compiled_prompt_cache
+from ai_expert.reply_cache import get_reply_cache
+from ai_expert.keyword_extractor import get_keyword_extractor
+from ai_expert.llm_governor import get_llm_governor, llm_lane
+from ai_expert.circuit_breaker import get_circuit_breaker
+from ai_expert.request_hedger import get_request_hedger
+from ai_expert.tracing import get_span_stats
+from ai_expert.pregeneration import get_pregeneration_registry
+from ai_expert.deadline import deadline_scope, request_deadline
 from ai_expert.template_loader import TemplateLoader
 from ai_expert.knowledge_base_manager import KnowledgeBaseManager
 from ai_expert.message_queue_manager import MessageQueueManager
@@ -18,7 +30,8 @@ from ai_expert.analytics_manager import AnalyticsManager
 from ai_expert.logger import api_logger as logger
 from ai_expert.constants import (
     RATE_LIMIT_AI_GENERATE, RATE_LIMIT_WINDOW,
-    MAX_MESSAGES_PER_SESSION
+    MAX_MESSAGES_PER_SESSION, LLM_LANE_BACKGROUND,
+    DEADLINE_GENERATION_RESERVE
 )
 import json
 import os
@@ -45,14 +58,16 @@ queue_manager = MessageQueueManager(db)
 # 初始化数据分析引擎
 analytics_manager = AnalyticsManager(db)
 
+# 应用级生成器服务（按 API Key 复用生成器，各请求无需重新构建）
+generator_service = GeneratorService(db, kb_manager)
+
 # 全局后台处理器实例
 bg_processor = None
 
 # API Key 管理（优先环境变量，兼容旧配置文件）
 def get_api_key() -> str:
-    """获取 DeepSeek API Key - 使用统一配置管理"""
-    from ai_expert.config import Config
-    return Config.get_deepseek_api_key()
+    """获取 DeepSeek API Key - 使用统一配置管理（首次读取后缓存，配置更新时失效）"""
+    return generator_service.get_api_key()
 
 def start_background_worker():
     """初始化并启动后台预生成服务"""
@@ -63,10 +78,14 @@ def start_background_worker():
         logger.warning("Please set DEEPSEEK_API_KEY environment variable or configure in .env file")
         return
 
-    from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator
-    generator = EnhancedReplyGenerator(api_key, db, kb_manager=kb_manager)
+    generator = generator_service.get(api_key)
+
+    # 预热到 DeepSeek 的连接，首个请求免去 TCP / TLS 握手
+    from ai_expert.config import Config
+    if Config.warm_up_deepseek():
+        generator.deepseek.warm_up()
 
-    bg_processor = BackgroundProcessor(db, queue_manager, generator)
+    bg_processor = BackgroundProcessor(db, queue_manager, generator, generator_service=generator_service)
     bg_processor.start()
     logger.info("Background worker pipeline initialized and running")
 
@@ -267,6 +286,8 @@ def delete_prompt(prompt_id):
     """删除配置"""
     try:
         db.delete_prompt(prompt_id)
+        # 同步删除该 AI 专家绑定的文档（整块丢弃向量分区）
+        kb_manager.delete_prompt_documents(prompt_id)
         
         return jsonify({
             'success': True
@@ -283,15 +304,10 @@ def delete_prompt(prompt_id):
 from ai_expert.rate_limiter import rate_limit
 from ai_expert.error_handler import handle_errors, ValidationError, APIKeyError, ExternalAPIError
 
-@ai_expert_bp.route('/generate', methods=['POST'])
-@rate_limit(max_requests=20, window_seconds=60)  # 每分钟最多 20 次 AI 生成
-@handle_errors  # 统一错误处理
-def generate_reply():
-    """生成 AI 回复建议"""
-    data = request.json or {}
+def _resolve_generation_request(data: dict):
+    """校验生成请求参数，确定 AI 专家配置与 Adapter"""
     session_id = data.get('session_id')
     customer_message = data.get('customer_message')
-    conversation_history = data.get('conversation_history', [])
     prompt_id = data.get('prompt_id')
 
     # 参数验证
@@ -318,11 +334,74 @@ def generate_reply():
     if not api_key:
         raise APIKeyError('DeepSeek API Key 未配置')
 
-    # 初始化 Adapter
-    deepseek_adapter = DeepSeekAdapter(api_key)
+    # 复用共享的 Adapter（共享连接池）
+    deepseek_adapter = get_deepseek_adapter(api_key)
+    return api_key, active_prompt, deepseek_adapter
+
+
+def _match_preset_answer(active_prompt: dict, customer_message: str, deepseek_adapter, deadline):
+    """匹配预设问答；语义匹配在为生成预留时间后的子预算内进行，预算不足时只做文本匹配"""
+    with deadline_scope(deadline.shrink(DEADLINE_GENERATION_RESERVE) if deadline else None):
+        return db.match_preset_answer(active_prompt['id'], customer_message, deepseek_adapter=deepseek_adapter)
+
+
+def _claim_queued_task(session_id: str, customer_message: str):
+    """队列中尚未处理的同一条消息由本次请求领取并回填结果，后台不再重复生成"""
+    task = queue_manager.get_pending_task(session_id, customer_message)
+    if task and queue_manager.claim_task(task['id']):
+        return task['id']
+    return None
+
+
+def _suggestions_payload(result: dict) -> dict:
+    """生成结果的响应体（交互式生成与复用的后台预生成结果共用）"""
+    return {
+        'success': result['success'],
+        'suggestions': {
+            'aggressive': result['aggressive'],
+            'conservative': result['conservative'],
+            'professional': result['professional']
+        },
+        'suggestion_id': result.get('suggestion_id'),
+        'metadata': result.get('metadata', {}),
+        'tokens_used': result.get('tokens_used', 0),
+        'prompt_tokens': result.get('prompt_tokens', 0),
+        'completion_tokens': result.get('completion_tokens', 0),
+        'prompt_cache_hit_tokens': result.get('prompt_cache_hit_tokens', 0),
+        'generation_mode': result.get('generation_mode'),
+        'llm_calls': result.get('llm_calls', 0),
+        'fallback': result.get('fallback'),
+        'cost': result.get('cost', 0),
+        'response_time': result.get('response_time', 0)
+    }
+
+
+def _build_system_prompt_config(active_prompt: dict) -> dict:
+    """获取生成配置（解析后的 JSON 字段与预渲染的静态章节按专家版本缓存）"""
+    return get_compiled_prompt_cache(db).get_config(active_prompt)
+
+
+@ai_expert_bp.route('/generate', methods=['POST'])
+@rate_limit(max_requests=20, window_seconds=60)  # 每分钟最多 20 次 AI 生成
+@handle_errors  # 统一错误处理
+def generate_reply():
+    """生成 AI 回复建议"""
+    data = request.json or {}
+    session_id = data.get('session_id')
+    customer_message = data.get('customer_message')
+    conversation_history = data.get('conversation_history', [])
+
+    api_key, active_prompt, deepseek_adapter = _resolve_generation_request(data)
+    # 端到端时间预算：预设匹配、检索与生成共用
+    deadline = request_deadline('generate')
+
+    # 后台已为这条消息预生成（或正在生成）时直接复用，不再重复调用 DeepSeek
+    pregenerated = get_pregeneration_registry().take(session_id, active_prompt['id'], customer_message, deadline)
+    if pregenerated:
+        return jsonify({**_suggestions_payload(pregenerated), 'pregenerated': True})
 
     # 先尝试匹配预设问答 (传入 deepseek_adapter 以支持语义匹配)
-    preset_answer = db.match_preset_answer(active_prompt['id'], customer_message, deepseek_adapter=deepseek_adapter)
+    preset_answer = _match_preset_answer(active_prompt, customer_message, deepseek_adapter, deadline)
 
     if preset_answer:
         # 如果匹配到预设答案，直接返回（三个版本都用预设答案）
@@ -340,57 +419,93 @@ def generate_reply():
         })
 
     # 没有匹配到预设答案，使用增强版 AI 生成
-    generator = EnhancedReplyGenerator(api_key, db, kb_manager=kb_manager)
+    generator = generator_service.get(api_key)
+    task_id = _claim_queued_task(session_id, customer_message)
 
-    # 解析配置（将 JSON 字符串转换为字典/列表）
-    knowledge_base_raw = active_prompt.get('knowledge_base', '[]')
-    forbidden_words_raw = active_prompt.get('forbidden_words', '[]')
-
-    # 安全解析 JSON 字符串
+    # 生成三个版本（使用增强版生成器）
+    result = {'success': False, 'error': 'AI 生成失败'}
     try:
-        knowledge_base = json.loads(knowledge_base_raw) if isinstance(knowledge_base_raw, str) else knowledge_base_raw
-    except:
-        knowledge_base = []
+        result = generator.generate_three_versions(
+            session_id=session_id,
+            customer_message=customer_message,
+            system_prompt_config=_build_system_prompt_config(active_prompt),
+            prompt_id=active_prompt['id'],
+            conversation_history=conversation_history,
+            deadline=deadline
+        )
+    finally:
+        if task_id is not None:
+            # 回填领取的队列任务，看板与后台处理器看到的是同一份结果
+            if result.get('success'):
+                queue_manager.update_status(task_id, 'COMPLETED', ai_reply_options={
+                    v_type: result[v_type] for v_type in ('aggressive', 'conservative', 'professional')
+                })
+            else:
+                queue_manager.update_status(task_id, 'FAILED', error_msg=result.get('error'))
 
-    try:
-        forbidden_words = json.loads(forbidden_words_raw) if isinstance(forbidden_words_raw, str) else forbidden_words_raw
-    except:
-        forbidden_words = []
-
-    system_prompt_config = {
-        'role_definition': active_prompt.get('role_definition', ''),
-        'business_logic': active_prompt.get('business_logic', ''),
-        'tone_style': active_prompt.get('tone_style', 'professional'),
-        'reply_length': active_prompt.get('reply_length', 'medium'),
-        'emoji_usage': active_prompt.get('emoji_usage', 'occasional'),
-        'knowledge_base': knowledge_base,
-        'forbidden_words': forbidden_words
-    }
+    if not result.get('success'):
+        raise ExternalAPIError(result.get('error', 'AI 生成失败'))
 
-    # 生成三个版本（使用增强版生成器）
-    result = generator.generate_three_versions(
-        session_id=session_id,
-        customer_message=customer_message,
-        system_prompt_config=system_prompt_config,
-        prompt_id=active_prompt['id'],
-        conversation_history=conversation_history
+    return jsonify(_suggestions_payload(result))
+
+
+def _sse_event(payload: dict) -> str:
+    # 与 /api/messages/stream 一致：只用 data 字段，事件类型放在 type 中
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@ai_expert_bp.route('/generate/stream', methods=['POST'])
+@rate_limit(max_requests=20, window_seconds=60)
+@handle_errors
+def generate_reply_stream():
+    """
+    流式生成 AI 回复建议 (SSE)
+
+    三个版本的 token 流并发进行，以带 version 标记的事件交替推送：
+    meta -> delta* / version_done / version_error -> done（或 error）
+    """
+    data = request.json or {}
+    session_id = data.get('session_id')
+    customer_message = data.get('customer_message')
+    conversation_history = data.get('conversation_history', [])
+
+    api_key, active_prompt, deepseek_adapter = _resolve_generation_request(data)
+    deadline = request_deadline('generate_stream')
+    pregenerated = get_pregeneration_registry().take(session_id, active_prompt['id'], customer_message, deadline)
+    preset_answer = None if pregenerated else _match_preset_answer(
+        active_prompt, customer_message, deepseek_adapter, deadline
     )
 
-    if not result.get('success'):
-        raise ExternalAPIError(result.get('error', 'AI 生成失败'))
+    if pregenerated:
+        def pregenerated_stream():
+            yield _sse_event({'type': 'done', **_suggestions_payload(pregenerated), 'pregenerated': True})
+        event_source = pregenerated_stream()
+    elif preset_answer:
+        def preset_stream():
+            yield _sse_event({
+                'type': 'done',
+                'is_preset': True,
+                'suggestions': {v_type: preset_answer for v_type in ('aggressive', 'conservative', 'professional')},
+                'tokens_used': 0,
+                'cost': 0,
+                'response_time': 0
+            })
+        event_source = preset_stream()
+    else:
+        generator = generator_service.get(api_key)
+        events = generator.generate_three_versions_stream(
+            session_id=session_id,
+            customer_message=customer_message,
+            system_prompt_config=_build_system_prompt_config(active_prompt),
+            prompt_id=active_prompt['id'],
+            conversation_history=conversation_history,
+            deadline=deadline
+        )
+        event_source = (_sse_event(event) for event in events)
 
-    return jsonify({
-        'success': result['success'],
-        'suggestions': {
-            'aggressive': result['aggressive'],
-            'conservative': result['conservative'],
-            'professional': result['professional']
-        },
-        'suggestion_id': result.get('suggestion_id'),
-        'metadata': result.get('metadata', {}),
-        'tokens_used': result.get('tokens_used', 0),
-        'cost': result.get('cost', 0),
-        'response_time': result.get('response_time', 0)
+    return Response(event_source, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 # ========== 版本选择记录 API（改进点5：反馈学习）==========
@@ -414,7 +529,7 @@ def record_selection():
         # 获取 API Key 并创建生成器
         api_key = get_api_key()
         if api_key:
-            generator = EnhancedReplyGenerator(api_key, db, kb_manager=kb_manager)
+            generator = generator_service.get(api_key)
             generator.record_version_selection(
                 session_id=session_id,
                 customer_message=customer_message,
@@ -450,7 +565,7 @@ def record_modification():
         # 获取 API Key 并创建生成器
         api_key = get_api_key()
         if api_key:
-            generator = EnhancedReplyGenerator(api_key, db, kb_manager=kb_manager)
+            generator = generator_service.get(api_key)
             generator.record_reply_modification(
                 session_id=session_id,
                 original_reply=original_reply,
@@ -478,7 +593,7 @@ def get_learning_insights():
                 'error': 'API Key not configured'
             }), 400
 
-        generator = EnhancedReplyGenerator(api_key, db)
+        generator = generator_service.get(api_key)
         insights = generator.get_learning_insights()
 
         return jsonify({
@@ -632,12 +747,30 @@ def get_performance_stats():
     """获取性能统计"""
     try:
         stats = db.get_usage_stats('all')
+        llm_cache = get_llm_cache()
+        llm_governor = get_llm_governor()
+        circuit_breaker = get_circuit_breaker()
 
         return jsonify({
             'success': True,
             'avg_response_time': stats['avg_response_time'],
             'success_rate': stats['success_rate'],
-            'total_requests': stats['requests']
+            'total_requests': stats['requests'],
+            'prompt_cache_hit_rate': stats['cache_hit_rate'],
+            'http_pool': get_http_client().get_metrics(),
+            'async_llm': get_async_runtime().get_metrics(),
+            'llm_governor': llm_governor.get_metrics() if llm_governor else None,
+            'circuit_breaker': circuit_breaker.get_metrics() if circuit_breaker else None,
+            'llm_latency': get_request_hedger().get_metrics(),
+            'generation_modes': db.get_generation_mode_stats(),
+            'llm_cache': llm_cache.get_metrics() if llm_cache else None,
+            'compiled_prompts': get_compiled_prompt_cache(db).get_metrics(),
+            'reply_cache': get_reply_cache(db).get_metrics(),
+            'keyword_lexicon': get_keyword_extractor(db).get_metrics(),
+            'generator_service': generator_service.get_metrics(),
+            'stream_latency': db.get_stream_latency_stats(),
+            'stage_latency': get_span_stats().get_metrics(),
+            'pregeneration': get_pregeneration_registry().get_metrics()
         })
 
     except Exception as e:
@@ -822,6 +955,9 @@ def update_config():
         with open(config_path, 'w', encoding='utf-8') as f:
             json.dump(config, f, ensure_ascii=False, indent=2)
 
+        # API Key 等配置可能已变化，下一个请求重新构建生成器
+        generator_service.invalidate()
+
         return jsonify({
             'success': True,
             'config': config
@@ -1107,6 +1243,67 @@ def delete_document(doc_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@ai_expert_bp.route('/documents/worker-status', methods=['GET'])
+def get_embedding_worker_status():
+    """获取向量化 / OCR 工作进程的健康状态"""
+    try:
+        return jsonify({'success': True, 'worker': kb_manager.get_worker_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@ai_expert_bp.route('/documents/reembed', methods=['POST'])
+def start_reembed():
+    """使用新的向量模型后台重建知识库索引，完成后原子切换（期间检索不受影响）"""
+    try:
+        data = request.json or {}
+        model_name = (data.get('model_name') or '').strip()
+        if not model_name:
+            return jsonify({'success': False, 'error': 'model_name is required'}), 400
+
+        job = kb_manager.start_reembed(
+            model_name,
+            batch_size=data.get('batch_size'),
+            pause_seconds=data.get('pause_seconds')
+        )
+        return jsonify({'success': True, 'job': job})
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@ai_expert_bp.route('/documents/reembed', methods=['GET'])
+def get_reembed_status():
+    """获取当前生效的向量模型与重建进度"""
+    try:
+        return jsonify({'success': True, **kb_manager.get_reembed_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@ai_expert_bp.route('/documents/reembed/cancel', methods=['POST'])
+def cancel_reembed():
+    """取消正在运行的重建任务（旧索引继续服务）"""
+    try:
+        return jsonify({'success': True, 'cancelled': kb_manager.cancel_reembed()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@ai_expert_bp.route('/documents/ocr/preload', methods=['POST'])
+def preload_ocr():
+    """预热 OCR 识别器（后台加载，首次上传图片不再卡顿）"""
+    try:
+        kb_manager.preload_ocr()
+        return jsonify({'success': True, 'ocr': kb_manager.get_ocr_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@ai_expert_bp.route('/documents/ocr/status', methods=['GET'])
+def get_ocr_status():
+    """获取 OCR 服务状态与缓存命中统计"""
+    try:
+        return jsonify({'success': True, 'ocr': kb_manager.get_ocr_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ========== Phase 5.5: 消息历史与任务持久化 API ==========
 
 @ai_expert_bp.route('/tasks/<int:task_id>/status', methods=['POST'])
@@ -1258,6 +1455,8 @@ def bulk_generate_replies():
             prompt_id = active_prompt['id']
         else:
             active_prompt = db.get_prompt_by_id(prompt_id)
+            if not active_prompt:
+                return jsonify({'success': False, 'error': f'Prompt {prompt_id} not found'}), 400
 
         # 获取待处理任务
         if task_ids:
@@ -1269,37 +1468,34 @@ def bulk_generate_replies():
             return jsonify({'success': True, 'count': 0, 'message': 'No pending tasks'})
 
         api_key = get_api_key()
-        generator = EnhancedReplyGenerator(api_key, db, kb_manager=kb_manager)
+        generator = generator_service.get(api_key)
         
+        # 构造生成所需的配置（所有任务共用）
+        system_prompt_config = _build_system_prompt_config(active_prompt)
+
         # 批量处理逻辑
         processed_count = 0
+        registry = get_pregeneration_registry()
         for task in pending_tasks:
+            # 领取任务（置为 PROCESSING）防止重复执行
+            if not queue_manager.claim_task(task['id']):
+                continue
+            pending = registry.begin(task['session_id'], prompt_id, task['raw_message'])
+            result = None
             try:
-                # 更新状态为 PROCESSING 防止重复执行
-                queue_manager.update_status(task['id'], 'PROCESSING')
-                
-                # 构造生成所需的配置
-                system_prompt_config = {
-                    'role_definition': active_prompt.get('role_definition', ''),
-                    'business_logic': active_prompt.get('business_logic', ''),
-                    'tone_style': active_prompt.get('tone_style', 'professional'),
-                    'reply_length': active_prompt.get('reply_length', 'medium'),
-                    'emoji_usage': active_prompt.get('emoji_usage', 'occasional'),
-                    'knowledge_base': json.loads(active_prompt.get('knowledge_base', '[]')),
-                    'forbidden_words': json.loads(active_prompt.get('forbidden_words', '[]'))
-                }
-                
                 # 获取简单的历史记录（此处可扩展）
                 history = db.get_recent_messages(task['session_id'], limit=5)
                 
-                # 执行生成
-                result = generator.generate_three_versions(
-                    session_id=task['session_id'],
-                    customer_message=task['raw_message'],
-                    system_prompt_config=system_prompt_config,
-                    prompt_id=prompt_id,
-                    conversation_history=history
-                )
+                # 执行生成（批量任务走后台通道，不挤占交互式生成）
+                with llm_lane(LLM_LANE_BACKGROUND):
+                    result = generator.generate_three_versions(
+                        session_id=task['session_id'],
+                        customer_message=task['raw_message'],
+                        system_prompt_config=system_prompt_config,
+                        prompt_id=prompt_id,
+                        conversation_history=history,
+                        deadline=request_deadline('bulk_generate')
+                    )
                 
                 if result['success']:
                     # 更新状态为 COMPLETED 并存储建议
@@ -1319,6 +1515,8 @@ def bulk_generate_replies():
             except Exception as task_err:
                 logger.error(f"Bulk Gen Error - Task {task['id']}: {task_err}")
                 queue_manager.update_status(task['id'], 'FAILED', error_msg=str(task_err))
+            finally:
+                registry.complete(pending, result)
 
         return jsonify({
             'success': True,
@@ -1349,10 +1547,13 @@ def get_analytics_dashboard():
             api_key = get_api_key()
             if api_key:
                 def generator_fn(prompt):
-                    from ai_expert.deepseek_adapter import DeepSeekAdapter
-                    # 可以在这里设置更短的超时，或者使用线程池
-                    adapter = DeepSeekAdapter(api_key)
-                    return adapter.chat(prompt, system_prompt="你是一位商业分析助手。")
+                    result = get_deepseek_adapter(api_key).chat([
+                        {"role": "system", "content": "你是一位商业分析助手。"},
+                        {"role": "user", "content": prompt}
+                    ])
+                    if not result.get('success'):
+                        raise Exception(result.get('error'))
+                    return result['content']
 
                 # 设置获取洞察的最长等待时间（例如 8 秒）
                 # 这里简单处理：如果失败则降级
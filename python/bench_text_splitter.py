@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+文本分块器基准测试
+对比内置 ChineseTextSplitter 与 LangChain RecursiveCharacterTextSplitter 的速度与分块结果
+
+用法: python bench_text_splitter.py [--chars 200000] [--rounds 5] [--layout paragraphs|lines|flat] [--file 文档.txt]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_expert.text_splitter import ChineseTextSplitter
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
+SENTENCES = [
+    "我们的产品支持七天无理由退货",
+    "收到商品后请检查包装是否完好",
+    "会员用户享受九折优惠，积分可以抵扣现金",
+    "配送范围覆盖全国，偏远地区需要额外支付运费",
+    "如果您对产品有任何疑问，欢迎随时咨询在线客服",
+    "本店所有商品均为正品，支持专柜验货",
+    "The warranty covers manufacturing defects for 12 months",
+]
+ENDINGS = ["。", "！", "？", "。\n", "。\n\n"]
+
+
+def make_corpus(chars: int, layout: str = "paragraphs", seed: int = 42) -> str:
+    """
+    生成合成语料
+    layout: paragraphs 有空行分段；lines 只有单换行（类似 PDF 提取结果）；flat 没有换行（类似 OCR 拼接结果）
+    """
+    rnd = random.Random(seed)
+    parts, total = [], 0
+    while total < chars:
+        part = rnd.choice(SENTENCES) + rnd.choice(ENDINGS)
+        parts.append(part)
+        total += len(part)
+    text = "".join(parts)
+    if layout == "lines":
+        text = text.replace("\n\n", "\n")
+    elif layout == "flat":
+        text = text.replace("\n", "")
+    return text
+
+
+def bench(name, fn, rounds):
+    best = float('inf')
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<28} {best * 1000:9.2f} ms   chunks={len(result):<5} avg_len={sum(map(len, result)) / max(len(result), 1):.1f}")
+    return result
+
+
+def coverage(reference, candidate) -> float:
+    """参考分块中的句子有多少出现在候选分块中（衡量内容是否一致）"""
+    candidate_text = "\n".join(candidate)
+    sentences = [s for c in reference for s in c.replace("！", "。").replace("？", "。").split("。") if s.strip()]
+    if not sentences:
+        return 1.0
+    return sum(1 for s in sentences if s.strip() in candidate_text) / len(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text splitter benchmark")
+    parser.add_argument('--chars', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--layout', choices=['paragraphs', 'lines', 'flat'], default='paragraphs')
+    parser.add_argument('--file', help="使用指定的 UTF-8 文本文件代替合成语料")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+    else:
+        text = make_corpus(args.chars, args.layout)
+    print(f"Corpus: {len(text)} chars, chunk_size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP}\n")
+
+    native = ChineseTextSplitter(CHUNK_SIZE, CHUNK_OVERLAP)
+    native_chunks = bench("ChineseTextSplitter", lambda: native.split_text(text), args.rounds)
+
+    pages = [text[i:i + 3000] for i in range(0, len(text), 3000)]
+    bench("ChineseTextSplitter.stream", lambda: list(native.split_stream(pages)), args.rounds)
+
+    import_start = time.perf_counter()
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        try:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+        except ImportError:
+            print("\nLangChain 未安装，跳过对比")
+            return
+    print(f"{'LangChain import':<28} {(time.perf_counter() - import_start) * 1000:9.2f} ms")
+
+    def run_langchain():
+        # 与旧版 _chunk_text 一致：每次调用都构建新的 splitter
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+        )
+        return splitter.split_text(text)
+
+    langchain_chunks = bench("RecursiveCharacterTextSplitter", run_langchain, args.rounds)
+
+    print(f"\nChunk count: native={len(native_chunks)} langchain={len(langchain_chunks)}")
+    print(f"Sentence coverage (langchain -> native): {coverage(langchain_chunks, native_chunks):.1%}")
+    print(f"Sentence coverage (native -> langchain): {coverage(native_chunks, langchain_chunks):.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+检索关键词提取对比
+对比本地提取器 (LocalKeywordExtractor) 与 DeepSeek 关键词调用的耗时与结果
+
+- 耗时：两种方式的 p50 / p95 / 最大值
+- 关键词覆盖率：LLM 给出的关键词中，有多少被本地结果覆盖（相同或互相包含）
+- 下游一致性：用两组关键词标记同一会话的高价值历史消息，比较结果的 Jaccard 相似度
+  （只有从数据库读取消息时才有会话历史）
+
+用法: python compare_keyword_extractors.py [--db ai_expert.db] [--limit 200] [--file 消息.txt] [--local-only]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_expert.config import Config
+from ai_expert.database import AIExpertDatabase
+from ai_expert.keyword_extractor import LocalKeywordExtractor
+from ai_expert.request_hedger import percentile
+from ai_expert.smart_context_selector import SmartContextSelector
+
+
+def load_samples(db: AIExpertDatabase, limit: int, file_path: str = None):
+    """[(消息, 会话历史)]；从文件读取时每行一条消息，没有历史"""
+    if file_path:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            return [(line.strip(), []) for line in f if line.strip()][:limit]
+
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT session_id, message, timestamp FROM conversation_history
+        WHERE is_customer = 1
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, (limit,))
+    rows = cursor.fetchall()
+    samples = []
+    for row in rows:
+        cursor.execute("""
+            SELECT message FROM conversation_history
+            WHERE session_id = ? AND timestamp < ?
+            ORDER BY timestamp DESC
+            LIMIT 20
+        """, (row['session_id'], row['timestamp']))
+        history = [{'content': r['message']} for r in reversed(cursor.fetchall())]
+        samples.append((row['message'], history))
+    conn.close()
+    return samples
+
+
+def timed(fn, text):
+    start = time.perf_counter()
+    result = fn(text)
+    return result, time.perf_counter() - start
+
+
+def covered(reference, candidate) -> float:
+    """reference 中被 candidate 覆盖（相同或互相包含）的比例"""
+    if not reference:
+        return 1.0
+    return sum(1 for r in reference if any(r in c or c in r for c in candidate)) / len(reference)
+
+
+def jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def report(name, seconds):
+    values = sorted(seconds)
+    print(f"{name:<8} p50={percentile(values, 0.50) * 1000:9.3f} ms   "
+          f"p95={percentile(values, 0.95) * 1000:9.3f} ms   max={values[-1] * 1000:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword extractor comparison")
+    parser.add_argument('--db', default=Config.get_database_path())
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--file', help="每行一条客户消息的 UTF-8 文本文件（代替数据库中的消息）")
+    parser.add_argument('--local-only', action='store_true', help="只测本地提取器，不调用 DeepSeek")
+    parser.add_argument('--use-cache', action='store_true', help="允许 LLM 调用命中辅助调用缓存（默认关闭以测真实耗时）")
+    parser.add_argument('--show', type=int, default=10, help="打印前 N 条消息的两组关键词")
+    args = parser.parse_args()
+
+    if not args.use_cache:
+        os.environ['LLM_CACHE'] = '0'
+
+    db = AIExpertDatabase(args.db)
+    samples = load_samples(db, args.limit, args.file)
+    if not samples:
+        print("没有可用的客户消息")
+        return
+
+    local = LocalKeywordExtractor(db)
+    build_start = time.perf_counter()
+    local.refresh()
+    print(f"Lexicon build: {(time.perf_counter() - build_start) * 1000:.1f} ms, {local.get_metrics()['terms']} terms")
+    print(f"Samples: {len(samples)}\n")
+
+    adapter = None
+    if not args.local_only:
+        api_key = Config.get_deepseek_api_key()
+        if api_key:
+            from ai_expert.deepseek_adapter import DeepSeekAdapter
+            adapter = DeepSeekAdapter(api_key)
+        else:
+            print("未配置 DEEPSEEK_API_KEY，只测本地提取器\n")
+
+    selector = SmartContextSelector()
+    local_times, llm_times, coverages, agreements = [], [], [], []
+    for index, (message, history) in enumerate(samples):
+        local_keywords, seconds = timed(local.extract, message)
+        local_times.append(seconds)
+        if adapter is None:
+            if index < args.show:
+                print(f"{message[:30]:<32} local={local_keywords}")
+            continue
+
+        llm_keywords, seconds = timed(adapter.extract_search_keywords, message)
+        llm_times.append(seconds)
+        coverages.append(covered(llm_keywords, local_keywords))
+        if history:
+            agreements.append(jaccard(
+                selector._mark_high_value_messages(history, dynamic_keywords=local_keywords),
+                selector._mark_high_value_messages(history, dynamic_keywords=llm_keywords)
+            ))
+        if index < args.show:
+            print(f"{message[:30]:<32} local={local_keywords}  llm={llm_keywords}")
+
+    print()
+    report("local", local_times)
+    if llm_times:
+        report("llm", llm_times)
+        print(f"\nLLM keywords covered by local: {sum(coverages) / len(coverages):.1%}")
+        if agreements:
+            print(f"High-value message agreement (Jaccard): {sum(agreements) / len(agreements):.1%}")
+
+
+if __name__ == '__main__':
+    main()
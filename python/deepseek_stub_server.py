@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+DeepSeek 兼容的本地桩服务
+模拟 /chat/completions（流式与非流式）与 /models 接口，用于离线压测，不消耗真实 token
+
+- 可配置延迟分布：非流式为整体延迟，流式为首 token 延迟，之后按 --token-rate 逐块输出
+- 按比例注入 429（带 Retry-After）与 5xx
+- 按字符估算 usage，重复出现的 system 提示计为缓存命中 (prompt_cache_hit_tokens)
+- 按请求内容给出合适的回复：JSON 三版本、关键词列表、相似度数字或普通文本
+- GET /stats 查看累计请求数、注入错误数与 token 用量
+
+用法: python deepseek_stub_server.py [--port 8900] [--latency lognormal:0.8,0.4] [--rate-429 0.05] [--rate-5xx 0.01]
+然后设置 DEEPSEEK_BASE_URL=http://127.0.0.1:8900 启动后端
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+REPLY_TEXT = "您好，这款产品目前有活动价，现在下单还可以享受包邮和七天无理由退换，有任何问题随时联系我。"
+VERSION_KEYS = ('aggressive', 'conservative', 'professional')
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    解析延迟分布（秒）：
+    fixed:0.5 / uniform:0.2,1.5 / normal:0.8,0.2 / lognormal:0.8,0.4（中位数, sigma）
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v] if args else []
+    rnd = random.Random()
+    if kind == 'fixed':
+        return lambda: values[0] if values else 0.0
+    if kind == 'uniform':
+        low, high = values
+        return lambda: rnd.uniform(low, high)
+    if kind == 'normal':
+        mean, std = values
+        return lambda: max(0.0, rnd.gauss(mean, std))
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: rnd.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 / token，其余约 4 字符 / token
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return max(1, cjk + (len(text) - cjk) // 4)
+
+
+def fake_reply(messages: List[Dict], response_format: Dict = None) -> str:
+    """按请求内容构造一个能被调用方正常解析的回复"""
+    system_prompt = next((m['content'] for m in messages if m.get('role') == 'system'), '')
+    if response_format and response_format.get('type') == 'json_object':
+        return json.dumps({key: f"[{key}] {REPLY_TEXT}" for key in VERSION_KEYS}, ensure_ascii=False)
+    if '检索关键词' in system_prompt:
+        return '["价格", "优惠", "发货"]'
+    if '语义相似度' in system_prompt:
+        return '0.3'
+    return REPLY_TEXT
+
+
+class StubState:
+    """桩服务配置与统计（所有请求线程共享）"""
+
+    def __init__(self, latency: Callable[[], float], token_rate: float, rate_429: float,
+                 rate_5xx: float, retry_after: float, seed: int = None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.stats = {
+            'requests': 0, 'streams': 0, 'throttled': 0, 'errors': 0,
+            'prompt_tokens': 0, 'prompt_cache_hit_tokens': 0, 'completion_tokens': 0,
+        }
+
+    def draw_fault(self):
+        """按比例决定本次请求注入的错误：429 / 500 / None"""
+        with self._lock:
+            roll = self._rnd.random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_5xx:
+            return 500
+        return None
+
+    def usage(self, messages: List[Dict], completion: str) -> Dict:
+        prompt_tokens = sum(estimate_tokens(m.get('content', '')) for m in messages)
+        completion_tokens = estimate_tokens(completion)
+        # 模拟服务端前缀缓存：system 提示出现过即视为命中
+        system_prompt = messages[0].get('content', '') if messages and messages[0].get('role') == 'system' else ''
+        prefix = hashlib.sha1(system_prompt.encode('utf-8')).hexdigest() if system_prompt else None
+        with self._lock:
+            hit = prefix in self._seen_prefixes
+            if prefix:
+                self._seen_prefixes.add(prefix)
+            hit_tokens = min(estimate_tokens(system_prompt), prompt_tokens) if hit else 0
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['prompt_cache_hit_tokens'] += hit_tokens
+            self.stats['completion_tokens'] += completion_tokens
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_cache_hit_tokens': hit_tokens,
+            'prompt_cache_miss_tokens': prompt_tokens - hit_tokens,
+        }
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: StubState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'deepseek-chat', 'object': 'model'}]})
+        elif path == '/stats':
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.split('?')[0].rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'invalid json'}})
+            return
+
+        state = self.state
+        state.count('requests')
+        fault = state.draw_fault()
+        if fault == 429:
+            state.count('throttled')
+            self._send_json(429, {'error': {'message': 'Rate limit reached'}},
+                            {'Retry-After': f"{state.retry_after:g}"})
+            return
+        if fault:
+            state.count('errors')
+            self._send_json(fault, {'error': {'message': 'Service unavailable'}})
+            return
+
+        messages = request.get('messages', [])
+        content = fake_reply(messages, request.get('response_format'))
+        time.sleep(state.latency())
+        if request.get('stream'):
+            state.count('streams')
+            self._stream(request, messages, content)
+        else:
+            self._send_json(200, {
+                'id': f"stub-{time.time_ns()}",
+                'object': 'chat.completion',
+                'model': request.get('model', 'deepseek-chat'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': state.usage(messages, content),
+            })
+
+    def _stream(self, request: Dict, messages: List[Dict], content: str):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(payload):
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        # 每块约 4 个字符，按 token_rate 控制输出节奏
+        step = 4
+        interval = step / self.state.token_rate if self.state.token_rate > 0 else 0
+        try:
+            for i in range(0, len(content), step):
+                emit({'choices': [{'index': 0, 'delta': {'content': content[i:i + step]}, 'finish_reason': None}]})
+                if interval:
+                    time.sleep(interval)
+            emit({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            if (request.get('stream_options') or {}).get('include_usage'):
+                emit({'choices': [], 'usage': self.state.usage(messages, content)})
+            emit('[DONE]')
+        except (BrokenPipeError, ConnectionResetError):
+            # 调用方取消（如对冲落败）时提前断开
+            pass
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_server(host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0', token_rate: float = 0,
+                rate_429: float = 0.0, rate_5xx: float = 0.0, retry_after: float = 1.0,
+                seed: int = None) -> StubServer:
+    """创建桩服务（未启动）；port=0 时自动分配端口，通过 server.server_address 获取"""
+    state = StubState(parse_latency(latency), token_rate, rate_429, rate_5xx, retry_after, seed)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = StubServer((host, port), handler)
+    server.state = state
+    return server
+
+
+def start_in_background(**kwargs) -> StubServer:
+    """在后台线程中启动桩服务，返回 server（调用 shutdown() 停止）"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True, name='deepseek-stub').start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepSeek-compatible stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='lognormal:0.8,0.4',
+                        help="fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MEDIAN,SIGMA")
+    parser.add_argument('--token-rate', type=float, default=200, help="流式输出速度 (字符/秒)，0 表示不限")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="429 响应的 Retry-After (秒)")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.token_rate,
+                         args.rate_429, args.rate_5xx, args.retry_after, args.seed)
+    host, port = server.server_address[:2]
+    print(f"[Stub] DeepSeek stub listening on http://{host}:{port} (latency={args.latency})")
+    print(f"[Stub] export DEEPSEEK_BASE_URL=http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[Stub] Stats: {json.dumps(server.state.snapshot())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+AI 生成链路压测
+在本进程内启动 Flask 后端（AI 专家 Blueprint）与 DeepSeek 桩服务，按场景并发回放流量，
+输出各场景的吞吐与 p50 / p95 / p99 延迟。全程离线，不消耗真实 token。
+
+场景：
+- generate: POST /api/ai/generate（交互式生成）
+- bulk:     监听入队若干条后 POST /api/ai/tasks/bulk-generate 批量生成
+- ingest:   按监听器的方式入队，由后台预生成线程处理，统计入队到生成完成的时间
+
+数据库与 LLM 缓存写在临时目录，不影响本地数据。
+
+用法: python load_test.py [--duration 30] [--concurrency 8] [--scenarios generate,bulk,ingest]
+                         [--latency lognormal:0.8,0.4] [--rate-429 0.02] [--rate-5xx 0.01]
+                         [--base-url http://127.0.0.1:8900]  # 使用已启动的桩服务
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+SCENARIOS = ('generate', 'bulk', 'ingest')
+CUSTOMER_MESSAGES = [
+    "这个多少钱？",
+    "有没有优惠活动",
+    "什么时候发货，大概几天能到",
+    "质量怎么样，可以退换吗",
+    "我再考虑一下",
+    "买两件能便宜点吗",
+    "支持货到付款吗",
+    "和别家比有什么优势",
+]
+HISTORY = [
+    {"role": "user", "content": "你好，在吗"},
+    {"role": "assistant", "content": "您好，在的，请问有什么可以帮您？"},
+]
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+
+class Recorder:
+    """按场景收集成功延迟与错误数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.items = defaultdict(int)
+
+    def ok(self, scenario: str, seconds: float, items: int = 1):
+        with self._lock:
+            self.latencies[scenario].append(seconds)
+            self.items[scenario] += items
+
+    def error(self, scenario: str):
+        with self._lock:
+            self.errors[scenario] += 1
+
+
+def prepare_environment(args, workdir: str):
+    """在导入后端模块前设置环境：桩服务地址、临时数据库、关闭频率限制与模型下载"""
+    os.environ['DEEPSEEK_BASE_URL'] = args.base_url
+    os.environ['DEEPSEEK_API_KEY'] = 'stub-key'
+    os.environ['DEEPSEEK_WARMUP'] = '0'
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'ai_expert.db')
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    # AIExpertDatabase 默认使用当前目录下的 ai_expert.db
+    os.chdir(workdir)
+
+
+def start_backend(with_background: bool):
+    """启动 Flask 后端（线程模式），返回 (base_url, server, ai_expert_api 模块)"""
+    from flask import Flask
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import ai_expert_api
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    prompt_id = ai_expert_api.db.create_prompt({
+        'name': '压测专家',
+        'role_definition': '你是一名电商客服，负责解答售前问题并促成下单。',
+        'business_logic': '优先介绍当前活动价，强调包邮与七天无理由退换。',
+    })
+    ai_expert_api.db.activate_prompt(prompt_id)
+    if with_background:
+        ai_expert_api.start_background_worker()
+
+    app = Flask(__name__)
+    app.register_blueprint(ai_expert_api.ai_expert_bp)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='load-test-backend').start()
+    return f"http://127.0.0.1:{server.server_port}", server, ai_expert_api
+
+
+def run_generate(session, api_url, worker_id, recorder, stop_at):
+    n = 0
+    while time.time() < stop_at:
+        n += 1
+        payload = {
+            'session_id': f"load-gen-{worker_id}-{n}",
+            'customer_message': random.choice(CUSTOMER_MESSAGES),
+            'conversation_history': HISTORY,
+        }
+        start = time.time()
+        try:
+            resp = session.post(f"{api_url}/api/ai/generate", json=payload, timeout=120)
+            if resp.status_code == 200 and resp.json().get('success'):
+                recorder.ok('generate', time.time() - start)
+            else:
+                recorder.error('generate')
+        except Exception:
+            recorder.error('generate')
+
+
+def run_bulk(session, api_url, worker_id, recorder, stop_at, queue_manager, batch_size):
+    n = 0
+    while time.time() < stop_at:
+        n += 1
+        task_ids = [
+            queue_manager.enqueue_message(f"load-bulk-{worker_id}-{n}-{i}", '压测客户', random.choice(CUSTOMER_MESSAGES))
+            for i in range(batch_size)
+        ]
+        start = time.time()
+        try:
+            resp = session.post(f"{api_url}/api/ai/tasks/bulk-generate", json={'task_ids': task_ids}, timeout=300)
+            data = resp.json()
+            if resp.status_code == 200 and data.get('success'):
+                recorder.ok('bulk', time.time() - start, data.get('processed_count', 0))
+            else:
+                recorder.error('bulk')
+        except Exception:
+            recorder.error('bulk')
+
+
+def run_ingest(worker_id, recorder, stop_at, queue_manager, task_timeout):
+    n = 0
+    while time.time() < stop_at:
+        n += 1
+        start = time.time()
+        task_id = queue_manager.enqueue_message(f"load-ingest-{worker_id}-{n}", '压测客户', random.choice(CUSTOMER_MESSAGES))
+        status = None
+        while time.time() - start < task_timeout:
+            task = queue_manager.get_task_by_id(task_id)
+            status = task and task['status']
+            if status in TERMINAL_STATUSES:
+                break
+            time.sleep(0.05)
+        if status == 'COMPLETED':
+            recorder.ok('ingest', time.time() - start)
+        else:
+            recorder.error('ingest')
+
+
+def summarize(recorder: Recorder, elapsed: float):
+    from ai_expert.request_hedger import percentile
+
+    print(f"\n{'scenario':<10} {'ok':>6} {'err':>5} {'items':>6} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    report = {}
+    for scenario in SCENARIOS:
+        values = sorted(recorder.latencies.get(scenario, []))
+        errors = recorder.errors.get(scenario, 0)
+        if not values and not errors:
+            continue
+        row = {
+            'ok': len(values),
+            'errors': errors,
+            'items': recorder.items.get(scenario, 0),
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 1) if values else None,
+            'p95_ms': round(percentile(values, 0.95) * 1000, 1) if values else None,
+            'p99_ms': round(percentile(values, 0.99) * 1000, 1) if values else None,
+            'max_ms': round(values[-1] * 1000, 1) if values else None,
+        }
+        report[scenario] = row
+        fmt = lambda v: f"{v:9.1f}" if v is not None else f"{'-':>9}"
+        print(f"{scenario:<10} {row['ok']:>6} {row['errors']:>5} {row['items']:>6} {row['throughput']:>7.2f} "
+              f"{fmt(row['p50_ms'])} {fmt(row['p95_ms'])} {fmt(row['p99_ms'])} {fmt(row['max_ms'])}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI generation load test (offline, against a DeepSeek stub)")
+    parser.add_argument('--duration', type=float, default=30, help="压测时长 (秒)")
+    parser.add_argument('--concurrency', type=int, default=8, help="每个场景的并发客户端数")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--bulk-size', type=int, default=5, help="每次批量生成的任务数")
+    parser.add_argument('--task-timeout', type=float, default=120, help="ingest 场景等待单条任务完成的最长时间")
+    parser.add_argument('--base-url', help="已启动的桩服务地址；不指定时在本进程内启动")
+    parser.add_argument('--latency', default='lognormal:0.8,0.4', help="桩服务延迟分布，见 deepseek_stub_server.py")
+    parser.add_argument('--token-rate', type=float, default=200)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-5xx', type=float, default=0.0)
+    parser.add_argument('--json', help="把结果写入指定 JSON 文件")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    if args.json:
+        # 之后会切换到临时目录
+        args.json = os.path.abspath(args.json)
+
+    stub = None
+    if not args.base_url:
+        from deepseek_stub_server import start_in_background
+        stub = start_in_background(latency=args.latency, token_rate=args.token_rate,
+                                   rate_429=args.rate_429, rate_5xx=args.rate_5xx)
+        args.base_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix='ai-load-test-')
+    prepare_environment(args, workdir)
+    api_url, backend, api = start_backend(with_background='ingest' in scenarios)
+
+    import requests
+    print(f"Backend {api_url}, DeepSeek stub {args.base_url}, data in {workdir}")
+    print(f"Scenarios: {', '.join(scenarios)} x {args.concurrency} clients for {args.duration:g}s")
+
+    recorder = Recorder()
+    stop_at = time.time() + args.duration
+    threads = []
+    for scenario in scenarios:
+        for worker_id in range(args.concurrency):
+            if scenario == 'generate':
+                target, extra = run_generate, (requests.Session(), api_url, worker_id, recorder, stop_at)
+            elif scenario == 'bulk':
+                target, extra = run_bulk, (requests.Session(), api_url, worker_id, recorder, stop_at,
+                                           api.queue_manager, args.bulk_size)
+            else:
+                target, extra = run_ingest, (worker_id, recorder, stop_at, api.queue_manager, args.task_timeout)
+            threads.append(threading.Thread(target=target, args=extra, daemon=True, name=f"load-{scenario}-{worker_id}"))
+
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    report = {'duration': round(elapsed, 2), 'concurrency': args.concurrency, 'scenarios': summarize(recorder, elapsed)}
+
+    performance = requests.get(f"{api_url}/api/ai/stats/performance", timeout=10).json()
+    governor = performance.get('llm_governor') or {}
+    if governor:
+        print(f"\nLLM governor: limit={governor.get('limit')} increases={governor.get('increases')} "
+              f"decreases={governor.get('decreases')}")
+    report['performance'] = performance
+    if stub:
+        report['stub'] = stub.state.snapshot()
+        print(f"DeepSeek stub: {json.dumps(report['stub'])}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if api.bg_processor:
+        api.bg_processor.stop()
+    backend.shutdown()
+    if stub:
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 异步 DeepSeek 适配器与共享事件循环
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('httpx')
+
+import ai_expert.async_deepseek_adapter as async_module
+from ai_expert.async_runtime import AsyncRuntime
+from ai_expert.async_deepseek_adapter import AsyncDeepSeekAdapter
+
+
+class SlowChatHandler(BaseHTTPRequestHandler):
+    """延迟返回的本地服务，记录同时在处理的请求数；fail_first 个请求返回 503"""
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+    fail_first = 0
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    received = 0
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        with cls.lock:
+            cls.received += 1
+            failing = cls.received <= cls.fail_first
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(cls.delay)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+        if failing:
+            payload, status = {'error': 'busy'}, 503
+        else:
+            payload, status = {
+                'choices': [{'message': {'content': body['messages'][-1]['content']}}],
+                'usage': {'prompt_tokens': 5, 'completion_tokens': 2, 'total_tokens': 7}
+            }, 200
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    # 默认 backlog 只有 5，并发建连时会触发 SYN 重传
+    request_queue_size = 128
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    handler = type('Handler', (SlowChatHandler,), {'lock': threading.Lock()})
+    httpd = Server(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_adapter(url, max_concurrency=50):
+    adapter = AsyncDeepSeekAdapter('test-key', runtime=AsyncRuntime(max_concurrency))
+    adapter.base_url = url
+    return adapter
+
+
+def fan_out(adapter, count):
+    async def _run():
+        return await asyncio.gather(*[
+            adapter.chat([{'role': 'user', 'content': f"msg-{i}"}]) for i in range(count)
+        ])
+    return adapter.runtime.run(_run())
+
+
+class TestAsyncDeepSeekAdapter:
+    """异步适配器测试"""
+
+    def test_fan_out_runs_concurrently_on_one_thread(self, server):
+        """测试多个请求在同一个事件循环线程上并发完成"""
+        handler, url = server
+        adapter = make_adapter(url)
+
+        start = time.time()
+        results = fan_out(adapter, 20)
+        elapsed = time.time() - start
+
+        assert [r['content'] for r in results] == [f"msg-{i}" for i in range(20)]
+        assert all(r['success'] and r['total_tokens'] == 7 for r in results)
+        # 串行需要 4 秒，并发应接近单次延迟
+        assert elapsed < 2.0
+        assert handler.peak > 1
+        # 所有请求都由同一个事件循环线程同时挂起等待
+        assert adapter.runtime.get_metrics()['peak_in_flight'] > 1
+
+    def test_global_semaphore_bounds_in_flight(self, server):
+        """测试全局信号量限制同时在途请求数"""
+        handler, url = server
+        adapter = make_adapter(url, max_concurrency=3)
+
+        results = fan_out(adapter, 9)
+
+        assert all(r['success'] for r in results)
+        assert handler.peak <= 3
+        metrics = adapter.runtime.get_metrics()
+        assert metrics['peak_in_flight'] == 3
+        assert metrics['completed'] == 9
+
+    def test_retry_on_retryable_status(self, server, monkeypatch):
+        """测试 503 后按退避策略重试并成功"""
+        monkeypatch.setattr(async_module, 'RETRY_DELAY_BASE', 0.01)
+        handler, url = server
+        handler.delay = 0
+        handler.fail_first = 2
+        adapter = make_adapter(url)
+
+        result = adapter.runtime.run(adapter.chat([{'role': 'user', 'content': '你好'}]))
+
+        assert result['success'] and result['content'] == '你好'
+        assert handler.received == 3
+
+    def test_connection_error_returns_failed_result(self, monkeypatch):
+        """测试连接失败时重试后返回与同步版一致的失败结构"""
+        monkeypatch.setattr(async_module, 'RETRY_DELAY_BASE', 0.01)
+        adapter = make_adapter("http://127.0.0.1:1/chat/completions")
+
+        result = adapter.runtime.run(adapter.chat([{'role': 'user', 'content': '你好'}]))
+
+        assert result['success'] is False
+        assert result['content'] == '' and result['total_tokens'] == 0
+        assert '已重试' in result['error']
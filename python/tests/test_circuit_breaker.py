@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 熔断与对冲请求
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.deepseek_adapter as sync_module
+from ai_expert.circuit_breaker import CircuitBreaker
+from ai_expert.request_hedger import RequestHedger
+from ai_expert.llm_governor import LLMGovernor
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.http_client import HTTPClient
+from ai_expert.async_runtime import AsyncRuntime
+from ai_expert.async_deepseek_adapter import AsyncDeepSeekAdapter
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    """可配置的假 DeepSeek：固定状态码，或第一个请求变慢"""
+
+    protocol_version = 'HTTP/1.1'
+    status = 200
+    slow_first = 0.0
+    received = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        cls = type(self)
+        cls.received += 1
+        if cls.received == 1 and cls.slow_first:
+            time.sleep(cls.slow_first)
+        body = json.dumps({
+            'choices': [{'message': {'content': f"reply-{cls.received}"}}],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': 2, 'total_tokens': 7}
+        }).encode('utf-8')
+        self.send_response(cls.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+@pytest.fixture
+def provider():
+    ProviderHandler.status = 200
+    ProviderHandler.slow_first = 0.0
+    ProviderHandler.received = 0
+    httpd = Server(('127.0.0.1', 0), ProviderHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_adapter(url, **kwargs):
+    adapter = DeepSeekAdapter('test-key', http_client=HTTPClient(), **kwargs)
+    adapter.base_url = url
+    return adapter
+
+
+class TestCircuitBreaker:
+    """状态机测试"""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=10)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow() is False
+        assert breaker.get_metrics()['rejected'] == 1
+
+    def test_half_open_probe(self):
+        """测试恢复时间后只放行一个探测，成功则恢复、失败则重新熔断"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.08)
+
+        assert breaker.allow() is True
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow() is False
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        time.sleep(0.08)
+        assert breaker.allow() is True
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.get_metrics()['opened'] == 2
+
+
+class TestAdapterResilience:
+    """Adapter 熔断与对冲测试"""
+
+    def test_open_breaker_fails_fast(self, provider, monkeypatch):
+        """测试服务商持续 5xx 时熔断，后续请求不再发出、立即失败"""
+        monkeypatch.setattr(sync_module, 'RETRY_DELAY_BASE', 0.01)
+        ProviderHandler.status = 500
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        adapter = make_adapter(provider, circuit_breaker=breaker)
+
+        first = adapter.chat([{'role': 'user', 'content': '你好'}])
+        assert first['success'] is False
+        assert ProviderHandler.received == 2
+        assert breaker.state == CircuitBreaker.OPEN
+
+        start = time.time()
+        second = adapter.chat([{'role': 'user', 'content': '你好'}])
+        assert second['success'] is False and '熔断' in second['error']
+        assert time.time() - start < 0.1
+        assert ProviderHandler.received == 2
+
+    def test_hedge_wins_when_first_request_is_slow(self, provider, monkeypatch):
+        """测试首个请求超过 p95 后发出对冲请求，先返回者胜出"""
+        monkeypatch.setenv('LLM_HEDGING', '1')
+        ProviderHandler.slow_first = 1.0
+        hedger = RequestHedger(min_samples=1, min_delay=0.05, max_ratio=1.0)
+        hedger.record_latency(500, 0.05)
+        breaker = CircuitBreaker()
+        adapter = make_adapter(provider, hedger=hedger, circuit_breaker=breaker)
+        threads = []
+        send = adapter._send
+
+        def recording_send(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return send(*args, **kwargs)
+
+        monkeypatch.setattr(adapter, '_send', recording_send)
+
+        start = time.time()
+        result = adapter.chat([{'role': 'user', 'content': '你好'}])
+        assert result['success'] and result['content'] == 'reply-2'
+        assert time.time() - start < 0.6
+        metrics = hedger.get_metrics()
+        assert metrics['hedged'] == 1 and metrics['hedge_wins'] == 1
+        # 原请求在调用方线程中发出，只有对冲请求进线程池；被中止的原请求不计为故障
+        assert threads[0] is threading.current_thread() and threads[1] is not threads[0]
+        assert breaker.get_metrics()['failures'] == 0
+        assert adapter.http.get_metrics()['errors'] == 0
+
+    def test_hedge_timer_starts_after_governor_slot(self, provider, monkeypatch):
+        """测试排队等待出站名额的时间不计入对冲等待"""
+        monkeypatch.setenv('LLM_HEDGING', '1')
+        hedger = RequestHedger(min_samples=1, min_delay=0.05, max_ratio=1.0)
+        hedger.record_latency(500, 0.05)
+        governor = LLMGovernor(initial_limit=1, min_limit=1, max_limit=1)
+        adapter = make_adapter(provider, hedger=hedger, circuit_breaker=CircuitBreaker(), llm_governor=governor)
+
+        permit = governor.acquire()
+        threading.Timer(0.3, governor.release, args=(permit,)).start()
+        result = adapter.chat([{'role': 'user', 'content': '你好'}])
+        assert result['content'] == 'reply-1'
+        assert ProviderHandler.received == 1
+        assert hedger.get_metrics()['hedged'] == 0
+
+    def test_no_hedge_while_governor_is_queueing(self, provider, monkeypatch):
+        """测试出站名额有人排队时不发对冲请求，等待原请求"""
+        monkeypatch.setenv('LLM_HEDGING', '1')
+        ProviderHandler.slow_first = 0.3
+        hedger = RequestHedger(min_samples=1, min_delay=0.05, max_ratio=1.0)
+        hedger.record_latency(500, 0.05)
+        governor = LLMGovernor(initial_limit=1, min_limit=1, max_limit=1)
+        adapter = make_adapter(provider, hedger=hedger, circuit_breaker=CircuitBreaker(), llm_governor=governor)
+
+        def queued_caller():
+            time.sleep(0.02)
+            governor.release(governor.acquire())
+
+        waiter = threading.Thread(target=queued_caller)
+        waiter.start()
+        result = adapter.chat([{'role': 'user', 'content': '你好'}])
+        waiter.join()
+        assert result['content'] == 'reply-1'
+        assert ProviderHandler.received == 1
+        assert hedger.get_metrics()['hedged'] == 0
+
+    def test_async_hedge_cancels_loser(self, provider, monkeypatch):
+        """测试异步对冲：对冲请求胜出后取消仍在等待的原请求"""
+        pytest.importorskip('httpx')
+        monkeypatch.setenv('LLM_HEDGING', '1')
+        ProviderHandler.slow_first = 1.0
+        hedger = RequestHedger(min_samples=1, min_delay=0.05, max_ratio=1.0)
+        hedger.record_latency(500, 0.05)
+        adapter = AsyncDeepSeekAdapter('test-key', runtime=AsyncRuntime(10), hedger=hedger,
+                                       circuit_breaker=CircuitBreaker())
+        adapter.base_url = provider
+
+        start = time.time()
+        result = adapter.runtime.run(adapter.chat([{'role': 'user', 'content': '你好'}]))
+        assert result['success'] and result['content'] == 'reply-2'
+        assert time.time() - start < 0.6
+        assert adapter.runtime.get_metrics()['in_flight'] == 0
+        assert hedger.get_metrics()['hedge_wins'] == 1
+
+    def test_hedge_budget(self, provider, monkeypatch):
+        """测试超出对冲比例时不再对冲，等待原请求"""
+        monkeypatch.setenv('LLM_HEDGING', '1')
+        ProviderHandler.slow_first = 0.3
+        hedger = RequestHedger(min_samples=1, min_delay=0.05, max_ratio=0.0)
+        hedger.record_latency(500, 0.05)
+        adapter = make_adapter(provider, hedger=hedger, circuit_breaker=CircuitBreaker())
+
+        result = adapter.chat([{'role': 'user', 'content': '你好'}])
+        assert result['content'] == 'reply-1'
+        assert ProviderHandler.received == 1
+        assert hedger.get_metrics()['hedged'] == 0
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - AI 专家 System Prompt 预编译缓存
+"""
+
+import sys
+import os
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.database import AIExpertDatabase
+from ai_expert.enhanced_prompt_builder import EnhancedPromptBuilder
+from ai_expert.compiled_prompt_cache import CompiledPromptCache, get_compiled_prompt_cache, parse_prompt_config
+
+
+PROMPT = {
+    'name': '电商客服',
+    'role_definition': '你是一名电商客服',
+    'business_logic': '促成下单',
+    'tone_style': 'friendly',
+    'reply_length': 'short',
+    'emoji_usage': 'none',
+    'knowledge_base': [{'name': '价格', 'details': '标准版 99 元'}],
+    'forbidden_words': ['保证有效'],
+    'system_prompt': '',
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = AIExpertDatabase(str(tmp_path / 'compiled.db'))
+    prompt_id = db.create_prompt(PROMPT)
+    db.activate_prompt(prompt_id)
+    return db
+
+
+class TestCompiledPromptCache:
+    """按 (prompt_id, updated_at) 缓存解析结果与静态章节"""
+
+    def test_compiled_prompt_matches_uncached_build(self, db):
+        row = db.get_active_prompt()
+        config = get_compiled_prompt_cache(db).get_config(row)
+        builder = EnhancedPromptBuilder()
+
+        plain = parse_prompt_config(row)
+        assert config['knowledge_base'] == PROMPT['knowledge_base']
+        assert builder.build_stable_prompt(config) == builder.build_stable_prompt(plain)
+
+        plain['few_shot_examples'] = ['Q: 多少钱\nA: 99 元']
+        assert builder.build_stable_prompt({**config, 'few_shot_examples': plain['few_shot_examples']}) \
+            == builder.build_stable_prompt(plain)
+
+    def test_hits_and_copies(self, db):
+        cache = get_compiled_prompt_cache(db)
+        row = db.get_active_prompt()
+        first = cache.get_config(row)
+        first['few_shot_examples'] = ['被调用方修改']
+        second = cache.get_config(db.get_active_prompt())
+
+        assert 'few_shot_examples' not in second
+        metrics = cache.get_metrics()
+        assert metrics['misses'] == 1 and metrics['hits'] == 1 and metrics['entries'] == 1
+
+    @pytest.mark.parametrize('change', ['update', 'full_update', 'activate'])
+    def test_invalidated_by_prompt_changes(self, db, change):
+        cache = get_compiled_prompt_cache(db)
+        row = db.get_active_prompt()
+        cache.get_config(row)
+
+        updated = {**PROMPT, 'business_logic': '先了解需求再推荐'}
+        if change == 'update':
+            db.update_prompt(row['id'], updated)
+        elif change == 'full_update':
+            db.full_update_prompt_transactional(row['id'], updated)
+        else:
+            db.activate_prompt(row['id'])
+
+        assert cache.get_metrics()['entries'] == 0
+        config = cache.get_config(db.get_active_prompt())
+        expected = '先了解需求再推荐' if change != 'activate' else '促成下单'
+        assert expected in config['compiled_static_prompt']
+
+    def test_new_updated_at_replaces_stale_entry(self):
+        cache = CompiledPromptCache(max_size=2)
+        row = {'id': 1, 'updated_at': 't1', 'role_definition': '旧角色'}
+        cache.get_config(row)
+        config = cache.get_config({**row, 'updated_at': 't2', 'role_definition': '新角色'})
+
+        assert '新角色' in config['compiled_static_prompt']
+        assert cache.get_metrics()['entries'] == 1
+
+        cache.get_config({'id': 2, 'updated_at': 't1'})
+        cache.get_config({'id': 3, 'updated_at': 't1'})
+        assert cache.get_metrics()['entries'] == 2
+
+    def test_invalid_json_fields_fall_back_to_empty(self):
+        config = parse_prompt_config({'knowledge_base': '{broken', 'forbidden_words': None})
+        assert config['knowledge_base'] == [] and config['forbidden_words'] == []
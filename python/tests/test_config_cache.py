@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - AI 专家配置缓存（写穿失效 + 跨进程版本检查）
+"""
+
+import sys
+import os
+import sqlite3
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.database as database_module
+from ai_expert.database import AIExpertDatabase
+
+
+PROMPT = {
+    'name': '电商客服',
+    'role_definition': '你是一名电商客服',
+    'knowledge_base': [{'name': '价格', 'details': '标准版 99 元'}],
+    'forbidden_words': [],
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return AIExpertDatabase(str(tmp_path / 'config.db'))
+
+
+def count_prompt_queries(db, monkeypatch):
+    """统计走到数据库的连接次数"""
+    calls = []
+    original = db.get_connection
+
+    def counting():
+        calls.append(1)
+        return original()
+    monkeypatch.setattr(db, 'get_connection', counting)
+    return calls
+
+
+class TestConfigCache:
+    """配置读取走内存缓存"""
+
+    def test_hot_reads_do_not_hit_database(self, db, monkeypatch):
+        prompt_id = db.create_prompt(PROMPT)
+        db.activate_prompt(prompt_id)
+        assert db.get_active_prompt()['id'] == prompt_id
+
+        calls = count_prompt_queries(db, monkeypatch)
+        for _ in range(50):
+            assert db.get_active_prompt()['id'] == prompt_id
+            assert db.get_prompt_by_id(prompt_id)['name'] == '电商客服'
+        assert calls == []
+
+    def test_returns_copies(self, db):
+        prompt_id = db.create_prompt(PROMPT)
+        row = db.get_prompt_by_id(prompt_id)
+        row['knowledge_base'] = []
+        assert db.get_prompt_by_id(prompt_id)['knowledge_base'] != []
+
+    def test_write_through_invalidation(self, db):
+        first = db.create_prompt(PROMPT)
+        second = db.create_prompt({**PROMPT, 'name': '售后客服'})
+        db.activate_prompt(first)
+        assert db.get_active_prompt()['id'] == first
+
+        db.activate_prompt(second)
+        assert db.get_active_prompt()['id'] == second
+
+        db.update_prompt(second, {**PROMPT, 'name': '售后专家', 'business_logic': '', 'tone_style': 'professional',
+                                  'reply_length': 'medium', 'emoji_usage': 'none', 'system_prompt': ''})
+        assert db.get_active_prompt()['name'] == '售后专家'
+
+        db.delete_prompt(second)
+        assert db.get_active_prompt() is None
+        assert db.get_prompt_by_id(second) is None
+        assert db.get_prompt_by_id('not-a-number') is None
+
+    def test_cross_process_change_detected(self, db, monkeypatch):
+        """其他进程（这里用独立连接模拟）修改 ai_prompts 后，下一次版本检查时重新加载"""
+        monkeypatch.setattr(database_module, 'CONFIG_CACHE_CHECK_INTERVAL', 0)
+        prompt_id = db.create_prompt(PROMPT)
+        db.activate_prompt(prompt_id)
+        assert db.get_active_prompt()['name'] == '电商客服'
+
+        conn = sqlite3.connect(db.db_path)
+        conn.execute("UPDATE ai_prompts SET name = ? WHERE id = ?", ('外部修改', prompt_id))
+        conn.commit()
+        conn.close()
+
+        assert db.get_active_prompt()['name'] == '外部修改'
+
+    def test_unrelated_writes_keep_cache(self, db, monkeypatch):
+        """其他表的写入只会让 data_version 变化，配置版本不变时不重新加载"""
+        monkeypatch.setattr(database_module, 'CONFIG_CACHE_CHECK_INTERVAL', 0)
+        prompt_id = db.create_prompt(PROMPT)
+        db.get_prompt_by_id(prompt_id)
+
+        db.add_message('s1', '客户', '你好')
+        calls = count_prompt_queries(db, monkeypatch)
+        assert db.get_prompt_by_id(prompt_id)['id'] == prompt_id
+        assert calls == []
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 端到端请求时间预算
+"""
+
+import sys
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.deadline import Deadline, deadline_scope, current_deadline
+from ai_expert.database import AIExpertDatabase
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.circuit_breaker import CircuitBreaker
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.http_client import HTTPClient
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, VERSION_TYPES
+
+
+class DegradedHandler(BaseHTTPRequestHandler):
+    """始终返回 503，或在 delay 秒后才响应"""
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    received = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).received += 1
+        time.sleep(type(self).delay)
+        body = b'{"error": "busy"}'
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+@pytest.fixture
+def degraded():
+    DegradedHandler.delay = 0.0
+    DegradedHandler.received = 0
+    httpd = Server(('127.0.0.1', 0), DegradedHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    adapter = DeepSeekAdapter('test-key', http_client=HTTPClient(), circuit_breaker=CircuitBreaker())
+    adapter.base_url = f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+    yield adapter
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class RecordingAdapter(DeepSeekAdapter):
+    """不发网络请求：记录调用，按 fail 集合决定哪些版本失败"""
+
+    def __init__(self, cache, fail=()):
+        super().__init__('test-key', llm_cache=cache)
+        self.fail = set(fail)
+        self.calls = []
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        system_prompt = messages[0]['content']
+        self.calls.append(system_prompt[:20])
+        if any(f"版本要求：{name}" in messages[-2]['content'] for name in self.fail):
+            return {'success': False, 'content': '', 'error': 'API Error: 503', 'total_tokens': 0}
+        return {'success': True, 'content': '["关键词"]' if '关键词' in system_prompt else '生成的回复',
+                'error': None, 'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15, 'cost': 0.001}
+
+
+@pytest.fixture
+def make_generator(tmp_path, monkeypatch):
+    monkeypatch.setenv('AI_ASYNC_LLM', '0')
+    monkeypatch.setenv('AI_GENERATION_MODE', 'per_style')
+    # 同一条消息会生成多次，关闭回复缓存以覆盖真实生成路径
+    monkeypatch.setenv('AI_REPLY_CACHE', '0')
+    db = AIExpertDatabase(str(tmp_path / 'deadline.db'))
+    cache = LLMCallCache(str(tmp_path / 'cache.db'))
+
+    def _make(fail=()):
+        return EnhancedReplyGenerator('test-key', db, deepseek_adapter=RecordingAdapter(cache, fail))
+    return _make
+
+
+def generate(generator, deadline=None):
+    return generator.generate_three_versions(
+        session_id='s1',
+        customer_message='这个多少钱',
+        system_prompt_config={'role_definition': '客服'},
+        prompt_id=1,
+        conversation_history=[{'role': 'user', 'content': '你好'}, {'role': 'assistant', 'content': '您好'}],
+        deadline=deadline
+    )
+
+
+class TestDeadline:
+    """Deadline 基础行为"""
+
+    def test_shrink_and_timeout(self):
+        deadline = Deadline(10)
+        assert 9 < deadline.remaining() <= 10
+        assert deadline.timeout(30) <= 10 and deadline.timeout(2) == 2
+        assert 1 < deadline.shrink(8).remaining() <= 2
+        assert deadline.shrink(20).expired()
+
+    def test_scope_is_restored(self):
+        outer = Deadline(5)
+        with deadline_scope(outer):
+            with deadline_scope(Deadline(1)):
+                assert current_deadline() is not outer
+            assert current_deadline() is outer
+            with deadline_scope(None):
+                assert current_deadline() is outer
+        assert current_deadline() is None
+
+
+class TestAdapterDeadline:
+    """Adapter 在预算内收紧超时、放弃重试"""
+
+    def test_retries_skipped_when_budget_low(self, degraded):
+        with deadline_scope(Deadline(1.5)):
+            start = time.time()
+            result = degraded.chat([{'role': 'user', 'content': '你好'}])
+        assert result['success'] is False and '预算' in result['error']
+        assert time.time() - start < 0.5
+        assert DegradedHandler.received == 1
+
+    def test_request_timeout_capped_by_budget(self, degraded):
+        DegradedHandler.delay = 3
+        with deadline_scope(Deadline(1.5)):
+            start = time.time()
+            result = degraded.chat([{'role': 'user', 'content': '你好'}])
+        assert result['success'] is False
+        assert time.time() - start < 2.5
+
+    def test_expired_budget_sends_nothing(self, degraded):
+        with deadline_scope(Deadline(0.5)):
+            result = degraded.chat([{'role': 'user', 'content': '你好'}])
+        assert result['success'] is False
+        assert DegradedHandler.received == 0
+
+
+class TestGeneratorDeadline:
+    """生成器的可选步骤与兜底回复"""
+
+    def test_tight_budget_skips_optional_llm_stages(self, make_generator, monkeypatch):
+        """测试预算不足以为生成预留时间时，不再做关键词提取，只发出生成请求"""
+        monkeypatch.setenv('AI_LLM_KEYWORDS', '1')
+        relaxed = make_generator()
+        generate(relaxed)
+        assert len(relaxed.deepseek.calls) == len(VERSION_TYPES) + 1
+
+        tight = make_generator()
+        result = generate(tight, Deadline(5))
+        assert result['success'] and result['fallback'] is None
+        assert len(tight.deepseek.calls) == len(VERSION_TYPES)
+
+    def test_failed_version_uses_fallback_under_deadline(self, make_generator):
+        """测试设置预算时，失败的版本使用兜底回复而不是错误信息"""
+        generator = make_generator(fail=['保守型'])
+        generator.db.get_golden_replies = lambda prompt_id, limit: [{'question': '价格', 'reply': '金牌话术回复'}]
+
+        result = generate(generator, Deadline(20))
+        assert result['conservative'] == '金牌话术回复'
+        assert result['aggressive'] == '生成的回复'
+        assert result['fallback'] == {'source': 'golden', 'versions': ['conservative']}
+
+        without_deadline = generate(make_generator(fail=['保守型']))
+        assert without_deadline['conservative'].startswith('生成失败')
+
+    def test_exhausted_budget_returns_fallback_only(self, make_generator):
+        """测试准备阶段后预算已用尽时不发起生成，全部版本使用通用兜底回复"""
+        generator = make_generator()
+        result = generate(generator, Deadline(0.5))
+
+        assert result['success'] is True
+        assert result['generation_mode'] == 'fallback'
+        assert result['llm_calls'] == 0
+        assert result['fallback']['source'] == 'default'
+        assert len({result[v_type] for v_type in VERSION_TYPES}) == 1
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - DeepSeek 本地桩服务与可配置接口地址
+"""
+
+import sys
+import os
+import json
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.deepseek_adapter as sync_module
+from ai_expert.config import Config
+from ai_expert.circuit_breaker import CircuitBreaker
+from ai_expert.llm_governor import LLMGovernor
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.http_client import HTTPClient
+from deepseek_stub_server import start_in_background, parse_latency
+
+
+@pytest.fixture
+def stub_factory(monkeypatch):
+    servers = []
+
+    def _start(**kwargs):
+        server = start_in_background(**kwargs)
+        servers.append(server)
+        monkeypatch.setenv('DEEPSEEK_BASE_URL', f"http://127.0.0.1:{server.server_address[1]}/")
+        return server
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_adapter(**kwargs):
+    return DeepSeekAdapter('stub-key', http_client=HTTPClient(), circuit_breaker=CircuitBreaker(), **kwargs)
+
+
+class TestBaseUrl:
+    """接口地址配置"""
+
+    def test_default_and_override(self, monkeypatch):
+        monkeypatch.delenv('DEEPSEEK_BASE_URL', raising=False)
+        assert make_adapter().base_url == "https://api.deepseek.com/chat/completions"
+
+        monkeypatch.setenv('DEEPSEEK_BASE_URL', 'http://127.0.0.1:8900/')
+        assert Config.get_deepseek_base_url() == 'http://127.0.0.1:8900'
+        adapter = make_adapter()
+        assert adapter.base_url == 'http://127.0.0.1:8900/chat/completions'
+        assert adapter.models_url == 'http://127.0.0.1:8900/models'
+
+
+class TestStubServer:
+    """桩服务行为"""
+
+    def test_chat_reports_usage_and_prefix_cache(self, stub_factory):
+        stub = stub_factory()
+        adapter = make_adapter()
+        messages = [{'role': 'system', 'content': '你是一名客服'}, {'role': 'user', 'content': '多少钱'}]
+
+        first = adapter.chat(messages)
+        second = adapter.chat(messages)
+        assert first['success'] and first['content']
+        assert first['prompt_tokens'] > 0 and first['completion_tokens'] > 0
+
+        stats = stub.state.snapshot()
+        assert stats['requests'] == 2
+        assert 0 < stats['prompt_cache_hit_tokens'] < stats['prompt_tokens']
+
+    def test_json_reply_has_all_versions(self, stub_factory):
+        stub_factory()
+        result = make_adapter().chat([{'role': 'user', 'content': '多少钱'}], response_format={'type': 'json_object'})
+        assert set(json.loads(result['content'])) == {'aggressive', 'conservative', 'professional'}
+
+    def test_stream_with_usage(self, stub_factory):
+        stub_factory(token_rate=0)
+        usage = {}
+        chunks = list(make_adapter().chat_stream([{'role': 'user', 'content': '多少钱'}], usage=usage))
+        assert len(chunks) > 1 and ''.join(chunks)
+        assert usage['completion_tokens'] > 0
+
+    def test_throttling_is_injected_with_retry_after(self, stub_factory, monkeypatch):
+        monkeypatch.setattr(sync_module, 'RETRY_DELAY_BASE', 0.01)
+        stub = stub_factory(rate_429=1.0, retry_after=0.05)
+        governor = LLMGovernor(initial_limit=4)
+        result = make_adapter(llm_governor=governor).chat([{'role': 'user', 'content': '你好'}])
+
+        assert result['success'] is False
+        assert stub.state.snapshot()['throttled'] >= 2
+        assert governor.get_metrics()['lanes']['interactive']['throttled'] >= 2
+
+    def test_latency_distributions(self):
+        assert parse_latency('fixed:0.2')() == 0.2
+        assert 0.1 <= parse_latency('uniform:0.1,0.3')() <= 0.3
+        assert parse_latency('lognormal:0.5,0.3')() > 0
+        with pytest.raises(ValueError):
+            parse_latency('poisson:1')
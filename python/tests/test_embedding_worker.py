@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 向量化工作进程
+"""
+
+import sys
+import os
+import time
+import textwrap
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+
+from ai_expert.embedding_worker import EmbeddingWorker, EmbeddingWorkerError
+
+
+FAKE_SENTENCE_TRANSFORMERS = textwrap.dedent('''
+    import numpy as np
+
+    class SentenceTransformer:
+        def __init__(self, name):
+            self.name = name
+
+        def encode(self, texts):
+            return np.array([[len(t), i, 1.0] for i, t in enumerate(texts)], dtype=np.float32)
+''')
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    """使用假的 sentence_transformers 模块启动工作进程"""
+    (tmp_path / 'sentence_transformers.py').write_text(FAKE_SENTENCE_TRANSFORMERS, encoding='utf-8')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+
+    w = EmbeddingWorker(health_interval=0.2, request_timeout=20)
+    w.start()
+    yield w
+    w.stop()
+
+
+class TestEmbeddingWorker:
+    """工作进程测试"""
+
+    def test_encode_returns_vectors_via_shared_memory(self, worker):
+        """测试编码结果通过共享内存正确返回"""
+        vectors = worker.encode(['你好', '价格是多少'])
+
+        assert vectors.shape == (2, 3)
+        assert vectors[0].tolist() == [2.0, 0.0, 1.0]
+        assert vectors[1].tolist() == [5.0, 1.0, 1.0]
+
+    def test_worker_errors_are_propagated(self, worker):
+        """测试子进程异常转换为 EmbeddingWorkerError"""
+        with pytest.raises(EmbeddingWorkerError):
+            worker.ocr('/path/does/not/exist.png')
+
+    def test_worker_restarts_after_crash(self, worker):
+        """测试子进程退出后自动重启"""
+        old_pid = worker.get_status()['pid']
+        worker._process.kill()
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            status = worker.get_status()
+            if status['alive'] and status['pid'] != old_pid:
+                break
+            time.sleep(0.1)
+
+        assert worker.get_status()['restart_count'] >= 1
+        assert worker.ping()
+        assert worker.encode(['a']).shape == (1, 3)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 三版本流式生成
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('httpx')
+
+import ai_expert.async_deepseek_adapter as async_module
+from ai_expert.database import AIExpertDatabase
+from ai_expert.async_runtime import AsyncRuntime
+from ai_expert.async_deepseek_adapter import AsyncDeepSeekAdapter
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.http_client import HTTPClient
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, VERSION_TYPES
+
+STYLE_NAMES = {'进取型': 'aggressive', '保守型': 'conservative', '专业型': 'professional'}
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """按版本要求（位于当前消息之前的 system 消息）中的版本名逐块推送 SSE，末尾附带用量"""
+
+    protocol_version = 'HTTP/1.1'
+    chunk_delay = 0.05
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        system_prompt = body['messages'][-2]['content']
+        version = next(v for name, v in STYLE_NAMES.items() if f"版本要求：{name}" in system_prompt)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(3):
+            chunk = {'choices': [{'delta': {'content': f"{version}-{i};"}}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.chunk_delay)
+        usage = {'choices': [], 'usage': {'prompt_tokens': 100, 'completion_tokens': 6, 'total_tokens': 106}}
+        self._write_chunk(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    httpd = Server(('127.0.0.1', 0), StreamingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def generator(tmp_path, server):
+    db = AIExpertDatabase(str(tmp_path / 'stream.db'))
+    sync_adapter = DeepSeekAdapter('test-key', http_client=HTTPClient())
+    sync_adapter.base_url = server
+    async_adapter = AsyncDeepSeekAdapter('test-key', runtime=AsyncRuntime(10))
+    async_adapter.base_url = server
+
+    gen = EnhancedReplyGenerator('test-key', db, deepseek_adapter=sync_adapter, async_deepseek_adapter=async_adapter)
+    # 跳过意图识别、检索等准备步骤
+    gen._prepare_generation = lambda *args, **kwargs: {
+        'system_prompt': '你是客服。',
+        'full_context': [{'role': 'user', 'content': '多少钱？'}],
+        'metadata': {'intent': 'price'},
+        'fallback': {'source': 'preset', 'content': '标准价格 99 元'}
+    }
+    return gen
+
+
+def collect(gen):
+    return list(gen.generate_three_versions_stream('s1', '多少钱？', {}, prompt_id=1))
+
+
+class TestGenerateStream:
+    """流式生成测试"""
+
+    @pytest.mark.parametrize('async_llm', ['1', '0'])
+    def test_streams_are_multiplexed_and_saved(self, generator, monkeypatch, async_llm):
+        """测试三个版本交替推送，结束后保存建议与各版本耗时"""
+        monkeypatch.setenv('AI_ASYNC_LLM', async_llm)
+        events = collect(generator)
+
+        assert events[0]['type'] == 'meta'
+        deltas = [e for e in events if e['type'] == 'delta']
+        assert {e['version'] for e in deltas} == set(VERSION_TYPES)
+        # 并发进行：第一个版本结束前，其他版本已经开始输出
+        first_done = next(i for i, e in enumerate(events) if e['type'] == 'version_done')
+        assert {e['version'] for e in events[:first_done] if e['type'] == 'delta'} == set(VERSION_TYPES)
+
+        done = events[-1]
+        assert done['type'] == 'done'
+        assert done['suggestions']['conservative'] == 'conservative-0;conservative-1;conservative-2;'
+        assert done['tokens_used'] == 318
+        for timing in done['timings'].values():
+            assert 0 < timing['ttft'] < timing['total_time']
+
+        stats = {row['version']: row for row in generator.db.get_stream_latency_stats()}
+        assert set(stats) == set(VERSION_TYPES)
+        assert generator.db.get_generation_mode_stats()[0]['generation_mode'] == 'stream'
+
+    def test_failed_version_is_reported(self, generator, monkeypatch):
+        """测试单个版本失败（连接被断开并重试耗尽）时推送 version_error，其余版本正常完成"""
+        monkeypatch.setenv('AI_ASYNC_LLM', '1')
+        monkeypatch.setattr(async_module, 'RETRY_DELAY_BASE', 0.01)
+        original = generator._version_messages
+
+        def broken(system_prompt, full_context, v_type):
+            messages = original(system_prompt, full_context, v_type)
+            if v_type == 'aggressive':
+                messages[-2]['content'] = '没有版本要求'
+            return messages
+        generator._version_messages = broken
+
+        events = collect(generator)
+        errors = [e for e in events if e['type'] == 'version_error']
+        assert [e['version'] for e in errors] == ['aggressive']
+        done = events[-1]
+        assert done['suggestions']['aggressive'].startswith('生成失败')
+        assert done['suggestions']['professional'].startswith('professional-0')
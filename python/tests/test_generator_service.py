@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 应用级生成器服务
+"""
+
+import sys
+import os
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.enhanced_reply_generator as generator_module
+from ai_expert.database import AIExpertDatabase
+from ai_expert.generator_service import GeneratorService
+from ai_expert.enhanced_reply_generator import VERSION_TYPES
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'key-a')
+    return GeneratorService(AIExpertDatabase(str(tmp_path / 'service.db')), kb_manager=None)
+
+
+class TestGeneratorService:
+    """生成器复用与切换"""
+
+    def test_reuses_generator(self, service):
+        first = service.get()
+        assert service.get() is first
+        assert service.get('key-a') is first
+        assert first.api_key == 'key-a'
+        assert service.get_metrics() == {'generators': 1, 'builds': 1, 'invalidations': 0}
+
+    def test_api_key_cached_until_invalidated(self, service, monkeypatch):
+        first = service.get()
+        monkeypatch.setenv('DEEPSEEK_API_KEY', 'key-b')
+        assert service.get_api_key() == 'key-a'
+        assert service.get() is first
+
+        service.invalidate()
+        second = service.get()
+        assert second is not first and second.api_key == 'key-b'
+
+    def test_missing_key_is_not_cached(self, service, monkeypatch):
+        monkeypatch.setenv('DEEPSEEK_API_KEY', '')
+        monkeypatch.setattr('ai_expert.config.Config.get_deepseek_api_key', staticmethod(lambda: ''))
+        assert service.get_api_key() == ''
+        monkeypatch.setattr('ai_expert.config.Config.get_deepseek_api_key', staticmethod(lambda: 'key-c'))
+        assert service.get_api_key() == 'key-c'
+
+    def test_concurrent_first_use_builds_once(self, service):
+        generators = []
+        threads = [threading.Thread(target=lambda: generators.append(service.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(g) for g in generators}) == 1
+        assert service.get_metrics()['builds'] == 1
+
+
+class TestVersionExecutor:
+    """逐版本生成（线程模式）复用共享线程池"""
+
+    def test_shared_pool_threads(self, service, monkeypatch):
+        monkeypatch.setenv('AI_ASYNC_LLM', '0')
+        generator = service.get()
+        thread_names = []
+
+        def fake_chat(messages, **kwargs):
+            thread_names.append(threading.current_thread().name)
+            return {'success': True, 'content': '好的', 'error': None, 'total_tokens': 1}
+        monkeypatch.setattr(generator.deepseek, 'chat', fake_chat)
+
+        for _ in range(2):
+            outcome = generator._generate_versions('system', [{'role': 'user', 'content': '你好'}],
+                                                   VERSION_TYPES, mode='per_style')
+            assert set(outcome['versions']) == set(VERSION_TYPES)
+        assert len(thread_names) == 2 * len(VERSION_TYPES)
+        assert all(name.startswith('version-gen') for name in thread_names)
+        assert generator_module._get_version_executor() is generator_module._get_version_executor()
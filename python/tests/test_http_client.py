@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 共享 HTTP 连接池
+"""
+
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.http_client import HTTPClient
+from ai_expert.deepseek_adapter import DeepSeekAdapter, get_deepseek_adapter
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """返回固定 chat completion 的本地服务（HTTP/1.1 keep-alive）"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({'data': []})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({
+            'choices': [{'message': {'content': '您好'}}],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': 2, 'total_tokens': 7}
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ChatHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestHTTPClient:
+    """连接复用测试"""
+
+    def test_sequential_requests_reuse_one_connection(self, server):
+        """测试顺序请求复用同一个 keep-alive 连接"""
+        client = HTTPClient(pool_maxsize=4)
+        for _ in range(5):
+            client.post(f"{server}/chat/completions", json={}, timeout=5).close()
+
+        metrics = client.get_metrics()
+        assert metrics['requests'] == 5
+        assert metrics['connections_created'] == 1
+        assert metrics['connection_reuse_rate'] == 0.8
+        assert metrics['pools'][0]['idle_connections'] == 1
+        client.close()
+
+    def test_warm_up_opens_connection_for_first_request(self, server):
+        """测试预热后首个业务请求直接复用已建立的连接"""
+        client = HTTPClient()
+        client.warm_up(f"{server}/models", background=False)
+        client.post(f"{server}/chat/completions", json={}, timeout=5).close()
+
+        metrics = client.get_metrics()
+        assert metrics['warmed_up'] == [f"{server}/models"]
+        assert metrics['connections_created'] == 1
+        client.close()
+
+    def test_adapter_uses_shared_client(self, server):
+        """测试 DeepSeekAdapter 通过注入的客户端发送请求"""
+        client = HTTPClient()
+        adapter = DeepSeekAdapter('test-key', http_client=client)
+        adapter.base_url = f"{server}/chat/completions"
+
+        for _ in range(3):
+            result = adapter.chat([{'role': 'user', 'content': '你好'}])
+            assert result['success'] and result['content'] == '您好'
+
+        assert client.get_metrics()['connections_created'] == 1
+        client.close()
+
+    def test_adapter_registry(self):
+        """测试相同 API Key 复用同一个 Adapter"""
+        assert get_deepseek_adapter('key-a') is get_deepseek_adapter('key-a')
+        assert get_deepseek_adapter('key-a') is not get_deepseek_adapter('key-b')
+        assert get_deepseek_adapter('key-a').http is get_deepseek_adapter('key-b').http
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 本地检索关键词提取
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.keyword_extractor import KeywordLexicon, LocalKeywordExtractor, builtin_terms, iter_terms
+from ai_expert.database import AIExpertDatabase
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, VERSION_TYPES
+
+PRESETS = ['这个多少钱 标准版99元，高级版199元', '地址在哪 我们在北京朝阳区', '周末营业吗 周末正常营业']
+CHUNKS = ['我们的产品支持七天无理由退货，会员享受九折优惠', '配送范围覆盖全国，偏远地区需要额外支付运费'] * 3
+
+
+@pytest.fixture
+def lexicon():
+    return KeywordLexicon.build(['优惠'], PRESETS, CHUNKS)
+
+
+class TestKeywordLexicon:
+    """n-gram TF-IDF 打分与去重"""
+
+    def test_candidates_skip_function_words(self):
+        terms = set(iter_terms('这个多少钱啊 iPhone15'))
+        assert '多少钱' in terms and 'iphone15' in terms
+        assert not any(t.endswith('啊') or t.startswith('这') for t in terms)
+
+    def test_candidates_never_contain_function_words(self):
+        """测试候选词在虚词 / 功能词处切开，中间也不含虚词（不出现 "播课的安"、"解一下直"）"""
+        terms = set(iter_terms('我想了解一下直播课的安排'))
+        assert {'直播课', '安排'} <= terms
+        assert not any(set(t) & set('我的') or '了解' in t or '一下' in t for t in terms)
+
+    @pytest.mark.parametrize('message, expected', [
+        ('我想了解一下直播课的安排', {'直播课', '安排'}),
+        ('这个课程多少钱啊', {'课程', '多少钱'}),
+    ])
+    def test_sensible_keywords_without_knowledge_base(self, message, expected):
+        """测试没有知识库时（只有内置常用词）也不会选出跨词碎片"""
+        lexicon = KeywordLexicon.build([], builtin_terms(), [])
+        assert set(lexicon.extract(message)) == expected
+
+    def test_domain_terms_extracted(self, lexicon):
+        assert lexicon.extract('你们地址在哪，周末营业吗') == ['周末营业', '地址在哪']
+        keywords = lexicon.extract('退货运费谁出')
+        assert keywords[:2] == ['运费', '退货']
+
+    def test_rule_terms_boosted_and_no_overlap(self, lexicon):
+        keywords = lexicon.extract('这个产品多少钱啊，有没有优惠')
+        assert keywords[0] == '优惠'
+        assert '多少钱' in keywords
+        # 关键词之间不共用字符（不出现 "品多少" 这类跨词碎片）
+        for i, first in enumerate(keywords):
+            assert not any(set(first) & set(second) for second in keywords[i + 1:])
+
+    def test_single_chunk_terms_kept(self):
+        """测试只在一个分块中出现的词不被当作未出现过的词降权"""
+        chunks = ['本周直播课安排在周三晚上八点', '课程分为基础班和进阶班'] + CHUNKS
+        lexicon = KeywordLexicon.build([], PRESETS, chunks)
+        assert '直播课' not in lexicon.doc_freq
+        assert lexicon.document_frequency('直播课') == 1
+        assert lexicon.document_frequency('录播课') == 0
+        assert set(lexicon.extract('我想了解一下直播课的安排')) == {'直播课', '安排'}
+
+    def test_sub_millisecond(self, lexicon):
+        start = time.perf_counter()
+        for _ in range(1000):
+            lexicon.extract('请问这个产品多少钱，周末能送货到朝阳区吗')
+        assert (time.perf_counter() - start) / 1000 < 0.001
+
+
+def seed(db):
+    conn = db.get_connection()
+    conn.execute("INSERT INTO keyword_rules (prompt_id, keyword) VALUES (1, '优惠')")
+    for preset in PRESETS:
+        question, answer = preset.split(' ')
+        conn.execute("INSERT INTO preset_qa (prompt_id, question_pattern, answer) VALUES (1, ?, ?)", (question, answer))
+    for i, chunk in enumerate(CHUNKS):
+        conn.execute("INSERT INTO chunks (file_id, chunk_index, content) VALUES (1, ?, ?)", (i, chunk))
+    conn.commit()
+    conn.close()
+
+
+class TestLocalKeywordExtractor:
+    """从数据库构建词表，后台刷新"""
+
+    def test_refresh_from_database(self, tmp_path):
+        db = AIExpertDatabase(str(tmp_path / 'keywords.db'))
+        seed(db)
+        extractor = LocalKeywordExtractor(db)
+        extractor.refresh()
+        assert extractor.extract('有没有优惠')[0] == '优惠'
+        metrics = extractor.get_metrics()
+        assert metrics['refreshes'] == 1
+        assert metrics['documents'] == len(PRESETS) + len(builtin_terms()) + len(CHUNKS) + 1
+
+    def test_first_extract_waits_for_lexicon(self, tmp_path):
+        """测试未预热时首次提取同步构建一次词表，而不是用空词表打分"""
+        extractor = LocalKeywordExtractor(AIExpertDatabase(str(tmp_path / 'keywords.db')))
+        assert set(extractor.extract('这个课程多少钱啊')) == {'课程', '多少钱'}
+        assert extractor.get_metrics()['refreshes'] == 1
+
+    def test_stale_lexicon_rebuilt_in_background(self, tmp_path):
+        db = AIExpertDatabase(str(tmp_path / 'keywords.db'))
+        extractor = LocalKeywordExtractor(db)
+        extractor.warm_up()
+        for _ in range(50):
+            if extractor.get_metrics()['refreshes']:
+                break
+            time.sleep(0.02)
+        builtin = extractor.get_metrics()['terms']
+        assert builtin > 0
+
+        seed(db)
+        extractor.mark_stale()
+        extractor.extract('多少钱')
+        for _ in range(50):
+            if extractor.get_metrics()['refreshes'] >= 2:
+                break
+            time.sleep(0.02)
+        assert extractor.get_metrics()['terms'] > builtin
+
+
+class RecordingAdapter(DeepSeekAdapter):
+    """不发网络请求，记录关键词提取调用"""
+
+    def __init__(self, cache):
+        super().__init__('test-key', llm_cache=cache)
+        self.keyword_calls = 0
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        if '关键词' in messages[0]['content']:
+            self.keyword_calls += 1
+            return {'success': True, 'content': '["价格"]', 'error': None, 'total_tokens': 0}
+        return {'success': True, 'content': '好的', 'error': None, 'total_tokens': 10}
+
+
+class TestGeneratorKeywords:
+    """生成器默认使用本地提取，AI_LLM_KEYWORDS=1 时调用 DeepSeek"""
+
+    @pytest.mark.parametrize('llm_keywords', ['0', '1'])
+    def test_keyword_source(self, tmp_path, monkeypatch, llm_keywords):
+        monkeypatch.setenv('AI_ASYNC_LLM', '0')
+        monkeypatch.setenv('AI_LLM_KEYWORDS', llm_keywords)
+        db = AIExpertDatabase(str(tmp_path / 'generator.db'))
+        adapter = RecordingAdapter(LLMCallCache(str(tmp_path / 'cache.db')))
+        generator = EnhancedReplyGenerator('test-key', db, deepseek_adapter=adapter)
+
+        prepared = generator._prepare_generation('s1', '这个多少钱', {'role_definition': '客服'}, 1,
+                                                 [{'role': 'user', 'content': '你好'}])
+        keywords = prepared['metadata']['context_info']['search_keywords']
+        if llm_keywords == '1':
+            assert adapter.keyword_calls == 1 and keywords == ['价格']
+        else:
+            assert adapter.keyword_calls == 0 and keywords
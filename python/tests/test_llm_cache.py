@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 辅助 LLM 调用缓存
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCallCache(str(tmp_path / 'cache.db'), memory_size=2, max_rows=3)
+
+
+class CountingAdapter(DeepSeekAdapter):
+    """不发网络请求、记录 chat 调用次数的 Adapter"""
+
+    def __init__(self, cache, reply):
+        super().__init__('test-key', llm_cache=cache)
+        self.reply = reply
+        self.chat_calls = 0
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        self.chat_calls += 1
+        return {'success': True, 'content': self.reply, 'error': None}
+
+
+class TestLLMCallCache:
+    """缓存读写测试"""
+
+    def test_memory_then_persistent_hit(self, cache, tmp_path):
+        """测试内存命中，且新实例（模拟重启）从 SQLite 命中"""
+        cache.put('extract_search_keywords', 'm', ['退货 流程'], ['退货'])
+        assert cache.get('extract_search_keywords', 'm', ['  退货   流程 ']) == ['退货']
+
+        restarted = LLMCallCache(str(tmp_path / 'cache.db'))
+        assert restarted.get('extract_search_keywords', 'm', ['退货 流程']) == ['退货']
+
+        assert cache.get_metrics()['functions']['extract_search_keywords']['memory_hits'] == 1
+        assert restarted.get_metrics()['functions']['extract_search_keywords']['db_hits'] == 1
+
+    def test_key_includes_function_and_model(self, cache):
+        """测试函数名与模型不同的调用互不命中"""
+        cache.put('extract_search_keywords', 'm1', ['价格'], ['价格'])
+        assert cache.get('extract_search_keywords', 'm2', ['价格']) is None
+        assert cache.get('check_similarity', 'm1', ['价格']) is None
+
+    def test_ttl_expiry(self, cache):
+        """测试过期条目不再命中"""
+        cache.put('check_similarity', 'm', ['a', 'b'], 0.9, ttl=0.05)
+        time.sleep(0.1)
+        assert cache.get('check_similarity', 'm', ['a', 'b']) is None
+        assert cache.get_metrics()['functions']['check_similarity']['misses'] == 1
+
+    def test_size_bounded_eviction(self, cache):
+        """测试内存 LRU 与 SQLite 容量上限"""
+        for i in range(5):
+            cache.put('f', 'm', [str(i)], i)
+        assert cache.get_metrics()['memory_entries'] == 2
+
+        cache.prune()
+        assert cache.get_metrics()['rows'] == 3
+        # 最早写入的条目被淘汰
+        assert cache.get('f', 'm', ['0']) is None
+        assert cache.get('f', 'm', ['4']) == 4
+
+
+class TestAdapterCaching:
+    """Adapter 辅助调用缓存测试"""
+
+    def test_repeat_keywords_skip_network(self, cache):
+        adapter = CountingAdapter(cache, '["退款", "运费"]')
+        assert adapter.extract_search_keywords("退款要运费吗") == ["退款", "运费"]
+        assert adapter.extract_search_keywords("退款要运费吗 ") == ["退款", "运费"]
+        assert adapter.chat_calls == 1
+
+    def test_similarity_is_order_independent(self, cache):
+        adapter = CountingAdapter(cache, "0.85")
+        assert adapter.check_similarity("怎么退货", "如何退货") == 0.85
+        assert adapter.check_similarity("如何退货", "怎么退货") == 0.85
+        assert adapter.chat_calls == 1
+
+    def test_unparsed_results_are_not_cached(self, cache):
+        """测试模型输出无法解析时不写入缓存"""
+        adapter = CountingAdapter(cache, "无法判断")
+        adapter.extract_search_keywords("随便问问")
+        adapter.extract_search_keywords("随便问问")
+        assert adapter.chat_calls == 2
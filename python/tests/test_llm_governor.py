@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 出站 LLM 流量调控
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.deepseek_adapter as sync_module
+from ai_expert.llm_governor import LLMGovernor, llm_lane, current_lane, parse_retry_after
+from ai_expert.async_runtime import AsyncRuntime
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.http_client import HTTPClient
+from ai_expert.constants import LLM_LANE_INTERACTIVE, LLM_LANE_BACKGROUND
+
+
+def acquire_in_thread(governor, lane, order):
+    def _run():
+        permit = governor.acquire(lane)
+        order.append(lane)
+        governor.release(permit)
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_queued(governor, lane, count=1):
+    deadline = time.time() + 2
+    while governor.get_metrics()['lanes'][lane]['queued'] < count:
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+class TestRetryAfter:
+    """Retry-After 解析测试"""
+
+    def test_seconds_and_http_date(self):
+        assert parse_retry_after('2') == 2.0
+        assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+    def test_invalid_and_capped(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after('稍后再试') is None
+        assert parse_retry_after('3600') == 60
+
+
+class TestLLMGovernor:
+    """AIMD 与优先级通道测试"""
+
+    def test_throttle_halves_limit_once_per_cooldown(self):
+        """测试同一波限流只收缩一次"""
+        governor = LLMGovernor(initial_limit=8)
+        for _ in range(3):
+            permit = governor.acquire()
+            permit.throttled()
+            governor.release(permit)
+        metrics = governor.get_metrics()
+        assert metrics['limit'] == 4
+        assert metrics['decreases'] == 1
+        assert metrics['lanes'][LLM_LANE_INTERACTIVE]['throttled'] == 3
+
+    def test_success_grows_limit_only_when_saturated(self):
+        """测试上限被用满时才增长"""
+        governor = LLMGovernor(initial_limit=2)
+        governor.release(governor.acquire())
+        assert governor.get_metrics()['increases'] == 0
+
+        permits = [governor.acquire() for _ in range(2)]
+        for permit in permits:
+            governor.release(permit)
+        assert governor.get_metrics()['increases'] == 1
+
+    def test_interactive_preempts_queued_background(self):
+        """测试名额释放时先发给交互通道，即使后台请求排队更早"""
+        governor = LLMGovernor(initial_limit=1)
+        held = governor.acquire()
+        order = []
+        background = acquire_in_thread(governor, LLM_LANE_BACKGROUND, order)
+        wait_queued(governor, LLM_LANE_BACKGROUND)
+        interactive = acquire_in_thread(governor, LLM_LANE_INTERACTIVE, order)
+        wait_queued(governor, LLM_LANE_INTERACTIVE)
+
+        governor.release(held)
+        background.join(2)
+        interactive.join(2)
+        assert order == [LLM_LANE_INTERACTIVE, LLM_LANE_BACKGROUND]
+
+    def test_background_share_leaves_headroom(self):
+        """测试后台通道占满份额后，交互请求仍可立即获得名额"""
+        governor = LLMGovernor(initial_limit=4, background_share=0.5)
+        held = [governor.acquire(LLM_LANE_BACKGROUND) for _ in range(2)]
+        order = []
+        waiting = acquire_in_thread(governor, LLM_LANE_BACKGROUND, order)
+        wait_queued(governor, LLM_LANE_BACKGROUND)
+
+        governor.release(governor.acquire(LLM_LANE_INTERACTIVE))
+        assert order == []
+        governor.release(held[0])
+        waiting.join(2)
+        assert order == [LLM_LANE_BACKGROUND]
+        governor.release(held[1])
+
+    def test_retry_after_pauses_all_lanes(self):
+        """测试 Retry-After 期间暂停发放名额，并计入排队耗时"""
+        governor = LLMGovernor(initial_limit=4)
+        permit = governor.acquire()
+        permit.throttled(0.2)
+        governor.release(permit)
+
+        start = time.time()
+        governor.release(governor.acquire())
+        assert time.time() - start >= 0.15
+        assert governor.get_metrics()['lanes'][LLM_LANE_INTERACTIVE]['max_wait_ms'] >= 150
+
+    def test_queue_timeout(self):
+        governor = LLMGovernor(initial_limit=1, queue_timeout=0.05)
+        held = governor.acquire()
+        with pytest.raises(TimeoutError):
+            governor.acquire()
+        governor.release(held)
+        assert governor.get_metrics()['lanes'][LLM_LANE_INTERACTIVE]['timeouts'] == 1
+
+    def test_lane_propagates_to_shared_loop(self):
+        """测试协程继承提交线程的通道，且在事件循环内排队不阻塞"""
+        governor = LLMGovernor(initial_limit=2)
+        runtime = AsyncRuntime(10)
+
+        async def _acquire():
+            async with governor.slot_async() as permit:
+                await asyncio.sleep(0.01)
+                return permit.lane, current_lane()
+
+        async def _many():
+            return await asyncio.gather(*[_acquire() for _ in range(5)])
+
+        with llm_lane(LLM_LANE_BACKGROUND):
+            results = runtime.run(_many())
+        assert results == [(LLM_LANE_BACKGROUND, LLM_LANE_BACKGROUND)] * 5
+        metrics = governor.get_metrics()
+        assert metrics['in_flight'] == 0
+        assert metrics['lanes'][LLM_LANE_BACKGROUND]['granted'] == 5
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """第一次请求返回 429 + Retry-After，之后正常返回"""
+
+    protocol_version = 'HTTP/1.1'
+    received = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).received += 1
+        if type(self).received == 1:
+            self._send(429, b'{}', {'Retry-After': '0.2'})
+            return
+        body = json.dumps({
+            'choices': [{'message': {'content': '好的'}}],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': 2, 'total_tokens': 7}
+        }).encode('utf-8')
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAdapterGovernance:
+    """Adapter 接入调控器测试"""
+
+    def test_retry_after_replaces_blind_backoff(self, monkeypatch):
+        """测试 429 时按 Retry-After 等待而不是指数退避，并收缩并发上限"""
+        monkeypatch.setattr(sync_module, 'RETRY_DELAY_BASE', 5)
+        ThrottlingHandler.received = 0
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        try:
+            governor = LLMGovernor(initial_limit=8)
+            adapter = DeepSeekAdapter('test-key', http_client=HTTPClient(), llm_governor=governor)
+            adapter.base_url = f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+
+            start = time.time()
+            result = adapter.chat([{'role': 'user', 'content': '你好'}])
+            elapsed = time.time() - start
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+        assert result['success'] and result['content'] == '好的'
+        assert 0.15 <= elapsed < 2
+        metrics = governor.get_metrics()
+        assert metrics['limit'] == 4
+        assert metrics['lanes'][LLM_LANE_INTERACTIVE]['throttled'] == 1
+        assert metrics['lanes'][LLM_LANE_INTERACTIVE]['granted'] == 2
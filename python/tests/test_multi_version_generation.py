@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 单次调用多版本生成
+"""
+
+import sys
+import os
+import json
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.database import AIExpertDatabase
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, parse_multi_version_reply, VERSION_TYPES
+
+
+class FakeAdapter:
+    """按调用顺序返回预设内容的假 Adapter，记录每次请求"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        self.calls.append({'messages': messages, 'response_format': response_format})
+        content = self.replies.pop(0)
+        prompt_tokens = len(messages[0]['content'])
+        return {
+            'success': True, 'content': content, 'error': None,
+            'prompt_tokens': prompt_tokens, 'completion_tokens': 10,
+            'total_tokens': prompt_tokens + 10, 'cost': 0.001
+        }
+
+
+@pytest.fixture
+def make_generator(tmp_path, monkeypatch):
+    monkeypatch.setenv('AI_ASYNC_LLM', '0')
+    db = AIExpertDatabase(str(tmp_path / 'gen.db'))
+
+    def _make(replies):
+        return EnhancedReplyGenerator('test-key', db, deepseek_adapter=FakeAdapter(replies))
+    return _make
+
+
+CONTEXT = [{'role': 'user', 'content': '这个多少钱？'}]
+ALL_VERSIONS = json.dumps({'aggressive': '现在下单立减', 'conservative': '您可以先了解', 'professional': '根据参数对比'},
+                          ensure_ascii=False)
+
+
+class TestParseMultiVersionReply:
+    """多版本 JSON 解析测试"""
+
+    def test_plain_json(self):
+        assert parse_multi_version_reply(ALL_VERSIONS, VERSION_TYPES)['conservative'] == '您可以先了解'
+
+    def test_code_fence_and_surrounding_text(self):
+        """测试容忍代码块与 JSON 前后的说明文字"""
+        content = f"好的，以下是回复：\n```json\n{ALL_VERSIONS}\n```"
+        assert set(parse_multi_version_reply(content, VERSION_TYPES)) == set(VERSION_TYPES)
+
+    def test_raw_newline_inside_string(self):
+        """测试字符串中的裸换行"""
+        content = '{"aggressive": "第一行\n第二行", "conservative": "b", "professional": "c"}'
+        assert parse_multi_version_reply(content, VERSION_TYPES)['aggressive'] == "第一行\n第二行"
+
+    def test_invalid_and_partial(self):
+        """测试无效 JSON 返回空，缺失 / 空值的版本被剔除"""
+        assert parse_multi_version_reply('不是 JSON', VERSION_TYPES) == {}
+        partial = parse_multi_version_reply('{"aggressive": "a", "conservative": "  ", "professional": 1}', VERSION_TYPES)
+        assert partial == {'aggressive': 'a'}
+
+
+class TestGenerationModes:
+    """生成模式测试"""
+
+    def test_single_call_generates_all_versions(self, make_generator):
+        """测试 single 模式一次调用得到全部版本，且只发送一次 System Prompt"""
+        generator = make_generator([ALL_VERSIONS])
+        outcome = generator._generate_versions('系统提示' * 200, CONTEXT, VERSION_TYPES, mode='single')
+
+        assert outcome['llm_calls'] == 1
+        assert outcome['versions']['professional'] == '根据参数对比'
+        assert generator.deepseek.calls[0]['response_format'] == {'type': 'json_object'}
+        assert outcome['completion_tokens'] == 10
+
+    def test_single_call_saves_prompt_tokens(self, make_generator):
+        """测试 single 模式的 prompt token 约为 per_style 的三分之一"""
+        system_prompt = '系统提示' * 1000  # 真实的 System Prompt 为数 KB
+        single = make_generator([ALL_VERSIONS])._generate_versions(system_prompt, CONTEXT, VERSION_TYPES, mode='single')
+        per_style = make_generator(['a', 'b', 'c'])._generate_versions(system_prompt, CONTEXT, VERSION_TYPES, mode='per_style')
+
+        assert per_style['llm_calls'] == 3
+        assert single['prompt_tokens'] < per_style['prompt_tokens'] / 2.5
+
+    def test_parse_failure_falls_back_per_style(self, make_generator):
+        """测试 JSON 解析失败时逐版本补生成，且 token 统计包含全部调用"""
+        generator = make_generator(['抱歉我无法输出 JSON', 'a', 'b', 'c'])
+        outcome = generator._generate_versions('系统提示', CONTEXT, VERSION_TYPES, mode='single')
+
+        assert outcome['llm_calls'] == 4
+        assert outcome['fallback_versions'] == VERSION_TYPES
+        assert sorted(outcome['versions'].values()) == ['a', 'b', 'c']
+        assert outcome['completion_tokens'] == 40
+
+    def test_partial_result_only_regenerates_missing(self, make_generator):
+        """测试只补生成缺失的版本"""
+        generator = make_generator(['{"aggressive": "A", "professional": "P"}', 'C'])
+        outcome = generator._generate_versions('系统提示', CONTEXT, VERSION_TYPES, mode='single')
+
+        assert outcome['llm_calls'] == 2
+        assert outcome['versions'] == {'aggressive': 'A', 'professional': 'P', 'conservative': 'C'}
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - OCR 识别服务
+"""
+
+import sys
+import os
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from ai_expert.database import AIExpertDatabase
+from ai_expert.ocr_service import OCRService, prepare_tiles, read_image
+
+
+class FakeReader:
+    """记录调用次数的假识别器：每个分块返回一行位于块中部的文字"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tile_shapes = []
+
+    def readtext(self, image, detail=1):
+        self.calls += 1
+        self.tile_shapes.append(image.shape)
+        height = image.shape[0]
+        return [([[0, height / 2 - 5], [10, height / 2 - 5], [10, height / 2 + 5], [0, height / 2 + 5]],
+                 f"line-{self.calls}", 0.9)]
+
+
+def make_price_list(path, prices, size=(1080, 2000)):
+    """生成只有价格数字不同的文字截图"""
+    from PIL import ImageDraw
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for i, price in enumerate(prices):
+        draw.text((80, 120 + i * 120), f"Item {i + 1}    price {price}", fill='black')
+    image.save(path, 'PNG')
+
+
+def make_image(path, size=(400, 300), fmt='PNG'):
+    """生成带有明暗块的测试图片"""
+    rng = np.random.default_rng(7)
+    blocks = rng.integers(0, 255, size=(6, 8), dtype=np.uint8)
+    image = Image.fromarray(blocks).resize(size, Image.NEAREST).convert('RGB')
+    image.save(path, fmt)
+    return image
+
+
+@pytest.fixture
+def service(tmp_path):
+    db = AIExpertDatabase(str(tmp_path / 'ocr.db'))
+    svc = OCRService(db, max_width=800, tile_height=600)
+    svc._reader = FakeReader()
+    return svc
+
+
+class TestImagePreprocessing:
+    """缩放与分块测试"""
+
+    def test_downscale_and_tile_ownership(self):
+        """测试宽图缩小、长图分块，且各块负责区间无缝覆盖整张图"""
+        image = Image.new('RGB', (2000, 5000), 'white')
+        tiles = prepare_tiles(image, max_width=1000, tile_height=1000, tile_overlap=100)
+
+        assert all(tile.shape[1] == 1000 for tile, _, _ in tiles)
+        assert all(tile.shape[0] <= 1000 for tile, _, _ in tiles)
+
+        # 把各块负责区间映射回整图坐标，应首尾相接覆盖 0..2500
+        covered = []
+        top = 0
+        for tile, own_top, own_bottom in tiles:
+            covered.append((top + own_top, top + own_bottom))
+            top += 1000 - 100
+        assert covered[0][0] == 0
+        assert covered[-1][1] == 2500
+        assert all(a[1] == b[0] for a, b in zip(covered, covered[1:]))
+
+    def test_small_image_is_untouched(self):
+        """测试小图不缩放、不分块"""
+        tiles = prepare_tiles(Image.new('RGB', (300, 200)), max_width=1600, tile_height=1600)
+        assert len(tiles) == 1
+        assert tiles[0][0].shape[:2] == (200, 300)
+
+    def test_read_image_tiles_long_screenshot(self, tmp_path):
+        """测试长截图分块识别"""
+        path = tmp_path / 'long.png'
+        Image.new('RGB', (500, 2500), 'white').save(path)
+        reader = FakeReader()
+
+        lines = read_image(reader, str(path), max_width=1000, tile_height=1000)
+        assert reader.calls == 3
+        assert lines == ['line-1', 'line-2', 'line-3']
+
+
+class TestOCRServiceCache:
+    """识别结果缓存测试"""
+
+    def test_exact_hit(self, service, tmp_path):
+        """测试同一文件第二次直接命中缓存"""
+        path = tmp_path / 'product.png'
+        make_image(path)
+
+        first = service.recognize(str(path))
+        second = service.recognize(str(path))
+
+        assert first == second
+        assert service._reader.calls == 1
+        assert service.get_status()['exact_hits'] == 1
+
+    def test_price_lists_differing_only_in_numbers_are_recognized_separately(self, service, tmp_path):
+        """测试只有数字不同的两张价目表截图各自识别，不复用对方的结果"""
+        make_price_list(tmp_path / 'prices_a.png', [199, 299, 399, 499])
+        make_price_list(tmp_path / 'prices_b.png', [188, 288, 388, 488])
+
+        first = service.recognize(str(tmp_path / 'prices_a.png'))
+        calls = service._reader.calls
+        second = service.recognize(str(tmp_path / 'prices_b.png'))
+
+        assert service._reader.calls == calls * 2
+        assert first != second
+        assert service.get_status()['exact_hits'] == 0
+
+    def test_resized_upload_is_recognized_again(self, service, tmp_path):
+        """测试缩放后重新上传的图片内容不同，重新识别"""
+        original = make_image(tmp_path / 'product.png')
+        service.recognize(str(tmp_path / 'product.png'))
+
+        original.resize((200, 150), Image.BILINEAR).save(tmp_path / 'product_small.jpg', 'JPEG', quality=85)
+        service.recognize(str(tmp_path / 'product_small.jpg'))
+        assert service._reader.calls == 2
+
+    def test_different_image_misses(self, service, tmp_path):
+        """测试不同图片不会误命中"""
+        make_image(tmp_path / 'a.png')
+        Image.new('RGB', (400, 300), 'white').save(tmp_path / 'b.png')
+
+        service.recognize(str(tmp_path / 'a.png'))
+        service.recognize(str(tmp_path / 'b.png'))
+        assert service._reader.calls == 2
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 生成前准备阶段的 DAG 并发执行
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.pipeline import Stage, StagePipeline, StageTimeoutError
+from ai_expert.deadline import Deadline, deadline_scope, current_deadline
+from ai_expert.database import AIExpertDatabase
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator
+
+
+def sleeper(seconds, value=None):
+    def _run(**kwargs):
+        time.sleep(seconds)
+        return value
+    return _run
+
+
+class TestStagePipeline:
+    """调度、超时与可选阶段"""
+
+    def test_independent_stages_run_concurrently(self):
+        pipeline = StagePipeline([
+            Stage('a', sleeper(0.2, 1)),
+            Stage('b', sleeper(0.2, 2)),
+            Stage('c', sleeper(0.2, 3)),
+            Stage('sum', lambda a, b, c: a + b + c, deps=['a', 'b', 'c'], inline=True),
+        ])
+        start = time.time()
+        results = pipeline.run()
+        assert results['sum'] == 6
+        assert time.time() - start < 0.4
+        assert set(pipeline.timings) == {'a', 'b', 'c', 'sum'}
+
+    def test_sequential_mode_matches(self):
+        order = []
+        stages = [
+            Stage('a', lambda: order.append('a') or 1),
+            Stage('b', lambda a: order.append('b') or a + 1, deps=['a']),
+        ]
+        assert StagePipeline(stages, concurrent=False).run() == {'a': 1, 'b': 2}
+        assert order == ['a', 'b']
+
+    def test_optional_stage_timeout_uses_default(self):
+        pipeline = StagePipeline([
+            Stage('slow', sleeper(1.0, 'late'), timeout=0.1, optional=True, default='default'),
+            Stage('after', lambda slow: slow, deps=['slow']),
+        ])
+        start = time.time()
+        assert pipeline.run()['after'] == 'default'
+        assert time.time() - start < 0.5
+        assert pipeline.skipped == {'slow': 'timeout'}
+
+    def test_required_stage_failures_raise(self):
+        with pytest.raises(StageTimeoutError):
+            StagePipeline([Stage('slow', sleeper(1.0), timeout=0.1)]).run()
+
+        def boom():
+            raise RuntimeError('boom')
+        with pytest.raises(RuntimeError):
+            StagePipeline([Stage('boom', boom)]).run()
+
+        pipeline = StagePipeline([Stage('boom', boom, optional=True, default=[])])
+        assert pipeline.run() == {'boom': []}
+        assert pipeline.skipped == {'boom': 'error'}
+
+    def test_condition_skips_stage(self):
+        called = []
+        pipeline = StagePipeline([
+            Stage('search', lambda: called.append(1), optional=True, default=[], condition=lambda: False),
+        ])
+        assert pipeline.run() == {'search': []}
+        assert called == [] and pipeline.skipped == {'search': 'condition'}
+
+    def test_invalid_graphs_rejected(self):
+        with pytest.raises(ValueError):
+            StagePipeline([Stage('a', lambda b: b, deps=['b']), Stage('b', lambda a: a, deps=['a'])])
+        with pytest.raises(ValueError):
+            StagePipeline([Stage('a', lambda missing: missing, deps=['missing'])])
+
+    def test_deadline_propagates_and_caps_timeout(self):
+        with deadline_scope(Deadline(0.2)):
+            pipeline = StagePipeline([
+                Stage('seen', lambda: current_deadline() is not None),
+                Stage('slow', sleeper(1.0), timeout=5, optional=True),
+            ])
+            start = time.time()
+            results = pipeline.run()
+        assert results['seen'] is True
+        assert pipeline.skipped == {'slow': 'timeout'}
+        assert time.time() - start < 0.6
+
+
+class SlowHelperAdapter(DeepSeekAdapter):
+    """关键词提取耗时 0.3 秒，不发网络请求"""
+
+    def __init__(self, cache):
+        super().__init__('test-key', llm_cache=cache)
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        time.sleep(0.3)
+        return {'success': True, 'content': '["价格"]', 'error': None, 'total_tokens': 0}
+
+
+class TestPreparationStages:
+    """生成前准备：互不依赖的阶段并行"""
+
+    @pytest.mark.parametrize('concurrent', ['1', '0'])
+    def test_preset_overlaps_context_selection(self, tmp_path, monkeypatch, concurrent):
+        monkeypatch.setenv('AI_STAGE_PIPELINE', concurrent)
+        # 上下文选择阶段的耗时来自 LLM 关键词提取
+        monkeypatch.setenv('AI_LLM_KEYWORDS', '1')
+        db = AIExpertDatabase(str(tmp_path / 'pipeline.db'))
+        generator = EnhancedReplyGenerator('test-key', db, deepseek_adapter=SlowHelperAdapter(
+            LLMCallCache(str(tmp_path / 'cache.db'))))
+
+        def slow_preset(**kwargs):
+            time.sleep(0.3)
+            return '标准版 99 元'
+        monkeypatch.setattr(db, 'match_preset_answer', slow_preset)
+
+        start = time.time()
+        prepared = generator._prepare_generation('s1', '这个多少钱', {'role_definition': '客服'}, 1,
+                                                 [{'role': 'user', 'content': '你好'}])
+        elapsed = time.time() - start
+
+        assert '[官方标准回答] 标准版 99 元' in prepared['full_context'][-2]['content']
+        assert prepared['fallback']['source'] == 'preset'
+        assert set(prepared['metadata']['pipeline']['timings_ms']) >= {'context', 'preset', 'intent', 'stage'}
+        if concurrent == '1':
+            assert elapsed < 0.55
+        else:
+            assert elapsed >= 0.6
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 后台预生成结果复用
+"""
+
+import sys
+import os
+import time
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.pregeneration as pregeneration
+from ai_expert.pregeneration import PregenerationRegistry
+from ai_expert.deadline import Deadline
+from ai_expert.database import AIExpertDatabase
+from ai_expert.message_queue_manager import MessageQueueManager
+from ai_expert.background_processor import BackgroundProcessor
+
+
+def make_result(text='好的'):
+    return {'success': True, 'aggressive': text, 'conservative': text, 'professional': text,
+            'suggestion_id': 1, 'tokens_used': 30}
+
+
+class TestPregenerationRegistry:
+    """完成、进行中与过期的预生成结果"""
+
+    def test_ready_result_taken_once(self):
+        registry = PregenerationRegistry()
+        registry.complete(registry.begin('s1', 1, '多少钱'), make_result())
+        assert registry.take('s1', 1, ' 多少钱 ')['aggressive'] == '好的'
+        assert registry.take('s1', 1, '多少钱') is None
+        assert registry.get_metrics()['hits_ready'] == 1
+
+    def test_key_includes_prompt_and_session(self):
+        registry = PregenerationRegistry()
+        registry.complete(registry.begin('s1', 1, '多少钱'), make_result())
+        assert registry.take('s1', 2, '多少钱') is None
+        assert registry.take('s2', 1, '多少钱') is None
+
+    def test_waits_for_inflight_result(self):
+        registry = PregenerationRegistry()
+        pending = registry.begin('s1', 1, '多少钱')
+        threading.Timer(0.1, registry.complete, args=(pending, make_result('后台'))).start()
+        start = time.time()
+        assert registry.take('s1', 1, '多少钱')['aggressive'] == '后台'
+        assert time.time() - start < 1
+        assert registry.get_metrics()['hits_inflight'] == 1
+
+    def test_failed_or_expired_result_not_reused(self):
+        registry = PregenerationRegistry(ttl=0.05)
+        registry.complete(registry.begin('s1', 1, 'a'), {'success': False, 'error': 'boom'})
+        assert registry.take('s1', 1, 'a') is None
+
+        registry.complete(registry.begin('s1', 1, 'b'), make_result())
+        time.sleep(0.1)
+        assert registry.take('s1', 1, 'b') is None
+
+    def test_wait_bounded_by_deadline(self, monkeypatch):
+        monkeypatch.setattr(pregeneration, 'DEADLINE_GENERATION_RESERVE', 0.1)
+        registry = PregenerationRegistry()
+        registry.begin('s1', 1, '多少钱')
+        start = time.time()
+        assert registry.take('s1', 1, '多少钱', deadline=Deadline(0.3)) is None
+        assert time.time() - start < 0.5
+        assert registry.get_metrics()['wait_timeouts'] == 1
+
+
+class FakeGenerator:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_three_versions(self, **kwargs):
+        self.calls += 1
+        return make_result('预生成')
+
+
+class TestBackgroundProcessor:
+    """后台处理器登记结果并跳过已被领取的任务"""
+
+    @pytest.fixture
+    def setup(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(pregeneration, '_registry', PregenerationRegistry())
+        db = AIExpertDatabase(str(tmp_path / 'queue.db'))
+        queue = MessageQueueManager(db)
+        generator = FakeGenerator()
+        processor = BackgroundProcessor(db, queue, generator)
+        active_prompt = {'id': 1, 'updated_at': 'v1', 'role_definition': '客服'}
+        return queue, generator, processor, active_prompt
+
+    def test_result_shared_with_interactive(self, setup):
+        queue, generator, processor, active_prompt = setup
+        task_id = queue.enqueue_message('s1', '张三', '多少钱')
+        processor._process_single_task(queue.get_task_by_id(task_id), active_prompt)
+
+        assert queue.get_task_by_id(task_id)['status'] == 'COMPLETED'
+        result = pregeneration.get_pregeneration_registry().take('s1', 1, '多少钱')
+        assert result['aggressive'] == '预生成' and generator.calls == 1
+
+    def test_claimed_task_skipped(self, setup):
+        queue, generator, processor, active_prompt = setup
+        task_id = queue.enqueue_message('s1', '张三', '多少钱')
+        assert queue.get_pending_task('s1', '多少钱')['id'] == task_id
+        assert queue.claim_task(task_id) is True
+        assert queue.claim_task(task_id) is False
+
+        processor._process_single_task(queue.get_task_by_id(task_id), active_prompt)
+        assert generator.calls == 0
+        assert queue.get_pending_task('s1', '多少钱') is None
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 上下文缓存友好的 Prompt 布局与缓存命中统计
+"""
+
+import sys
+import os
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.database import AIExpertDatabase
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.cost_calculator import calculate_deepseek_cost
+from ai_expert.deepseek_adapter import DeepSeekAdapter, parse_chat_response
+from ai_expert.enhanced_prompt_builder import EnhancedPromptBuilder
+from ai_expert.intent_recognizer import CustomerIntent, ObjectionType
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, VERSION_TYPES
+
+
+CONFIG = {
+    'role_definition': '你是一名电商客服',
+    'business_logic': '促成下单',
+    'knowledge_base': [{'name': '价格', 'details': '标准版 99 元'}],
+    'forbidden_words': ['保证有效'],
+}
+
+
+class FakeAdapter(DeepSeekAdapter):
+    """不发网络请求：记录生成请求的消息，返回带缓存命中字段的结果"""
+
+    def __init__(self, cache):
+        super().__init__('test-key', llm_cache=cache)
+        self.calls = []
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        if '关键词' in messages[0]['content']:
+            return {'success': True, 'content': '["价格"]', 'error': None, 'total_tokens': 0}
+        self.calls.append(messages)
+        return {
+            'success': True, 'content': '好的', 'error': None,
+            'prompt_tokens': 100, 'completion_tokens': 10, 'total_tokens': 110,
+            'prompt_cache_hit_tokens': 64, 'prompt_cache_miss_tokens': 36, 'cost': 0.0001
+        }
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    monkeypatch.setenv('AI_ASYNC_LLM', '0')
+    monkeypatch.setenv('AI_GENERATION_MODE', 'per_style')
+    db = AIExpertDatabase(str(tmp_path / 'layout.db'))
+    cache = LLMCallCache(str(tmp_path / 'cache.db'))
+    return EnhancedReplyGenerator('test-key', db, deepseek_adapter=FakeAdapter(cache))
+
+
+def generate(generator, session_id, message, history):
+    return generator.generate_three_versions(
+        session_id=session_id,
+        customer_message=message,
+        system_prompt_config=dict(CONFIG),
+        prompt_id=1,
+        conversation_history=history
+    )
+
+
+class TestPromptLayout:
+    """稳定部分在前、本轮内容在后"""
+
+    def test_stable_prompt_excludes_turn_content(self):
+        builder = EnhancedPromptBuilder()
+        stable = builder.build_stable_prompt(CONFIG)
+        turn = builder.build_turn_prompt(
+            customer_memory={'stage': 'hot'},
+            customer_intent=CustomerIntent.OBJECTION,
+            objection_type=ObjectionType.PRICE,
+            retrieved_knowledge=['[官方标准回答] 99 元包邮']
+        )
+        assert '标准版 99 元' in stable and '保证有效' in stable
+        assert '客户意图' not in stable and '99 元包邮' not in stable
+        assert '价格异议' in turn and '99 元包邮' in turn
+
+        full = builder.build_system_prompt(CONFIG, customer_intent=CustomerIntent.OBJECTION,
+                                           objection_type=ObjectionType.PRICE)
+        assert full.startswith(stable)
+
+    def test_versions_share_prefix(self, generator):
+        """测试各版本请求只有最后的本轮情境 + 版本要求不同"""
+        history = [{'role': 'user', 'content': '你好'}, {'role': 'assistant', 'content': '您好，请问需要什么？'}]
+        generate(generator, 's1', '太贵了', history)
+
+        calls = generator.deepseek.calls
+        assert len(calls) == len(VERSION_TYPES)
+        prefixes = {repr(messages[:-2]) for messages in calls}
+        assert len(prefixes) == 1
+        assert all(messages[-1] == {'role': 'user', 'content': '太贵了'} for messages in calls)
+        assert all('版本要求' in messages[-2]['content'] and messages[-2]['role'] == 'system' for messages in calls)
+        assert all('版本要求' not in messages[0]['content'] for messages in calls)
+
+    def test_next_turn_extends_previous_prefix(self, generator):
+        """测试同一会话的下一轮请求：System Prompt 与历史逐字节一致，只在末尾追加"""
+        history = [{'role': 'user', 'content': '你好'}, {'role': 'assistant', 'content': '您好，请问需要什么？'}]
+        generate(generator, 's1', '有优惠吗', history)
+        first = generator.deepseek.calls[0]
+
+        history += [{'role': 'user', 'content': '有优惠吗'}, {'role': 'assistant', 'content': '现在有满减活动'}]
+        generate(generator, 's1', '那我买两件', history)
+        second = generator.deepseek.calls[len(VERSION_TYPES)]
+
+        assert second[0] == first[0]
+        assert second[1:3] == first[1:3]
+
+    def test_retrieved_knowledge_not_merged_into_config(self, generator):
+        config = dict(CONFIG)
+        generator.db.match_preset_answer = lambda **kwargs: '99 元包邮'
+        generator.generate_three_versions(session_id='s2', customer_message='多少钱', system_prompt_config=config,
+                                          prompt_id=1, conversation_history=[])
+        messages = generator.deepseek.calls[0]
+        assert config['knowledge_base'] == CONFIG['knowledge_base']
+        assert '99 元包邮' not in messages[0]['content']
+        assert '99 元包邮' in messages[-2]['content']
+
+
+class TestCacheAccounting:
+    """缓存命中 token 的解析、计费与统计"""
+
+    def test_usage_parsing_and_cost(self):
+        result = parse_chat_response({
+            'choices': [{'message': {'content': 'hi'}}],
+            'usage': {'prompt_tokens': 1000, 'completion_tokens': 100, 'total_tokens': 1100,
+                      'prompt_cache_hit_tokens': 800, 'prompt_cache_miss_tokens': 200}
+        }, 0.1)
+        assert result['prompt_cache_hit_tokens'] == 800
+        assert result['prompt_cache_miss_tokens'] == 200
+        assert result['cost'] == calculate_deepseek_cost(1000, 100, 800)
+        assert calculate_deepseek_cost(1000, 100, 800) < calculate_deepseek_cost(1000, 100)
+
+        without_cache_fields = parse_chat_response({
+            'choices': [{'message': {'content': 'hi'}}],
+            'usage': {'prompt_tokens': 50, 'completion_tokens': 5, 'total_tokens': 55}
+        }, 0.1)
+        assert without_cache_fields['prompt_cache_hit_tokens'] == 0
+        assert without_cache_fields['prompt_cache_miss_tokens'] == 50
+
+    def test_generation_logs_cache_usage(self, generator):
+        result = generate(generator, 's3', '多少钱', [])
+        assert result['prompt_cache_hit_tokens'] == 64 * len(VERSION_TYPES)
+
+        stats = generator.db.get_usage_stats('all')
+        assert stats['requests'] == 1
+        assert stats['prompt_cache_hit_tokens'] == 64 * len(VERSION_TYPES)
+        assert stats['prompt_cache_miss_tokens'] == 36 * len(VERSION_TYPES)
+        assert stats['cache_hit_rate'] == 64.0
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 向量索引后台重建
+"""
+
+import sys
+import os
+import json
+import hashlib
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+
+from ai_expert.knowledge_base_manager import KnowledgeBaseManager, _ActiveIndex
+from ai_expert.constants import EMBEDDING_MODEL_NAME
+
+NEW_MODEL = 'fake-model-v2'
+
+
+class FakeModel:
+    """按文本哈希生成确定向量的假模型；设置 gate 后编码会阻塞到 gate 打开"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.gate = None
+
+    def encode(self, texts):
+        if self.gate is not None:
+            self.gate.wait()
+        rows = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+            rows.append(np.random.default_rng(seed).normal(size=self.dim))
+        return np.array(rows, dtype=np.float32)
+
+
+def make_kb(tmp_path, models):
+    kb = KnowledgeBaseManager(
+        db_path=str(tmp_path / 'kb.db'),
+        vector_db_path=str(tmp_path / 'vectors'),
+        use_worker=False
+    )
+    kb.models.update(models)
+    return kb
+
+
+def write_doc(tmp_path, name, sentences):
+    path = tmp_path / name
+    path.write_text("\n\n".join(sentences), encoding='utf-8')
+    return str(path)
+
+
+class TestReEmbedJob:
+    """重建任务测试"""
+
+    def test_reembed_switches_model_atomically(self, tmp_path):
+        """测试重建完成后切换到新模型，且重启后仍生效"""
+        kb = make_kb(tmp_path, {EMBEDDING_MODEL_NAME: FakeModel(4), NEW_MODEL: FakeModel(6)})
+        assert kb.add_document(write_doc(tmp_path, 'a.txt', ["退货政策说明" * 60, "会员积分规则" * 60]))
+        assert kb.vector_store.metadata[0]['embedding_model'] == EMBEDDING_MODEL_NAME
+
+        kb.start_reembed(NEW_MODEL, batch_size=1, pause_seconds=0)
+        kb.reembed_job.join(10)
+
+        status = kb.get_reembed_status()
+        assert status['active_model'] == NEW_MODEL
+        assert status['job']['status'] == 'completed'
+        assert status['job']['processed'] == 2
+        assert kb.vector_store.vectors.shape[1] == 6
+        assert all(m['embedding_model'] == NEW_MODEL for m in kb.vector_store.metadata)
+
+        results = kb.search("退货政策说明" * 60, threshold=0.99)
+        assert results and results[0]['content'].startswith("退货政策说明")
+
+        manifest = json.loads((tmp_path / 'vectors' / 'manifest.json').read_text(encoding='utf-8'))
+        assert manifest['active_model'] == NEW_MODEL
+        assert manifest['previous_model'] == EMBEDDING_MODEL_NAME
+
+        reloaded = make_kb(tmp_path, {NEW_MODEL: FakeModel(6)})
+        assert reloaded.model_name == NEW_MODEL
+        assert reloaded.vector_store.vectors.shape == (2, 6)
+
+    def test_writes_during_reembed_are_caught_up(self, tmp_path):
+        """测试重建期间新增与删除的文档在切换后保持一致，且旧索引持续可检索"""
+        new_model = FakeModel(6)
+        new_model.gate = threading.Event()
+        kb = make_kb(tmp_path, {EMBEDDING_MODEL_NAME: FakeModel(4), NEW_MODEL: new_model})
+        kb.add_document(write_doc(tmp_path, 'keep.txt', ["保留的文档" * 30]))
+        kb.add_document(write_doc(tmp_path, 'drop.txt', ["将被删除的文档" * 30]))
+
+        kb.start_reembed(NEW_MODEL, batch_size=1, pause_seconds=0)
+
+        # 重建进行中：旧索引照常服务，新上传的文档写入旧索引
+        assert kb.model_name == EMBEDDING_MODEL_NAME
+        assert kb.search("保留的文档" * 30, threshold=0.99)
+        kb.add_document(write_doc(tmp_path, 'new.txt', ["重建期间上传" * 30]))
+        drop_id = next(f['id'] for f in kb.get_file_list() if f['file_name'] == 'drop.txt')
+        kb.delete_file(drop_id)
+
+        new_model.gate.set()
+        kb.reembed_job.join(10)
+
+        assert kb.model_name == NEW_MODEL
+        sources = sorted(m['source'] for m in kb.vector_store.metadata)
+        assert sources == ['keep.txt', 'new.txt']
+
+    def test_failed_reencode_after_model_switch_leaves_no_file(self, tmp_path, monkeypatch):
+        """测试上传期间切换模型、按新模型重新编码失败时返回 False，且不留下没有分块的文件记录"""
+        kb = make_kb(tmp_path, {EMBEDDING_MODEL_NAME: FakeModel(4), NEW_MODEL: FakeModel(6)})
+        encode = kb._encode
+
+        def switching_encode(texts, model_name=None):
+            if model_name == NEW_MODEL:
+                raise RuntimeError("worker died")
+            vectors = encode(texts, model_name)
+            kb._active = _ActiveIndex(NEW_MODEL, kb._active.store)
+            return vectors
+
+        monkeypatch.setattr(kb, '_encode', switching_encode)
+        assert kb.add_document(write_doc(tmp_path, 'a.txt', ["上传中途切换模型" * 30])) is False
+        assert kb.get_file_list() == []
+
+        def failing_encode(texts, model_name=None):
+            raise RuntimeError("out of memory")
+
+        monkeypatch.setattr(kb, '_encode', failing_encode)
+        assert kb.add_document(write_doc(tmp_path, 'b.txt', ["编码失败" * 30])) is False
+        assert kb.get_file_list() == []
+
+    def test_cancel_keeps_old_index(self, tmp_path):
+        """测试取消重建后旧索引不受影响"""
+        new_model = FakeModel(6)
+        new_model.gate = threading.Event()
+        kb = make_kb(tmp_path, {EMBEDDING_MODEL_NAME: FakeModel(4), NEW_MODEL: new_model})
+        kb.add_document(write_doc(tmp_path, 'a.txt', ["段落" * 100, "另一段" * 100]))
+
+        kb.start_reembed(NEW_MODEL, batch_size=1, pause_seconds=0)
+        assert kb.cancel_reembed()
+        new_model.gate.set()
+        kb.reembed_job.join(10)
+
+        assert kb.reembed_job.status == 'cancelled'
+        assert kb.model_name == EMBEDDING_MODEL_NAME
+        assert kb.vector_store.vectors.shape[1] == 4
+
+    def test_reject_reembed_to_active_model(self, tmp_path):
+        """测试不能重建到当前生效的模型"""
+        kb = make_kb(tmp_path, {EMBEDDING_MODEL_NAME: FakeModel(4)})
+        with pytest.raises(ValueError):
+            kb.start_reembed(EMBEDDING_MODEL_NAME)
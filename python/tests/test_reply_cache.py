@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 重复问题的回复缓存
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.reply_cache import ReplyCache, memory_profile, conversation_topic
+from ai_expert.database import AIExpertDatabase
+from ai_expert.llm_cache import LLMCallCache
+from ai_expert.deepseek_adapter import DeepSeekAdapter
+from ai_expert.enhanced_reply_generator import EnhancedReplyGenerator, VERSION_TYPES
+
+VERSIONS = {v_type: f'{v_type} 回复' for v_type in VERSION_TYPES}
+
+# 语义层用的假向量：同义问法映射到相近的向量
+EMBEDDINGS = {
+    '多少钱': [1.0, 0.0, 0.0],
+    '价格多少': [0.99, 0.1, 0.0],
+    '地址在哪': [0.0, 1.0, 0.0],
+}
+
+
+def fake_embed(text):
+    return EMBEDDINGS.get(text)
+
+
+class TestReplyCache:
+    """精确层、语义层、TTL 与失效"""
+
+    def test_exact_tier(self):
+        cache = ReplyCache()
+        probe = cache.probe(1, ' 多少钱 ', 'price_inquiry', 'greeting')
+        assert cache.get(probe) is None
+        cache.put(probe, VERSIONS)
+
+        hit = cache.get(cache.probe(1, '多少钱', 'price_inquiry', 'greeting'))
+        assert hit['tier'] == 'exact' and hit['versions'] == VERSIONS
+        # 专家、意图或阶段不同都不命中
+        assert cache.get(cache.probe(2, '多少钱', 'price_inquiry', 'greeting')) is None
+        assert cache.get(cache.probe(1, '多少钱', 'price_inquiry', 'closing')) is None
+        metrics = cache.get_metrics()
+        assert metrics['exact_hits'] == 1 and metrics['misses'] == 3 and metrics['hit_rate'] == 25.0
+
+    def test_customer_profile_is_part_of_key(self):
+        """测试客户画像不同的会话不共用回复"""
+        cold = memory_profile({'stage': 'cold', 'preferences': {}, 'provided_info': []})
+        sensitive = memory_profile({'stage': 'cold', 'preferences': {'price_sensitive': True}, 'provided_info': []})
+        informed = memory_profile({'stage': 'cold', 'preferences': {},
+                                   'provided_info': [{'info': '报价单', 'timestamp': 't'}]})
+        assert len({cold, sensitive, informed}) == 3
+        # 互动次数、最后意图不进入提示词，不影响画像
+        assert memory_profile({'stage': 'cold', 'interaction_count': 5, 'last_intent': 'inquiry'}) == cold
+
+        cache = ReplyCache()
+        cache.put(cache.probe(1, '多少钱', None, None, cold), VERSIONS)
+        assert cache.get(cache.probe(1, '多少钱', None, None, cold)) is not None
+        assert cache.get(cache.probe(1, '多少钱', None, None, sensitive)) is None
+        assert cache.get(cache.probe(1, '多少钱', None, None, informed)) is None
+
+    def test_conversation_topic_is_part_of_key(self):
+        """测试依赖上文的问题只在话题相同时共用回复，寒暄不形成话题"""
+        extract = lambda text: [w for w in ('羽绒服', '运动鞋') if w in text]
+        coat = conversation_topic([{'role': 'user', 'content': '羽绒服有黑色吗'},
+                                   {'role': 'assistant', 'content': '运动鞋也有'}], '这个多少钱', extract)
+        shoes = conversation_topic([{'message': '运动鞋有黑色吗', 'is_customer': 1},
+                                    {'message': '这个多少钱', 'is_customer': 1}], '这个多少钱', extract)
+        assert coat == ('羽绒服',) and shoes == ('运动鞋',)
+        assert conversation_topic([{'role': 'user', 'content': '你好'}], '这个多少钱', extract) == ()
+
+        cache = ReplyCache()
+        cache.put(cache.probe(1, '这个多少钱', None, None, (), coat), VERSIONS)
+        assert cache.get(cache.probe(1, '这个多少钱', None, None, (), coat)) is not None
+        assert cache.get(cache.probe(1, '这个多少钱', None, None, (), shoes)) is None
+
+    def test_long_messages_not_cached(self):
+        assert ReplyCache.probe(1, '我' * 200, None, None) is None
+        assert ReplyCache.probe(1, '   ', None, None) is None
+
+    def test_semantic_tier(self):
+        cache = ReplyCache()
+        probe = cache.probe(1, '多少钱', 'price_inquiry', 'greeting')
+        cache.get(probe, embed=fake_embed, threshold=0.9)
+        cache.put(probe, VERSIONS)
+
+        hit = cache.get(cache.probe(1, '价格多少', 'price_inquiry', 'greeting'), embed=fake_embed, threshold=0.9)
+        assert hit['tier'] == 'semantic' and hit['score'] >= 0.9
+        assert cache.get(cache.probe(1, '地址在哪', 'price_inquiry', 'greeting'), embed=fake_embed, threshold=0.9) is None
+        # 阈值为 0 时只用精确层
+        assert cache.get(cache.probe(1, '价格多少', 'price_inquiry', 'greeting'), embed=fake_embed, threshold=0) is None
+
+    def test_ttl_and_invalidation(self):
+        cache = ReplyCache(ttl=0.05)
+        cache.put(cache.probe(1, '多少钱', None, None), VERSIONS)
+        time.sleep(0.1)
+        assert cache.get(cache.probe(1, '多少钱', None, None)) is None
+
+        cache = ReplyCache()
+        cache.put(cache.probe(1, '多少钱', None, None), VERSIONS)
+        cache.put(cache.probe(2, '多少钱', None, None), VERSIONS)
+        cache.invalidate(1)
+        assert cache.get(cache.probe(1, '多少钱', None, None)) is None
+        assert cache.get(cache.probe(2, '多少钱', None, None)) is not None
+        cache.invalidate()
+        assert cache.get_metrics()['entries'] == 0
+
+    def test_knowledge_base_changes_invalidate(self):
+        class FakeKB:
+            def __init__(self):
+                self.listeners = []
+
+            def add_change_listener(self, callback):
+                self.listeners.append(callback)
+
+        cache, kb = ReplyCache(), FakeKB()
+        cache.watch_knowledge_base(kb)
+        cache.watch_knowledge_base(kb)
+        assert len(kb.listeners) == 1
+
+        cache.put(cache.probe(1, '多少钱', None, None), VERSIONS)
+        kb.listeners[0](None)
+        assert cache.get_metrics()['entries'] == 0
+
+
+class CountingAdapter(DeepSeekAdapter):
+    """不发网络请求，统计生成调用次数"""
+
+    def __init__(self, cache):
+        super().__init__('test-key', llm_cache=cache)
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.7, max_tokens=500, stream=False, response_format=None):
+        if '关键词' in messages[0]['content']:
+            return {'success': True, 'content': '["价格"]', 'error': None, 'total_tokens': 0}
+        self.calls += 1
+        return {'success': True, 'content': '标准版 99 元', 'error': None,
+                'prompt_tokens': 100, 'completion_tokens': 10, 'total_tokens': 110, 'cost': 0.0001}
+
+
+class TestGeneratorReplyCache:
+    """生成器在重复问题上直接使用缓存"""
+
+    @pytest.fixture
+    def setup(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('AI_ASYNC_LLM', '0')
+        monkeypatch.setenv('AI_GENERATION_MODE', 'per_style')
+        db = AIExpertDatabase(str(tmp_path / 'reply_cache.db'))
+        adapter = CountingAdapter(LLMCallCache(str(tmp_path / 'cache.db')))
+        return db, adapter, EnhancedReplyGenerator('test-key', db, deepseek_adapter=adapter)
+
+    @staticmethod
+    def generate(generator, session_id, history_message='你好'):
+        return generator.generate_three_versions(
+            session_id=session_id,
+            customer_message='这个多少钱',
+            system_prompt_config={'role_definition': '客服'},
+            prompt_id=1,
+            conversation_history=[{'role': 'user', 'content': history_message}]
+        )
+
+    def test_repeated_question_served_from_cache(self, setup):
+        """测试客户画像相同的会话重复提问时直接使用缓存"""
+        db, adapter, generator = setup
+        first = self.generate(generator, 's1')
+        calls = adapter.calls
+        assert first['success'] and calls == len(VERSION_TYPES)
+
+        second = self.generate(generator, 's2')
+        assert adapter.calls == calls
+        assert second['generation_mode'] == 'cache' and second['tokens_used'] == 0 and second['cost'] == 0
+        assert second['metadata']['reply_cache']['tier'] == 'exact'
+        assert {v: second[v] for v in VERSION_TYPES} == {v: first[v] for v in VERSION_TYPES}
+        assert second['suggestion_id'] != first['suggestion_id']
+
+    def test_cache_respects_customer_memory(self, setup):
+        """测试画像不同的客户不会拿到别人的回复，命中缓存时客户记忆照常更新"""
+        db, adapter, generator = setup
+        memory = generator.customer_memory
+        self.generate(generator, 's1')
+        calls = adapter.calls
+
+        # 热线索、对价格敏感的客户：画像不同，重新生成
+        memory.update_stage('s3', 'hot')
+        memory.add_preference('s3', 'price_sensitive', True)
+        third = self.generate(generator, 's3')
+        assert adapter.calls == calls + len(VERSION_TYPES)
+        assert third['generation_mode'] != 'cache'
+
+        # 画像相同的新客户命中缓存，互动次数与最后意图仍然写入记忆
+        second = self.generate(generator, 's2')
+        assert second['generation_mode'] == 'cache'
+        assert second['metadata']['customer_stage'] == 'cold'
+        s2 = memory.get_memory('s2')
+        assert s2['interaction_count'] == 1
+        assert s2['last_intent'] == second['metadata']['intent']
+        assert memory.get_memory('s1')['interaction_count'] == 1
+
+    def test_deictic_question_about_different_products(self, setup):
+        """测试两个会话问同一句 "这个多少钱" 但上文是不同商品时，不共用回复"""
+        db, adapter, generator = setup
+        coat = self.generate(generator, 's1', '羽绒服有黑色吗')
+        assert coat['generation_mode'] != 'cache'
+        shoes = self.generate(generator, 's2', '运动鞋有黑色吗')
+        assert shoes['generation_mode'] != 'cache'
+        # 同一商品的新会话仍命中
+        again = self.generate(generator, 's3', '羽绒服有黑色吗')
+        assert again['generation_mode'] == 'cache' and again['metadata']['reply_cache']['tier'] == 'exact'
+
+    def test_prompt_change_invalidates(self, setup):
+        db, adapter, generator = setup
+        self.generate(generator, 's1')
+        db._notify_prompt_changed(1)
+        self.generate(generator, 's2')
+        assert adapter.calls == 2 * len(VERSION_TYPES)
+
+    def test_preset_and_golden_edits_invalidate(self, setup):
+        """测试预设问答、金牌话术变化后，该专家的缓存回复失效（其他专家不受影响）"""
+        db, adapter, generator = setup
+        cache = generator.reply_cache
+        cache.put(cache.probe(2, '地址在哪', None, None), VERSIONS)
+        self.generate(generator, 's1')
+        assert self.generate(generator, 's2')['generation_mode'] == 'cache'
+
+        qa_id = db.add_preset_qa(1, '发货', '48 小时内发货')
+        edits = [
+            lambda: db.update_preset_qa(qa_id, '发货', '24 小时内发货'),
+            lambda: db.delete_preset_qa(qa_id),
+            lambda: db.add_golden_reply(1, '多少钱', '标准版 99 元'),
+            lambda: db.add_golden_reply(1, '多少钱', '标准版 99 元'),
+        ]
+        for index, edit in enumerate([lambda: None] + edits):
+            edit()
+            assert self.generate(generator, f'p{index}')['generation_mode'] != 'cache'
+            assert self.generate(generator, f'q{index}')['generation_mode'] == 'cache'
+        assert cache.get(cache.probe(2, '地址在哪', None, None)) is not None
+
+    def test_disabled_by_config(self, setup, monkeypatch):
+        monkeypatch.setenv('AI_REPLY_CACHE', '0')
+        db, adapter, generator = setup
+        self.generate(generator, 's1')
+        self.generate(generator, 's2')
+        assert adapter.calls == 2 * len(VERSION_TYPES)
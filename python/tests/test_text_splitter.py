@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 中文文本分块器
+"""
+
+import sys
+import os
+import random
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_expert.text_splitter import ChineseTextSplitter, token_length
+
+
+SAMPLE = (
+    "我们的产品支持七天无理由退货。收到商品后请检查包装是否完好！"
+    "如有问题请联系客服？\n"
+    "会员用户享受九折优惠，积分可以抵扣现金，每一百积分抵扣一元。\n\n"
+    "配送范围覆盖全国，偏远地区需要额外支付运费。一般情况下三天内送达。"
+) * 5
+
+
+class TestChineseTextSplitter:
+    """分块器测试"""
+
+    def test_chunks_respect_size_and_sentence_boundaries(self):
+        """测试分块不超过 chunk_size，且在句子边界处切分"""
+        splitter = ChineseTextSplitter(chunk_size=80, chunk_overlap=20)
+        chunks = splitter.split_text(SAMPLE)
+
+        assert len(chunks) > 1
+        assert all(len(c) <= 80 for c in chunks)
+        assert all(c[-1] in "。！？\n" or c.endswith("元。") for c in chunks[:-1])
+
+    def test_overlap_between_chunks(self):
+        """测试相邻块之间存在重叠（重叠以句子为单位）"""
+        splitter = ChineseTextSplitter(chunk_size=80, chunk_overlap=40)
+        chunks = splitter.split_text(SAMPLE.replace("\n", ""))
+
+        overlapping = sum(1 for a, b in zip(chunks, chunks[1:]) if b[:10] in a)
+        assert overlapping >= len(chunks) // 2
+
+    def test_stream_matches_full_text(self):
+        """测试按任意切片流式输入的结果与整段切分一致"""
+        splitter = ChineseTextSplitter(chunk_size=60, chunk_overlap=15)
+        pages = [SAMPLE[i:i + 37] for i in range(0, len(SAMPLE), 37)]
+
+        assert list(splitter.split_stream(iter(pages))) == splitter.split_text(SAMPLE)
+
+    def test_stream_boundary_at_page_end(self):
+        """测试段落结束的空行跨页时，不提前确认段落边界"""
+        splitter = ChineseTextSplitter(chunk_size=5, chunk_overlap=2)
+        text = "！a好\n\n\n"
+
+        assert splitter.split_text(text) == ["！", "a好"]
+        assert list(splitter.split_stream([text[:5], text[5:]])) == ["！", "a好"]
+
+    def test_stream_matches_full_text_randomized(self):
+        """测试随机文本、随机分页下流式结果与整段切分一致，且分块不超过 chunk_size"""
+        rnd = random.Random(20240601)
+        alphabets = ["好中文a b。！？，、\n\n ”x）\t!", "好好好好好好，ab", "中。”’」\n \n"]
+        for _ in range(1500):
+            alphabet = rnd.choice(alphabets)
+            text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 200)))
+            chunk_size = rnd.randint(2, 40)
+            splitter = ChineseTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=rnd.randint(0, chunk_size - 1),
+                length_function=rnd.choice([None, token_length])
+            )
+            cuts = sorted(rnd.sample(range(len(text) + 1), min(rnd.randint(0, 20), len(text) + 1)))
+            pages = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+            chunks = splitter.split_text(text)
+            assert list(splitter.split_stream(iter(pages))) == chunks, (text, chunk_size, cuts)
+            assert all(splitter.length_function(c) <= chunk_size for c in chunks)
+
+    def test_paragraphs_kept_whole_when_they_fit(self):
+        """测试放得下的段落整体保留，不在段落内部切分"""
+        splitter = ChineseTextSplitter(chunk_size=80, chunk_overlap=0)
+        paragraphs = ["第一段。" * 10, "第二段内容。" * 5, "第三段！" * 6]
+        chunks = splitter.split_text("\n\n".join(paragraphs))
+
+        assert chunks == [paragraphs[0] + "\n\n" + paragraphs[1], paragraphs[2]]
+
+    def test_long_sentence_without_punctuation_is_hard_split(self):
+        """测试没有标点的超长文本按长度硬切"""
+        splitter = ChineseTextSplitter(chunk_size=50, chunk_overlap=0)
+        chunks = splitter.split_text("长" * 175)
+
+        assert [len(c) for c in chunks] == [50, 50, 50, 25]
+
+    def test_token_length_function(self):
+        """测试按 token 估算长度分块"""
+        splitter = ChineseTextSplitter(chunk_size=30, chunk_overlap=5, length_function=token_length)
+        chunks = splitter.split_text(SAMPLE)
+
+        assert all(token_length(c) <= 30 for c in chunks)
+        assert token_length("中文") == 1
+        assert token_length("abcdefgh") == 2
+
+    def test_invalid_overlap(self):
+        """测试重叠长度不能大于等于块大小"""
+        with pytest.raises(ValueError):
+            ChineseTextSplitter(chunk_size=10, chunk_overlap=10)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - 分阶段耗时追踪
+"""
+
+import sys
+import os
+import asyncio
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_expert.tracing as tracing
+from ai_expert.config import Config
+from ai_expert.tracing import SpanStats, get_span_stats, trace_span, traced
+from ai_expert.pipeline import Stage, StagePipeline
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    get_span_stats().reset()
+    yield
+    get_span_stats().reset()
+
+
+class TestSpanStats:
+    """耗时样本与分位数"""
+
+    def test_percentiles(self):
+        stats = SpanStats(window=100)
+        for ms in range(1, 101):
+            stats.record('stage.preset', ms / 1000)
+        metrics = stats.get_metrics()['stage.preset']
+        assert metrics['count'] == 100 and metrics['errors'] == 0
+        assert metrics['p50_ms'] <= metrics['p95_ms'] <= metrics['p99_ms'] <= 100
+
+    def test_window_bounds_samples(self):
+        stats = SpanStats(window=10)
+        for _ in range(5):
+            stats.record('slow', 10.0)
+        for _ in range(10):
+            stats.record('slow', 0.001)
+        metrics = stats.get_metrics()['slow']
+        assert metrics['count'] == 15
+        assert metrics['p99_ms'] == 1.0
+
+    def test_exporter_config(self, monkeypatch):
+        monkeypatch.delenv('AI_TRACE_EXPORTER', raising=False)
+        assert Config.get_trace_exporter() == 'none'
+        monkeypatch.setenv('AI_TRACE_EXPORTER', 'FILE')
+        assert Config.get_trace_exporter() == 'file'
+        monkeypatch.setenv('AI_TRACE_EXPORTER', 'jaeger')
+        assert Config.get_trace_exporter() == 'none'
+
+
+class TestTraced:
+    """装饰器覆盖普通函数、生成器与协程"""
+
+    def test_function_and_errors(self):
+        @traced('ok')
+        def ok():
+            return 1
+
+        @traced('boom')
+        def boom():
+            raise RuntimeError('boom')
+
+        assert ok() == 1
+        with pytest.raises(RuntimeError):
+            boom()
+        metrics = get_span_stats().get_metrics()
+        assert metrics['ok']['count'] == 1 and metrics['ok']['errors'] == 0
+        assert metrics['boom']['errors'] == 1
+
+    def test_generator_timed_over_iteration(self):
+        @traced('stream')
+        def stream():
+            yield 1
+            yield 2
+
+        gen = stream()
+        assert 'stream' not in get_span_stats().get_metrics()
+        assert list(gen) == [1, 2]
+        assert get_span_stats().get_metrics()['stream']['count'] == 1
+
+        # 调用方提前关闭不计为错误
+        gen = stream()
+        next(gen)
+        gen.close()
+        metrics = get_span_stats().get_metrics()['stream']
+        assert metrics['count'] == 2 and metrics['errors'] == 0
+
+    def test_coroutine(self):
+        @traced('async.chat')
+        async def chat():
+            await asyncio.sleep(0.01)
+            return 'ok'
+
+        assert asyncio.run(chat()) == 'ok'
+        assert get_span_stats().get_metrics()['async.chat']['p50_ms'] >= 10
+
+    def test_span_without_exporter(self, monkeypatch):
+        monkeypatch.setattr(tracing, '_tracer', None)
+        monkeypatch.setattr(tracing, '_tracer_initialized', True)
+        with trace_span('plain', attr=1) as span:
+            assert span is None
+        assert get_span_stats().get_metrics()['plain']['count'] == 1
+
+
+class TestPipelineSpans:
+    """流水线每个阶段记录一个 span"""
+
+    @pytest.mark.parametrize('concurrent', [True, False])
+    def test_stage_spans(self, concurrent):
+        StagePipeline([
+            Stage('a', lambda: 1),
+            Stage('b', lambda a: a + 1, deps=['a'], inline=True),
+            Stage('skipped', lambda: 0, optional=True, condition=lambda: False),
+        ], concurrent=concurrent).run()
+        metrics = get_span_stats().get_metrics()
+        assert metrics['stage.a']['count'] == 1
+        assert metrics['stage.b']['count'] == 1
+        assert 'stage.skipped' not in metrics
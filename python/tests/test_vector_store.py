@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Unit Tests - SimpleVectorStore 向量存储
+"""
+
+import sys
+import os
+import random
+import threading
+
+import pytest
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+
+from ai_expert.knowledge_base_manager import SimpleVectorStore, KnowledgeBaseManager
+
+DIM = 8
+
+
+def make_vector(chunk_id: int) -> list:
+    """根据 chunk_id 生成确定的向量，便于校验向量与元数据是否对齐"""
+    rng = np.random.default_rng(chunk_id)
+    vec = rng.normal(size=DIM).astype(np.float32)
+    vec[0] = float(chunk_id)
+    return vec.tolist()
+
+
+def make_meta(chunk_id: int, file_id: int, bound_prompt_id: int = 0) -> dict:
+    return {"chunk_id": chunk_id, "file_id": file_id, "bound_prompt_id": bound_prompt_id, "chunk_index": chunk_id}
+
+
+class TestSimpleVectorStore:
+    """向量存储基础功能测试"""
+
+    def test_add_search_and_delete(self, tmp_path):
+        """测试添加、检索、删除"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add([make_vector(1), make_vector(2)], [make_meta(1, 10), make_meta(2, 20)])
+
+        results = store.search(make_vector(2), top_k=1)
+        assert results[0]['id'] == 2
+        assert results[0]['score'] == pytest.approx(1.0, abs=1e-5)
+
+        store.delete(lambda meta: meta['file_id'] == 20)
+        assert [r['id'] for r in store.search(make_vector(2), top_k=5)] == [1]
+
+    def test_persistence_roundtrip(self, tmp_path):
+        """测试重新加载后数据一致"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add([make_vector(i) for i in range(5)], [make_meta(i, i) for i in range(5)])
+
+        reloaded = SimpleVectorStore(str(tmp_path))
+        assert len(reloaded.metadata) == 5
+        assert reloaded.search(make_vector(3), top_k=1)[0]['id'] == 3
+
+    def test_search_with_filter(self, tmp_path):
+        """测试过滤函数"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add([make_vector(i) for i in range(6)], [make_meta(i, i % 2) for i in range(6)])
+
+        results = store.search(make_vector(1), filter_fn=lambda m: m['file_id'] == 0, top_k=3)
+        assert len(results) == 3
+        assert all(r['metadata']['file_id'] == 0 for r in results)
+
+
+class TestSimpleVectorStorePartitions:
+    """按 bound_prompt_id 分区测试"""
+
+    def test_search_only_touches_requested_partitions(self, tmp_path):
+        """测试检索只返回全局分区与目标分区的结果"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add(
+            [make_vector(i) for i in range(9)],
+            [make_meta(i, i, bound_prompt_id=i % 3) for i in range(9)]
+        )
+        assert sorted(store.partition_ids()) == [0, 1, 2]
+
+        results = store.search(make_vector(2), top_k=9, partitions=[0, 1])
+        assert {r['metadata']['bound_prompt_id'] for r in results} == {0, 1}
+        assert len(results) == 6
+        scores = [r['score'] for r in results]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_drop_partition(self, tmp_path):
+        """测试整块删除分区并同步落盘"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add(
+            [make_vector(i) for i in range(6)],
+            [make_meta(i, i, bound_prompt_id=i % 2) for i in range(6)]
+        )
+
+        assert store.drop_partition(1) == 3
+        assert store.drop_partition(1) == 0
+        assert store.partition_ids() == [0]
+
+        reloaded = SimpleVectorStore(str(tmp_path))
+        assert reloaded.partition_ids() == [0]
+        assert reloaded.partition_size(0) == 3
+
+    def test_migrates_legacy_single_file_index(self, tmp_path):
+        """测试旧版单文件索引自动迁移为分区格式"""
+        import pickle
+        metadata = [make_meta(i, i, bound_prompt_id=i % 2) for i in range(4)]
+        np.save(str(tmp_path / 'vectors.npy'), np.array([make_vector(i) for i in range(4)], dtype=np.float32))
+        with open(tmp_path / 'metadata.pkl', 'wb') as f:
+            pickle.dump(metadata, f)
+
+        store = SimpleVectorStore(str(tmp_path))
+        assert sorted(store.partition_ids()) == [0, 1]
+        assert store.search(make_vector(3), top_k=1, partitions=[1])[0]['id'] == 3
+        assert not (tmp_path / 'vectors.npy').exists()
+
+        reloaded = SimpleVectorStore(str(tmp_path))
+        assert sorted(reloaded.partition_ids()) == [0, 1]
+
+
+class TestBatchSearch:
+    """多查询批量检索测试"""
+
+    def test_search_batch_matches_single_search(self, tmp_path):
+        """测试批量检索结果与逐条检索一致"""
+        store = SimpleVectorStore(str(tmp_path))
+        store.add(
+            [make_vector(i) for i in range(20)],
+            [make_meta(i, i, bound_prompt_id=i % 2) for i in range(20)]
+        )
+
+        queries = [make_vector(3), make_vector(8), make_vector(15)]
+        batched = store.search_batch(queries, top_k=4, partitions=[0, 1])
+        for query, results in zip(queries, batched):
+            single = store.search(query, top_k=4, partitions=[0, 1])
+            assert [r['id'] for r in results] == [r['id'] for r in single]
+            assert [r['score'] for r in results] == pytest.approx([r['score'] for r in single])
+
+    def test_search_many_fuses_and_dedups(self, tmp_path):
+        """测试 search_many 去重融合并批量取回全文"""
+        kb = KnowledgeBaseManager(
+            db_path=str(tmp_path / 'kb.db'),
+            vector_db_path=str(tmp_path / 'vectors'),
+            use_worker=False
+        )
+        lookup = {'q1': make_vector(1), 'q2': make_vector(2), 'q1 again': make_vector(1)}
+
+        class FakeModel:
+            def encode(self, texts):
+                return np.array([lookup[t] for t in texts], dtype=np.float32)
+
+        kb.model = FakeModel()
+
+        conn = kb.sql_db.get_connection()
+        for i in range(4):
+            conn.execute(
+                "INSERT INTO chunks (file_id, chunk_index, content, token_count) VALUES (?, ?, ?, ?)",
+                (i, 0, f"content-{i}", 9)
+            )
+        conn.commit()
+        conn.close()
+        kb.vector_store.add(
+            [make_vector(i) for i in range(4)],
+            [{**make_meta(i, i), "chunk_index": 0, "source": f"doc{i}"} for i in range(4)]
+        )
+
+        results = kb.search_many(['q1', 'q2', 'q1 again', ''], top_k=2, threshold=0.99)
+        assert sorted(r['content'] for r in results) == ['content-1', 'content-2']
+        by_content = {r['content']: r for r in results}
+        assert by_content['content-1']['matched_queries'] == [0, 2]
+        assert by_content['content-2']['matched_queries'] == [1]
+
+
+class TestSimpleVectorStoreConcurrency:
+    """并发读写压力测试：检索结果必须始终与某个一致的快照对应"""
+
+    def test_concurrent_add_delete_search(self, tmp_path):
+        store = SimpleVectorStore(str(tmp_path))
+        store.add([make_vector(i) for i in range(50)], [make_meta(i, i) for i in range(50)])
+
+        errors = []
+        stop = threading.Event()
+        next_id = [1000]
+        id_lock = threading.Lock()
+
+        def writer_add():
+            while not stop.is_set():
+                with id_lock:
+                    ids = list(range(next_id[0], next_id[0] + 5))
+                    next_id[0] += 5
+                store.add([make_vector(i) for i in ids], [make_meta(i, i, i % 3) for i in ids])
+
+        def writer_delete():
+            rnd = random.Random(1)
+            while not stop.is_set():
+                victim = rnd.randrange(0, next_id[0])
+                store.delete(lambda meta: meta['file_id'] == victim)
+
+        def reader():
+            rnd = random.Random(2)
+            while not stop.is_set():
+                try:
+                    for snapshot in list(store._partitions.values()):
+                        assert len(snapshot.vectors) == len(snapshot.metadata) == len(snapshot.norms)
+                        assert np.array_equal(
+                            snapshot.vectors[:, 0],
+                            np.array([m['chunk_id'] for m in snapshot.metadata], dtype=np.float32)
+                        )
+
+                    query = make_vector(rnd.randrange(0, next_id[0]))
+                    q = np.array(query, dtype=np.float32)
+                    for res in store.search(query, top_k=5):
+                        vec = np.array(make_vector(res['id']), dtype=np.float32)
+                        expected = float(np.dot(vec, q) / (np.linalg.norm(vec) * np.linalg.norm(q)))
+                        assert res['score'] == pytest.approx(expected, abs=1e-4)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+        threads = [threading.Thread(target=writer_add), threading.Thread(target=writer_delete)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for t in threads:
+            t.start()
+
+        stop.wait(1.5)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        assert not errors, errors[0]
+
+        # 最终落盘的数据与内存快照一致
+        reloaded = SimpleVectorStore(str(tmp_path))
+        assert sorted(m['chunk_id'] for m in reloaded.metadata) == sorted(m['chunk_id'] for m in store.metadata)
@@ -17,6 +17,16 @@ interface ReplyVersion {
   style: string;
 }
 
+type ReplySuggestions = Record<'aggressive' | 'conservative' | 'professional', string>;
+
+const VERSION_ORDER: (keyof ReplySuggestions)[] = ['aggressive', 'conservative', 'professional'];
+
+const toReplyVersions = (suggestions: ReplySuggestions): ReplyVersion[] => [
+  { version: '版本1', content: suggestions.aggressive, style: '进取型' },
+  { version: '版本2', content: suggestions.conservative, style: '保守型' },
+  { version: '版本3', content: suggestions.professional, style: '专业型' }
+];
+
 interface AIExpert {
   id: number;
   name: string;
@@ -165,12 +175,7 @@ export const InlineReplyGenerator: React.FC<InlineReplyGeneratorProps> = ({
           if (data.success && Array.isArray(data.tasks)) {
             const task = data.tasks.find((t: any) => t.session_id === currentSession);
             if (task && task.ai_reply_options) {
-              const options = task.ai_reply_options;
-              setReplies([
-                { version: '版本1', content: options.aggressive, style: '进取型' },
-                { version: '版本2', content: options.conservative, style: '保守型' },
-                { version: '版本3', content: options.professional, style: '专业型' }
-              ]);
+              setReplies(toReplyVersions(task.ai_reply_options));
               setIsExpanded(true);
               setIsTyping(false);
               setLastTaskLoaded(task.id);
@@ -197,7 +202,8 @@ export const InlineReplyGenerator: React.FC<InlineReplyGeneratorProps> = ({
         setLoading(false);
         return;
       }
-      const response = await fetch('http://localhost:5000/api/ai/generate', {
+      // 流式生成：三个版本的 token 交替到达，收到首个 token 即开始展示
+      const response = await fetch('http://localhost:5000/api/ai/generate/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -210,19 +216,55 @@ export const InlineReplyGenerator: React.FC<InlineReplyGeneratorProps> = ({
           }))
         })
       });
-      const data = await response.json();
-      if (data.success && data.suggestions) {
-        setReplies([
-          { version: '版本1', content: data.suggestions.aggressive, style: '进取型' },
-          { version: '版本2', content: data.suggestions.conservative, style: '保守型' },
-          { version: '版本3', content: data.suggestions.professional, style: '专业型' }
-        ]);
-        setMetadata(data.metadata);
-        setStats({ total_tokens: data.tokens_used || 0, cost: data.cost || 0 });
-        setIsExpanded(true);
-        setIsTyping(true);
-      } else {
-        setError(data.error || '生成失败');
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => null);
+        setError(data?.error || '生成失败');
+        return;
+      }
+
+      setReplies(toReplyVersions({ aggressive: '', conservative: '', professional: '' }));
+      setStats(null);
+      setIsTyping(false);
+      setIsExpanded(true);
+
+      const updateVersion = (version: keyof ReplySuggestions, update: (content: string) => string) => {
+        const target = VERSION_ORDER.indexOf(version);
+        setReplies(prev => prev.map((reply, i) => (i === target ? { ...reply, content: update(reply.content) } : reply)));
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+
+        for (const raw of events) {
+          if (!raw.startsWith('data: ')) continue;
+          const event = JSON.parse(raw.slice(6));
+          switch (event.type) {
+            case 'meta':
+              setMetadata(event.metadata);
+              break;
+            case 'delta':
+              setLoading(false);
+              updateVersion(event.version, content => content + event.content);
+              break;
+            case 'version_error':
+              updateVersion(event.version, () => `生成失败: ${event.error}`);
+              break;
+            case 'done':
+              setReplies(toReplyVersions(event.suggestions));
+              setStats({ total_tokens: event.tokens_used || 0, cost: event.cost || 0 });
+              break;
+            case 'error':
+              setError(event.error || '生成失败');
+              break;
+          }
+        }
       }
     } catch (err) {
       setError('网络连接失败，请检查后端服务器');
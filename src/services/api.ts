@@ -108,6 +108,7 @@ export const API_ENDPOINTS = {
     // AI 专家
     AI_PROMPTS: '/api/ai/prompts',
     AI_GENERATE: '/api/ai/generate',
+    AI_GENERATE_STREAM: '/api/ai/generate/stream',
     AI_RECORD_SELECTION: '/api/ai/record-selection',
     AI_RECORD_MODIFICATION: '/api/ai/record-modification',
     